@@ -5,18 +5,14 @@ from __future__ import annotations
 import asyncio
 import hashlib
 import re
-import struct
 import time
 from collections.abc import Callable
 from collections.abc import Mapping
 from datetime import date
 from datetime import datetime
-from pathlib import Path
 from typing import Literal
 from typing import TypedDict
-from zoneinfo import ZoneInfo
 
-import bcrypt
 import app.metrics
 import databases.core
 from fastapi import APIRouter
@@ -28,6 +24,9 @@ from fastapi.responses import HTMLResponse
 import app.packets
 import app.settings
 import app.state
+import app.usecases.chat_log
+import app.usecases.leaderboards
+import app.usecases.passwords
 import app.usecases.performance
 import app.utils
 from app import commands
@@ -40,7 +39,6 @@ from app.constants.privileges import ClanPrivileges
 from app.constants.privileges import ClientPrivileges
 from app.constants.privileges import Privileges
 from app.logging import Ansi
-from app.logging import get_timestamp
 from app.logging import log
 from app.logging import magnitude_fmt_time
 from app.objects.beatmap import Beatmap
@@ -72,8 +70,6 @@ from app.usecases.performance import ScoreParams
 
 OSU_API_V2_CHANGELOG_URL = "https://osu.ppy.sh/api/v2/changelog"
 
-BEATMAPS_PATH = Path.cwd() / ".data/osu"
-DISK_CHAT_LOG_FILE = ".data/logs/chat.log"
 
 BASE_DOMAIN = app.settings.DOMAIN
 
@@ -94,7 +90,7 @@ router = APIRouter(tags=["Bancho API"])
 async def bancho_http_handler() -> Response:
     """Handle a request from a web browser."""
     new_line = "\n"
-    matches = [m for m in app.state.sessions.matches if m is not None]
+    matches = list(app.state.sessions.matches)
     players = [p for p in app.state.sessions.players if not p.is_bot_client]
 
     packets = app.state.packets["all"]
@@ -157,7 +153,7 @@ async def bancho_view_matches() -> Response:
     HOST = "host"
     max_properties_length = max(len(BEATMAP), len(HOST))
 
-    matches = [m for m in app.state.sessions.matches if m is not None]
+    matches = list(app.state.sessions.matches)
 
     match_id_max_length = (
         len(str(max(match.id for match in matches))) if len(matches) else 0
@@ -206,6 +202,15 @@ async def bancho_handler(
     player = app.state.sessions.players.get(token=osu_token)
 
     if not player:
+        if app.state.sessions.backend.distributed:
+            worker_id = await app.state.sessions.backend.get_session_worker(osu_token)
+            if worker_id is not None:
+                log(
+                    f"A request for a session on worker {worker_id} was sent to "
+                    f"worker {app.settings.WORKER_ID}; check the load balancer config.",
+                    Ansi.LYELLOW,
+                )
+
         # chances are, we just restarted the server
         # tell their client to reconnect immediately.
         return Response(
@@ -215,6 +220,12 @@ async def bancho_handler(
             ),  # ms until reconnection
         )
 
+    if player.packet_queue_overflowed:
+        # the client fell too far behind on their packets
+        # to catch up; have them reconnect with a fresh state.
+        player.logout()
+        return Response(content=app.packets.restart_server(0))
+
     if player.restricted:
         # restricted users may only use certain packet handlers.
         packet_map = app.state.packets["restricted"]
@@ -292,6 +303,7 @@ class ChangeAction(BasePacket):
         player.status.mods = Mods(self.mods)
         player.status.mode = GameMode(self.mode)
         player.status.map_id = self.map_id
+        player.invalidate_packets()
 
         # broadcast it to all online players.
         if not player.restricted:
@@ -434,11 +446,7 @@ class SendMessage(BasePacket):
             app.metrics.increment("ex_chat_messages")
 
         log(f"{player} @ {t_chan}: {msg}", Ansi.LCYAN)
-
-        with open(DISK_CHAT_LOG_FILE, "a+") as f:
-            f.write(
-                f"[{get_timestamp(full=True, tz=ZoneInfo('GMT'))}] {player} @ {t_chan}: {msg}\n",
-            )
+        app.usecases.chat_log.write(player, t_chan, msg)
 
 
 @register(ClientPackets.LOGOUT, restricted=True)
@@ -621,15 +629,12 @@ async def authenticate(
 
     trusted_hashword = user_info["pw_bcrypt"].encode()
 
-    # in-memory bcrypt lookup cache for performance
-    if trusted_hashword in app.state.cache.bcrypt:  # ~0.01 ms
-        if untrusted_password != app.state.cache.bcrypt[trusted_hashword]:
-            return None
-    else:  # ~200ms
-        if not bcrypt.checkpw(untrusted_password, trusted_hashword):
-            return None
-
-        app.state.cache.bcrypt[trusted_hashword] = untrusted_password
+    # (may raise PasswordChecksOverloaded)
+    if not await app.usecases.passwords.verify_password(
+        untrusted_password,
+        trusted_hashword,
+    ):
+        return None
 
     return user_info
 
@@ -723,7 +728,31 @@ async def handle_osu_login_request(
             player.logout()
             del player
 
-    user_info = await authenticate(login_data["username"], login_data["password_md5"])
+    phase_start_time = time.perf_counter()
+
+    try:
+        user_info = await authenticate(
+            login_data["username"],
+            login_data["password_md5"],
+        )
+    except app.usecases.passwords.PasswordChecksOverloaded:
+        # too many logins are waiting on bcrypt (e.g. everyone
+        # reconnecting after a restart); the client will retry.
+        return {
+            "osu_token": "server-busy",
+            "response_body": (
+                app.packets.notification(
+                    f"{BASE_DOMAIN}: The server is busy, retrying shortly..",
+                )
+                + app.packets.login_reply(LoginFailureReason.ERROR_OCCURRED)
+            ),
+        }
+    finally:
+        app.metrics.histrogram(
+            "ex_login_auth_time",
+            time.perf_counter() - phase_start_time,
+        )
+
     if user_info is None:
         return {
             "osu_token": "incorrect-credentials",
@@ -746,6 +775,8 @@ async def handle_osu_login_request(
 
     """ login credentials verified """
 
+    phase_start_time = time.perf_counter()
+
     await logins_repo.create(
         user_id=user_info["id"],
         ip=str(ip),
@@ -811,6 +842,12 @@ async def handle_osu_login_request(
 
     """ All checks passed, player is safe to login """
 
+    app.metrics.histrogram(
+        "ex_login_checks_time",
+        time.perf_counter() - phase_start_time,
+    )
+    phase_start_time = time.perf_counter()
+
     # get clan & clan priv if we're in a clan
     clan_id: int | None = None
     clan_priv: ClanPrivileges | None = None
@@ -843,6 +880,9 @@ async def handle_osu_login_request(
             country=geoloc["country"]["acronym"],
         )
 
+        # (cached leaderboards' country views include the user's country)
+        app.usecases.leaderboards.invalidate_user(user_info["id"])
+
     client_details = ClientDetails(
         osu_version=osu_version,
         osu_path_md5=login_data["osu_path_md5"],
@@ -858,7 +898,7 @@ async def handle_osu_login_request(
         name=user_info["name"],
         priv=Privileges(user_info["priv"]),
         pw_bcrypt=user_info["pw_bcrypt"].encode(),
-        token=Player.generate_token(),
+        token=app.state.sessions.backend.generate_token(),
         clan_id=clan_id,
         clan_priv=clan_priv,
         geoloc=geoloc,
@@ -893,28 +933,30 @@ async def handle_osu_login_request(
 
     # send all appropriate channel info to our player.
     # the osu! client will attempt to join the channels.
-    for channel in app.state.sessions.channels:
+    login_channels = [
+        channel
+        for channel in app.state.sessions.channels
         if (
-            not channel.auto_join
-            or not channel.can_read(player.priv)
-            or channel.real_name == "#lobby"
-        ):  # (can't be in mp lobby @ login)
-            continue
-
-        # send chan info to all players who can see
-        # the channel (to update their playercounts)
-        chan_info_packet = app.packets.channel_info(
+            channel.auto_join
+            and channel.can_read(player.priv)
+            and channel.real_name != "#lobby"
+        )  # (can't be in mp lobby @ login)
+    ]
+
+    # (across all workers)
+    player_counts = await app.state.sessions.backend.get_channel_player_counts(
+        login_channels,
+    )
+
+    for channel in login_channels:
+        # NOTE: other players are sent the channels' new
+        # playercounts periodically, as the player joins them.
+        data += app.packets.channel_info(
             channel.real_name,
             channel.topic,
-            len(channel.players),
+            player_counts[channel.real_name],
         )
 
-        data += chan_info_packet
-
-        for o in app.state.sessions.players:
-            if channel.can_read(o.priv):
-                o.enqueue(chan_info_packet)
-
     # tells osu! to reorder channels based on config.
     data += app.packets.channel_info_end()
 
@@ -939,20 +981,24 @@ async def handle_osu_login_request(
 
     if not player.restricted:
         # player is unrestricted, two way data
-        for o in app.state.sessions.players:
-            # enqueue us to them
-            o.enqueue(user_data)
+        app.state.sessions.players.enqueue(user_data)
 
-            # enqueue them to us.
-            if not o.restricted:
-                if o is app.state.sessions.bot:
-                    # optimization for bot since it's
-                    # the most frequently requested user
-                    data += app.packets.bot_presence(o)
-                    data += app.packets.bot_stats(o)
-                else:
-                    data += app.packets.user_presence(o)
-                    data += app.packets.user_stats(o)
+        if app.state.sessions.backend.distributed:
+            # players may be online on other workers, so their
+            # presences & stats are only sent as they're requested.
+            data += app.packets.user_presence_bundle(
+                await app.state.sessions.backend.get_online_user_ids(),
+            )
+        elif (
+            app.settings.LOGIN_PRESENCE_BUNDLE_THRESHOLD
+            and len(app.state.sessions.players)
+            > app.settings.LOGIN_PRESENCE_BUNDLE_THRESHOLD
+        ):
+            # only send the ids of the online players; the client
+            # will request the presence & stats of those it shows.
+            data += app.state.sessions.players.presence_bundle()
+        else:
+            data += app.state.sessions.players.login_packets()
 
         # the player may have been sent mail while offline,
         # enqueue any messages from their respective authors.
@@ -1010,16 +1056,9 @@ async def handle_osu_login_request(
 
     else:
         # player is restricted, one way data
-        for o in app.state.sessions.players.unrestricted:
-            # enqueue them to us.
-            if o is app.state.sessions.bot:
-                # optimization for bot since it's
-                # the most frequently requested user
-                data += app.packets.bot_presence(o)
-                data += app.packets.bot_stats(o)
-            else:
-                data += app.packets.user_presence(o)
-                data += app.packets.user_stats(o)
+        # NOTE: restricted players can't request presences,
+        # so they're always sent the full presence & stats.
+        data += app.state.sessions.players.login_packets()
 
         data += app.packets.account_restricted()
         data += app.packets.send_message(
@@ -1032,6 +1071,12 @@ async def handle_osu_login_request(
     # add `p` to the global player list,
     # making them officially logged in.
     app.state.sessions.players.append(player)
+    app.state.sessions.backend.add_session(player)
+
+    app.metrics.histrogram(
+        "ex_login_setup_time",
+        time.perf_counter() - phase_start_time,
+    )
 
     if app.metrics.enabled:
         if not player.restricted:
@@ -1121,16 +1166,11 @@ class SpectateFrames(BasePacket):
         # NOTE: this is given a fastpath here for efficiency due to the
         # sheer rate of usage of these packets in spectator mode.
 
-        # data = app.packets.spectateFrames(self.frame_bundle.raw_data)
-        data = (
-            struct.pack("<HxI", 15, len(self.frame_bundle.raw_data))
-            + self.frame_bundle.raw_data
-        )
-
-        # enqueue the data
-        # to all spectators.
-        for spectator in player.spectators:
-            spectator.enqueue(data)
+        # the bundle is stored once, and read by each
+        # spectator from the relay as they poll for data.
+        # (copied, rather than keeping a view of the request's body)
+        if player.spectator_relay is not None:
+            player.spectator_relay.publish(bytes(self.frame_bundle.raw_data))
 
 
 @register(ClientPackets.CANT_SPECTATE)
@@ -1220,6 +1260,17 @@ class SendPrivateMessage(BasePacket):
             # target is not bot, send the message normally if online
             if target.is_online:
                 target.send(msg, sender=player)
+            elif await app.state.sessions.backend.is_online(target):
+                # target is online on another worker
+                app.state.sessions.backend.send_to_user(
+                    target.id,
+                    app.packets.send_message(
+                        sender=player.name,
+                        msg=msg,
+                        recipient=target.name,
+                        sender_id=player.id,
+                    ),
+                )
             else:
                 # inform user they're offline, but
                 # will receive the mail @ next login.
@@ -1308,8 +1359,9 @@ class SendPrivateMessage(BasePacket):
                                 for acc in app.settings.PP_CACHED_ACCURACIES
                             ]
 
-                            results = app.usecases.performance.calculate_performances(
-                                osu_file_path=str(BEATMAPS_PATH / f"{bmap.id}.osu"),
+                            results = await app.usecases.performance.calculate_performances_async(
+                                beatmap_id=bmap.id,
+                                beatmap_md5=bmap.md5,
                                 scores=scores,
                             )
 
@@ -1334,10 +1386,7 @@ class SendPrivateMessage(BasePacket):
         player.update_latest_activity_soon()
 
         log(f"{player} @ {target}: {msg}", Ansi.LCYAN)
-        with open(DISK_CHAT_LOG_FILE, "a+") as f:
-            f.write(
-                f"[{get_timestamp(full=True, tz=ZoneInfo('GMT'))}] {player} @ {target}: {msg}\n",
-            )
+        app.usecases.chat_log.write(player, target, msg)
 
 
 @register(ClientPackets.PART_LOBBY)
@@ -1351,18 +1400,23 @@ class LobbyJoin(BasePacket):
     async def handle(self, player: Player) -> None:
         player.in_lobby = True
 
+        # (sent in a single chunk, rather than one per match)
+        data = bytearray()
+
         for match in app.state.sessions.matches:
-            if match is not None:
-                try:
-                    player.enqueue(app.packets.new_match(match))
-                except ValueError:
-                    log(
-                        f"Failed to send match {match.id} to player joining lobby; likely due to missing host",
-                        Ansi.LYELLOW,
-                    )
-                    stacktrace = app.utils.get_appropriate_stacktrace()
-                    await app.state.services.log_strange_occurrence(stacktrace)
-                    continue
+            try:
+                data += app.packets.new_match(match)
+            except ValueError:
+                log(
+                    f"Failed to send match {match.id} to player joining lobby; likely due to missing host",
+                    Ansi.LYELLOW,
+                )
+                stacktrace = app.utils.get_appropriate_stacktrace()
+                await app.state.services.log_strange_occurrence(stacktrace)
+                continue
+
+        if data:
+            player.enqueue(bytes(data))
 
 
 def validate_match_data(
@@ -1441,9 +1495,8 @@ class MatchCreate(BasePacket):
             chat_channel=chat_channel,
         )
 
-        app.state.sessions.matches[match_id] = match
+        app.state.sessions.matches.append(match)
         app.state.sessions.channels.append(chat_channel)
-        match.chat = chat_channel
 
         player.update_latest_activity_soon()
         player.join_match(match, self.match_data.passwd)
@@ -1459,7 +1512,7 @@ class MatchJoin(BasePacket):
         self.match_passwd = reader.read_string()
 
     async def handle(self, player: Player) -> None:
-        match = app.state.sessions.matches[self.match_id]
+        match = app.state.sessions.matches.get(self.match_id)
         if not match:
             log(f"{player} tried to join a non-existant mp lobby?")
             player.enqueue(app.packets.match_join_fail())
@@ -1948,7 +2001,7 @@ class MatchTransferHost(BasePacket):
             log(f"{player} tried to transfer host to an empty slot?")
             return
 
-        player.match.host_id = target.id
+        app.state.sessions.matches.set_host(player.match, target.id)
         player.match.host.enqueue(app.packets.match_transfer_host())
         player.match.enqueue_state()
 
@@ -1959,13 +2012,10 @@ class TourneyMatchInfoRequest(BasePacket):
         self.match_id = reader.read_i32()
 
     async def handle(self, player: Player) -> None:
-        if not 0 <= self.match_id < 64:
-            return  # invalid match id
-
         if not player.priv & Privileges.DONATOR:
             return  # insufficient privs
 
-        match = app.state.sessions.matches[self.match_id]
+        match = app.state.sessions.matches.get(self.match_id)
         if not match:
             return  # match not found
 
@@ -1978,13 +2028,10 @@ class TourneyMatchJoinChannel(BasePacket):
         self.match_id = reader.read_i32()
 
     async def handle(self, player: Player) -> None:
-        if not 0 <= self.match_id < 64:
-            return  # invalid match id
-
         if not player.priv & Privileges.DONATOR:
             return  # insufficient privs
 
-        match = app.state.sessions.matches[self.match_id]
+        match = app.state.sessions.matches.get(self.match_id)
         if not match:
             return  # match not found
 
@@ -2004,13 +2051,10 @@ class TourneyMatchLeaveChannel(BasePacket):
         self.match_id = reader.read_i32()
 
     async def handle(self, player: Player) -> None:
-        if not 0 <= self.match_id < 64:
-            return  # invalid match id
-
         if not player.priv & Privileges.DONATOR:
             return  # insufficient privs
 
-        match = app.state.sessions.matches[self.match_id]
+        match = app.state.sessions.matches.get(self.match_id)
         if not (match and player.id in match.tourney_clients):
             return  # match not found
 
@@ -2035,6 +2079,7 @@ class FriendAdd(BasePacket):
 
         if target.id in player.blocks:
             player.blocks.remove(target.id)
+            app.state.sessions.players.update_blocks(player)
 
         player.update_latest_activity_soon()
         await player.add_friend(target)
@@ -2121,20 +2166,32 @@ class SetAwayMessage(BasePacket):
         player.away_msg = self.msg.text
 
 
+async def enqueue_remote_presences(player: Player, user_ids: list[int]) -> None:
+    """Enqueue the presences & stats of users online on other workers."""
+    if not user_ids or not app.state.sessions.backend.distributed:
+        return
+
+    presences = await app.state.sessions.backend.get_presences(user_ids)
+    for packets in presences.values():
+        player.enqueue(packets)
+
+
 @register(ClientPackets.USER_STATS_REQUEST, restricted=True)
 class StatsRequest(BasePacket):
     def __init__(self, reader: BanchoPacketReader) -> None:
         self.user_ids = reader.read_i32_list_i16l()
 
     async def handle(self, player: Player) -> None:
-        unrestrcted_ids = [p.id for p in app.state.sessions.players.unrestricted]
+        remote_user_ids = []
 
-        def is_online(o: int) -> bool:
-            return o in unrestrcted_ids and o != player.id
+        for user_id in self.user_ids:
+            if user_id == player.id:
+                continue
 
-        for online in filter(is_online, self.user_ids):
-            target = app.state.sessions.players.get(id=online)
-            if target:
+            target = app.state.sessions.players.get(id=user_id)
+            if target is None:
+                remote_user_ids.append(user_id)
+            elif not target.restricted:
                 if target is app.state.sessions.bot:
                     # optimization for bot since it's
                     # the most frequently requested user
@@ -2144,6 +2201,8 @@ class StatsRequest(BasePacket):
 
                 player.enqueue(packet)
 
+        await enqueue_remote_presences(player, remote_user_ids)
+
 
 @register(ClientPackets.MATCH_INVITE)
 class MatchInvite(BasePacket):
@@ -2199,9 +2258,13 @@ class UserPresenceRequest(BasePacket):
         self.user_ids = reader.read_i32_list_i16l()
 
     async def handle(self, player: Player) -> None:
+        remote_user_ids = []
+
         for pid in self.user_ids:
             target = app.state.sessions.players.get(id=pid)
-            if target:
+            if target is None:
+                remote_user_ids.append(pid)
+            else:
                 if target is app.state.sessions.bot:
                     # optimization for bot since it's
                     # the most frequently requested user
@@ -2211,6 +2274,8 @@ class UserPresenceRequest(BasePacket):
 
                 player.enqueue(packet)
 
+        await enqueue_remote_presences(player, remote_user_ids)
+
 
 @register(ClientPackets.USER_PRESENCE_REQUEST_ALL)
 class UserPresenceRequestAll(BasePacket):
@@ -2223,8 +2288,8 @@ class UserPresenceRequestAll(BasePacket):
 
         buffer = bytearray()
 
-        for player in app.state.sessions.players.unrestricted:
-            buffer += app.packets.user_presence(player)
+        for target in app.state.sessions.players.unrestricted:
+            buffer += app.packets.user_presence(target)
 
         player.enqueue(bytes(buffer))
 
@@ -14,8 +14,6 @@ from collections import defaultdict
 from collections.abc import Awaitable
 from collections.abc import Callable
 from collections.abc import Mapping
-from enum import IntEnum
-from enum import unique
 from functools import cache
 from pathlib import Path as SystemPath
 from typing import Any
@@ -23,7 +21,6 @@ from typing import Literal
 from urllib.parse import unquote
 from urllib.parse import unquote_plus
 
-import bcrypt
 from app.api.v2.common import json
 from app.discord import Embed, Webhook
 import app.metrics
@@ -42,15 +39,24 @@ from fastapi.responses import FileResponse
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import RedirectResponse
 from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRouter
 from starlette.datastructures import UploadFile as StarletteUploadFile
 
 import app.packets
 import app.settings
 import app.state
+import app.usecases.beatmap_cache
+import app.usecases.best_scores
+import app.usecases.leaderboards
+import app.usecases.passwords
+import app.usecases.replays
+import app.usecases.write_behind
 import app.utils
 from app import encryption
 from app._typing import UNSET
+from app.api.middlewares import FORWARDED_HEADER
+from app.api.middlewares import SessionOnOtherWorker
 from app.constants import regexes
 from app.constants.clientflags import LastFMFlags
 from app.constants.gamemodes import GameMode
@@ -66,7 +72,6 @@ from app.objects.player import Player
 from app.objects.score import Grade
 from app.objects.score import Score
 from app.objects.score import SubmissionStatus
-from app.repositories import clans as clans_repo
 from app.repositories import comments as comments_repo
 from app.repositories import favourites as favourites_repo
 from app.repositories import mail as mail_repo
@@ -78,12 +83,9 @@ from app.repositories import users as users_repo
 from app.repositories.achievements import Achievement
 from app.usecases import achievements as achievements_usecases
 from app.usecases import user_achievements as user_achievements_usecases
-from app.utils import escape_enum
-from app.utils import pymysql_encode
 
 
 BEATMAPS_PATH = SystemPath.cwd() / ".data/osu"
-REPLAYS_PATH = SystemPath.cwd() / ".data/osr"
 SCREENSHOTS_PATH = SystemPath.cwd() / ".data/ss"
 SEASONAL_BGS_PATH = SystemPath.cwd() / ".data/assets/seasonal-backgrounds"
 SUBFOLDER = os.getenv("SEASONAL_BGS_SUBFOLDER", "").strip().strip("/")
@@ -126,14 +128,31 @@ router = APIRouter(
 )
 
 
+async def route_to_session_worker(request: Request, username: str) -> None:
+    """\
+    Have a request from a user logged in to another worker forwarded to it,
+    where their session (stats, match, etc.) is; see `WorkerRoutingMiddleware`.
+    """
+    if (
+        not app.state.sessions.backend.distributed
+        or FORWARDED_HEADER in request.headers  # (only forwarded once)
+    ):
+        return
+
+    worker_id = await app.state.sessions.backend.get_user_worker(username)
+    if worker_id is not None and worker_id != app.state.sessions.backend.worker_id:
+        raise SessionOnOtherWorker(worker_id)
+
+
 @cache
 def authenticate_player_session(
     param_function: Callable[..., Any],
     username_alias: str = "u",
     pw_md5_alias: str = "p",
     err: Any | None = None,
-) -> Callable[[str, str], Awaitable[Player]]:
+) -> Callable[..., Awaitable[Player]]:
     async def wrapper(
+        request: Request,
         username: str = param_function(..., alias=username_alias),
         pw_md5: str = param_function(..., alias=pw_md5_alias),
     ) -> Player:
@@ -144,6 +163,8 @@ def authenticate_player_session(
         if player:
             return player
 
+        await route_to_session_worker(request, unquote(username))
+
         # player login incorrect
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -618,6 +639,8 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
 
         player = await app.state.sessions.players.from_login(username, pw_md5)
         if not player:
+            await route_to_session_worker(request, username)
+
             # Player is not online, return nothing so that their
             # client will retry submission when they log in.
             return Response(b"")
@@ -690,6 +713,7 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
         if score.mode != score.player.status.mode:
             score.player.status.mods = score.mods
             score.player.status.mode = score.mode
+            score.player.invalidate_packets()
 
             if not score.player.restricted:
                 app.state.sessions.players.enqueue(app.packets.user_stats(score.player))
@@ -714,7 +738,7 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
                 expected_md5=bmap.md5,
             )
             if osu_file_available:
-                score.pp, score.sr = score.calculate_performance(bmap.id)
+                score.pp, score.sr = await score.calculate_performance(bmap.id)
 
                 if score.passed:
                     await score.calculate_status()
@@ -906,6 +930,9 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
                 },
             )
 
+            if score.status == SubmissionStatus.BEST and not score.player.restricted:
+                app.usecases.leaderboards.invalidate_map(score.bmap.md5, score.mode)
+
             pubsub = app.state.services.redis.pubsub()
             await pubsub.execute_command("PUBLISH", "ex:submit", score.toJSON())
             
@@ -916,8 +943,7 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
             MIN_REPLAY_SIZE = 24
 
             if len(replay_data) >= MIN_REPLAY_SIZE:
-                replay_disk_file = REPLAYS_PATH / f"{score.id}.osr"
-                replay_disk_file.write_bytes(replay_data)
+                await app.usecases.replays.save(score.id, replay_data)
             else:
                 log(f"{score.player} submitted a score without a replay!", Ansi.LRED)
 
@@ -992,32 +1018,25 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
                 stats.rscore += additional_rscore
                 stats_updates["rscore"] = stats.rscore
 
-                # fetch scores sorted by pp for total acc/pp calc
-                # NOTE: we select all plays (and not just top100)
-                # because bonus pp counts the total amount of ranked
-                # scores. I'm aware this scales horribly, and it'll
-                # likely be split into two queries in the future.
-                best_scores = await app.state.services.database.fetch_all(
-                    "SELECT s.pp, s.acc FROM scores s "
-                    "INNER JOIN maps m ON s.map_md5 = m.md5 "
-                    "WHERE s.userid = :user_id AND s.mode = :mode "
-                    "AND s.status = 2 AND m.status IN (2, 3) "  # ranked, approved
-                    "ORDER BY s.pp DESC",
-                    {"user_id": score.player.id, "mode": score.mode},
+                # update the player's best scores & recalculate their
+                # total weighted pp/acc (only reweighting what's moved)
+                best_scores = await app.usecases.best_scores.fetch(
+                    score.player.id,
+                    score.mode,
                 )
+                best_scores.update(score.bmap.md5, score.pp, score.acc)
 
-                # calculate new total weighted accuracy
-                weighted_acc = sum(
-                    row["acc"] * 0.95**i for i, row in enumerate(best_scores)
-                )
-                bonus_acc = 100.0 / (20 * (1 - 0.95 ** len(best_scores)))
-                stats.acc = (weighted_acc * bonus_acc) / 100
+                if app.settings.DEBUG:
+                    best_scores = await app.usecases.best_scores.check_consistency(
+                        best_scores,
+                        score.player.id,
+                        score.mode,
+                    )
+
+                stats.acc = best_scores.acc
                 stats_updates["acc"] = stats.acc
 
-                # calculate new total weighted pp
-                weighted_pp = sum(row["pp"] * 0.95**i for i, row in enumerate(best_scores))
-                bonus_pp = 416.6667 * (1 - 0.9994 ** len(best_scores))
-                stats.pp = round(weighted_pp + bonus_pp)
+                stats.pp = best_scores.pp
                 stats_updates["pp"] = stats.pp
 
                 # update global & country ranking
@@ -1041,6 +1060,8 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
             pp=stats_updates.get("pp", UNSET),
         )
 
+        score.player.invalidate_packets()
+
         if not score.player.restricted:
             # enqueue new stats info to all other users
             app.state.sessions.players.enqueue(app.packets.user_stats(score.player))
@@ -1050,18 +1071,18 @@ if(not app.settings.DISALLOW_OLD_CLIENTS):
             if score.passed:
                 score.bmap.passes += 1
 
-            await app.state.services.database.execute(
-                "UPDATE maps SET plays = :plays, passes = :passes WHERE md5 = :map_md5",
-                {
-                    "plays": score.bmap.plays,
-                    "passes": score.bmap.passes,
-                    "map_md5": score.bmap.md5,
-                },
+            app.usecases.write_behind.increment_map_plays(
+                score.bmap.md5,
+                passed=score.passed,
             )
 
         # update their recent score
         score.player.recent_scores[score.mode] = score
 
+        if score.player.match is not None:
+            # the match may be waiting on the score
+            score.player.match.submit_score(score)
+
         """ score submission charts """
 
         # charts are only displayed for passes vanilla gamemodes.
@@ -1233,6 +1254,8 @@ async def osuSubmitModularSelector(
 
     player = await app.state.sessions.players.from_login(username, pw_md5)
     if not player:
+        await route_to_session_worker(request, username)
+
         # Player is not online, return nothing so that their
         # client will retry submission when they log in.
         return Response(b"")
@@ -1311,6 +1334,7 @@ async def osuSubmitModularSelector(
     if score.mode != score.player.status.mode:
         score.player.status.mods = score.mods
         score.player.status.mode = score.mode
+        score.player.invalidate_packets()
 
         if not score.player.restricted:
             app.state.sessions.players.enqueue(app.packets.user_stats(score.player))
@@ -1335,7 +1359,7 @@ async def osuSubmitModularSelector(
             expected_md5=bmap.md5,
         )
         if osu_file_available:
-            score.pp, score.sr = score.calculate_performance(bmap.id)
+            score.pp, score.sr = await score.calculate_performance(bmap.id)
 
             if score.passed:
                 await score.calculate_status()
@@ -1526,6 +1550,9 @@ async def osuSubmitModularSelector(
             },
         )
 
+        if score.status == SubmissionStatus.BEST and not score.player.restricted:
+            app.usecases.leaderboards.invalidate_map(score.bmap.md5, score.mode)
+
         pubsub = app.state.services.redis.pubsub()
         await pubsub.execute_command("PUBLISH", "ex:submit", score.toJSON())
         
@@ -1535,8 +1562,7 @@ async def osuSubmitModularSelector(
         MIN_REPLAY_SIZE = 24
 
         if len(replay_data) >= MIN_REPLAY_SIZE:
-            replay_disk_file = REPLAYS_PATH / f"{score.id}.osr"
-            replay_disk_file.write_bytes(replay_data)
+            await app.usecases.replays.save(score.id, replay_data)
         else:
             log(f"{score.player} submitted a score without a replay!", Ansi.LRED)
 
@@ -1611,32 +1637,25 @@ async def osuSubmitModularSelector(
             stats.rscore += additional_rscore
             stats_updates["rscore"] = stats.rscore
 
-            # fetch scores sorted by pp for total acc/pp calc
-            # NOTE: we select all plays (and not just top100)
-            # because bonus pp counts the total amount of ranked
-            # scores. I'm aware this scales horribly, and it'll
-            # likely be split into two queries in the future.
-            best_scores = await app.state.services.database.fetch_all(
-                "SELECT s.pp, s.acc FROM scores s "
-                "INNER JOIN maps m ON s.map_md5 = m.md5 "
-                "WHERE s.userid = :user_id AND s.mode = :mode "
-                "AND s.status = 2 AND m.status IN (2, 3) "  # ranked, approved
-                "ORDER BY s.pp DESC",
-                {"user_id": score.player.id, "mode": score.mode},
+            # update the player's best scores & recalculate their
+            # total weighted pp/acc (only reweighting what's moved)
+            best_scores = await app.usecases.best_scores.fetch(
+                score.player.id,
+                score.mode,
             )
+            best_scores.update(score.bmap.md5, score.pp, score.acc)
 
-            # calculate new total weighted accuracy
-            weighted_acc = sum(
-                row["acc"] * 0.95**i for i, row in enumerate(best_scores)
-            )
-            bonus_acc = 100.0 / (20 * (1 - 0.95 ** len(best_scores)))
-            stats.acc = (weighted_acc * bonus_acc) / 100
+            if app.settings.DEBUG:
+                best_scores = await app.usecases.best_scores.check_consistency(
+                    best_scores,
+                    score.player.id,
+                    score.mode,
+                )
+
+            stats.acc = best_scores.acc
             stats_updates["acc"] = stats.acc
 
-            # calculate new total weighted pp
-            weighted_pp = sum(row["pp"] * 0.95**i for i, row in enumerate(best_scores))
-            bonus_pp = 416.6667 * (1 - 0.9994 ** len(best_scores))
-            stats.pp = round(weighted_pp + bonus_pp)
+            stats.pp = best_scores.pp
             stats_updates["pp"] = stats.pp
 
             # update global & country ranking
@@ -1660,6 +1679,8 @@ async def osuSubmitModularSelector(
         pp=stats_updates.get("pp", UNSET),
     )
 
+    score.player.invalidate_packets()
+
     if not score.player.restricted:
         # enqueue new stats info to all other users
         app.state.sessions.players.enqueue(app.packets.user_stats(score.player))
@@ -1669,18 +1690,18 @@ async def osuSubmitModularSelector(
         if score.passed:
             score.bmap.passes += 1
 
-        await app.state.services.database.execute(
-            "UPDATE maps SET plays = :plays, passes = :passes WHERE md5 = :map_md5",
-            {
-                "plays": score.bmap.plays,
-                "passes": score.bmap.passes,
-                "map_md5": score.bmap.md5,
-            },
+        app.usecases.write_behind.increment_map_plays(
+            score.bmap.md5,
+            passed=score.passed,
         )
 
     # update their recent score
     score.player.recent_scores[score.mode] = score
 
+    if score.player.match is not None:
+        # the match may be waiting on the score
+        score.player.match.submit_score(score)
+
     """ score submission charts """
 
     # charts are only displayed for passes vanilla gamemodes.
@@ -1788,15 +1809,19 @@ async def getReplay(
     if not score:
         return Response(b"", status_code=404)
 
-    file = REPLAYS_PATH / f"{score_id}.osr"
-    if not file.exists():
+    replay = await app.usecases.replays.find(score_id)
+    if replay is None:
         return Response(b"", status_code=404)
 
     # increment replay views for this score
     if score.player is not None and player.id != score.player.id:
-        app.state.loop.create_task(score.increment_replay_views())  # type: ignore[unused-awaitable]
+        score.increment_replay_views()
 
-    return FileResponse(file)
+    return StreamingResponse(
+        replay.iter_chunks(),
+        media_type="application/octet-stream",
+        headers={"Content-Length": str(replay.size)},
+    )
 
 
 @router.get("/web/osu-rate.php")
@@ -1810,11 +1835,10 @@ async def osuRate(
     if rating is None:
         # check if we have the map in our cache;
         # if not, the map probably doesn't exist.
-        if map_md5 not in app.state.cache.beatmap:
+        cached = app.usecases.beatmap_cache.get_map(map_md5)
+        if cached is None:
             return Response(b"no exist")
 
-        cached = app.state.cache.beatmap[map_md5]
-
         # only allow rating on maps with a leaderboard.
         if cached.status < RankedStatus.Ranked:
             return Response(b"not ranked")
@@ -1833,107 +1857,6 @@ async def osuRate(
     return Response(f"alreadyvoted\n{avg}".encode())
 
 
-@unique
-@pymysql_encode(escape_enum)
-class LeaderboardType(IntEnum):
-    Local = 0
-    Top = 1
-    Mods = 2
-    Friends = 3
-    Country = 4
-
-
-async def get_leaderboard_scores(
-    leaderboard_type: LeaderboardType | int,
-    map_md5: str,
-    mode: int,
-    mods: Mods,
-    player: Player,
-    scoring_metric: Literal["pp", "score"],
-) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
-    query = [
-        f"SELECT s.id, s.{scoring_metric} AS _score, "
-        "s.max_combo, s.n50, s.n100, s.n300, "
-        "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
-        "UNIX_TIMESTAMP(s.play_time) time, u.id userid, "
-        "COALESCE(CONCAT('[', c.tag, '] ', u.name), u.name) AS name "
-        "FROM scores s "
-        "INNER JOIN users u ON u.id = s.userid "
-        "LEFT JOIN clans c ON c.id = u.clan_id "
-        "WHERE s.map_md5 = :map_md5 AND s.status = 2 "  # 2: =best score
-        "AND (u.priv & 1 OR u.id = :user_id) AND mode = :mode",
-    ]
-
-    params: dict[str, Any] = {
-        "map_md5": map_md5,
-        "user_id": player.id,
-        "mode": mode,
-    }
-
-    if leaderboard_type == LeaderboardType.Mods:
-        query.append("AND s.mods = :mods")
-        params["mods"] = mods
-    elif leaderboard_type == LeaderboardType.Friends:
-        query.append("AND s.userid IN :friends")
-        params["friends"] = player.friends | {player.id}
-    elif leaderboard_type == LeaderboardType.Country:
-        query.append("AND u.country = :country")
-        params["country"] = player.geoloc["country"]["acronym"]
-
-    # TODO: customizability of the number of scores
-    query.append("ORDER BY _score DESC LIMIT 50")
-
-    score_rows = await app.state.services.database.fetch_all(
-        " ".join(query),
-        params,
-    )
-
-    if score_rows:  # None or []
-        # fetch player's personal best score
-        personal_best_score_row = await app.state.services.database.fetch_one(
-            f"SELECT id, {scoring_metric} AS _score, "
-            "max_combo, n50, n100, n300, "
-            "nmiss, nkatu, ngeki, perfect, mods, "
-            "UNIX_TIMESTAMP(play_time) time "
-            "FROM scores "
-            "WHERE map_md5 = :map_md5 AND mode = :mode "
-            "AND userid = :user_id AND status = 2 "
-            "ORDER BY _score DESC LIMIT 1",
-            {"map_md5": map_md5, "mode": mode, "user_id": player.id},
-        )
-
-        if personal_best_score_row is not None:
-            # calculate the rank of the score.
-            p_best_rank = 1 + await app.state.services.database.fetch_val(
-                "SELECT COUNT(*) FROM scores s "
-                "INNER JOIN users u ON u.id = s.userid "
-                "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
-                "AND s.status = 2 AND u.priv & 1 "
-                f"AND s.{scoring_metric} > :score",
-                {
-                    "map_md5": map_md5,
-                    "mode": mode,
-                    "score": personal_best_score_row["_score"],
-                },
-                column=0,  # COUNT(*)
-            )
-
-            # attach rank to personal best row
-            personal_best_score_row["rank"] = p_best_rank
-    else:
-        score_rows = []
-        personal_best_score_row = None
-
-    return score_rows, personal_best_score_row
-
-
-SCORE_LISTING_FMTSTR = (
-    "{id}|{name}|{score}|{max_combo}|"
-    "{n50}|{n100}|{n300}|{nmiss}|{nkatu}|{ngeki}|"
-    "{perfect}|{mods}|{userid}|{rank}|{time}|{has_replay}"
-)
-
-
 @router.get("/web/osu-osz2-getscores.php")
 async def getScores(
     player: Player = Depends(authenticate_player_session(Query, "us", "ha")),
@@ -1954,9 +1877,9 @@ async def getScores(
 
     # check if this md5 has already been  cached as
     # unsubmitted/needs update to reduce osu!api spam
-    if map_md5 in app.state.cache.unsubmitted:
+    if app.usecases.beatmap_cache.is_unsubmitted(map_md5):
         return Response(b"-1|false")
-    if map_md5 in app.state.cache.needs_update:
+    if app.usecases.beatmap_cache.needs_update(map_md5):
         return Response(b"1|false")
 
     if mods_arg & Mods.RELAX:
@@ -1973,21 +1896,22 @@ async def getScores(
     mods = Mods(mods_arg)
     mode = GameMode(mode_arg)
 
-    row = await app.state.services.database.fetch_one(
-        "SELECT ingame_settings FROM users WHERE id = :user_id",
-        {"user_id": player.id},
-    )
-    user_settings = row["ingame_settings"] or {}
-    if isinstance(user_settings, str):
-        import orjson
-        user_settings = orjson.loads(user_settings)
-
-    legacy_rxap_score = (
-        user_settings.get("leaderboard", {})
-        .get("legacy-rxap-score", False)
-    )
-
     if mods & (Mods.RELAX | Mods.AUTOPILOT):
+        # the in-game settings only affect rx/ap leaderboards
+        row = await app.state.services.database.fetch_one(
+            "SELECT ingame_settings FROM users WHERE id = :user_id",
+            {"user_id": player.id},
+        )
+        user_settings = row["ingame_settings"] or {}
+        if isinstance(user_settings, str):
+            import orjson
+            user_settings = orjson.loads(user_settings)
+
+        legacy_rxap_score = (
+            user_settings.get("leaderboard", {})
+            .get("legacy-rxap-score", False)
+        )
+
         scoring_metric: Literal["pp", "score"] = "score" if legacy_rxap_score else "pp"
     else:
         scoring_metric: Literal["pp", "score"] = "score"
@@ -1998,6 +1922,7 @@ async def getScores(
     if mode != player.status.mode:
         player.status.mods = mods
         player.status.mode = mode
+        player.invalidate_packets()
 
         if not player.restricted:
             app.state.sessions.players.enqueue(app.packets.user_stats(player))
@@ -2012,7 +1937,7 @@ async def getScores(
 
         if has_set_id and map_set_id not in app.state.cache.beatmapset:
             # set not cached, it doesn't exist
-            app.state.cache.unsubmitted.add(map_md5)
+            app.usecases.beatmap_cache.mark_unsubmitted(map_md5)
             return Response(b"-1|false")
 
         map_filename = unquote_plus(map_filename)  # TODO: is unquote needed?
@@ -2039,13 +1964,13 @@ async def getScores(
 
         if map_exists:
             # map can be updated.
-            app.state.cache.needs_update.add(map_md5)
+            app.usecases.beatmap_cache.mark_needs_update(map_md5)
             return Response(b"1|false")
         else:
             # map is unsubmitted.
             # add this map to the unsubmitted cache, so
             # that we don't have to make this request again.
-            app.state.cache.unsubmitted.add(map_md5)
+            app.usecases.beatmap_cache.mark_unsubmitted(map_md5)
             return Response(b"-1|false")
 
     # we've found a beatmap for the request.
@@ -2062,19 +1987,20 @@ async def getScores(
         return Response(f"{int(bmap.status)}|false".encode())
 
     # fetch scores & personal best
-    # TODO: create a leaderboard cache
     if not requesting_from_editor_song_select:
-        score_rows, personal_best_score_row = await get_leaderboard_scores(
-            leaderboard_type,
-            bmap.md5,
-            mode,
-            mods,
-            player,
-            scoring_metric,
+        score_listings, personal_best_listing = (
+            await app.usecases.leaderboards.fetch_score_listings(
+                leaderboard_type,
+                bmap.md5,
+                mode,
+                mods,
+                player,
+                scoring_metric,
+            )
         )
     else:
-        score_rows = []
-        personal_best_score_row = None
+        score_listings = []
+        personal_best_listing = None
 
     # fetch beatmap rating
     map_avg_rating = await ratings_repo.get_map_rating(map_md5=map_md5)
@@ -2084,50 +2010,18 @@ async def getScores(
     response_lines: list[str] = [
         # NOTE: fa stands for featured artist (for the ones that may not know)
         # {ranked_status}|{serv_has_osz2}|{bid}|{bsid}|{len(scores)}|{fa_track_id}|{fa_license_text}
-        f"{int(bmap.status)}|false|{bmap.id}|{bmap.set_id}|{len(score_rows)}|0|",
+        f"{int(bmap.status)}|false|{bmap.id}|{bmap.set_id}|{len(score_listings)}|0|",
         # {offset}\n{beatmap_name}\n{rating}
         # TODO: server side beatmap offsets
         f"0\n{bmap.full_name}\n{map_avg_rating}",
     ]
 
-    if not score_rows:
+    if not score_listings:
         response_lines.extend(("", ""))  # no scores, no personal best
         return Response("\n".join(response_lines).encode())
 
-    if personal_best_score_row is not None:
-        user_clan = (
-            await clans_repo.fetch_one(id=player.clan_id)
-            if player.clan_id is not None
-            else None
-        )
-        display_name = (
-            f"[{user_clan['tag']}] {player.name}"
-            if user_clan is not None
-            else player.name
-        )
-        response_lines.append(
-            SCORE_LISTING_FMTSTR.format(
-                **personal_best_score_row,
-                name=display_name,
-                userid=player.id,
-                score=int(round(personal_best_score_row["_score"])),
-                has_replay="1",
-            ),
-        )
-    else:
-        response_lines.append("")
-
-    response_lines.extend(
-        [
-            SCORE_LISTING_FMTSTR.format(
-                **s,
-                score=int(round(s["_score"])),
-                has_replay="1",
-                rank=idx + 1,
-            )
-            for idx, s in enumerate(score_rows)
-        ],
-    )
+    response_lines.append(personal_best_listing or "")
+    response_lines.extend(score_listings)
 
     return Response("\n".join(response_lines).encode())
 
@@ -2527,8 +2421,7 @@ async def register_account(
         # they want to register the account now.
         # make the md5 & bcrypt the md5 for sql.
         pw_md5 = hashlib.md5(pw_plaintext.encode()).hexdigest().encode()
-        pw_bcrypt = bcrypt.hashpw(pw_md5, bcrypt.gensalt())
-        app.state.cache.bcrypt[pw_bcrypt] = pw_md5  # cache result for login
+        pw_bcrypt = await app.usecases.passwords.hash_password(pw_md5)
 
         ip = app.state.services.ip_resolver.get_ip(request.headers)
 
@@ -29,6 +29,11 @@ from .start import *
 import app.bg_loops
 import app.settings
 import app.state
+import app.usecases.beatmap_cache
+import app.usecases.chat_log
+import app.usecases.passwords
+import app.usecases.performance
+import app.usecases.write_behind
 import app.utils
 from app.api import api_router  # type: ignore[attr-defined]
 from app.api import domains
@@ -92,7 +97,8 @@ async def lifespan(asgi_app: BanchoAPI) -> AsyncIterator[None]:
 
     await start_pubsub_recievers()
 
-    if(app.settings.ENABLE_IRC):
+    # (the irc server is only run by the first worker)
+    if(app.settings.ENABLE_IRC and app.settings.WORKER_ID == 0):
         loop = asyncio.get_event_loop()
 
         app.state.services.irc = IRCServer(
@@ -113,15 +119,23 @@ async def lifespan(asgi_app: BanchoAPI) -> AsyncIterator[None]:
 
     app.state.services.ip_resolver = app.state.services.IPResolver()
 
+    app.usecases.performance.start_workers()
+    app.usecases.passwords.start_workers()
+
     await app.state.services.run_sql_migrations()
 
     await collections.initialize_ram_caches()
 
+    await app.state.sessions.backend.start()
+
+    app.usecases.beatmap_cache.load_snapshot()
+
     await app.bg_loops.initialize_housekeeping_tasks()
 
     log("Startup process complete.", Ansi.LGREEN)
+    port = app.settings.APP_PORT + app.settings.WORKER_ID
     log(
-        f"Listening @ {app.settings.APP_HOST}:{app.settings.APP_PORT}",
+        f"Listening @ {app.settings.APP_HOST}:{port}",
         Ansi.LMAGENTA,
     )
 
@@ -131,8 +145,21 @@ async def lifespan(asgi_app: BanchoAPI) -> AsyncIterator[None]:
     # and shut down any of the housekeeping tasks running in the background.
     await app.state.sessions.cancel_housekeeping_tasks()
 
+    await app.state.sessions.backend.stop()
+
+    # write any remaining coalesced updates before disconnecting from sql
+    await app.usecases.write_behind.flush()
+
+    # & any buffered chat messages to the chat log
+    await app.usecases.chat_log.flush()
+
+    await app.usecases.beatmap_cache.save_snapshot()
+
     # shutdown services
 
+    await asyncio.to_thread(app.usecases.performance.shutdown_workers)
+    await asyncio.to_thread(app.usecases.passwords.shutdown_workers)
+
     await app.state.services.http_client.aclose()
     await app.state.services.database.disconnect()
     await app.state.services.redis.aclose()
@@ -160,6 +187,7 @@ def init_exception_handlers(asgi_app: BanchoAPI) -> None:
 
 def init_middlewares(asgi_app: BanchoAPI) -> None:
     """Initialize our app's middleware stack."""
+    asgi_app.add_middleware(middlewares.WorkerRoutingMiddleware)
     asgi_app.add_middleware(middlewares.MetricsMiddleware)
     asgi_app.add_middleware(middlewares.RateLimitMiddleware)
 
@@ -12,6 +12,7 @@ import app.packets
 import app.settings
 import app.state
 import app.settings
+import app.usecases.chat_log
 from app import commands
 from app.logging import Ansi
 from app.logging import log
@@ -504,11 +505,8 @@ class IRCClient:
                         )
             else:
                 await channel.send(message, fro)
-                log(
-                    f"{fro} @ {channel}: {message}",
-                    Ansi.LCYAN,
-                    file=".data/logs/chat.log",
-                )
+                log(f"{fro} @ {channel}: {message}", Ansi.LCYAN)
+                app.usecases.chat_log.write(fro, channel, message)
         else:
             recipient = await app.state.sessions.players.from_cache_or_sql(
                 name=make_safe_name(to),
@@ -530,11 +528,8 @@ class IRCClient:
                         await fro.send_bot(cmd["resp"])
             else:
                 await recipient.send(message, fro)
-                log(
-                    f"{fro} @ {recipient}: {message}",
-                    Ansi.LCYAN,
-                    file=".data/logs/chat.log",
-                )
+                log(f"{fro} @ {recipient}: {message}", Ansi.LCYAN)
+                app.usecases.chat_log.write(fro, recipient, message)
  
         return 1
  
@@ -8,10 +8,35 @@ from starlette.requests import Request
 from starlette.responses import Response
 
 import app
+import app.settings
+import app.state
 from app.logging import Ansi
 from app.logging import log
 from app.logging import magnitude_fmt_time
 
+# set on requests forwarded between workers, to the id of the forwarding worker
+FORWARDED_HEADER = "bancho-forwarded-by"
+
+# headers which describe the connection (or encoding) of a
+# forwarded request or response, rather than its contents
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        "connection",
+        "keep-alive",
+        "transfer-encoding",
+        "content-length",
+        "content-encoding",
+    ),
+)
+
+
+class SessionOnOtherWorker(Exception):
+    """Raised when a request is from a user logged in to another worker."""
+
+    def __init__(self, worker_id: int) -> None:
+        super().__init__(worker_id)
+        self.worker_id = worker_id
+
 
 class MetricsMiddleware(BaseHTTPMiddleware):
     async def dispatch(
@@ -76,4 +101,67 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         # Call the next middleware
         response = await call_next(request)
 
-        return response
\ No newline at end of file
+        return response
+
+
+class WorkerRoutingMiddleware(BaseHTTPMiddleware):
+    """\
+    Forwards osu! web requests to the worker which a user is logged in to.
+
+    osu! web requests (score submission, leaderboards, replays, etc.) don't
+    include the user's osu-token, so they can't be routed by the load balancer;
+    the endpoints raise `SessionOnOtherWorker` for users on other workers,
+    and the request is forwarded to that worker, where the user's state is.
+    """
+
+    async def dispatch(
+        self,
+        request: Request,
+        call_next: RequestResponseEndpoint,
+    ) -> Response:
+        host = request.headers.get("host", "")
+        if not app.state.sessions.backend.distributed or not host.startswith("osu."):
+            return await call_next(request)
+
+        # (read up front, as it may need to be forwarded after it's been parsed)
+        body = await request.body()
+
+        try:
+            return await call_next(request)
+        except SessionOnOtherWorker as exc:
+            return await self.forward(request, body, exc.worker_id)
+
+    async def forward(self, request: Request, body: bytes, worker_id: int) -> Response:
+        # each worker listens on APP_PORT + its id (see main.py)
+        worker_host = app.settings.APP_HOST
+        if worker_host == "0.0.0.0":
+            worker_host = "127.0.0.1"
+
+        port = app.settings.APP_PORT + worker_id
+        url = f"http://{worker_host}:{port}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+
+        headers = [
+            (key, value)
+            for key, value in request.headers.items()
+            if key not in HOP_BY_HOP_HEADERS
+        ]
+        headers.append((FORWARDED_HEADER, str(app.settings.WORKER_ID)))
+
+        response = await app.state.services.http_client.request(
+            request.method,
+            url,
+            headers=headers,
+            content=body,
+        )
+
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={
+                key: value
+                for key, value in response.headers.items()
+                if key not in HOP_BY_HOP_HEADERS
+            },
+        )
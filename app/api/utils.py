@@ -1,5 +1,7 @@
 import time
 import app
+import app.usecases.best_scores
+import app.usecases.leaderboards
 from app.constants.gamemodes import GameMode
 from app.constants.privileges import Privileges
 from app.objects.beatmap import Beatmap, ensure_osu_file_is_available
@@ -27,6 +29,9 @@ async def wipe_user(id: int, mode: GameMode) -> str:
     
     await app.state.services.database.execute("DELETE FROM scores WHERE userid = :user_id AND mode = :mode",
         {"user_id": id, "mode": mode},)
+
+    app.usecases.best_scores.invalidate_user(id)
+    app.usecases.leaderboards.invalidate_user(id)
     
     await app.state.services.database.execute(
         """
@@ -102,6 +107,8 @@ async def change_user_flag(id: int, flag: str) -> str:
         {"country": flag.lower(), "user_id": id},
     )
 
+    app.usecases.leaderboards.invalidate_user(id)
+
     for mode in GameMode:
         modequery = await app.state.services.database.fetch_one(
             "SELECT pp FROM stats WHERE id = :id AND mode = :mode",
@@ -130,7 +137,8 @@ async def change_user_name(id: int, name: str) -> str:
         {"name": name, "user_id": id},
     )
 
-    target.name = name
+    app.state.sessions.players.rename(target, name)
+    app.usecases.leaderboards.invalidate_user(id)
 
     if target.is_online:
         target.logout()
@@ -155,6 +163,9 @@ async def change_bm_status(beatmap_id: int, status: int, frozen: bool) -> str:
     beatmap.status = status
     beatmap.frozen = frozen
 
+    # players' totals only include scores on ranked & approved maps
+    app.usecases.best_scores.clear()
+
     return "success"
 
 async def restrict(id: int, userId: int, reason: str) -> str:
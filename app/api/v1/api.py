@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import hashlib
 import struct
+from collections.abc import AsyncIterator
 from pathlib import Path as SystemPath
 from typing import Literal
 from urllib.parse import quote
@@ -14,17 +15,20 @@ from fastapi import status
 from fastapi.param_functions import Query
 from fastapi.responses import ORJSONResponse
 from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials as HTTPCredentials
 from fastapi.security import HTTPBearer
 
 import app.packets
 import app.state
 import app.usecases.performance
+import app.usecases.replays
 from app.constants import regexes
 from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
 from app.objects.beatmap import Beatmap
 from app.objects.beatmap import ensure_osu_file_is_available
+from app.objects.match import MAX_MATCH_ID
 from app.repositories import clans as clans_repo
 from app.repositories import scores as scores_repo
 from app.repositories import stats as stats_repo
@@ -35,7 +39,6 @@ from app.usecases.performance import ScoreParams
 
 AVATARS_PATH = SystemPath.cwd() / ".data/avatars"
 BEATMAPS_PATH = SystemPath.cwd() / ".data/osu"
-REPLAYS_PATH = SystemPath.cwd() / ".data/osr"
 SCREENSHOTS_PATH = SystemPath.cwd() / ".data/ss"
 
 
@@ -125,8 +128,9 @@ async def api_calculate_pp(
             ),
         )
 
-    results = app.usecases.performance.calculate_performances(
-        str(BEATMAPS_PATH / f"{beatmap.id}.osu"),
+    results = await app.usecases.performance.calculate_performances_async(
+        beatmap.id,
+        beatmap.md5,
         scores,
     )
 
@@ -762,21 +766,21 @@ async def api_get_replay(
     the player's total replay views.
     """
     # fetch replay file & make sure it exists
-    replay_file = REPLAYS_PATH / f"{score_id}.osr"
-    if not replay_file.exists():
+    replay = await app.usecases.replays.find(score_id)
+    if replay is None:
         return ORJSONResponse(
             {"status": "Replay not found."},
             status_code=status.HTTP_404_NOT_FOUND,
         )
-    # read replay frames from file
-    raw_replay_data = replay_file.read_bytes()
     if not include_headers:
-        return Response(
-            bytes(raw_replay_data),
+        # stream replay frames from file
+        return StreamingResponse(
+            replay.iter_chunks(),
             media_type="application/octet-stream",
             headers={
                 "Content-Description": "File Transfer",
                 "Content-Disposition": "attachment; filename=\"replay.osr\"",
+                "Content-Length": str(replay.size),
             },
         )
     # add replay headers from sql
@@ -794,6 +798,7 @@ async def api_get_replay(
     )
     if not row:
         # score not found in sql
+        replay.close()
         return ORJSONResponse(
             {"status": "Score not found."},
             status_code=status.HTTP_404_NOT_FOUND,
@@ -844,12 +849,17 @@ async def api_get_replay(
     timestamp = int(row["play_time"].timestamp() * 1e7)
     replay_data += struct.pack("<q", timestamp + DATETIME_OFFSET)
 
-    # pack the raw replay data into the buffer
-    replay_data += struct.pack("<i", len(raw_replay_data))
-    replay_data += raw_replay_data
+    # the raw replay data follows the headers, streamed from file
+    replay_data += struct.pack("<i", replay.size)
 
     # pack additional info buffer
-    replay_data += struct.pack("<q", score_id)
+    additional_info = struct.pack("<q", score_id)
+
+    async def iter_replay_chunks() -> AsyncIterator[bytes]:
+        yield bytes(replay_data)
+        async for chunk in replay.iter_chunks():
+            yield chunk
+        yield additional_info
 
     def format_filename_rfc5987(params):
         """Format filename according to RFC 5987 for proper Unicode support."""
@@ -864,21 +874,24 @@ async def api_get_replay(
         return f"attachment; filename=\"{ascii_filename}\"; filename*={utf8_filename}"
 
     # stream data back to the client
-    return Response(
-        bytes(replay_data),
+    return StreamingResponse(
+        iter_replay_chunks(),
         media_type="application/octet-stream",
         headers={
             "Content-Description": "File Transfer",
             "Content-Disposition": format_filename_rfc5987(row),
+            "Content-Length": str(
+                len(replay_data) + replay.size + len(additional_info),
+            ),
         },
     )
 
 @router.get("/get_match")
 async def api_get_match(
-    match_id: int = Query(..., alias="id", ge=1, le=64),
+    match_id: int = Query(..., alias="id", ge=0, le=MAX_MATCH_ID),
 ) -> Response:
     """Return information of a given multiplayer match."""
-    match = app.state.sessions.matches[match_id]
+    match = app.state.sessions.matches.get(match_id)
     if not match:
         return ORJSONResponse(
             {"status": "Match not found."},
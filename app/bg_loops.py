@@ -3,9 +3,13 @@ from __future__ import annotations
 import asyncio
 import time
 
+import app.metrics
 import app.packets
 import app.settings
 import app.state
+import app.usecases.beatmap_cache
+import app.usecases.chat_log
+import app.usecases.write_behind
 from app.constants.privileges import Privileges
 from app.logging import Ansi
 from app.logging import log
@@ -26,6 +30,11 @@ async def initialize_housekeeping_tasks() -> None:
                 _remove_expired_donation_privileges(interval=30 * 60),
                 _update_bot_status(interval=5 * 60),
                 _disconnect_ghosts(interval=OSU_CLIENT_MIN_PING_INTERVAL // 3),
+                _flush_write_behind(interval=app.settings.WRITE_BEHIND_FLUSH_INTERVAL),
+                _evict_expired_beatmaps(interval=5 * 60),
+                _update_packet_queue_metrics(interval=15),
+                _broadcast_channel_player_counts(interval=5),
+                _flush_chat_log(interval=1),
             )
         },
     )
@@ -76,10 +85,15 @@ async def _disconnect_ghosts(interval: int) -> None:
         await asyncio.sleep(interval)
         current_time = time.time()
 
-        for player in app.state.sessions.players:
+        # (copied, as logging out removes players from the list)
+        for player in list(app.state.sessions.players):
             if current_time - player.last_recv_time > OSU_CLIENT_MIN_PING_INTERVAL:
                 log(f"Auto-dced {player}.", Ansi.LMAGENTA)
                 player.logout()
+            elif player.packet_queue_overflowed and not player.irc_client:
+                # (irc clients aren't sent packets from their queue)
+                log(f"Auto-dced {player} (packet queue overflowed).", Ansi.LMAGENTA)
+                player.logout()
 
 
 async def _update_bot_status(interval: int) -> None:
@@ -87,3 +101,47 @@ async def _update_bot_status(interval: int) -> None:
     while True:
         await asyncio.sleep(interval)
         app.packets.bot_stats.cache_clear()
+        app.state.sessions.players.update_login_packets(app.state.sessions.bot)
+
+
+async def _flush_write_behind(interval: int) -> None:
+    """Write coalesced bookkeeping updates (latest activity,
+    replay views, map plays & passes) to sql in batches."""
+    while True:
+        await asyncio.sleep(interval)
+        await app.usecases.write_behind.flush()
+
+
+async def _evict_expired_beatmaps(interval: int) -> None:
+    """Evict beatmap sets which haven't been used in a while from the cache."""
+    while True:
+        await asyncio.sleep(interval)
+        app.usecases.beatmap_cache.evict_expired()
+
+
+async def _update_packet_queue_metrics(interval: int) -> None:
+    """Report the sizes of the online players' packet queues."""
+    while True:
+        await asyncio.sleep(interval)
+
+        queue_sizes = [
+            player.packet_queue_size for player in app.state.sessions.players
+        ]
+        app.metrics.gauge("ex_packet_queue_bytes", sum(queue_sizes))
+        app.metrics.gauge("ex_packet_queue_max_bytes", max(queue_sizes, default=0))
+
+
+async def _broadcast_channel_player_counts(interval: int) -> None:
+    """Send channels' changed playercounts to the players who can see them,
+    in batches, rather than to every player on each join & leave."""
+    while True:
+        await asyncio.sleep(interval)
+        await app.state.sessions.channels.broadcast_player_counts()
+
+
+async def _flush_chat_log(interval: int) -> None:
+    """Write buffered chat messages to the chat log in batches,
+    rather than opening & writing to it for each message."""
+    while True:
+        await asyncio.sleep(interval)
+        await app.usecases.chat_log.flush()
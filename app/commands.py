@@ -40,6 +40,9 @@ import app.logging
 import app.packets
 import app.settings
 import app.state
+import app.usecases.beatmap_cache
+import app.usecases.best_scores
+import app.usecases.leaderboards
 import app.usecases.performance
 import app.utils
 from app.constants import regexes
@@ -334,6 +337,7 @@ async def changename(ctx: Context) -> str | None:
 
     # all checks passed, update their name
     await users_repo.partial_update(ctx.player.id, name=name)
+    app.usecases.leaderboards.invalidate_user(ctx.player.id)
 
     ctx.player.enqueue(
         app.packets.notification(f"Your username has been changed to {name}!"),
@@ -566,8 +570,9 @@ async def _with(ctx: Context) -> str | None:
         score_args.acc = acc
         msg_fields.append(f"{acc:.2f}%")
 
-    result = app.usecases.performance.calculate_performances(
-        osu_file_path=str(BEATMAPS_PATH / f"{bmap.id}.osu"),
+    result = await app.usecases.performance.calculate_performances_async(
+        beatmap_id=bmap.id,
+        beatmap_md5=bmap.md5,
         scores=[score_args],  # calculate one score
     )
 
@@ -737,7 +742,7 @@ async def _map(ctx: Context) -> str | None:
                 await maps_repo.partial_update(_bmap.id, status=new_status, frozen=True)
 
             # make sure cache and db are synced about the newest change
-            for _bmap in app.state.cache.beatmapset[bmap.set_id].maps:
+            for _bmap in bmap.set.maps:
                 _bmap.status = new_status
                 _bmap.frozen = True
 
@@ -763,6 +768,12 @@ async def _map(ctx: Context) -> str | None:
 
         # deactivate rank requests for all ids
         await map_requests_repo.mark_batch_as_inactive(map_ids=modified_beatmap_ids)
+
+    # (every worker's cached maps are refetched with their new statuses)
+    app.usecases.beatmap_cache.invalidate_set(bmap.set_id)
+
+    # players' totals only include scores on ranked & approved maps
+    app.usecases.best_scores.clear()
     pubsub = app.state.services.redis.pubsub()
     data = json.dumps({
         "map_ids": modified_beatmap_ids,
@@ -1467,6 +1478,8 @@ async def wipemap(ctx: Context) -> str | None:
         "DELETE FROM scores WHERE map_md5 = :map_md5",
         {"map_md5": map_md5},
     )
+    app.usecases.best_scores.clear()
+    app.usecases.leaderboards.invalidate_map(map_md5)
 
     return "Scores wiped."
 
@@ -2114,7 +2127,7 @@ async def mp_host(ctx: Context, match: Match) -> str | None:
     if target not in {slot.player for slot in match.slots}:
         return "Found no such player in the match."
 
-    match.host_id = target.id
+    app.state.sessions.matches.set_host(match, target.id)
 
     match.host.enqueue(app.packets.match_transfer_host())
     match.enqueue_state(lobby=True)
@@ -2855,6 +2868,7 @@ async def clan_create(ctx: Context) -> str | None:
         clan_id=new_clan["id"],
         clan_priv=ClanPrivileges.Owner,
     )
+    app.usecases.leaderboards.invalidate_user(ctx.player.id)
 
     # announce clan creation
     announce_chan = app.state.sessions.channels.get_by_name("#announce")
@@ -2895,6 +2909,8 @@ async def clan_disband(ctx: Context) -> str | None:
         update(users_repo.UsersTable).where(users_repo.UsersTable.clan_id == clan["id"]).values(clan_id=0, clan_priv=0)
     )
     for member_id in clan_member_ids:
+        app.usecases.leaderboards.invalidate_user(member_id)
+
         member = app.state.sessions.players.get(id=member_id)
         if member:
             member.clan_id = None
@@ -2947,6 +2963,7 @@ async def clan_leave(ctx: Context) -> str | None:
     clan_members = await users_repo.fetch_many(clan_id=clan["id"])
 
     await users_repo.partial_update(ctx.player.id, clan_id=0, clan_priv=0)
+    app.usecases.leaderboards.invalidate_user(ctx.player.id)
     ctx.player.clan_id = None
     ctx.player.clan_priv = None
 
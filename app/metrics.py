@@ -12,6 +12,27 @@ METRICS = {
     "ex_first_place_webhook": Counter("ex_first_place_webhook", "First place webhooks send"),
     "ex_chat_messages": Counter("ex_chat_messages", "Total number of chat messages sent"),
     "ex_logins": Counter("ex_logins", "Total number of logins"),
+    "ex_pp_calc_queue_depth": Gauge("ex_pp_calc_queue_depth_g", "Number of pp calculations queued or running"),
+    "ex_pp_calc_time": Histogram("ex_pp_calc_time", "PP calculation latency in seconds (including queueing)"),
+    "ex_beatmap_cache_hits": Counter("ex_beatmap_cache_hits", "Total number of beatmap cache hits"),
+    "ex_beatmap_cache_misses": Counter("ex_beatmap_cache_misses", "Total number of beatmap cache misses"),
+    "ex_beatmap_cache_evictions": Counter("ex_beatmap_cache_evictions", "Total number of beatmap sets evicted from the cache"),
+    "ex_beatmap_cache_sets": Gauge("ex_beatmap_cache_sets_g", "Number of beatmap sets currently cached"),
+    "ex_beatmap_cache_memory": Gauge("ex_beatmap_cache_memory_g", "Estimated memory usage of the beatmap cache in bytes"),
+    "ex_spectator_relay_bytes": Counter("ex_spectator_relay_bytes", "Total bytes of replay frames relayed to spectators"),
+    "ex_spectator_frames_dropped": Counter("ex_spectator_frames_dropped", "Total number of replay frame bundles dropped for lagging spectators"),
+    "ex_packet_queue_overflows": Counter("ex_packet_queue_overflows", "Total number of times a player's packet queue overflowed"),
+    "ex_packet_queue_dropped_chunks": Counter("ex_packet_queue_dropped_chunks", "Total number of queued packet chunks dropped due to overflow"),
+    "ex_packet_queue_replaced_packets": Counter("ex_packet_queue_replaced_packets", "Total number of queued stats & presence packets replaced by newer ones"),
+    "ex_packet_queue_bytes": Gauge("ex_packet_queue_bytes_g", "Total bytes queued to be sent to online players"),
+    "ex_packet_queue_max_bytes": Gauge("ex_packet_queue_max_bytes_g", "Bytes queued to be sent to the online player with the largest queue"),
+    "ex_bcrypt_time": Histogram("ex_bcrypt_time", "bcrypt check & hash latency in seconds (including queueing)"),
+    "ex_bcrypt_pending_checks": Gauge("ex_bcrypt_pending_checks_g", "Number of bcrypt password checks queued or running"),
+    "ex_bcrypt_checks_rejected": Counter("ex_bcrypt_checks_rejected", "Total number of logins turned away as too many password checks were queued"),
+    "ex_login_auth_time": Histogram("ex_login_auth_time", "Login authentication (user lookup & password check) latency in seconds"),
+    "ex_login_checks_time": Histogram("ex_login_checks_time", "Login client & hardware checks latency in seconds"),
+    "ex_login_setup_time": Histogram("ex_login_setup_time", "Login session setup (geolocation, stats & packets) latency in seconds"),
+    "ex_chat_log_dropped_messages": Counter("ex_chat_log_dropped_messages", "Total number of chat messages dropped from a full chat log buffer"),
 }
 
 enabled = app.settings.ENABLE_PROMETHEUS
@@ -21,15 +42,18 @@ def start_metrics_server():
     if not enabled:
         return
 
+    # each worker serves its own metrics, from PROMETHEUS_PORT upwards
+    port = app.settings.PROMETHEUS_PORT + app.settings.WORKER_ID
+
     log(
-        f"Starting metrics server on 127.0.0.1:{app.settings.PROMETHEUS_PORT}",
+        f"Starting metrics server on 127.0.0.1:{port}",
         Ansi.LYELLOW,
     )
 
-    start_http_server(app.settings.PROMETHEUS_PORT)
+    start_http_server(port)
 
-def increment(metric: str):
-    """Increments the specified metric by 1."""
+def increment(metric: str, amount: float = 1):
+    """Increments the specified metric by `amount` (1 by default)."""
     if not enabled:
         return
 
@@ -37,7 +61,7 @@ def increment(metric: str):
     if metric_object is None:
         raise ValueError(f"Invalid metric name: {metric}")
 
-    metric_object.inc()
+    metric_object.inc(amount)
 
 def decrement(metric: str):
     """Decrements the specified metric by 1."""
@@ -59,4 +83,15 @@ def histrogram(metric: str, value: float):
     if metric_object is None:
         raise ValueError(f"Invalid metric name: {metric}")
 
-    metric_object.observe(value)
\ No newline at end of file
+    metric_object.observe(value)
+
+def gauge(metric: str, value: float) -> None:
+    """Sets the specified gauge metric to a value."""
+    if not enabled:
+        return
+
+    metric_object = METRICS.get(metric)
+    if not isinstance(metric_object, Gauge):
+        raise ValueError(f"Invalid gauge metric name: {metric}")
+
+    metric_object.set(value)
@@ -7,5 +7,8 @@ from . import channel
 from . import collections
 from . import match
 from . import models
+from . import packet_queue
 from . import player
 from . import score
+from . import session_backend
+from . import spectator_relay
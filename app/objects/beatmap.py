@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import functools
 import hashlib
+import os
+import time
+from collections import OrderedDict
 from collections import defaultdict
+from collections.abc import Callable
+from collections.abc import Coroutine
 from collections.abc import Mapping
 from datetime import datetime
 from datetime import timedelta
@@ -11,6 +17,7 @@ from enum import unique
 from pathlib import Path
 from typing import Any
 from typing import TypedDict
+from typing import TypeVar
 
 import httpx
 from tenacity import retry
@@ -18,6 +25,9 @@ from tenacity.stop import stop_after_attempt
 
 import app.settings
 import app.state
+import app.usecases.beatmap_cache
+import app.usecases.best_scores
+import app.usecases.leaderboards
 import app.utils
 from app.constants.gamemodes import GameMode
 from app.logging import Ansi
@@ -34,6 +44,27 @@ DEFAULT_LAST_UPDATE = datetime(1970, 1, 1)
 
 IGNORED_BEATMAP_CHARS = dict.fromkeys(map(ord, r':\/*<>?"|'), None)
 
+T = TypeVar("T")
+
+# resolutions currently in progress, shared between concurrent callers.
+# keys are ("md5", md5), ("bid", bid), ("bsid", bsid), ("update", bsid)
+# or ("osu_file", bid).
+_in_flight: dict[tuple[str, str | int], asyncio.Task[Any]] = {}
+
+# resolutions which recently found nothing; {key: expiry}
+_not_found: dict[tuple[str, str | int], float] = {}
+
+# expired entries are purged from `_not_found` once it grows this large
+MAX_NOT_FOUND_ENTRIES = 4096
+
+# the version of an .osu file on disk; (mtime_ns, size, md5)
+OsuFileVersion = tuple[int, int, str]
+
+# .osu files' versions when they were last hashed (or written), so they're
+# only re-hashed when changed on disk; lru, {beatmap_id: version}
+_osu_file_versions: OrderedDict[int, OsuFileVersion] = OrderedDict()
+MAX_CACHED_OSU_FILE_VERSIONS = 100_000
+
 
 class BeatmapApiResponse(TypedDict):
     data: list[dict[str, Any]] | None
@@ -74,21 +105,73 @@ async def api_get_osu_file(beatmap_id: int) -> bytes:
     return response.read()
 
 
-def disk_has_expected_osu_file(
+def hash_osu_file(osu_file_path: Path) -> OsuFileVersion:
+    """Read & hash an .osu file. Blocking; should be run in a thread."""
+    with osu_file_path.open("rb") as f:
+        stat = os.fstat(f.fileno())
+        osu_file_md5 = hashlib.md5(f.read()).hexdigest()
+
+    return (stat.st_mtime_ns, stat.st_size, osu_file_md5)
+
+
+def write_osu_file_to_disk(beatmap_id: int, data: bytes) -> OsuFileVersion:
+    """Atomically write an .osu file. Blocking; should be run in a thread."""
+    osu_file_path = BEATMAPS_PATH / f"{beatmap_id}.osu"
+    app.utils.write_file_atomically(osu_file_path, data)
+
+    stat = osu_file_path.stat()
+    return (stat.st_mtime_ns, stat.st_size, hashlib.md5(data).hexdigest())
+
+
+def _remember_osu_file_version(beatmap_id: int, version: OsuFileVersion) -> None:
+    _osu_file_versions[beatmap_id] = version
+    _osu_file_versions.move_to_end(beatmap_id)
+
+    if len(_osu_file_versions) > MAX_CACHED_OSU_FILE_VERSIONS:
+        _osu_file_versions.popitem(last=False)
+
+
+async def disk_has_expected_osu_file(
     beatmap_id: int,
     expected_md5: str | None = None,
 ) -> bool:
     osu_file_path = BEATMAPS_PATH / f"{beatmap_id}.osu"
-    file_exists = osu_file_path.exists()
-    if file_exists and expected_md5 is not None:
-        osu_file_md5 = hashlib.md5(osu_file_path.read_bytes()).hexdigest()
-        return osu_file_md5 == expected_md5
-    return file_exists
+    try:
+        stat = osu_file_path.stat()
+    except FileNotFoundError:
+        return False
 
+    if expected_md5 is None:
+        return True
 
-def write_osu_file_to_disk(beatmap_id: int, data: bytes) -> None:
-    osu_file_path = BEATMAPS_PATH / f"{beatmap_id}.osu"
-    osu_file_path.write_bytes(data)
+    # only re-hash the file if it's changed since it was last hashed
+    version = _osu_file_versions.get(beatmap_id)
+    if version is None or version[:2] != (stat.st_mtime_ns, stat.st_size):
+        try:
+            version = await asyncio.to_thread(hash_osu_file, osu_file_path)
+        except FileNotFoundError:
+            return False
+
+    _remember_osu_file_version(beatmap_id, version)
+    return version[2] == expected_md5
+
+
+async def _download_osu_file(beatmap_id: int) -> bool:
+    try:
+        latest_osu_file = await api_get_osu_file(beatmap_id)
+    except httpx.HTTPStatusError:
+        return False
+    except Exception:
+        log(f"Failed to fetch osu file for {beatmap_id}", Ansi.LRED)
+        return False
+
+    version = await asyncio.to_thread(
+        write_osu_file_to_disk,
+        beatmap_id,
+        latest_osu_file,
+    )
+    _remember_osu_file_version(beatmap_id, version)
+    return True
 
 
 async def ensure_osu_file_is_available(
@@ -104,19 +187,14 @@ async def ensure_osu_file_is_available(
 
     Returns whether the file is available for use.
     """
-    if disk_has_expected_osu_file(beatmap_id, expected_md5):
+    if await disk_has_expected_osu_file(beatmap_id, expected_md5):
         return True
 
-    try:
-        latest_osu_file = await api_get_osu_file(beatmap_id)
-    except httpx.HTTPStatusError:
-        return False
-    except Exception:
-        log(f"Failed to fetch osu file for {beatmap_id}", Ansi.LRED)
-        return False
-
-    write_osu_file_to_disk(beatmap_id, latest_osu_file)
-    return True
+    # concurrent requests for the same file share a single download
+    return await _single_flight(
+        ("osu_file", beatmap_id),
+        functools.partial(_download_osu_file, beatmap_id),
+    )
 
 
 # for some ungodly reason, different values are used to
@@ -277,6 +355,32 @@ class Beatmap:
         # XXX: This is set when a map's status is manually changed.
     """
 
+    __slots__ = (
+        "set",
+        "md5",
+        "id",
+        "set_id",
+        "artist",
+        "title",
+        "version",
+        "creator",
+        "last_update",
+        "total_length",
+        "max_combo",
+        "status",
+        "frozen",
+        "plays",
+        "passes",
+        "mode",
+        "bpm",
+        "cs",
+        "od",
+        "ar",
+        "hp",
+        "diff",
+        "filename",
+    )
+
     def __init__(
         self,
         map_set: BeatmapSet,
@@ -400,42 +504,15 @@ class Beatmap:
         bmap = await cls._from_md5_cache(md5)
 
         if not bmap:
-            # map not found in cache
-
-            # to be efficient, we want to cache the whole set
-            # at once rather than caching the individual map
-
-            if set_id <= 0:
-                # set id not provided - fetch it from the map md5
-                rec = await maps_repo.fetch_one(md5=md5)
-
-                if rec is not None:
-                    # set found in db
-                    set_id = rec["set_id"]
-                else:
-                    # set not found in db, try api
-                    api_data = await api_get_beatmaps(h=md5)
-
-                    if api_data["data"] is None:
-                        return None
-
-                    api_response = api_data["data"]
-                    set_id = int(api_response[0]["beatmapset_id"])
-
-            # fetch (and cache) beatmap set
-            beatmap_set = await BeatmapSet.from_bsid(set_id)
-
-            if beatmap_set is not None:
-                # the beatmap set has been cached - fetch beatmap from cache
-                bmap = await cls._from_md5_cache(md5)
-
-                # XXX:HACK in this case, BeatmapSet.from_bsid will have
-                # ensured the map is up to date, so we can just return it
-                return bmap
+            # map not found in cache; concurrent
+            # requests for it share a single lookup
+            return await _resolve(
+                ("md5", md5),
+                functools.partial(cls._from_md5_uncached, md5, set_id),
+            )
 
-        if bmap is not None:
-            if bmap.set._cache_expired():
-                await bmap.set._update_if_available()
+        if bmap.set._cache_expired():
+            await bmap.set._update_if_available()
 
         return bmap
 
@@ -445,40 +522,15 @@ class Beatmap:
         bmap = await cls._from_bid_cache(bid)
 
         if not bmap:
-            # map not found in cache
-
-            # to be efficient, we want to cache the whole set
-            # at once rather than caching the individual map
-
-            rec = await maps_repo.fetch_one(id=bid)
-
-            if rec is not None:
-                # set found in db
-                set_id = rec["set_id"]
-            else:
-                # set not found in db, try getting via api
-                api_data = await api_get_beatmaps(b=bid)
-
-                if api_data["data"] is None:
-                    return None
-
-                api_response = api_data["data"]
-                set_id = int(api_response[0]["beatmapset_id"])
-
-            # fetch (and cache) beatmap set
-            beatmap_set = await BeatmapSet.from_bsid(set_id)
-
-            if beatmap_set is not None:
-                # the beatmap set has been cached - fetch beatmap from cache
-                bmap = await cls._from_bid_cache(bid)
-
-                # XXX:HACK in this case, BeatmapSet.from_bsid will have
-                # ensured the map is up to date, so we can just return it
-                return bmap
+            # map not found in cache; concurrent
+            # requests for it share a single lookup
+            return await _resolve(
+                ("bid", bid),
+                functools.partial(cls._from_bid_uncached, bid),
+            )
 
-        if bmap is not None:
-            if bmap.set._cache_expired():
-                await bmap.set._update_if_available()
+        if bmap.set._cache_expired():
+            await bmap.set._update_if_available()
 
         return bmap
 
@@ -550,12 +602,80 @@ class Beatmap:
     @staticmethod
     async def _from_md5_cache(md5: str) -> Beatmap | None:
         """Fetch a map from the cache by md5."""
-        return app.state.cache.beatmap.get(md5, None)
+        return app.usecases.beatmap_cache.get_map(md5)
 
     @staticmethod
     async def _from_bid_cache(bid: int) -> Beatmap | None:
         """Fetch a map from the cache by id."""
-        return app.state.cache.beatmap.get(bid, None)
+        return app.usecases.beatmap_cache.get_map(bid)
+
+    @classmethod
+    async def _from_md5_uncached(cls, md5: str, set_id: int = -1) -> Beatmap | None:
+        """Fetch a map from the database, or osuapi by md5."""
+        # to be efficient, we want to cache the whole set
+        # at once rather than caching the individual map
+
+        if set_id <= 0:
+            # set id not provided - fetch it from the map md5
+            rec = await maps_repo.fetch_one(md5=md5)
+
+            if rec is not None:
+                # set found in db
+                set_id = rec["set_id"]
+            else:
+                # set not found in db, try api
+                api_data = await api_get_beatmaps(h=md5)
+
+                if api_data["data"] is None:
+                    return None
+
+                api_response = api_data["data"]
+                set_id = int(api_response[0]["beatmapset_id"])
+
+        # fetch (and cache) beatmap set
+        beatmap_set = await BeatmapSet.from_bsid(set_id)
+
+        if beatmap_set is None:
+            return None
+
+        # the beatmap set has been cached - fetch beatmap from cache
+
+        # XXX:HACK in this case, BeatmapSet.from_bsid will have
+        # ensured the map is up to date, so we can just return it
+        return await cls._from_md5_cache(md5)
+
+    @classmethod
+    async def _from_bid_uncached(cls, bid: int) -> Beatmap | None:
+        """Fetch a map from the database, or osuapi by id."""
+        # to be efficient, we want to cache the whole set
+        # at once rather than caching the individual map
+
+        rec = await maps_repo.fetch_one(id=bid)
+
+        if rec is not None:
+            # set found in db
+            set_id = rec["set_id"]
+        else:
+            # set not found in db, try getting via api
+            api_data = await api_get_beatmaps(b=bid)
+
+            if api_data["data"] is None:
+                return None
+
+            api_response = api_data["data"]
+            set_id = int(api_response[0]["beatmapset_id"])
+
+        # fetch (and cache) beatmap set
+        beatmap_set = await BeatmapSet.from_bsid(set_id)
+
+        if beatmap_set is None:
+            return None
+
+        # the beatmap set has been cached - fetch beatmap from cache
+
+        # XXX:HACK in this case, BeatmapSet.from_bsid will have
+        # ensured the map is up to date, so we can just return it
+        return await cls._from_bid_cache(bid)
 
 
 class BeatmapSet:
@@ -587,6 +707,8 @@ class BeatmapSet:
       await BeatmapSet._save_to_sql() -> None
     """
 
+    __slots__ = ("id", "maps", "last_osuapi_check")
+
     def __init__(
         self,
         id: int,
@@ -650,7 +772,10 @@ class BeatmapSet:
     async def _update_if_available(self) -> None:
         """Fetch the newest data from the api, check for differences
         and propogate any update into our cache & database."""
+        # concurrent checks of the same set share a single api request
+        await _single_flight(("update", self.id), self._check_for_update)
 
+    async def _check_for_update(self) -> None:
         try:
             api_data = await api_get_beatmaps(s=self.id)
         except (httpx.TransportError, httpx.DecodingError):
@@ -679,6 +804,7 @@ class BeatmapSet:
 
             updated_maps: list[Beatmap] = []
             map_md5s_to_delete: set[str] = set()
+            ranked_statuses_changed = False
 
             # temp value for building the new beatmap
             bmap: Beatmap
@@ -698,6 +824,9 @@ class BeatmapSet:
                         or old_map.status != new_ranked_status
                     ):
                         # update map from old_maps
+                        if old_map.status != new_ranked_status:
+                            ranked_statuses_changed = True
+
                         bmap = old_maps[old_id]
                         bmap._parse_from_osuapi_resp(new_map)
                         updated_maps.append(bmap)
@@ -725,6 +854,10 @@ class BeatmapSet:
             # save changes to cache
             self.maps = updated_maps
 
+            if app.state.cache.beatmapset.get(self.id) is self:
+                # reindex the set's maps, as their md5s may have changed
+                cache_beatmap_set(self)
+
             # save changes to sql
 
             if map_md5s_to_delete:
@@ -739,6 +872,8 @@ class BeatmapSet:
                     "DELETE FROM scores WHERE map_md5 IN :map_md5s",
                     {"map_md5s": map_md5s_to_delete},
                 )
+                for map_md5 in map_md5s_to_delete:
+                    app.usecases.leaderboards.invalidate_map(map_md5)
 
             # update last_osuapi_check
             await app.state.services.database.execute(
@@ -754,6 +889,10 @@ class BeatmapSet:
 
             # update maps in sql
             await self._save_to_sql()
+
+            if map_md5s_to_delete or ranked_statuses_changed:
+                # players' totals only include scores on ranked & approved maps
+                app.usecases.best_scores.clear()
         elif api_data["status_code"] in (404, 200):
             # NOTE: 200 can return an empty array of beatmaps,
             #       so we still delete in this case if the beatmap data is None
@@ -775,12 +914,16 @@ class BeatmapSet:
                     "DELETE FROM scores WHERE map_md5 IN :map_md5s",
                     {"map_md5s": map_md5s_to_delete},
                 )
+                for map_md5 in map_md5s_to_delete:
+                    app.usecases.leaderboards.invalidate_map(map_md5)
+                app.usecases.best_scores.clear()
 
             # delete set
             await app.state.services.database.execute(
                 "DELETE FROM mapsets WHERE id = :set_id",
                 {"set_id": self.id},
             )
+            app.usecases.beatmap_cache.remove_set(self.id)
 
     async def _save_to_sql(self) -> None:
         """Save the object's attributes into the database."""
@@ -833,7 +976,7 @@ class BeatmapSet:
     @staticmethod
     async def _from_bsid_cache(bsid: int) -> BeatmapSet | None:
         """Fetch a mapset from the cache by set id."""
-        return app.state.cache.beatmapset.get(bsid, None)
+        return app.usecases.beatmap_cache.get_set(bsid)
 
     @classmethod
     async def _from_bsid_sql(cls, bsid: int) -> BeatmapSet | None:
@@ -952,27 +1095,19 @@ class BeatmapSet:
         return None
 
     @classmethod
-    async def from_bsid(cls, bsid: int) -> BeatmapSet | None:
-        """Cache all maps in a set from the osuapi, optionally
-        returning beatmaps by their md5 or id."""
-        bmap_set = await cls._from_bsid_cache(bsid)
-        did_api_request = False
+    async def _from_bsid_uncached(cls, bsid: int) -> BeatmapSet | None:
+        """Fetch a mapset from the database, or osuapi by set id."""
+        bmap_set = await cls._from_bsid_sql(bsid)
 
         if not bmap_set:
-            bmap_set = await cls._from_bsid_sql(bsid)
+            bmap_set = await cls._from_bsid_osuapi(bsid)
 
             if not bmap_set:
-                bmap_set = await cls._from_bsid_osuapi(bsid)
-
-                if not bmap_set:
-                    return None
-
-                did_api_request = True
-
-        # TODO: this can be done less often for certain types of maps,
-        # such as ones that're ranked on bancho and won't be updated,
-        # and perhaps ones that haven't been updated in a long time.
-        if not did_api_request and bmap_set._cache_expired():
+                return None
+        elif bmap_set._cache_expired():
+            # TODO: this can be done less often for certain types of maps,
+            # such as ones that're ranked on bancho and won't be updated,
+            # and perhaps ones that haven't been updated in a long time.
             await bmap_set._update_if_available()
 
         # cache the beatmap set, and beatmaps
@@ -981,16 +1116,80 @@ class BeatmapSet:
 
         return bmap_set
 
+    @classmethod
+    async def from_bsid(cls, bsid: int) -> BeatmapSet | None:
+        """Cache all maps in a set from the osuapi, optionally
+        returning beatmaps by their md5 or id."""
+        bmap_set = await cls._from_bsid_cache(bsid)
+
+        if not bmap_set:
+            # set not found in cache; concurrent
+            # requests for it share a single lookup
+            return await _resolve(
+                ("bsid", bsid),
+                functools.partial(cls._from_bsid_uncached, bsid),
+            )
 
-def cache_beatmap(beatmap: Beatmap) -> None:
-    """Add the beatmap to the cache."""
-    app.state.cache.beatmap[beatmap.md5] = beatmap
-    app.state.cache.beatmap[beatmap.id] = beatmap
+        if bmap_set._cache_expired():
+            await bmap_set._update_if_available()
+
+        return bmap_set
 
 
 def cache_beatmap_set(beatmap_set: BeatmapSet) -> None:
     """Add the beatmap set, and each beatmap to the cache."""
-    app.state.cache.beatmapset[beatmap_set.id] = beatmap_set
+    app.usecases.beatmap_cache.add_set(beatmap_set)
+
+
+def _finish_flight(key: tuple[str, str | int], task: asyncio.Task[Any]) -> None:
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+
+    if not task.cancelled():
+        # the exception is raised to each caller; retrieve it
+        # here too, in case every caller has been cancelled
+        task.exception()
+
+
+async def _single_flight(
+    key: tuple[str, str | int],
+    func: Callable[[], Coroutine[Any, Any, T]],
+) -> T:
+    """Run `func`, or wait for the run of it already in progress for `key`."""
+    task = _in_flight.get(key)
+
+    if task is None:
+        task = asyncio.create_task(func())
+        task.add_done_callback(functools.partial(_finish_flight, key))
+        _in_flight[key] = task
+
+    # shielded, so a cancelled caller doesn't cancel the run for the others
+    return await asyncio.shield(task)
+
+
+async def _resolve(
+    key: tuple[str, str | int],
+    func: Callable[[], Coroutine[Any, Any, T | None]],
+) -> T | None:
+    """Resolve `key` with `func` as a single flight, remembering
+    for a short while if nothing could be found."""
+    expiry = _not_found.get(key)
+
+    if expiry is not None:
+        if time.monotonic() < expiry:
+            return None
+
+        del _not_found[key]
+
+    result = await _single_flight(key, func)
+
+    if result is None:
+        now = time.monotonic()
+
+        if len(_not_found) >= MAX_NOT_FOUND_ENTRIES:
+            for expired_key in [k for k, v in _not_found.items() if v <= now]:
+                del _not_found[expired_key]
+
+        _not_found[key] = now + app.settings.BEATMAP_NEGATIVE_CACHE_TTL
 
-    for beatmap in beatmap_set.maps:
-        cache_beatmap(beatmap)
+    return result
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from collections.abc import Sequence
+from collections.abc import Collection
 from typing import TYPE_CHECKING
 
 import app.packets
@@ -52,7 +52,8 @@ class Channel:
         self.auto_join = auto_join
         self.instance = instance
 
-        self.players: list[Player] = []
+        # (a dict, as an ordered set)
+        self.players: dict[Player, None] = {}
 
     def __repr__(self) -> str:
         return f"<{self.real_name}>"
@@ -83,8 +84,13 @@ class Channel:
             sender_id=sender.id,
         )
 
+        app.state.sessions.backend.send_to_channel(self, data, sender_id=sender.id)
+
+        # (members who've blocked the sender aren't sent the message)
+        blocked_by = app.state.sessions.players.get_blocked_by(sender.id)
+
         for player in self.players:
-            if sender.id not in player.blocks and (to_self or player.id != sender.id):
+            if player not in blocked_by and (to_self or player.id != sender.id):
                 player.enqueue(data)
 
     def send_bot(self, msg: str) -> None:
@@ -118,11 +124,11 @@ class Channel:
 
     def append(self, player: Player) -> None:
         """Add `player` to the channel's players."""
-        self.players.append(player)
+        self.players[player] = None
 
     def remove(self, player: Player) -> None:
         """Remove `player` from the channel's players."""
-        self.players.remove(player)
+        del self.players[player]
 
         if not self.players and self.instance:
             # if it's an instance channel and this
@@ -130,8 +136,18 @@ class Channel:
             # the channel from the global list.
             app.state.sessions.channels.remove(self)
 
-    def enqueue(self, data: bytes, immune: Sequence[int] = []) -> None:
+    def enqueue(self, data: bytes, immune: Collection[int] = ()) -> None:
         """Enqueue `data` to all connected clients not in `immune`."""
+        app.state.sessions.backend.send_to_channel(self, data, sender_id=0)
+
+        if not immune:
+            for player in self.players:
+                player.enqueue(data)
+            return
+
+        if not isinstance(immune, (set, frozenset)):
+            immune = set(immune)
+
         for player in self.players:
             if player.id not in immune:
                 player.enqueue(data)
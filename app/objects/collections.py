@@ -1,20 +1,23 @@
 from __future__ import annotations
 
+from collections.abc import Collection
 from collections.abc import Iterable
 from collections.abc import Iterator
-from collections.abc import Sequence
 from typing import Any
 
 import databases.core
 
+import app.packets
 import app.settings
 import app.state
+import app.usecases.passwords
 import app.utils
 from app.constants.privileges import ClanPrivileges
 from app.constants.privileges import Privileges
 from app.logging import Ansi
 from app.logging import log
 from app.objects.channel import Channel
+from app.objects.match import MAX_MATCH_ID
 from app.objects.match import Match
 from app.objects.player import Player
 from app.repositories import channels as channels_repo
@@ -23,19 +26,67 @@ from app.repositories import users as users_repo
 from app.utils import make_safe_name
 
 
-class Channels(list[Channel]):
-    """The currently active chat channels on the server."""
+class Channels:
+    """The currently active chat channels on the server.
+
+    Channels are kept by their real name (e.g. #multi_1, rather than
+    #multiplayer), in the order they were added.
+    """
+
+    def __init__(self, channels: Iterable[Channel] = ()) -> None:
+        self._by_name: dict[str, Channel] = {}
+
+        # channels whose playercounts changed since they were last broadcast
+        self._player_count_changed: set[Channel] = set()
+
+        for channel in channels:
+            self._by_name[channel.real_name] = channel
 
     def __iter__(self) -> Iterator[Channel]:
-        return super().__iter__()
+        return iter(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def mark_player_count_changed(self, channel: Channel) -> None:
+        """Mark `channel`'s playercount to be sent in the next broadcast."""
+        self._player_count_changed.add(channel)
+
+    async def broadcast_player_counts(self) -> None:
+        """Send the playercounts of the channels which changed since the
+        last broadcast to all players who have access to see them."""
+        changed_channels = self._player_count_changed
+        self._player_count_changed = set()
+
+        player_counts = await app.state.sessions.backend.get_channel_player_counts(
+            changed_channels,
+        )
+
+        broadcasts: dict[Privileges, bytearray] = {}
+
+        for channel in changed_channels:
+            if channel.read_priv not in broadcasts:
+                broadcasts[channel.read_priv] = bytearray()
+            broadcasts[channel.read_priv] += app.packets.channel_info(
+                channel.name,
+                channel.topic,
+                player_counts[channel.real_name],
+            )
+
+        for read_priv, chan_info_packets in broadcasts.items():
+            app.state.sessions.players.enqueue_to_readers(
+                read_priv,
+                bytes(chan_info_packets),
+            )
 
     def __contains__(self, o: object) -> bool:
-        """Check whether internal list contains `o`."""
-        # Allow string to be passed to compare vs. name.
+        """Check whether `o` (a channel, or a channel's real name) is active."""
         if isinstance(o, str):
-            return o in (chan.name for chan in self)
+            return o in self._by_name
+        elif isinstance(o, Channel):
+            return self._by_name.get(o.real_name) is o
         else:
-            return super().__contains__(o)
+            return False
 
     def __repr__(self) -> str:
         # XXX: we use the "real" name, aka
@@ -44,30 +95,30 @@ class Channels(list[Channel]):
         return f'[{", ".join(c.real_name for c in self)}]'
 
     def get_by_name(self, name: str) -> Channel | None:
-        """Get a channel from the list by `name`."""
-        for channel in self:
-            if channel.real_name == name:
-                return channel
-
-        return None
+        """Get a channel from the list by its real `name`."""
+        return self._by_name.get(name)
 
     def append(self, channel: Channel) -> None:
         """Append `channel` to the list."""
-        super().append(channel)
+        self._by_name[channel.real_name] = channel
 
         if app.settings.DEBUG:
             log(f"{channel} added to channels list.")
 
     def extend(self, channels: Iterable[Channel]) -> None:
         """Extend the list with `channels`."""
-        super().extend(channels)
+        for channel in channels:
+            self._by_name[channel.real_name] = channel
 
         if app.settings.DEBUG:
             log(f"{channels} added to channels list.")
 
     def remove(self, channel: Channel) -> None:
         """Remove `channel` from the list."""
-        super().remove(channel)
+        if self._by_name.get(channel.real_name) is not channel:
+            return
+
+        del self._by_name[channel.real_name]
 
         if app.settings.DEBUG:
             log(f"{channel} removed from channels list.")
@@ -87,43 +138,147 @@ class Channels(list[Channel]):
             )
 
 
-class Matches(list[Match | None]):
-    """The currently active multiplayer matches on the server."""
+class Matches:
+    """The currently active multiplayer matches on the server.
+
+    Matches are kept by id, and indexed by host & chat channel. Ids are
+    allocated in O(1) from a stack of ids freed by removed matches (or
+    the next unused id), so they stay within `MAX_MATCH_ID`.
+    """
 
     def __init__(self) -> None:
-        MAX_MATCHES = 64  # TODO: refactor this out of existence
-        super().__init__([None] * MAX_MATCHES)
+        self._by_id: dict[int, Match] = {}  # (in order of creation)
+        self._by_host_id: dict[int, Match] = {}
+        self._by_channel: dict[Channel, Match] = {}
 
-    def __iter__(self) -> Iterator[Match | None]:
-        return super().__iter__()
+        # ids freed by removed matches, to be reused before new ids
+        self._free_ids: list[int] = []
+        self._next_id = 0
+
+    def __iter__(self) -> Iterator[Match]:
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, o: object) -> bool:
+        return isinstance(o, Match) and self._by_id.get(o.id) is o
 
     def __repr__(self) -> str:
-        return f'[{", ".join(match.name for match in self if match)}]'
+        return f'[{", ".join(match.name for match in self)}]'
+
+    def get(self, id: int) -> Match | None:
+        """Get a match by id."""
+        return self._by_id.get(id)
+
+    def get_by_host(self, host_id: int) -> Match | None:
+        """Get the match hosted by a player, by their id."""
+        return self._by_host_id.get(host_id)
+
+    def get_by_channel(self, channel: Channel) -> Match | None:
+        """Get the match using `channel` as its chat."""
+        return self._by_channel.get(channel)
 
     def get_free(self) -> int | None:
-        """Return the first free match id from `self`."""
-        for idx, match in enumerate(self):
-            if match is None:
-                return idx
+        """Return the next free match id, or None if all are in use."""
+        if self._free_ids:
+            return self._free_ids[-1]
+
+        if self._next_id <= MAX_MATCH_ID:
+            return self._next_id
 
         return None
 
-    def remove(self, match: Match | None) -> None:
-        """Remove `match` from the list."""
-        for i, _m in enumerate(self):
-            if match is _m:
-                self[i] = None
-                break
+    def append(self, match: Match) -> None:
+        """Add `match` to the list, under its id."""
+        if match.id in self._by_id:
+            raise ValueError(f"Match id {match.id} is already in use")
+
+        if self._free_ids and self._free_ids[-1] == match.id:
+            self._free_ids.pop()
+        elif match.id >= self._next_id:
+            # (any ids skipped over are free to be used later)
+            self._free_ids.extend(range(match.id - 1, self._next_id - 1, -1))
+            self._next_id = match.id + 1
+        else:
+            self._free_ids.remove(match.id)
+
+        self._by_id[match.id] = match
+        self._by_host_id[match.host_id] = match
+        self._by_channel[match.chat] = match
+
+        if app.settings.DEBUG:
+            log(f"{match} added to matches list.")
+
+    def remove(self, match: Match) -> None:
+        """Remove `match` from the list, freeing its id."""
+        if self._by_id.get(match.id) is not match:
+            return
+
+        del self._by_id[match.id]
+        self._free_ids.append(match.id)
+
+        if self._by_host_id.get(match.host_id) is match:
+            del self._by_host_id[match.host_id]
+        if self._by_channel.get(match.chat) is match:
+            del self._by_channel[match.chat]
 
         if app.settings.DEBUG:
             log(f"{match} removed from matches list.")
 
+    def set_host(self, match: Match, host_id: int) -> None:
+        """Transfer `match`'s host to another player, by their id."""
+        if self._by_host_id.get(match.host_id) is match:
+            del self._by_host_id[match.host_id]
+
+        match.host_id = host_id
+
+        if match in self:
+            self._by_host_id[host_id] = match
+
 
 class Players(list[Player]):
-    """The currently active players on the server."""
+    """The currently active players on the server.
+
+    Lookups by token, id, name & irc key are served from hash
+    indexes which are maintained by `append`, `remove` & `rename`;
+    the list itself is only used for iteration & ordering.
+    """
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
+        super().__init__()
+
+        # the keys each player was indexed under, so they can still be
+        # unindexed after attributes (e.g. token on logout) have changed.
+        self._indexed: dict[Player, tuple[str, int, str, str | None]] = {}
+
+        self._by_token: dict[str, Player] = {}
+        # multiple sessions may share an id/name (e.g. tourney clients);
+        # the earliest session is the one returned from lookups.
+        self._by_id: dict[int, list[Player]] = {}
+        self._by_name: dict[str, list[Player]] = {}
+        self._by_irc_key: dict[str, list[Player]] = {}
+
+        # cached `staff`, `restricted`, `unrestricted` & `readers` views.
+        self._views: dict[str, set[Player]] = {}
+
+        # the presence & stats of each unrestricted player, which are
+        # sent to players as they log in; see `login_packets`.
+        self._login_packets: dict[Player, bytes] = {}
+        self._login_buffer = bytearray()
+        self._login_buffer_outdated_bytes = 0
+        self._login_buffer_needs_rebuild = False
+        self._outdated_login_packets: set[Player] = set()
+        self._presence_bundle: bytes | None = None
+
+        # the online players blocking each user; {user id: players}.
+        # (along with the blocks each player was indexed under)
+        self._blocked_by: dict[int, set[Player]] = {}
+        self._indexed_blocks: dict[Player, frozenset[int]] = {}
+
+        players: list[Player] = list(*args, **kwargs)
+        for player in players:
+            self.append(player)
 
     def __iter__(self) -> Iterator[Player]:
         return super().__iter__()
@@ -132,9 +287,12 @@ class Players(list[Player]):
         # allow us to either pass in the player
         # obj, or the player name as a string.
         if isinstance(player, str):
-            return player in (player.name for player in self)
+            return any(
+                p.name == player
+                for p in self._by_name.get(make_safe_name(player), ())
+            )
         else:
-            return super().__contains__(player)
+            return player in self._indexed
 
     def __repr__(self) -> str:
         return f'[{", ".join(map(repr, self))}]'
@@ -142,29 +300,147 @@ class Players(list[Player]):
     @property
     def ids(self) -> set[int]:
         """Return a set of the current ids in the list."""
-        return {p.id for p in self}
+        return set(self._by_id)
+
+    # NOTE: the views below are cached until the next change to the
+    # player list or to an online player's privileges; do not mutate.
 
     @property
     def staff(self) -> set[Player]:
         """Return a set of the current staff online."""
-        return {p for p in self if p.priv & Privileges.STAFF}
+        staff = self._views.get("staff")
+        if staff is None:
+            staff = self._views["staff"] = {
+                p for p in self if p.priv & Privileges.STAFF
+            }
+        return staff
 
     @property
     def restricted(self) -> set[Player]:
         """Return a set of the current restricted players."""
-        return {p for p in self if not p.priv & Privileges.UNRESTRICTED}
+        restricted = self._views.get("restricted")
+        if restricted is None:
+            restricted = self._views["restricted"] = {
+                p for p in self if not p.priv & Privileges.UNRESTRICTED
+            }
+        return restricted
 
     @property
     def unrestricted(self) -> set[Player]:
         """Return a set of the current unrestricted players."""
-        return {p for p in self if p.priv & Privileges.UNRESTRICTED}
+        unrestricted = self._views.get("unrestricted")
+        if unrestricted is None:
+            unrestricted = self._views["unrestricted"] = {
+                p for p in self if p.priv & Privileges.UNRESTRICTED
+            }
+        return unrestricted
+
+    def clear_cached_views(self) -> None:
+        """Invalidate the cached privilege-based views of the list."""
+        self._views.clear()
+
+    def readers(self, read_priv: Privileges) -> set[Player]:
+        """Return a set of the current players who can read
+        channels with `read_priv` (see `Channel.can_read`)."""
+        view_name = f"readers:{int(read_priv)}"
+        readers = self._views.get(view_name)
+        if readers is None:
+            readers = self._views[view_name] = {
+                p for p in self if not read_priv or p.priv & read_priv
+            }
+        return readers
+
+    def login_packets(self) -> bytearray:
+        """Return the presence & stats of all unrestricted players,
+        to be sent to a player logging in. (Do not mutate.)
+
+        The buffer is maintained as players come, go & change; a newer
+        copy of a player's packets is appended over their older copy
+        (as the client only keeps the latest), and the buffer is only
+        rebuilt after players leave, or once it's mostly outdated."""
+        for player in self._outdated_login_packets:
+            if player not in self._login_packets:
+                continue
+
+            packets = _login_packets(player)
+            self._login_buffer_outdated_bytes += len(self._login_packets[player])
+            self._login_packets[player] = packets
+
+            if not self._login_buffer_needs_rebuild:
+                self._login_buffer += packets
+
+        self._outdated_login_packets.clear()
+
+        if (
+            self._login_buffer_needs_rebuild
+            or self._login_buffer_outdated_bytes * 2 > len(self._login_buffer)
+        ):
+            self._login_buffer = bytearray(b"".join(self._login_packets.values()))
+            self._login_buffer_outdated_bytes = 0
+            self._login_buffer_needs_rebuild = False
+
+        return self._login_buffer
+
+    def presence_bundle(self) -> bytes:
+        """Return the ids of all unrestricted players, to be sent to a
+        player logging in (who requests the packets they need later)."""
+        if self._presence_bundle is None:
+            self._presence_bundle = app.packets.user_presence_bundle(
+                {player.id for player in self._login_packets},
+            )
+        return self._presence_bundle
+
+    def update_login_packets(self, player: Player) -> None:
+        """Update `player`'s packets sent to players logging in
+        (after a change to their presence, stats or privileges)."""
+        if player not in self._indexed:
+            return
 
-    def enqueue(self, data: bytes, immune: Sequence[Player] = []) -> None:
+        if not player.priv & Privileges.UNRESTRICTED:
+            self._remove_login_packets(player)
+        elif player not in self._login_packets:
+            self._add_login_packets(player)
+        else:
+            # (encoded lazily, as players often change many times between logins)
+            self._outdated_login_packets.add(player)
+
+    def _add_login_packets(self, player: Player) -> None:
+        # (encoded on the next login, once the player's stats are loaded)
+        self._login_packets[player] = b""
+        self._outdated_login_packets.add(player)
+        self._presence_bundle = None
+
+    def _remove_login_packets(self, player: Player) -> None:
+        if self._login_packets.pop(player, None) is not None:
+            # the player's packets can't be taken back out
+            # of the buffer; it's rebuilt on the next login.
+            self._login_buffer_needs_rebuild = True
+            self._presence_bundle = None
+
+    def enqueue(self, data: bytes, immune: Collection[Player] = ()) -> None:
         """Enqueue `data` to all players, except for those in `immune`."""
+        app.state.sessions.backend.broadcast(data)
+
+        if not immune:
+            for player in self:
+                player.enqueue(data)
+            return
+
+        if not isinstance(immune, (set, frozenset)):
+            immune = set(immune)
+
         for player in self:
             if player not in immune:
                 player.enqueue(data)
 
+    def enqueue_to_readers(self, read_priv: Privileges, data: bytes) -> None:
+        """Enqueue `data` to all players who can read
+        channels with `read_priv` (e.g. channel info)."""
+        app.state.sessions.backend.broadcast(data, read_priv)
+
+        for player in self.readers(read_priv):
+            player.enqueue(data)
+
     def get(
         self,
         token: str | None = None,
@@ -173,21 +449,40 @@ class Players(list[Player]):
         name: str | None = None,
     ) -> Player | None:
         """Get a player by token, id, or name from cache."""
-        for player in self:
-            if token is not None:
-                if player.token == token:
-                    return player
-            elif irc_key is not None:
-                if player.irc_key == irc_key:
-                    return player
-            elif id is not None:
-                if player.id == id:
-                    return player
-            elif name is not None:
-                if player.safe_name == make_safe_name(name):
-                    return player
+        if token is not None:
+            return self._by_token.get(token)
+
+        if irc_key is not None:
+            players = self._by_irc_key.get(irc_key)
+        elif id is not None:
+            players = self._by_id.get(id)
+        elif name is not None:
+            players = self._by_name.get(make_safe_name(name))
+        else:
+            return None
 
-        return None
+        return players[0] if players else None
+
+    def _index(self, player: Player) -> None:
+        keys = (player.token, player.id, player.safe_name, player.irc_key)
+        self._indexed[player] = keys
+
+        self._by_token[player.token] = player
+        self._by_id.setdefault(player.id, []).append(player)
+        self._by_name.setdefault(player.safe_name, []).append(player)
+        if player.irc_key is not None:
+            self._by_irc_key.setdefault(player.irc_key, []).append(player)
+
+    def _unindex(self, player: Player) -> None:
+        token, id, safe_name, irc_key = self._indexed.pop(player)
+
+        if self._by_token.get(token) is player:
+            del self._by_token[token]
+
+        _remove_from_index(self._by_id, id, player)
+        _remove_from_index(self._by_name, safe_name, player)
+        if irc_key is not None:
+            _remove_from_index(self._by_irc_key, irc_key, player)
 
     async def get_sql(
         self,
@@ -267,8 +562,14 @@ class Players(list[Player]):
 
         assert player.pw_bcrypt is not None
 
-        if app.state.cache.bcrypt[player.pw_bcrypt] == pw_md5.encode():
-            return player
+        try:
+            if await app.usecases.passwords.verify_password(
+                pw_md5.encode(),
+                player.pw_bcrypt,
+            ):
+                return player
+        except app.usecases.passwords.PasswordChecksOverloaded:
+            pass
 
         return None
 
@@ -280,6 +581,12 @@ class Players(list[Player]):
             return
 
         super().append(player)
+        self._index(player)
+        self._index_blocks(player)
+        self._views.clear()
+
+        if player.priv & Privileges.UNRESTRICTED:
+            self._add_login_packets(player)
 
     def remove(self, player: Player) -> None:
         """Remove `p` from the list."""
@@ -289,6 +596,77 @@ class Players(list[Player]):
             return
 
         super().remove(player)
+        self._unindex(player)
+        self._unindex_blocks(player)
+        self._views.clear()
+
+        self._remove_login_packets(player)
+
+    def get_blocked_by(self, user_id: int) -> Collection[Player]:
+        """Return the online players who have blocked a user."""
+        return self._blocked_by.get(user_id, ())
+
+    def update_blocks(self, player: Player) -> None:
+        """Update the blocked-by index after `player`'s blocks change."""
+        if player not in self:
+            return
+
+        self._unindex_blocks(player)
+        self._index_blocks(player)
+
+    def _index_blocks(self, player: Player) -> None:
+        blocks = frozenset(player.blocks)
+        self._indexed_blocks[player] = blocks
+
+        for user_id in blocks:
+            self._blocked_by.setdefault(user_id, set()).add(player)
+
+    def _unindex_blocks(self, player: Player) -> None:
+        for user_id in self._indexed_blocks.pop(player, ()):
+            blocked_by = self._blocked_by[user_id]
+            blocked_by.discard(player)
+            if not blocked_by:
+                del self._blocked_by[user_id]
+
+    def rename(self, player: Player, name: str) -> None:
+        """Change `player`'s name, keeping the name index up to date."""
+        if player not in self:
+            player.name = name
+            player.invalidate_packets()
+            return
+
+        self._unindex(player)
+        player.name = name
+        player.invalidate_packets()
+        self._index(player)
+
+
+def _login_packets(player: Player) -> bytes:
+    if player.is_bot_client:
+        # optimization for bot since it's
+        # the most frequently requested user
+        return app.packets.bot_presence(player) + app.packets.bot_stats(player)
+
+    return app.packets.user_presence(player) + app.packets.user_stats(player)
+
+
+def _remove_from_index(
+    index: dict[Any, list[Player]],
+    key: Any,
+    player: Player,
+) -> None:
+    """Remove `player` from the bucket at `index[key]`, if present."""
+    players = index.get(key)
+    if players is None:
+        return
+
+    for idx, p in enumerate(players):
+        if p is player:
+            del players[idx]
+            break
+
+    if not players:
+        del index[key]
 
 
 async def initialize_ram_caches() -> None:
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 from collections import defaultdict
+from collections.abc import Collection
 from collections.abc import Sequence
 from datetime import datetime as datetime
 from datetime import timedelta as timedelta
@@ -26,10 +27,17 @@ if TYPE_CHECKING:
 
     from app.objects.channel import Channel
     from app.objects.player import Player
+    from app.objects.score import Score
 
 
 MAX_MATCH_NAME_LENGTH = 50
 
+# match ids are read by the osu! client as an i16
+MAX_MATCH_ID = 32767
+
+# how long to wait for players' scores after a map's completion (in total)
+SCORE_SUBMISSION_TIMEOUT = 10.0  # seconds
+
 
 @unique
 @pymysql_encode(escape_enum)
@@ -200,6 +208,10 @@ class Match:
 
         self.tourney_clients: set[int] = set()  # player ids
 
+        # scores being awaited after a map's completion, resolved
+        # as they're submitted; {(map md5, player id): future}
+        self._score_waiters: dict[tuple[str, int], asyncio.Future[Score]] = {}
+
     @property
     def host(self) -> Player:
         player = app.state.sessions.players.get(id=self.host_id)
@@ -285,7 +297,7 @@ class Match:
         self,
         data: bytes,
         lobby: bool = True,
-        immune: Sequence[int] = [],
+        immune: Collection[int] = (),
     ) -> None:
         """Add data to be sent to all clients in the match."""
         self.chat.enqueue(data, immune)
@@ -339,6 +351,15 @@ class Match:
         self.winners.clear()
         self.bans.clear()
 
+    def submit_score(self, score: Score) -> None:
+        """Pass a submitted score on to the match, if it's being awaited."""
+        if score.bmap is None or score.player is None:
+            return
+
+        waiter = self._score_waiters.get((score.bmap.md5, score.player.id))
+        if waiter is not None and not waiter.done():
+            waiter.set_result(score)
+
     async def await_submissions(
         self,
         was_playing: Sequence[Slot],
@@ -346,7 +367,6 @@ class Match:
         """Await score submissions from all players in completed state."""
         scores: dict[MatchTeams | Player, int] = defaultdict(int)
         didnt_submit: list[Player] = []
-        time_waited = 0.0  # allow up to 10s (total, not per player)
 
         ffa = self.team_type in (MatchTeamTypes.head_to_head, MatchTeamTypes.tag_coop)
 
@@ -355,46 +375,62 @@ class Match:
         else:
             win_cond = ("score", "acc", "max_combo", "score")[self.win_condition]
 
-        bmap = await Beatmap.from_md5(self.map_md5)
-
-        if not bmap:
-            # map isn't submitted
-            return {}, ()
+        # start listening for the players' submissions before anything
+        # is awaited, so that none can be missed in the meantime.
+        map_md5 = self.map_md5
+        loop = asyncio.get_running_loop()
+        waiters: list[tuple[Slot, Player, asyncio.Future[Score]]] = []
 
         for s in was_playing:
-            # continue trying to fetch each player's
-            # scores until they've all been submitted.
-            while True:
-                assert s.player is not None
-                rc_score = s.player.recent_score
-
-                max_age = datetime.now() - timedelta(
-                    seconds=bmap.total_length + time_waited + 0.5,
-                )
+            assert s.player is not None
+            waiter: asyncio.Future[Score] = loop.create_future()
+            self._score_waiters[(map_md5, s.player.id)] = waiter
+            waiters.append((s, s.player, waiter))
+
+        try:
+            bmap = await Beatmap.from_md5(map_md5)
+
+            if not bmap:
+                # map isn't submitted
+                return {}, ()
+
+            # scores may have been submitted before the map was completed
+            max_age = datetime.now() - timedelta(seconds=bmap.total_length + 0.5)
 
+            for _, player, waiter in waiters:
+                rc_score = player.recent_score
                 if (
                     rc_score
                     and rc_score.bmap
-                    and rc_score.bmap.md5 == self.map_md5
+                    and rc_score.bmap.md5 == map_md5
                     and rc_score.server_time > max_age
+                    and not waiter.done()
                 ):
-                    # score found, add to our scores dict if != 0.
-                    score: int = getattr(rc_score, win_cond)
-                    if score:
-                        key: MatchTeams | Player = s.player if ffa else s.team
-                        scores[key] += score
-
-                    break
-
-                # wait 0.5s and try again
-                await asyncio.sleep(0.5)
-                time_waited += 0.5
-
-                if time_waited > 10:
-                    # inform the match this user didn't
-                    # submit a score in time, and skip them.
-                    didnt_submit.append(s.player)
-                    break
+                    waiter.set_result(rc_score)
+
+            # wait for the rest of the scores together, up to the deadline
+            pending = [waiter for _, _, waiter in waiters if not waiter.done()]
+            if pending:
+                await asyncio.wait(pending, timeout=SCORE_SUBMISSION_TIMEOUT)
+        finally:
+            for _, player, waiter in waiters:
+                waiter.cancel()  # (if it's still pending)
+
+                if self._score_waiters.get((map_md5, player.id)) is waiter:
+                    del self._score_waiters[(map_md5, player.id)]
+
+        for s, player, waiter in waiters:
+            if waiter.cancelled():
+                # inform the match this user didn't
+                # submit a score in time, and skip them.
+                didnt_submit.append(player)
+                continue
+
+            # score found, add to our scores dict if != 0.
+            score: int = getattr(waiter.result(), win_cond)
+            if score:
+                key: MatchTeams | Player = player if ffa else s.team
+                scores[key] += score
 
         # all scores retrieved, update the match.
         return scores, didnt_submit
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import struct
+
+import app.metrics
+from app.packets import ServerPackets
+
+# how the queue makes room once it grows past its max size
+OVERFLOW_POLICIES = ("coalesce", "drop_oldest", "disconnect")
+
+# packets which only carry a user's latest state; older
+# copies for the same user can be dropped without any loss
+COALESCABLE_PACKETS = (ServerPackets.USER_STATS, ServerPackets.USER_PRESENCE)
+
+PACKET_HEADER = struct.Struct("<HxI")
+USER_ID = struct.Struct("<i")
+
+# replaced packets leave empty chunks behind in the queue,
+# which are compacted once they make up most of the queue
+MIN_REPLACED_CHUNKS_TO_COMPACT = 64
+
+
+class PacketQueue:
+    """Packets waiting to be sent to a client on their next poll.
+
+    Packets are kept as a list of chunks (usually one per enqueue), so
+    broadcasts share a single bytes object between each recipient's
+    queue, and the queue is joined only once, when it's drained.
+
+    Chunks holding a single stats or presence packet are kept in slots,
+    keyed by the packet & its user; a newer packet for the same slot
+    replaces the older, so only the latest is sent. (The new packet is
+    still queued at the end, to preserve its order with other packets,
+    such as a logout & re-login.)
+
+    The queue holds at most `max_size` bytes. Past that, the policy
+    decides how to make room:
+      - "coalesce": drop all but the latest stats & presence for each
+        user, then (if still needed) fall back to "drop_oldest".
+      - "drop_oldest": drop the oldest chunks.
+      - "disconnect": drop the whole queue, and stop accepting packets;
+        the player should be logged out (see `overflowed`).
+    """
+
+    def __init__(self, max_size: int, overflow_policy: str = "coalesce") -> None:
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow_policy}")
+
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+
+        self.chunks: list[bytes] = []
+        self.size = 0  # in bytes
+
+        # the index of each slot's chunk; {(packet id, user id): index}
+        self.slots: dict[tuple[int, int], int] = {}
+        self.num_replaced = 0
+
+        # whether the queue overflowed with the "disconnect" policy
+        self.overflowed = False
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def push(self, data: bytes) -> None:
+        """Add data to the end of the queue."""
+        if self.overflowed:
+            # the player's about to be disconnected
+            return
+
+        key = _slot_key(data)
+        if key is not None:
+            index = self.slots.get(key)
+            if index is not None:
+                # the outdated packet is replaced with an empty chunk
+                self.size -= len(self.chunks[index])
+                self.chunks[index] = b""
+                self.num_replaced += 1
+                app.metrics.increment("ex_packet_queue_replaced_packets")
+
+            self.slots[key] = len(self.chunks)
+
+        self.chunks.append(data)
+        self.size += len(data)
+
+        if (
+            self.num_replaced >= MIN_REPLACED_CHUNKS_TO_COMPACT
+            and self.num_replaced * 2 > len(self.chunks)
+        ):
+            self._compact()
+
+        if self.size > self.max_size:
+            self._make_room()
+
+    def drain(self) -> list[bytes]:
+        """Remove & return all chunks in the queue."""
+        chunks = self.chunks
+        self.chunks = []
+        self.size = 0
+        self.slots.clear()
+        self.num_replaced = 0
+        return chunks
+
+    def _compact(self) -> None:
+        # remove the empty chunks left by replaced packets
+        self.chunks = [chunk for chunk in self.chunks if chunk]
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self.slots = {}
+        self.num_replaced = 0
+
+        for index, chunk in enumerate(self.chunks):
+            key = _slot_key(chunk)
+            if key is not None:
+                self.slots[key] = index
+
+    def _make_room(self) -> None:
+        app.metrics.increment("ex_packet_queue_overflows")
+
+        if self.overflow_policy == "disconnect":
+            self.drain()
+            self.overflowed = True
+            return
+
+        if self.overflow_policy == "coalesce":
+            self._coalesce()
+
+        # drop the oldest chunks, but always keep the newest
+        num_dropped = 0
+        while self.size > self.max_size and num_dropped < len(self.chunks) - 1:
+            self.size -= len(self.chunks[num_dropped])
+            num_dropped += 1
+
+        if num_dropped:
+            del self.chunks[:num_dropped]
+            app.metrics.increment("ex_packet_queue_dropped_chunks", num_dropped)
+
+        self._compact()
+
+    def _coalesce(self) -> None:
+        # walk the queue from newest to oldest, so the
+        # first copy of each user's state seen is kept
+        seen: set[tuple[int, int]] = set()
+        coalesced_chunks: list[bytes] = []
+
+        for chunk in reversed(self.chunks):
+            packets = _split_packets(chunk)
+
+            kept_packets: list[bytes] = []
+            for packet in reversed(packets):
+                key = _coalesce_key(packet)
+                if key is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+
+                kept_packets.append(packet)
+
+            if len(kept_packets) == len(packets):
+                # keep the original (possibly shared) chunk
+                coalesced_chunks.append(chunk)
+            elif kept_packets:
+                coalesced_chunks.append(b"".join(reversed(kept_packets)))
+
+        coalesced_chunks.reverse()
+        self.chunks = coalesced_chunks
+        self.size = sum(map(len, coalesced_chunks))
+
+
+def _coalesce_key(packet: bytes) -> tuple[int, int] | None:
+    # stats & presence packets both start with the user's id
+    if len(packet) < PACKET_HEADER.size + USER_ID.size:
+        return None
+
+    packet_id = PACKET_HEADER.unpack_from(packet)[0]
+    if packet_id not in COALESCABLE_PACKETS:
+        return None
+
+    return (packet_id, USER_ID.unpack_from(packet, PACKET_HEADER.size)[0])
+
+
+def _slot_key(chunk: bytes) -> tuple[int, int] | None:
+    # (a cheap check first, as this is run for every packet queued)
+    if len(chunk) < PACKET_HEADER.size or chunk[0] not in COALESCABLE_PACKETS:
+        return None
+
+    # only chunks holding a single packet are kept in slots
+    if PACKET_HEADER.size + PACKET_HEADER.unpack_from(chunk)[1] != len(chunk):
+        return None
+
+    return _coalesce_key(chunk)
+
+
+def _split_packets(chunk: bytes) -> list[bytes]:
+    packets = []
+
+    offset = 0
+    while offset + PACKET_HEADER.size <= len(chunk):
+        length = PACKET_HEADER.unpack_from(chunk, offset)[1]
+        end = offset + PACKET_HEADER.size + length
+        packets.append(chunk[offset:end])
+        offset = end
+
+    if offset < len(chunk):
+        # (not a packet; kept as is)
+        packets.append(chunk[offset:])
+
+    return packets
@@ -19,6 +19,8 @@ import databases.core
 import app.packets
 import app.settings
 import app.state
+import app.usecases.leaderboards
+import app.usecases.write_behind
 from app._typing import IPAddress
 from app.constants.gamemodes import GameMode
 from app.constants.mods import Mods
@@ -35,6 +37,8 @@ from app.objects.match import Slot
 from app.objects.match import SlotStatus
 from app.objects.score import Grade
 from app.objects.score import Score
+from app.objects.packet_queue import PacketQueue
+from app.objects.spectator_relay import SpectatorRelay
 from app.repositories import clans as clans_repo
 from app.repositories import logs as logs_repo
 from app.repositories import stats as stats_repo
@@ -201,11 +205,14 @@ class Player:
     is_tourney_client: `bool`
         Whether this is a management/spectator tourney client.
 
-    _packet_queue: `bytearray`
+    _packet_queue: `PacketQueue`
         Bytes enqueued to the player which will be transmitted
         at the tail end of their next connection to the server.
         XXX: cls.enqueue() will add data to this queue, and
              cls.dequeue() will return the data, and remove it.
+             Broadcasts share the same (immutable) bytes object
+             between each recipient's queue, rather than copying.
+             The queue's size is capped by PACKET_QUEUE_MAX_SIZE.
     """
 
     def __init__(
@@ -279,6 +286,7 @@ class Player:
         self.channels: list[Channel] = []
         self.spectators: list[Player] = []
         self.spectating: Player | None = None
+        self.spectator_relay: SpectatorRelay | None = None
         self.match: Match | None = None
         self.stealth = False
 
@@ -292,7 +300,10 @@ class Player:
         # store the last beatmap /np'ed by the user.
         self.last_np: LastNp | None = None
 
-        self._packet_queue = bytearray()
+        self._packet_queue = PacketQueue(
+            max_size=app.settings.PACKET_QUEUE_MAX_SIZE * 1024,
+            overflow_policy=app.settings.PACKET_QUEUE_OVERFLOW_POLICY,
+        )
 
     def __repr__(self) -> str:
         return f"<{self.name} ({self.id})>"
@@ -348,6 +359,56 @@ class Player:
             ret |= ClientPrivileges.OWNER
         return ret
 
+    @cached_property
+    def presence_packet(self) -> bytes:
+        """The player's encoded USER_PRESENCE packet."""
+        # NOTE: this is cached until wiped by `invalidate_packets`.
+        return app.packets._user_presence(
+            user_id=self.id,
+            name=self.name,
+            utc_offset=self.utc_offset,
+            country_code=self.geoloc["country"]["numeric"],
+            bancho_privileges=self.bancho_priv,
+            mode=self.status.mode.as_vanilla,
+            latitude=self.geoloc["latitude"],
+            longitude=self.geoloc["longitude"],
+            global_rank=self.gm_stats.rank,
+        )
+
+    @cached_property
+    def stats_packet(self) -> bytes:
+        """The player's encoded USER_STATS packet."""
+        # NOTE: this is cached until wiped by `invalidate_packets`.
+        gm_stats = self.gm_stats
+        return app.packets._user_stats(
+            user_id=self.id,
+            action=self.status.action,
+            info_text=self.status.info_text,
+            map_md5=self.status.map_md5,
+            mods=self.status.mods,
+            mode=self.status.mode.as_vanilla,
+            map_id=self.status.map_id,
+            ranked_score=gm_stats.rscore,
+            accuracy=gm_stats.acc,
+            plays=gm_stats.plays,
+            total_score=gm_stats.tscore,
+            global_rank=gm_stats.rank,
+            pp=gm_stats.pp,
+        )
+
+    def invalidate_packets(self) -> None:
+        """Wipe `self`'s cached presence & stats packets.
+
+        This must be called after changing any of the player's
+        status, stats, privileges, name or geolocation."""
+        if "presence_packet" in vars(self):
+            del self.presence_packet  # wipe cached_property
+        if "stats_packet" in vars(self):
+            del self.stats_packet  # wipe cached_property
+
+        app.state.sessions.players.update_login_packets(self)
+        app.state.sessions.backend.update_presence(self)
+
     @property
     def restricted(self) -> bool:
         """Return whether the player is restricted."""
@@ -403,6 +464,7 @@ class Player:
     def logout(self) -> None:
         """Log `self` out of the server."""
         # invalidate the user's token.
+        app.state.sessions.backend.remove_session(self)
         self.token = ""
 
         # leave multiplayer.
@@ -440,6 +502,9 @@ class Player:
         if "bancho_priv" in vars(self):
             del self.bancho_priv  # wipe cached_property
 
+        self.invalidate_packets()
+        app.state.sessions.players.clear_cached_views()
+
         await users_repo.partial_update(
             id=self.id,
             priv=self.priv,
@@ -452,6 +517,9 @@ class Player:
         if "bancho_priv" in vars(self):
             del self.bancho_priv  # wipe cached_property
 
+        self.invalidate_packets()
+        app.state.sessions.players.clear_cached_views()
+
         await users_repo.partial_update(
             id=self.id,
             priv=self.priv,
@@ -469,6 +537,9 @@ class Player:
         if "bancho_priv" in vars(self):
             del self.bancho_priv  # wipe cached_property
 
+        self.invalidate_packets()
+        app.state.sessions.players.clear_cached_views()
+
         await users_repo.partial_update(
             id=self.id,
             priv=self.priv,
@@ -500,6 +571,9 @@ class Player:
                 self.id,
             )
 
+        # their scores are no longer shown on map leaderboards
+        app.usecases.leaderboards.invalidate_user(self.id)
+
         log_msg = f"{admin} restricted {self} for: {reason}."
 
         log(log_msg, Ansi.LRED)
@@ -537,6 +611,9 @@ class Player:
                 {str(self.id): stats.pp},
             )
 
+        # their scores may now be shown on any map leaderboard
+        app.usecases.leaderboards.clear()
+
         log_msg = f"{admin} unrestricted {self} for: {reason}."
 
         log(log_msg, Ansi.LRED)
@@ -699,7 +776,7 @@ class Player:
                 # player was host, trasnfer to first occupied slot
                 for s in self.match.slots:
                     if s.player is not None:
-                        self.match.host_id = s.player.id
+                        app.state.sessions.matches.set_host(self.match, s.player.id)
                         self.match.host.enqueue(app.packets.match_transfer_host())
                         break
 
@@ -724,26 +801,23 @@ class Player:
 
         channel.append(self)  # add to channel.players
         self.channels.append(channel)  # add to player.channels
+        app.state.sessions.backend.add_channel_member(channel, self)
 
         self.enqueue(app.packets.channel_join(channel.name))
 
-        chan_info_packet = app.packets.channel_info(
-            channel.name,
-            channel.topic,
-            len(channel.players),
-        )
-
         if channel.instance:
             # instanced channel, only send the players
             # who are currently inside the instance
-            for player in channel.players:
-                player.enqueue(chan_info_packet)
+            chan_info_packet = app.packets.channel_info(
+                channel.name,
+                channel.topic,
+                len(channel.players),
+            )
+            channel.enqueue(chan_info_packet)
         else:
-            # normal channel, send to all players who
-            # have access to see the channel's usercount.
-            for player in app.state.sessions.players:
-                if channel.can_read(player.priv):
-                    player.enqueue(chan_info_packet)
+            # normal channel, all players who have access to see
+            # the channel's usercount are sent it periodically.
+            app.state.sessions.channels.mark_player_count_changed(channel)
 
         if app.settings.DEBUG:
             log(f"{self} joined {channel}.")
@@ -758,27 +832,24 @@ class Player:
 
         channel.remove(self)  # remove from c.players
         self.channels.remove(channel)  # remove from player.channels
+        app.state.sessions.backend.remove_channel_member(channel, self)
 
         if kick:
             self.enqueue(app.packets.channel_kick(channel.name))
 
-        chan_info_packet = app.packets.channel_info(
-            channel.name,
-            channel.topic,
-            len(channel.players),
-        )
-
         if channel.instance:
             # instanced channel, only send the players
             # who are currently inside the instance
-            for player in channel.players:
-                player.enqueue(chan_info_packet)
+            chan_info_packet = app.packets.channel_info(
+                channel.name,
+                channel.topic,
+                len(channel.players),
+            )
+            channel.enqueue(chan_info_packet)
         else:
-            # normal channel, send to all players who
-            # have access to see the channel's usercount.
-            for player in app.state.sessions.players:
-                if channel.can_read(player.priv):
-                    player.enqueue(chan_info_packet)
+            # normal channel, all players who have access to see
+            # the channel's usercount are sent it periodically.
+            app.state.sessions.channels.mark_player_count_changed(channel)
 
         if app.settings.DEBUG:
             log(f"{self} left {channel}.")
@@ -818,7 +889,13 @@ class Player:
             for spectator in self.spectators:
                 player.enqueue(app.packets.fellow_spectator_joined(spectator.id))
 
+        if self.spectator_relay is None:
+            self.spectator_relay = SpectatorRelay(
+                max_lag=app.settings.SPECTATOR_MAX_LAG_FRAMES,
+            )
+
         self.spectators.append(player)
+        self.spectator_relay.add_spectator(player)
         player.spectating = self
 
         log(f"{player} is now spectating {self}.")
@@ -828,6 +905,12 @@ class Player:
         self.spectators.remove(player)
         player.spectating = None
 
+        assert self.spectator_relay is not None
+        if self.spectators:
+            self.spectator_relay.remove_spectator(player)
+        else:
+            self.spectator_relay = None
+
         channel = app.state.sessions.channels.get_by_name(f"#spec_{self.id}")
         assert channel is not None
 
@@ -897,6 +980,7 @@ class Player:
             return
 
         self.blocks.add(player.id)
+        app.state.sessions.players.update_blocks(self)
         await app.state.services.database.execute(
             "REPLACE INTO relationships VALUES (:user1, :user2, 'block')",
             {"user1": self.id, "user2": player.id},
@@ -914,6 +998,7 @@ class Player:
             return
 
         self.blocks.remove(player.id)
+        app.state.sessions.players.update_blocks(self)
         await app.state.services.database.execute(
             "DELETE FROM relationships WHERE user1 = :user1 AND user2 = :user2",
             {"user1": self.id, "user2": player.id},
@@ -932,6 +1017,8 @@ class Player:
             else:
                 self.blocks.add(row["user2"])
 
+        app.state.sessions.players.update_blocks(self)
+
         # always have bot added to friends.
         self.friends.add(1)
 
@@ -999,24 +1086,40 @@ class Player:
                 },
             )
 
+        self.invalidate_packets()
+
     def update_latest_activity_soon(self) -> None:
-        """Update the player's latest activity in the database."""
-        task = users_repo.partial_update(
-            id=self.id,
-            latest_activity=int(time.time()),
-        )
-        app.state.loop.create_task(task)  # type: ignore[unused-awaitable]
+        """Update the player's latest activity in the database (on the next flush)."""
+        app.usecases.write_behind.update_latest_activity(self.id, int(time.time()))
+
+    @property
+    def packet_queue_size(self) -> int:
+        """The number of bytes waiting to be sent to the client."""
+        return self._packet_queue.size
+
+    @property
+    def packet_queue_overflowed(self) -> bool:
+        """Whether the client fell too far behind on
+        their packets, and should be disconnected."""
+        return self._packet_queue.overflowed
 
     def enqueue(self, data: bytes) -> None:
         """Add data to be sent to the client."""
-        self._packet_queue += data
+        self._packet_queue.push(data)
 
     def dequeue(self) -> bytes | None:
         """Get data from the queue to send to the client."""
-        if self._packet_queue:
-            data = bytes(self._packet_queue)
-            self._packet_queue.clear()
-            return data
+        chunks = self._packet_queue.drain()
+
+        host = self.spectating
+        if host is not None and host.spectator_relay is not None:
+            # read the host's frames we haven't seen yet
+            frames = host.spectator_relay.read(self)
+            if frames is not None:
+                chunks.append(frames)
+
+        if chunks:
+            return b"".join(chunks)
 
         return None
 
@@ -5,12 +5,12 @@ import hashlib
 from datetime import datetime
 from enum import IntEnum
 from enum import unique
-from pathlib import Path
 from typing import TYPE_CHECKING
 
 from app.api.v2.common import json
 import app.state
 import app.usecases.performance
+import app.usecases.write_behind
 import app.utils
 from app.constants.clientflags import ClientFlags
 from app.constants.gamemodes import GameMode
@@ -24,8 +24,6 @@ from app.utils import pymysql_encode
 if TYPE_CHECKING:
     from app.objects.player import Player
 
-BEATMAPS_PATH = Path.cwd() / ".data/osu"
-
 
 @unique
 class Grade(IntEnum):
@@ -356,8 +354,9 @@ class Score:
         assert num_better_scores is not None
         return num_better_scores + 1
 
-    def calculate_performance(self, beatmap_id: int) -> tuple[float, float]:
+    async def calculate_performance(self, beatmap_id: int) -> tuple[float, float]:
         """Calculate PP and star rating for our score."""
+        assert self.bmap is not None
         mode_vn = self.mode.as_vanilla
 
         score_args = ScoreParams(
@@ -372,8 +371,9 @@ class Score:
             nmiss=self.nmiss,
         )
 
-        result = app.usecases.performance.calculate_performances(
-            osu_file_path=str(BEATMAPS_PATH / f"{beatmap_id}.osu"),
+        result = await app.usecases.performance.calculate_performances_async(
+            beatmap_id=beatmap_id,
+            beatmap_md5=self.bmap.md5,
             scores=[score_args],
         )
 
@@ -479,15 +479,10 @@ class Score:
 
     """ Methods for updating a score. """
 
-    async def increment_replay_views(self) -> None:
+    def increment_replay_views(self) -> None:
         # TODO: move replay views to be per-score rather than per-user
         assert self.player is not None
 
         # TODO: apparently cached stats don't store replay views?
         #       need to refactor that to be able to use stats_repo here
-        await app.state.services.database.execute(
-            f"UPDATE stats "
-            "SET replay_views = replay_views + 1 "
-            "WHERE id = :user_id AND mode = :mode",
-            {"user_id": self.player.id, "mode": self.mode},
-        )
+        app.usecases.write_behind.increment_replay_views(self.player.id, self.mode)
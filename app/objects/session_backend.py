@@ -0,0 +1,802 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import struct
+import uuid
+from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import ParamSpec
+from typing import Protocol
+from typing import cast
+
+import orjson
+from redis import asyncio as aioredis
+
+import app.state
+from app.constants.privileges import Privileges
+from app.logging import Ansi
+from app.logging import log
+from app.utils import make_safe_name
+
+if TYPE_CHECKING:
+    from app.objects.channel import Channel
+    from app.objects.collections import Channels
+    from app.objects.collections import Players
+    from app.objects.player import Player
+
+# packets sent between workers are prefixed with this header;
+# (source worker id, kind, user id or privileges, channel name length)
+MESSAGE_HEADER = struct.Struct("<HBiH")
+
+# the kinds of packets sent between workers
+MESSAGE_BROADCAST = 0  # to all players (who can read a privilege)
+MESSAGE_USER = 1  # to a single user's sessions
+MESSAGE_CHANNEL = 2  # to the members of a chat channel
+MESSAGE_INVALIDATE = 3  # a cache invalidation, to all workers' caches
+
+# how long to wait before retrying a failed flush to the broker
+FLUSH_RETRY_DELAY = 1.0  # seconds
+
+P = ParamSpec("P")
+
+# the cache invalidations which can be published to other workers, by name
+_invalidations: dict[str, Callable[..., None]] = {}
+
+
+def shared_invalidation(func: Callable[P, None]) -> Callable[P, None]:
+    """\
+    Make a cache invalidation apply to every worker's cache.
+
+    The invalidation is run on this worker, and published (along with
+    its arguments) to the other workers, which run it on their caches.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+    _invalidations[name] = func
+
+    @functools.wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> None:
+        func(*args, **kwargs)
+        app.state.sessions.backend.publish_invalidation(name, args, kwargs)
+
+    return wrapper
+
+
+class SessionBroker(Protocol):
+    """The state shared by each worker's sessions (see `SessionBackend`)."""
+
+    async def set_session(self, token: str, worker_id: int, user_id: int) -> None: ...
+
+    async def delete_sessions(self, tokens: Iterable[str]) -> None: ...
+
+    async def get_session(self, token: str) -> tuple[int, int] | None:
+        """Return the (worker id, user id) of a session."""
+        ...
+
+    async def set_users(self, users: dict[str, int], worker_id: int) -> None:
+        """Store the worker which users ({safe_name: user_id}) are logged in to."""
+        ...
+
+    async def remove_users(self, users: dict[str, int], worker_id: int) -> None:
+        """Remove logged out users ({safe_name: user_id}), along with
+        their presences, if they're still logged in to `worker_id`."""
+        ...
+
+    async def get_user_worker(self, safe_name: str) -> int | None: ...
+
+    async def clear_worker(self, worker_id: int) -> None:
+        """Remove all of a worker's sessions, users (& their presences),
+        and channel memberships; e.g. those left behind by a crash."""
+        ...
+
+    async def get_online_user_ids(self) -> set[int]:
+        """Return the ids of the online users with presences (i.e. unrestricted)."""
+        ...
+
+    async def set_presences(self, presences: dict[int, bytes]) -> None:
+        """Store users' encoded presence & stats packets."""
+        ...
+
+    async def delete_presences(self, user_ids: Iterable[int]) -> None: ...
+
+    async def get_presences(self, user_ids: Iterable[int]) -> dict[int, bytes]: ...
+
+    async def update_channel_members(
+        self,
+        joined: Iterable[tuple[str, int]],
+        left: Iterable[tuple[str, int]],
+        worker_id: int,
+    ) -> None: ...
+
+    async def get_channel_member_counts(
+        self,
+        channel_names: Iterable[str],
+    ) -> dict[str, int]: ...
+
+    async def publish(self, messages: list[bytes]) -> None: ...
+
+    def subscribe(self) -> AsyncIterator[bytes]: ...
+
+
+class RedisSessionBroker:
+    """Shares session state between workers through redis."""
+
+    SESSIONS_KEY = "bancho:sessions"  # {token: "worker_id:user_id"}
+    USERS_KEY = "bancho:users"  # {safe_name: "worker_id:user_id"}
+    PRESENCES_KEY = "bancho:presences"  # {user_id: packets}
+    CHANNEL_MEMBERS_KEY = "bancho:channel_members:{}"  # {"worker_id:user_id": n}
+    PACKETS_CHANNEL = "bancho:packets"
+
+    def __init__(self, redis: aioredis.Redis) -> None:
+        self.redis = redis
+
+    async def set_session(self, token: str, worker_id: int, user_id: int) -> None:
+        await cast(
+            Awaitable[int],
+            self.redis.hset(self.SESSIONS_KEY, token, f"{worker_id}:{user_id}"),
+        )
+
+    async def delete_sessions(self, tokens: Iterable[str]) -> None:
+        tokens = list(tokens)
+        if tokens:
+            await cast(
+                Awaitable[int],
+                self.redis.hdel(self.SESSIONS_KEY, *cast(list[Any], tokens)),
+            )
+
+    async def get_session(self, token: str) -> tuple[int, int] | None:
+        session = await cast(
+            Awaitable[bytes | None],
+            self.redis.hget(self.SESSIONS_KEY, token),
+        )
+        if session is None:
+            return None
+
+        worker_id, user_id = session.split(b":")
+        return int(worker_id), int(user_id)
+
+    async def set_users(self, users: dict[str, int], worker_id: int) -> None:
+        if users:
+            mapping = {
+                safe_name: f"{worker_id}:{user_id}"
+                for safe_name, user_id in users.items()
+            }
+            await cast(
+                Awaitable[int],
+                self.redis.hset(self.USERS_KEY, mapping=mapping),
+            )
+
+    async def remove_users(self, users: dict[str, int], worker_id: int) -> None:
+        if not users:
+            return
+
+        # (users may have logged in to another worker since)
+        values = await cast(
+            Awaitable[list[bytes | None]],
+            self.redis.hmget(self.USERS_KEY, list(users)),
+        )
+        removed_users = {
+            safe_name: user_id
+            for (safe_name, user_id), value in zip(users.items(), values)
+            if value == f"{worker_id}:{user_id}".encode()
+        }
+        if removed_users:
+            safe_names: list[Any] = list(removed_users)
+            await cast(Awaitable[int], self.redis.hdel(self.USERS_KEY, *safe_names))
+            await self.delete_presences(removed_users.values())
+
+    async def get_user_worker(self, safe_name: str) -> int | None:
+        value = await cast(
+            Awaitable[bytes | None],
+            self.redis.hget(self.USERS_KEY, safe_name),
+        )
+        return int(value.split(b":")[0]) if value is not None else None
+
+    async def clear_worker(self, worker_id: int) -> None:
+        prefix = f"{worker_id}:".encode()
+
+        await self.delete_sessions(
+            [
+                token.decode()
+                async for token, session in self.redis.hscan_iter(self.SESSIONS_KEY)
+                if session.startswith(prefix)
+            ],
+        )
+
+        users = {
+            safe_name.decode(): int(value.split(b":")[1])
+            async for safe_name, value in self.redis.hscan_iter(self.USERS_KEY)
+            if value.startswith(prefix)
+        }
+        await self.remove_users(users, worker_id)
+
+        channel_members_keys = self.redis.scan_iter(
+            match=self.CHANNEL_MEMBERS_KEY.format("*"),
+        )
+        async for key in channel_members_keys:
+            members = [
+                member
+                async for member, _ in self.redis.hscan_iter(key)
+                if member.startswith(prefix)
+            ]
+            if members:
+                await cast(Awaitable[int], self.redis.hdel(key, *members))
+
+    async def get_online_user_ids(self) -> set[int]:
+        user_ids = await cast(
+            Awaitable[list[bytes]],
+            self.redis.hkeys(self.PRESENCES_KEY),
+        )
+        return {int(user_id) for user_id in user_ids}
+
+    async def set_presences(self, presences: dict[int, bytes]) -> None:
+        if presences:
+            await cast(
+                Awaitable[int],
+                self.redis.hset(self.PRESENCES_KEY, mapping=presences),
+            )
+
+    async def delete_presences(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if user_ids:
+            await cast(
+                Awaitable[int],
+                self.redis.hdel(self.PRESENCES_KEY, *cast(list[Any], user_ids)),
+            )
+
+    async def get_presences(self, user_ids: Iterable[int]) -> dict[int, bytes]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+
+        presences = await cast(
+            Awaitable[list[bytes | None]],
+            self.redis.hmget(self.PRESENCES_KEY, user_ids),
+        )
+        return {
+            user_id: packets
+            for user_id, packets in zip(user_ids, presences)
+            if packets is not None
+        }
+
+    async def update_channel_members(
+        self,
+        joined: Iterable[tuple[str, int]],
+        left: Iterable[tuple[str, int]],
+        worker_id: int,
+    ) -> None:
+        # members are counted, as a user may join from multiple sessions;
+        # (& by worker, so a worker's members can be removed if it crashes)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for members, change in ((joined, 1), (left, -1)):
+                for channel_name, user_id in members:
+                    pipe.hincrby(
+                        self.CHANNEL_MEMBERS_KEY.format(channel_name),
+                        f"{worker_id}:{user_id}",
+                        change,
+                    )
+            await pipe.execute()
+
+    async def get_channel_member_counts(
+        self,
+        channel_names: Iterable[str],
+    ) -> dict[str, int]:
+        channel_names = list(channel_names)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for channel_name in channel_names:
+                pipe.hgetall(self.CHANNEL_MEMBERS_KEY.format(channel_name))
+            results = await pipe.execute()
+
+        return {
+            channel_name: len(
+                {
+                    member.split(b":")[1]
+                    for member, count in members.items()
+                    if int(count) > 0
+                },
+            )
+            for channel_name, members in zip(channel_names, results)
+        }
+
+    async def publish(self, messages: list[bytes]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.publish(self.PACKETS_CHANNEL, message)
+            await pipe.execute()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.PACKETS_CHANNEL)
+
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.unsubscribe(self.PACKETS_CHANNEL)
+
+
+class MemorySessionBroker:
+    """Shares session state between workers in a single process.
+
+    A stand-in for redis when running (or testing) multiple
+    workers in one process; it's not shared across processes."""
+
+    def __init__(self) -> None:
+        self.sessions: dict[str, tuple[int, int]] = {}
+        self.users: dict[str, tuple[int, int]] = {}
+        self.presences: dict[int, bytes] = {}
+        self.channel_members: dict[str, dict[tuple[int, int], int]] = {}
+        self.subscribers: list[asyncio.Queue[bytes]] = []
+
+    async def set_session(self, token: str, worker_id: int, user_id: int) -> None:
+        self.sessions[token] = (worker_id, user_id)
+
+    async def delete_sessions(self, tokens: Iterable[str]) -> None:
+        for token in tokens:
+            self.sessions.pop(token, None)
+
+    async def get_session(self, token: str) -> tuple[int, int] | None:
+        return self.sessions.get(token)
+
+    async def set_users(self, users: dict[str, int], worker_id: int) -> None:
+        for safe_name, user_id in users.items():
+            self.users[safe_name] = (worker_id, user_id)
+
+    async def remove_users(self, users: dict[str, int], worker_id: int) -> None:
+        for safe_name, user_id in users.items():
+            if self.users.get(safe_name) == (worker_id, user_id):
+                del self.users[safe_name]
+                self.presences.pop(user_id, None)
+
+    async def get_user_worker(self, safe_name: str) -> int | None:
+        user = self.users.get(safe_name)
+        return user[0] if user is not None else None
+
+    async def clear_worker(self, worker_id: int) -> None:
+        await self.delete_sessions(
+            [
+                token
+                for token, (session_worker_id, _) in self.sessions.items()
+                if session_worker_id == worker_id
+            ],
+        )
+        await self.remove_users(
+            {
+                safe_name: user_id
+                for safe_name, (user_worker_id, user_id) in self.users.items()
+                if user_worker_id == worker_id
+            },
+            worker_id,
+        )
+
+        for members in self.channel_members.values():
+            for member in [member for member in members if member[0] == worker_id]:
+                del members[member]
+
+    async def get_online_user_ids(self) -> set[int]:
+        return set(self.presences)
+
+    async def set_presences(self, presences: dict[int, bytes]) -> None:
+        self.presences |= presences
+
+    async def delete_presences(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            self.presences.pop(user_id, None)
+
+    async def get_presences(self, user_ids: Iterable[int]) -> dict[int, bytes]:
+        return {
+            user_id: self.presences[user_id]
+            for user_id in user_ids
+            if user_id in self.presences
+        }
+
+    async def update_channel_members(
+        self,
+        joined: Iterable[tuple[str, int]],
+        left: Iterable[tuple[str, int]],
+        worker_id: int,
+    ) -> None:
+        for (channel_name, user_id), change in [
+            *((member, 1) for member in joined),
+            *((member, -1) for member in left),
+        ]:
+            members = self.channel_members.setdefault(channel_name, {})
+            member = (worker_id, user_id)
+            members[member] = members.get(member, 0) + change
+
+    async def get_channel_member_counts(
+        self,
+        channel_names: Iterable[str],
+    ) -> dict[str, int]:
+        counts = {}
+        for channel_name in channel_names:
+            members = self.channel_members.get(channel_name, {})
+            counts[channel_name] = len(
+                {user_id for (_, user_id), count in members.items() if count > 0},
+            )
+
+        return counts
+
+    async def publish(self, messages: list[bytes]) -> None:
+        for queue in self.subscribers:
+            for message in messages:
+                queue.put_nowait(message)
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue[bytes] = asyncio.Queue()
+        self.subscribers.append(queue)
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.subscribers.remove(queue)
+
+
+class SessionBackend:
+    """Where a worker's sessions are tracked, and its packets delivered.
+
+    Without a broker, the worker is the only one; all state is kept in
+    its own collections (in `app.state.sessions`), as it always has been.
+
+    With a broker, each worker's sessions (token -> worker routing),
+    online users, their presences & channel memberships are shared
+    through it, and packets to players on other workers (along with
+    invalidations of the workers' caches) are published to them.
+    Changes are made from synchronous code, so they're queued, and
+    sent to the broker in batches on the next iteration of the loop.
+
+    NOTE: players stay on the worker they logged in to; tokens are
+    prefixed with its id, so a load balancer can route their requests
+    (see ext/nginx.conf.example). Their osu! web requests don't carry
+    the token, so those are forwarded to the worker by the worker which
+    receives them (see `app.api.middlewares.WorkerRoutingMiddleware`).
+    Matches & spectating are per-worker.
+    """
+
+    def __init__(
+        self,
+        players: Players,
+        channels: Channels,
+        worker_id: int = 0,
+        broker: SessionBroker | None = None,
+    ) -> None:
+        # the worker's collections, where packets from other workers are delivered
+        self.players = players
+        self.channels = channels
+
+        self.worker_id = worker_id
+        self.broker = broker
+
+        self._messages: list[bytes] = []
+        self._added_sessions: dict[str, Player] = {}  # {token: player}
+        self._removed_sessions: dict[str, Player] = {}  # {token: player}
+        self._changed_presences: dict[int, Player] = {}
+        self._joined_channels: list[tuple[str, int]] = []
+        self._left_channels: list[tuple[str, int]] = []
+
+        self._flush_task: asyncio.Task[None] | None = None
+        self._listen_task: asyncio.Task[None] | None = None
+
+    @property
+    def distributed(self) -> bool:
+        """Whether sessions are shared with other workers."""
+        return self.broker is not None
+
+    def generate_token(self) -> str:
+        """Generate a token for a new session on this worker."""
+        if not self.distributed:
+            return str(uuid.uuid4())
+
+        return f"{self.worker_id}-{uuid.uuid4()}"
+
+    async def start(self) -> None:
+        """Start receiving packets from other workers."""
+        if self.broker is None:
+            return
+
+        # sessions (& channel members) left behind by an unclean shutdown
+        await self.broker.clear_worker(self.worker_id)
+
+        self._listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Stop receiving packets from other workers, and remove
+        this worker's sessions (& channel members) from the broker."""
+        if self.broker is None:
+            return
+
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+
+        await self.flush()
+        await self.broker.clear_worker(self.worker_id)
+
+    # sessions
+
+    def add_session(self, player: Player) -> None:
+        """Share a session which logged in to this worker."""
+        if self.broker is None:
+            return
+
+        self._added_sessions[player.token] = player
+        self._changed_presences[player.id] = player
+        self._schedule_flush()
+
+    def remove_session(self, player: Player) -> None:
+        """Stop sharing a session which is logging out of this worker."""
+        if self.broker is None:
+            return
+
+        self._added_sessions.pop(player.token, None)
+        self._removed_sessions[player.token] = player
+        self._schedule_flush()
+
+    async def get_session_worker(self, token: str) -> int | None:
+        """Return the id of the worker which owns a session."""
+        if self.broker is None:
+            return self.worker_id if self.players.get(token=token) else None
+
+        await self.flush()
+        session = await self.broker.get_session(token)
+        return session[0] if session is not None else None
+
+    async def get_user_worker(self, name: str) -> int | None:
+        """Return the id of the worker which a user is logged in to."""
+        safe_name = make_safe_name(name)
+        if self.broker is None:
+            return self.worker_id if self.players.get(name=safe_name) else None
+
+        await self.flush()
+        return await self.broker.get_user_worker(safe_name)
+
+    async def get_online_user_ids(self) -> set[int]:
+        """Return the ids of all online unrestricted users, across all workers."""
+        if self.broker is None:
+            return {player.id for player in self.players.unrestricted}
+
+        await self.flush()
+        return await self.broker.get_online_user_ids()
+
+    async def is_online(self, player: Player) -> bool:
+        """Return whether a user is online, on any worker."""
+        if self.players.get(id=player.id) is not None:
+            return True
+
+        return await self.get_user_worker(player.name) is not None
+
+    # presences
+
+    def update_presence(self, player: Player) -> None:
+        """Share a player's changed presence & stats."""
+        if self.broker is None or self.players.get(token=player.token) is not player:
+            return
+
+        self._changed_presences[player.id] = player
+        self._schedule_flush()
+
+    async def get_presences(self, user_ids: Iterable[int]) -> dict[int, bytes]:
+        """Return the presence & stats packets of users on other workers."""
+        if self.broker is None:
+            return {}
+
+        await self.flush()
+        return await self.broker.get_presences(user_ids)
+
+    # channels
+
+    def add_channel_member(self, channel: Channel, player: Player) -> None:
+        if self.broker is None or channel.instance:
+            return
+
+        self._joined_channels.append((channel.real_name, player.id))
+        self._schedule_flush()
+
+    def remove_channel_member(self, channel: Channel, player: Player) -> None:
+        if self.broker is None or channel.instance:
+            return
+
+        self._left_channels.append((channel.real_name, player.id))
+        self._schedule_flush()
+
+    async def get_channel_player_counts(
+        self,
+        channels: Iterable[Channel],
+    ) -> dict[str, int]:
+        """Return the number of players in channels, across all workers."""
+        counts = {channel.real_name: len(channel.players) for channel in channels}
+        if self.broker is None:
+            return counts
+
+        await self.flush()
+        shared_counts = await self.broker.get_channel_member_counts(
+            name for name in counts if not name.startswith(("#spec_", "#multi_"))
+        )
+        return counts | shared_counts
+
+    # packets
+
+    def broadcast(self, data: bytes, read_priv: Privileges = Privileges(0)) -> None:
+        """Send packets to all players on other workers
+        (who can read channels with `read_priv`)."""
+        self._publish(MESSAGE_BROADCAST, int(read_priv), "", data)
+
+    def send_to_user(self, user_id: int, data: bytes) -> None:
+        """Send packets to a user's sessions on other workers."""
+        self._publish(MESSAGE_USER, user_id, "", data)
+
+    def send_to_channel(self, channel: Channel, data: bytes, sender_id: int) -> None:
+        """Send packets to a channel's members on other workers."""
+        if channel.instance:
+            return
+
+        self._publish(MESSAGE_CHANNEL, sender_id, channel.real_name, data)
+
+    def publish_invalidation(
+        self,
+        name: str,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> None:
+        """Run a cache invalidation on other workers (see `shared_invalidation`)."""
+        self._publish(MESSAGE_INVALIDATE, 0, name, orjson.dumps([args, kwargs]))
+
+    def _publish(self, kind: int, arg: int, channel_name: str, data: bytes) -> None:
+        if self.broker is None:
+            return
+
+        encoded_name = channel_name.encode()
+        header = MESSAGE_HEADER.pack(self.worker_id, kind, arg, len(encoded_name))
+        self._messages.append(header + encoded_name + data)
+        self._schedule_flush()
+
+    def _deliver(self, message: bytes) -> None:
+        worker_id, kind, arg, name_length = MESSAGE_HEADER.unpack_from(message)
+        if worker_id == self.worker_id:
+            return
+
+        offset = MESSAGE_HEADER.size
+        channel_name = message[offset : offset + name_length].decode()
+        data = message[offset + name_length :]
+
+        if kind == MESSAGE_BROADCAST:
+            if arg:
+                for player in self.players.readers(Privileges(arg)):
+                    player.enqueue(data)
+            else:
+                for player in self.players:
+                    player.enqueue(data)
+
+        elif kind == MESSAGE_USER:
+            target = self.players.get(id=arg)
+            if target is not None:
+                target.enqueue(data)
+
+        elif kind == MESSAGE_CHANNEL:
+            channel = self.channels.get_by_name(channel_name)
+            if channel is not None:
+                blocked_by = self.players.get_blocked_by(arg)
+                for player in channel.players:
+                    if player not in blocked_by:
+                        player.enqueue(data)
+
+        elif kind == MESSAGE_INVALIDATE:
+            args, kwargs = orjson.loads(data)
+            _invalidations[channel_name](*args, **kwargs)
+
+    async def _listen(self) -> None:
+        assert self.broker is not None
+
+        async for message in self.broker.subscribe():
+            try:
+                self._deliver(message)
+            except Exception as exc:
+                log(f"Failed to deliver packets from a worker: {exc!r}", Ansi.LRED)
+
+    # flushing
+
+    def _schedule_flush(self, delay: float = 0.0) -> None:
+        if self._flush_task is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # (no loop; sent on the next explicit flush)
+            return
+
+        self._flush_task = loop.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Send all queued changes & packets to the broker."""
+        if self.broker is None:
+            return
+
+        if (
+            self._flush_task is not None
+            and self._flush_task is not asyncio.current_task()
+        ):
+            # a flush is already scheduled; wait for it to run
+            await asyncio.shield(self._flush_task)
+            return
+
+        self._flush_task = None
+
+        added_sessions, self._added_sessions = self._added_sessions, {}
+        removed_sessions, self._removed_sessions = self._removed_sessions, {}
+        changed_presences, self._changed_presences = self._changed_presences, {}
+        joined_channels, self._joined_channels = self._joined_channels, []
+        left_channels, self._left_channels = self._left_channels, []
+        messages, self._messages = self._messages, []
+
+        # users are still logged in to this worker while they have any session
+        logged_out_users = {
+            player.safe_name: player.id
+            for player in removed_sessions.values()
+            if self.players.get(id=player.id) is None
+        }
+
+        # restricted players are hidden from other players, so
+        # only unrestricted players' presences are shared (& listed online)
+        presences: dict[int, bytes] = {}
+        hidden_user_ids: list[int] = []
+        for user_id, player in changed_presences.items():
+            if not player.is_online:
+                continue
+
+            if player.restricted:
+                hidden_user_ids.append(user_id)
+            else:
+                presences[user_id] = player.presence_packet + player.stats_packet
+
+        try:
+            for token, player in added_sessions.items():
+                await self.broker.set_session(token, self.worker_id, player.id)
+            await self.broker.delete_sessions(removed_sessions)
+
+            await self.broker.set_users(
+                {player.safe_name: player.id for player in added_sessions.values()},
+                self.worker_id,
+            )
+            await self.broker.remove_users(logged_out_users, self.worker_id)
+
+            await self.broker.set_presences(presences)
+            await self.broker.delete_presences(hidden_user_ids)
+
+            if joined_channels or left_channels:
+                await self.broker.update_channel_members(
+                    joined_channels,
+                    left_channels,
+                    self.worker_id,
+                )
+                joined_channels, left_channels = [], []
+
+            if messages:
+                await self.broker.publish(messages)
+                messages = []
+        except Exception as exc:
+            log(f"Failed to flush session changes: {exc!r}", Ansi.LRED)
+
+            # requeue the changes (before any queued since) to be retried;
+            # all but the channel members & packets can safely be resent.
+            self._added_sessions = added_sessions | self._added_sessions
+            self._removed_sessions = removed_sessions | self._removed_sessions
+            self._changed_presences = changed_presences | self._changed_presences
+            self._joined_channels = joined_channels + self._joined_channels
+            self._left_channels = left_channels + self._left_channels
+            self._messages = messages + self._messages
+
+            self._schedule_flush(delay=FLUSH_RETRY_DELAY)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import itertools
+import struct
+from collections import deque
+from typing import TYPE_CHECKING
+
+import app.metrics
+from app.packets import ServerPackets
+
+if TYPE_CHECKING:
+    from app.objects.player import Player
+
+
+class SpectatorRelay:
+    """A host's replay frames, relayed to their spectators.
+
+    Each frame bundle is encoded once, into a ring buffer of the host's
+    most recent bundles. Spectators read the bundles they haven't seen
+    (by sequence number) as they poll for data, so a bundle is stored
+    once, no matter how many spectators the host has.
+
+    A spectator which falls more than `max_lag` bundles behind
+    skips the bundles which have since been dropped.
+    """
+
+    def __init__(self, max_lag: int) -> None:
+        self.frames: deque[bytes] = deque(maxlen=max_lag)
+        self.next_seq = 0  # the sequence number of the next bundle
+
+        # the next sequence number each spectator will read; {player: seq}
+        # (keyed by player, as their token is cleared when they log out)
+        self.cursors: dict[Player, int] = {}
+
+    @property
+    def first_seq(self) -> int:
+        """The sequence number of the oldest bundle in the buffer."""
+        return self.next_seq - len(self.frames)
+
+    def add_spectator(self, player: Player) -> None:
+        """Start relaying bundles to a spectator, from the next bundle."""
+        self.cursors[player] = self.next_seq
+
+    def remove_spectator(self, player: Player) -> None:
+        """Stop relaying bundles to a spectator."""
+        del self.cursors[player]
+        self._release_read_frames()
+
+    def publish(self, raw_data: bytes) -> None:
+        """Add a frame bundle, to be read by each spectator."""
+        # encoded once here, rather than once per spectator
+        self.frames.append(
+            struct.pack("<HxI", ServerPackets.SPECTATE_FRAMES, len(raw_data))
+            + raw_data,
+        )
+        self.next_seq += 1
+
+    def read(self, player: Player) -> bytes | None:
+        """Read the bundles a spectator hasn't seen yet."""
+        cursor = self.cursors[player]
+        first_seq = self.first_seq
+
+        if cursor < first_seq:
+            # the spectator fell too far behind; skip the dropped bundles
+            app.metrics.increment("ex_spectator_frames_dropped", first_seq - cursor)
+            cursor = first_seq
+
+        if cursor == self.next_seq:
+            return None
+
+        data = b"".join(itertools.islice(self.frames, cursor - first_seq, None))
+        self.cursors[player] = self.next_seq
+        self._release_read_frames()
+
+        app.metrics.increment("ex_spectator_relay_bytes", len(data))
+        return data
+
+    def _release_read_frames(self) -> None:
+        # bundles read by every spectator are no longer needed
+        oldest_cursor = min(self.cursors.values(), default=self.next_seq)
+        while self.frames and self.first_seq < oldest_cursor:
+            self.frames.popleft()
@@ -13,6 +13,7 @@ from enum import IntEnum
 from enum import unique
 from functools import cache
 from functools import lru_cache
+from functools import partial
 from typing import TYPE_CHECKING
 from typing import Any
 from typing import NamedTuple
@@ -303,11 +304,39 @@ class BasePacket(ABC):
 PacketMap = dict[ClientPackets, type[BasePacket]]
 
 
+# precompiled decoders for the reader; these are far
+# cheaper than re-parsing a format string on every read.
+PACKET_HEADER_FMT = struct.Struct("<HxI")
+
+_I8 = struct.Struct("<b")
+_I16 = struct.Struct("<h")
+_U16 = struct.Struct("<H")
+_I32 = struct.Struct("<i")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_U64 = struct.Struct("<Q")
+_F16 = struct.Struct("<e")
+_F32 = struct.Struct("<f")
+_F64 = struct.Struct("<d")
+
+REPLAYFRAME_FMT = struct.Struct("<BBffi")
+SCOREFRAME_V2_FMT = struct.Struct("<dd")
+
+# fixed-layout sections of an osu! match
+MATCH_HEAD_FMT = struct.Struct("<hbbi")  # id, in_progress, powerplay, mods
+MATCH_SLOTS_FMT = struct.Struct("<16b16b")  # slot statuses & teams
+MATCH_TAIL_FMT = struct.Struct("<ibbbb")  # host, mode, win cond, team type, freemods
+MATCH_SLOT_MODS_FMT = struct.Struct("<16i")
+
+
 class BanchoPacketReader:
     """\
     A class for reading bancho packets
     from the osu! client's request body.
 
+    The reader never re-slices the body; it advances an integer
+    cursor over the (readonly) view and decodes values in place.
+
     Attributes
     -----------
     body_view: `memoryview`
@@ -331,141 +360,126 @@ class BanchoPacketReader:
 
         self.current_len = 0  # last read packet's length
 
+        self._offset = 0  # read cursor into body_view
+        self._packet_end = 0  # offset at which the current packet ends
+
     def __iter__(self) -> Iterator[BasePacket]:
         return self
 
     def __next__(self) -> BasePacket:
-        # do not break until we've read the
+        # resume from the end of the last packet, regardless
+        # of how much of its body the handler actually read.
+        self._offset = self._packet_end
+        body_len = len(self.body_view)
+
+        # do not return until we've read the
         # header of a packet we can handle.
-        p_type = ClientPackets.UNKNOWN_PACKET
-        p_len = 0
-        while self.body_view:  # len(self.view) < 7?
-            p_type, p_len = self._read_header()
-
-            if p_type not in self.packet_map:
-                # packet type not handled, remove
-                # from internal buffer and continue.
-                if p_len != 0:
-                    self.body_view = self.body_view[p_len:]
-            else:
-                # we can handle this one.
-                break
-        else:
-            raise StopIteration
+        while self._offset + PACKET_HEADER_FMT.size <= body_len:
+            p_type, p_len = PACKET_HEADER_FMT.unpack_from(self.body_view, self._offset)
+            self._offset += PACKET_HEADER_FMT.size
+            self._packet_end = self._offset + p_len
+
+            if p_type in self.packet_map:
+                # we have a packet handler for this.
+                packet_cls = self.packet_map[ClientPackets(p_type)]
+                self.current_len = p_len
 
-        # we have a packet handler for this.
-        packet_cls = self.packet_map[p_type]
-        self.current_len = p_len
+                return packet_cls(self)
 
-        return packet_cls(self)
+            # packet type not handled, skip over its body.
+            self._offset = self._packet_end
 
-    def _read_header(self) -> tuple[ClientPackets, int]:
-        """Read the header of an osu! packet (id & length)."""
-        # read type & length from the body
-        data = struct.unpack("<HxI", self.body_view[:7])
-        self.body_view = self.body_view[7:]
-        return ClientPackets(data[0]), data[1]
+        self._packet_end = self._offset
+        raise StopIteration
+
+    def _unpack(self, fmt: struct.Struct) -> tuple[Any, ...]:
+        """Decode `fmt` at the cursor & advance past it."""
+        val = fmt.unpack_from(self.body_view, self._offset)
+        self._offset += fmt.size
+        return val
 
     """ public API (exposed for packet handler's __init__ methods) """
 
     def read_raw(self) -> memoryview:
-        val = self.body_view[: self.current_len]
-        self.body_view = self.body_view[self.current_len :]
-        return val
+        start = self._offset
+        self._offset += self.current_len
+        return self.body_view[start : self._offset]
 
     # integral types
 
     def read_i8(self) -> int:
-        val = self.body_view[0]
-        self.body_view = self.body_view[1:]
-        return val - 256 if val > 127 else val
+        return cast(int, self._unpack(_I8)[0])
 
     def read_u8(self) -> int:
-        val = self.body_view[0]
-        self.body_view = self.body_view[1:]
+        val = self.body_view[self._offset]
+        self._offset += 1
         return val
 
     def read_i16(self) -> int:
-        val = int.from_bytes(self.body_view[:2], "little", signed=True)
-        self.body_view = self.body_view[2:]
-        return val
+        return cast(int, self._unpack(_I16)[0])
 
     def read_u16(self) -> int:
-        val = int.from_bytes(self.body_view[:2], "little", signed=False)
-        self.body_view = self.body_view[2:]
-        return val
+        return cast(int, self._unpack(_U16)[0])
 
     def read_i32(self) -> int:
-        val = int.from_bytes(self.body_view[:4], "little", signed=True)
-        self.body_view = self.body_view[4:]
-        return val
+        return cast(int, self._unpack(_I32)[0])
 
     def read_u32(self) -> int:
-        val = int.from_bytes(self.body_view[:4], "little", signed=False)
-        self.body_view = self.body_view[4:]
-        return val
+        return cast(int, self._unpack(_U32)[0])
 
     def read_i64(self) -> int:
-        val = int.from_bytes(self.body_view[:8], "little", signed=True)
-        self.body_view = self.body_view[8:]
-        return val
+        return cast(int, self._unpack(_I64)[0])
 
     def read_u64(self) -> int:
-        val = int.from_bytes(self.body_view[:8], "little", signed=False)
-        self.body_view = self.body_view[8:]
-        return val
+        return cast(int, self._unpack(_U64)[0])
 
     # floating-point types
 
     def read_f16(self) -> float:
-        (val,) = struct.unpack_from("<e", self.body_view[:2])
-        self.body_view = self.body_view[2:]
-        return cast(float, val)
+        return cast(float, self._unpack(_F16)[0])
 
     def read_f32(self) -> float:
-        (val,) = struct.unpack_from("<f", self.body_view[:4])
-        self.body_view = self.body_view[4:]
-        return cast(float, val)
+        return cast(float, self._unpack(_F32)[0])
 
     def read_f64(self) -> float:
-        (val,) = struct.unpack_from("<d", self.body_view[:8])
-        self.body_view = self.body_view[8:]
-        return cast(float, val)
+        return cast(float, self._unpack(_F64)[0])
 
     # complex types
 
     # XXX: some osu! packets use i16 for
     # array length, while others use i32
     def read_i32_list_i16l(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:2], "little")
-        self.body_view = self.body_view[2:]
-
-        val = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
-        return val
+        length = self.read_u16()
+        return self._read_list("I", length)
 
     def read_i32_list_i32l(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:4], "little")
-        self.body_view = self.body_view[4:]
+        length = self.read_u32()
+        return self._read_list("I", length)
 
-        val = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
+    def _read_list(self, fmt: str, length: int) -> tuple[int, ...]:
+        """Decode `length` sequential values of the (4 byte) type `fmt`."""
+        val = struct.unpack_from(f"<{length}{fmt}", self.body_view, self._offset)
+        self._offset += length * 4
         return val
 
     def read_string(self) -> str:
-        exists = self.body_view[0] == 0x0B
-        self.body_view = self.body_view[1:]
+        view = self.body_view
+        offset = self._offset
+
+        exists = view[offset] == 0x0B
+        offset += 1
 
         if not exists:
             # no string sent.
+            self._offset = offset
             return ""
 
         # non-empty string, decode str length (uleb128)
         length = shift = 0
 
         while True:
-            byte = self.body_view[0]
-            self.body_view = self.body_view[1:]
+            byte = view[offset]
+            offset += 1
 
             length |= (byte & 0x7F) << shift
             if (byte & 0x80) == 0:
@@ -473,9 +487,8 @@ class BanchoPacketReader:
 
             shift += 7
 
-        val = self.body_view[:length].tobytes().decode()  # copy
-        self.body_view = self.body_view[length:]
-        return val
+        self._offset = offset + length
+        return str(view[offset : self._offset], "utf-8")
 
     # custom osu! types
 
@@ -498,64 +511,73 @@ class BanchoPacketReader:
 
     def read_match(self) -> MultiplayerMatch:
         """Read an osu! match from the internal buffer."""
+        match_id, in_progress, powerplay, mods = self._unpack(MATCH_HEAD_FMT)
+
         match = MultiplayerMatch(
-            id=self.read_i16(),
-            in_progress=self.read_i8() == 1,
-            powerplay=self.read_i8(),
-            mods=self.read_i32(),
+            id=match_id,
+            in_progress=in_progress == 1,
+            powerplay=powerplay,
+            mods=mods,
             name=self.read_string(),
             passwd=self.read_string(),
             map_name=self.read_string(),
             map_id=self.read_i32(),
             map_md5=self.read_string(),
-            slot_statuses=[self.read_i8() for _ in range(16)],
-            slot_teams=[self.read_i8() for _ in range(16)],
-            # ^^ up to slot_ids, as it relies on slot_statuses ^^
         )
 
-        for status in match.slot_statuses:
-            if status & 124 != 0:  # slot has a player
-                match.slot_ids.append(self.read_i32())
+        slots = self._unpack(MATCH_SLOTS_FMT)
+        match.slot_statuses = list(slots[:16])
+        match.slot_teams = list(slots[16:])
 
-        match.host_id = self.read_i32()
-        match.mode = self.read_i8()
-        match.win_condition = self.read_i8()
-        match.team_type = self.read_i8()
-        match.freemods = self.read_i8() == 1
+        # slot ids are only sent for slots which have a player
+        occupied = sum(1 for status in match.slot_statuses if status & 124 != 0)
+        if occupied:
+            match.slot_ids = list(self._read_list("i", occupied))
+
+        (
+            match.host_id,
+            match.mode,
+            match.win_condition,
+            match.team_type,
+            freemods,
+        ) = self._unpack(MATCH_TAIL_FMT)
+        match.freemods = freemods == 1
 
         if match.freemods:
-            match.slot_mods = [self.read_i32() for _ in range(16)]
+            match.slot_mods = list(self._unpack(MATCH_SLOT_MODS_FMT))
 
         match.seed = self.read_i32()  # used for mania random mod
 
         return match
 
     def read_scoreframe(self) -> ScoreFrame:
-        sf = ScoreFrame(*SCOREFRAME_FMT.unpack_from(self.body_view[:29]))
-        self.body_view = self.body_view[29:]
+        sf = ScoreFrame(*self._unpack(SCOREFRAME_FMT))
 
         if sf.score_v2:
-            sf.combo_portion = self.read_f64()
-            sf.bonus_portion = self.read_f64()
+            sf.combo_portion, sf.bonus_portion = self._unpack(SCOREFRAME_V2_FMT)
 
         return sf
 
     def read_replayframe(self) -> ReplayFrame:
-        return ReplayFrame(
-            button_state=self.read_u8(),
-            taiko_byte=self.read_u8(),  # pre-taiko support (<=2008)
-            x=self.read_f32(),
-            y=self.read_f32(),
-            time=self.read_i32(),
-        )
+        return ReplayFrame._make(self._unpack(REPLAYFRAME_FMT))
 
     def read_replayframe_bundle(self) -> ReplayFrameBundle:
         # save raw format to distribute to the other clients
-        raw_data = self.body_view[: self.current_len]
+        raw_data = self.body_view[self._offset : self._offset + self.current_len]
 
         extra = self.read_i32()  # bancho proto >= 18
         framecount = self.read_u16()
-        frames = [self.read_replayframe() for _ in range(framecount)]
+
+        # decode all frames in a single pass over the buffer
+        frames_end = self._offset + framecount * REPLAYFRAME_FMT.size
+        frames = list(
+            map(
+                ReplayFrame._make,
+                REPLAYFRAME_FMT.iter_unpack(self.body_view[self._offset : frames_end]),
+            ),
+        )
+        self._offset = frames_end
+
         action = ReplayAction(self.read_u8())
         scoreframe = self.read_scoreframe()
         sequence = self.read_u16()
@@ -699,49 +721,247 @@ def write_scoreframe(s: ScoreFrame) -> bytes:
     )
 
 
-_noexpand_types: dict[osuTypes, Callable[..., bytes]] = {
-    # base
-    osuTypes.i8: struct.Struct("<b").pack,
-    osuTypes.u8: struct.Struct("<B").pack,
-    osuTypes.i16: struct.Struct("<h").pack,
-    osuTypes.u16: struct.Struct("<H").pack,
-    osuTypes.i32: struct.Struct("<i").pack,
-    osuTypes.u32: struct.Struct("<I").pack,
-    # osuTypes.f16: struct.Struct('<e').pack, # futureproofing
-    osuTypes.f32: struct.Struct("<f").pack,
-    osuTypes.i64: struct.Struct("<q").pack,
-    osuTypes.u64: struct.Struct("<Q").pack,
-    osuTypes.f64: struct.Struct("<d").pack,
-    # more complex
-    osuTypes.string: write_string,
-    osuTypes.i32_list: write_i32_list,
-    osuTypes.scoreframe: write_scoreframe,
+# struct format characters for all fixed-size types
+_fixed_type_fmts: dict[osuTypes, str] = {
+    osuTypes.i8: "b",
+    osuTypes.u8: "B",
+    osuTypes.i16: "h",
+    osuTypes.u16: "H",
+    osuTypes.i32: "i",
+    osuTypes.u32: "I",
+    osuTypes.f32: "f",
+    osuTypes.i64: "q",
+    osuTypes.u64: "Q",
+    osuTypes.f64: "d",
+}
+
+# composite types which are flattened into their fields when compiled
+_composite_types: dict[osuTypes, tuple[osuTypes, ...]] = {
+    osuTypes.message: (osuTypes.string, osuTypes.string, osuTypes.string, osuTypes.i32),
+    osuTypes.channel: (osuTypes.string, osuTypes.string, osuTypes.u16),
+}
+
+PacketEncoder = Callable[..., bytes]
+FieldWriter = Callable[[bytearray, Any], None]
+
+PACKET_LENGTH_FMT = struct.Struct("<I")
+
+
+def _write_string_into(buf: bytearray, s: str) -> None:
+    """Write `s` into `buf` (ULEB128 & string)."""
+    if not s:
+        buf.append(0x00)
+        return
+
+    encoded = s.encode()
+    length = len(encoded)
+
+    buf.append(0x0B)
+    while length >= 0x80:
+        buf.append((length & 0x7F) | 0x80)
+        length >>= 7
+    buf.append(length)
+
+    buf += encoded
+
+
+def _write_i32_list_into(buf: bytearray, l: Collection[int]) -> None:
+    """Write `l` into `buf` (int32 list, 2 bytes len)."""
+    buf += struct.pack(f"<H{len(l)}i", len(l), *l)
+
+
+def _write_raw_into(buf: bytearray, data: bytes) -> None:
+    buf += data
+
+
+def _write_scoreframe_into(buf: bytearray, s: ScoreFrame) -> None:
+    buf += write_scoreframe(s)
+
+
+def _write_match_into(buf: bytearray, args: tuple[Match, bool]) -> None:
+    buf += write_match(*args)  # (match, send_pw)
+
+
+def _fixed_writer(fmt: struct.Struct) -> FieldWriter:
+    pack = fmt.pack
+
+    def write_fixed(buf: bytearray, values: tuple[Any, ...]) -> None:
+        buf += pack(*values)
+
+    return write_fixed
+
+
+_variable_type_writers: dict[osuTypes, FieldWriter] = {
+    osuTypes.string: _write_string_into,
+    osuTypes.i32_list: _write_i32_list_into,
+    osuTypes.raw: _write_raw_into,
+    osuTypes.scoreframe: _write_scoreframe_into,
+    osuTypes.match: _write_match_into,
     # not (yet?) implemented: write replayframe & bundle
 }
 
-_expand_types: dict[osuTypes, Callable[..., bytearray]] = {
-    # multiarg, tuple expansion
-    osuTypes.message: write_message,
-    osuTypes.channel: write_channel,
-    osuTypes.match: write_match,
+# variable-size types which take more than one argument
+_multiarg_types: dict[osuTypes, int] = {
+    osuTypes.match: 2,  # (match, send_pw)
 }
 
 
-def write(packid: int, *args: tuple[Any, osuTypes]) -> bytes:
-    """Write `args` into bytes."""
-    ret = bytearray(struct.pack("<Hx", packid))
+def compile_packet(packet_id: ServerPackets, *fields: osuTypes) -> PacketEncoder:
+    """\
+    Compile a packet's schema into a specialized encoder.
 
-    for p_args, p_type in args:
-        if p_type == osuTypes.raw:
-            ret += p_args
-        elif p_type in _noexpand_types:
-            ret += _noexpand_types[p_type](p_args)
-        elif p_type in _expand_types:
-            ret += _expand_types[p_type](*p_args)
+    The encoder takes one argument per (flattened) field, and returns
+    the packet with its header. Consecutive fixed-size fields are
+    packed together with a single `struct.Struct`; packets comprised
+    only of fixed-size fields are packed with their header in one go.
+    """
+    flat_fields: list[osuTypes] = []
+    for field_type in fields:
+        flat_fields.extend(_composite_types.get(field_type, (field_type,)))
 
-    # add size
-    ret[3:3] = struct.pack("<I", len(ret) - 3)
-    return bytes(ret)
+    if all(field_type in _fixed_type_fmts for field_type in flat_fields):
+        fmt = struct.Struct(
+            "<HxI" + "".join(_fixed_type_fmts[t] for t in flat_fields),
+        )
+        # the length never changes, so bake it into the encoder.
+        return partial(fmt.pack, packet_id, fmt.size - PACKET_HEADER_FMT.size)
+
+    # build the list of writers, each with the slice (or index)
+    # of the encoder's arguments that it's responsible for.
+    writers: list[tuple[FieldWriter, int | slice]] = []
+    arg_idx = 0
+    run_start = 0
+    run_fmt = ""
+
+    for field_type in flat_fields:
+        if field_type in _fixed_type_fmts:
+            if not run_fmt:
+                run_start = arg_idx
+            run_fmt += _fixed_type_fmts[field_type]
+            arg_idx += 1
+            continue
+
+        if run_fmt:
+            run = _fixed_writer(struct.Struct("<" + run_fmt))
+            writers.append((run, slice(run_start, arg_idx)))
+            run_fmt = ""
+
+        writer = _variable_type_writers[field_type]
+        if field_type in _multiarg_types:
+            num_args = _multiarg_types[field_type]
+            writers.append((writer, slice(arg_idx, arg_idx + num_args)))
+            arg_idx += num_args
+        else:
+            writers.append((writer, arg_idx))
+            arg_idx += 1
+
+    if run_fmt:
+        run = _fixed_writer(struct.Struct("<" + run_fmt))
+        writers.append((run, slice(run_start, arg_idx)))
+
+    # reserve space for the length up front; it's filled in once
+    # the packet is written, rather than being spliced in after.
+    header = PACKET_HEADER_FMT.pack(packet_id, 0)
+
+    def encode(*args: Any) -> bytes:
+        buf = bytearray(header)
+
+        for writer, key in writers:
+            writer(buf, args[key])
+
+        PACKET_LENGTH_FMT.pack_into(buf, 3, len(buf) - PACKET_HEADER_FMT.size)
+        return bytes(buf)
+
+    return encode
+
+
+# the schema of each packet sent by the server.
+SERVER_PACKET_SCHEMAS: dict[ServerPackets, tuple[osuTypes, ...]] = {
+    ServerPackets.USER_ID: (osuTypes.i32,),
+    ServerPackets.SEND_MESSAGE: (osuTypes.message,),
+    ServerPackets.PONG: (),
+    ServerPackets.HANDLE_IRC_CHANGE_USERNAME: (osuTypes.string,),
+    ServerPackets.USER_STATS: (
+        osuTypes.i32,  # id
+        osuTypes.u8,  # action
+        osuTypes.string,  # info_text
+        osuTypes.string,  # map_md5
+        osuTypes.i32,  # mods
+        osuTypes.u8,  # mode
+        osuTypes.i32,  # map_id
+        osuTypes.i64,  # rscore
+        osuTypes.f32,  # acc
+        osuTypes.i32,  # plays
+        osuTypes.i64,  # tscore
+        osuTypes.i32,  # rank
+        osuTypes.u16,  # pp
+    ),
+    ServerPackets.USER_LOGOUT: (osuTypes.i32, osuTypes.u8),
+    ServerPackets.SPECTATOR_JOINED: (osuTypes.i32,),
+    ServerPackets.SPECTATOR_LEFT: (osuTypes.i32,),
+    ServerPackets.SPECTATE_FRAMES: (osuTypes.raw,),
+    ServerPackets.VERSION_UPDATE: (),
+    ServerPackets.SPECTATOR_CANT_SPECTATE: (osuTypes.i32,),
+    ServerPackets.GET_ATTENTION: (),
+    ServerPackets.NOTIFICATION: (osuTypes.string,),
+    ServerPackets.UPDATE_MATCH: (osuTypes.match,),
+    ServerPackets.NEW_MATCH: (osuTypes.match,),
+    ServerPackets.DISPOSE_MATCH: (osuTypes.i32,),
+    ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS: (),
+    ServerPackets.MATCH_JOIN_SUCCESS: (osuTypes.match,),
+    ServerPackets.MATCH_JOIN_FAIL: (),
+    ServerPackets.FELLOW_SPECTATOR_JOINED: (osuTypes.i32,),
+    ServerPackets.FELLOW_SPECTATOR_LEFT: (osuTypes.i32,),
+    ServerPackets.MATCH_START: (osuTypes.match,),
+    ServerPackets.MATCH_SCORE_UPDATE: (osuTypes.scoreframe,),
+    ServerPackets.MATCH_TRANSFER_HOST: (),
+    ServerPackets.MATCH_ALL_PLAYERS_LOADED: (),
+    ServerPackets.MATCH_PLAYER_FAILED: (osuTypes.i32,),
+    ServerPackets.MATCH_COMPLETE: (),
+    ServerPackets.MATCH_SKIP: (),
+    ServerPackets.CHANNEL_JOIN_SUCCESS: (osuTypes.string,),
+    ServerPackets.CHANNEL_INFO: (osuTypes.channel,),
+    ServerPackets.CHANNEL_KICK: (osuTypes.string,),
+    ServerPackets.CHANNEL_AUTO_JOIN: (osuTypes.channel,),
+    ServerPackets.PRIVILEGES: (osuTypes.i32,),
+    ServerPackets.FRIENDS_LIST: (osuTypes.i32_list,),
+    ServerPackets.PROTOCOL_VERSION: (osuTypes.i32,),
+    ServerPackets.MAIN_MENU_ICON: (osuTypes.string,),
+    ServerPackets.MONITOR: (),
+    ServerPackets.MATCH_PLAYER_SKIPPED: (osuTypes.i32,),
+    ServerPackets.USER_PRESENCE: (
+        osuTypes.i32,  # id
+        osuTypes.string,  # name
+        osuTypes.u8,  # utc offset
+        osuTypes.u8,  # country code
+        osuTypes.u8,  # bancho privileges | mode
+        osuTypes.f32,  # longitude
+        osuTypes.f32,  # latitude
+        osuTypes.i32,  # global rank
+    ),
+    ServerPackets.RESTART: (osuTypes.i32,),
+    ServerPackets.MATCH_INVITE: (osuTypes.message,),
+    ServerPackets.CHANNEL_INFO_END: (),
+    ServerPackets.MATCH_CHANGE_PASSWORD: (osuTypes.string,),
+    ServerPackets.SILENCE_END: (osuTypes.i32,),
+    ServerPackets.USER_SILENCED: (osuTypes.i32,),
+    ServerPackets.USER_PRESENCE_SINGLE: (osuTypes.i32,),
+    ServerPackets.USER_PRESENCE_BUNDLE: (osuTypes.i32_list,),
+    ServerPackets.USER_DM_BLOCKED: (osuTypes.message,),
+    ServerPackets.TARGET_IS_SILENCED: (osuTypes.message,),
+    ServerPackets.VERSION_UPDATE_FORCED: (),
+    ServerPackets.SWITCH_SERVER: (osuTypes.i32,),
+    ServerPackets.ACCOUNT_RESTRICTED: (),
+    ServerPackets.RTX: (osuTypes.string,),
+    ServerPackets.MATCH_ABORT: (),
+    ServerPackets.SWITCH_TOURNAMENT_SERVER: (osuTypes.string,),
+}
+
+# each packet's schema, compiled once at startup.
+ENCODERS: dict[ServerPackets, PacketEncoder] = {
+    packet_id: compile_packet(packet_id, *fields)
+    for packet_id, fields in SERVER_PACKET_SCHEMAS.items()
+}
 
 
 #
@@ -770,30 +990,24 @@ def login_reply(user_id: int) -> bytes:
 
     In failure cases, we'll send a negative integer of type `LoginFailureReason`.
     """
-    return write(ServerPackets.USER_ID, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.USER_ID](user_id)
 
 
 # packet id: 7
 def send_message(sender: str, msg: str, recipient: str, sender_id: int) -> bytes:
-    return write(
-        ServerPackets.SEND_MESSAGE,
-        ((sender, msg, recipient, sender_id), osuTypes.message),
-    )
+    return ENCODERS[ServerPackets.SEND_MESSAGE](sender, msg, recipient, sender_id)
 
 
 # packet id: 8
 @cache
 def pong() -> bytes:
-    return write(ServerPackets.PONG)
+    return ENCODERS[ServerPackets.PONG]()
 
 
 # packet id: 9
 # NOTE: deprecated
 def change_username(old: str, new: str) -> bytes:
-    return write(
-        ServerPackets.HANDLE_IRC_CHANGE_USERNAME,
-        (f"{old}>>>>{new}", osuTypes.string),
-    )
+    return ENCODERS[ServerPackets.HANDLE_IRC_CHANGE_USERNAME](f"{old}>>>>{new}")
 
 
 BOT_STATUSES = (
@@ -818,21 +1032,20 @@ def bot_stats(player: Player) -> bytes:
     # pick at random from list of potential statuses.
     status_id, status_txt = random.choice(BOT_STATUSES)
 
-    return write(
-        ServerPackets.USER_STATS,
-        (player.id, osuTypes.i32),  # id
-        (status_id, osuTypes.u8),  # action
-        (status_txt, osuTypes.string),  # info_text
-        ("", osuTypes.string),  # map_md5
-        (0, osuTypes.i32),  # mods
-        (0, osuTypes.u8),  # mode
-        (0, osuTypes.i32),  # map_id
-        (0, osuTypes.i64),  # rscore
-        (0.0, osuTypes.f32),  # acc
-        (0, osuTypes.i32),  # plays
-        (0, osuTypes.i64),  # tscore
-        (0, osuTypes.i32),  # rank
-        (0, osuTypes.u16),  # pp
+    return ENCODERS[ServerPackets.USER_STATS](
+        player.id,  # id
+        status_id,  # action
+        status_txt,  # info_text
+        "",  # map_md5
+        0,  # mods
+        0,  # mode
+        0,  # map_id
+        0,  # rscore
+        0.0,  # acc
+        0,  # plays
+        0,  # tscore
+        0,  # rank
+        0,  # pp
     )
 
 
@@ -858,69 +1071,45 @@ def _user_stats(
         ranked_score = pp
         pp = 0
 
-    return write(
-        ServerPackets.USER_STATS,
-        (user_id, osuTypes.i32),
-        (action, osuTypes.u8),
-        (info_text, osuTypes.string),
-        (map_md5, osuTypes.string),
-        (mods, osuTypes.i32),
-        (mode, osuTypes.u8),
-        (map_id, osuTypes.i32),
-        (ranked_score, osuTypes.i64),
-        (accuracy / 100.0, osuTypes.f32),
-        (plays, osuTypes.i32),
-        (total_score, osuTypes.i64),
-        (global_rank, osuTypes.i32),
-        (pp, osuTypes.u16),
+    return ENCODERS[ServerPackets.USER_STATS](
+        user_id,
+        action,
+        info_text,
+        map_md5,
+        mods,
+        mode,
+        map_id,
+        ranked_score,
+        accuracy / 100.0,
+        plays,
+        total_score,
+        global_rank,
+        pp,
     )
 
 
 def user_stats(player: Player) -> bytes:
-    gm_stats = player.gm_stats
-    if gm_stats.pp > 0xFFFF:
-        # HACK: if pp is over osu!'s ingame cap,
-        # we can instead display it as ranked score
-        rscore = gm_stats.pp
-        pp = 0
-    else:
-        rscore = gm_stats.rscore
-        pp = gm_stats.pp
-
-    return write(
-        ServerPackets.USER_STATS,
-        (player.id, osuTypes.i32),
-        (player.status.action, osuTypes.u8),
-        (player.status.info_text, osuTypes.string),
-        (player.status.map_md5, osuTypes.string),
-        (player.status.mods, osuTypes.i32),
-        (player.status.mode.as_vanilla, osuTypes.u8),
-        (player.status.map_id, osuTypes.i32),
-        (rscore, osuTypes.i64),
-        (gm_stats.acc / 100.0, osuTypes.f32),
-        (gm_stats.plays, osuTypes.i32),
-        (gm_stats.tscore, osuTypes.i64),
-        (gm_stats.rank, osuTypes.i32),
-        (pp, osuTypes.u16),
-    )
+    # NOTE: the encoded packet is cached on the player, and
+    # only rebuilt after their status or stats have changed.
+    return player.stats_packet
 
 
 # packet id: 12
 @cache
 def logout(user_id: int) -> bytes:
-    return write(ServerPackets.USER_LOGOUT, (user_id, osuTypes.i32), (0, osuTypes.u8))
+    return ENCODERS[ServerPackets.USER_LOGOUT](user_id, 0)
 
 
 # packet id: 13
 @cache
 def spectator_joined(user_id: int) -> bytes:
-    return write(ServerPackets.SPECTATOR_JOINED, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.SPECTATOR_JOINED](user_id)
 
 
 # packet id: 14
 @cache
 def spectator_left(user_id: int) -> bytes:
-    return write(ServerPackets.SPECTATOR_LEFT, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.SPECTATOR_LEFT](user_id)
 
 
 # packet id: 15
@@ -930,81 +1119,81 @@ def spectate_frames(data: bytes) -> bytes:
 
     # spectator frames *received* by the server are always validated.
 
-    return write(ServerPackets.SPECTATE_FRAMES, (data, osuTypes.raw))
+    return ENCODERS[ServerPackets.SPECTATE_FRAMES](data)
 
 
 # packet id: 19
 @cache
 def version_update() -> bytes:
-    return write(ServerPackets.VERSION_UPDATE)
+    return ENCODERS[ServerPackets.VERSION_UPDATE]()
 
 
 # packet id: 22
 @cache
 def spectator_cant_spectate(user_id: int) -> bytes:
-    return write(ServerPackets.SPECTATOR_CANT_SPECTATE, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.SPECTATOR_CANT_SPECTATE](user_id)
 
 
 # packet id: 23
 @cache
 def get_attention() -> bytes:
-    return write(ServerPackets.GET_ATTENTION)
+    return ENCODERS[ServerPackets.GET_ATTENTION]()
 
 
 # packet id: 24
 @lru_cache(maxsize=4)
 def notification(msg: str) -> bytes:
-    return write(ServerPackets.NOTIFICATION, (msg, osuTypes.string))
+    return ENCODERS[ServerPackets.NOTIFICATION](msg)
 
 
 # packet id: 26
 def update_match(m: Match, send_pw: bool = True) -> bytes:
-    return write(ServerPackets.UPDATE_MATCH, ((m, send_pw), osuTypes.match))
+    return ENCODERS[ServerPackets.UPDATE_MATCH](m, send_pw)
 
 
 # packet id: 27
 def new_match(m: Match) -> bytes:
-    return write(ServerPackets.NEW_MATCH, ((m, True), osuTypes.match))
+    return ENCODERS[ServerPackets.NEW_MATCH](m, True)
 
 
 # packet id: 28
 @cache
 def dispose_match(id: int) -> bytes:
-    return write(ServerPackets.DISPOSE_MATCH, (id, osuTypes.i32))
+    return ENCODERS[ServerPackets.DISPOSE_MATCH](id)
 
 
 # packet id: 34
 @cache
 def toggle_block_non_friend_dm() -> bytes:
-    return write(ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS)
+    return ENCODERS[ServerPackets.TOGGLE_BLOCK_NON_FRIEND_DMS]()
 
 
 # packet id: 36
 def match_join_success(m: Match) -> bytes:
-    return write(ServerPackets.MATCH_JOIN_SUCCESS, ((m, True), osuTypes.match))
+    return ENCODERS[ServerPackets.MATCH_JOIN_SUCCESS](m, True)
 
 
 # packet id: 37
 @cache
 def match_join_fail() -> bytes:
-    return write(ServerPackets.MATCH_JOIN_FAIL)
+    return ENCODERS[ServerPackets.MATCH_JOIN_FAIL]()
 
 
 # packet id: 42
 @cache
 def fellow_spectator_joined(user_id: int) -> bytes:
-    return write(ServerPackets.FELLOW_SPECTATOR_JOINED, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.FELLOW_SPECTATOR_JOINED](user_id)
 
 
 # packet id: 43
 @cache
 def fellow_spectator_left(user_id: int) -> bytes:
-    return write(ServerPackets.FELLOW_SPECTATOR_LEFT, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.FELLOW_SPECTATOR_LEFT](user_id)
 
 
 # packet id: 46
 def match_start(m: Match) -> bytes:
-    return write(ServerPackets.MATCH_START, ((m, True), osuTypes.match))
+    return ENCODERS[ServerPackets.MATCH_START](m, True)
 
 
 # packet id: 48
@@ -1013,64 +1202,61 @@ def match_start(m: Match) -> bytes:
 #       rather than parsing them. Though I might
 #       end up doing it eventually for security reasons
 def match_score_update(frame: ScoreFrame) -> bytes:
-    return write(ServerPackets.MATCH_SCORE_UPDATE, (frame, osuTypes.scoreframe))
+    return ENCODERS[ServerPackets.MATCH_SCORE_UPDATE](frame)
 
 
 # packet id: 50
 @cache
 def match_transfer_host() -> bytes:
-    return write(ServerPackets.MATCH_TRANSFER_HOST)
+    return ENCODERS[ServerPackets.MATCH_TRANSFER_HOST]()
 
 
 # packet id: 53
 @cache
 def match_all_players_loaded() -> bytes:
-    return write(ServerPackets.MATCH_ALL_PLAYERS_LOADED)
+    return ENCODERS[ServerPackets.MATCH_ALL_PLAYERS_LOADED]()
 
 
 # packet id: 57
 @cache
 def match_player_failed(slot_id: int) -> bytes:
-    return write(ServerPackets.MATCH_PLAYER_FAILED, (slot_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.MATCH_PLAYER_FAILED](slot_id)
 
 
 # packet id: 58
 @cache
 def match_complete() -> bytes:
-    return write(ServerPackets.MATCH_COMPLETE)
+    return ENCODERS[ServerPackets.MATCH_COMPLETE]()
 
 
 # packet id: 61
 @cache
 def match_skip() -> bytes:
-    return write(ServerPackets.MATCH_SKIP)
+    return ENCODERS[ServerPackets.MATCH_SKIP]()
 
 
 # packet id: 64
 @lru_cache(maxsize=16)
 def channel_join(name: str) -> bytes:
-    return write(ServerPackets.CHANNEL_JOIN_SUCCESS, (name, osuTypes.string))
+    return ENCODERS[ServerPackets.CHANNEL_JOIN_SUCCESS](name)
 
 
 # packet id: 65
 @lru_cache(maxsize=8)
 def channel_info(name: str, topic: str, p_count: int) -> bytes:
-    return write(ServerPackets.CHANNEL_INFO, ((name, topic, p_count), osuTypes.channel))
+    return ENCODERS[ServerPackets.CHANNEL_INFO](name, topic, p_count)
 
 
 # packet id: 66
 @lru_cache(maxsize=8)
 def channel_kick(name: str) -> bytes:
-    return write(ServerPackets.CHANNEL_KICK, (name, osuTypes.string))
+    return ENCODERS[ServerPackets.CHANNEL_KICK](name)
 
 
 # packet id: 67
 @lru_cache(maxsize=8)
 def channel_auto_join(name: str, topic: str, p_count: int) -> bytes:
-    return write(
-        ServerPackets.CHANNEL_AUTO_JOIN,
-        ((name, topic, p_count), osuTypes.channel),
-    )
+    return ENCODERS[ServerPackets.CHANNEL_AUTO_JOIN](name, topic, p_count)
 
 
 # packet id: 69
@@ -1084,27 +1270,24 @@ def channel_auto_join(name: str, topic: str, p_count: int) -> bytes:
 # packet id: 71
 @cache
 def bancho_privileges(priv: int) -> bytes:
-    return write(ServerPackets.PRIVILEGES, (priv, osuTypes.i32))
+    return ENCODERS[ServerPackets.PRIVILEGES](priv)
 
 
 # packet id: 72
 def friends_list(friends: Collection[int]) -> bytes:
-    return write(ServerPackets.FRIENDS_LIST, (friends, osuTypes.i32_list))
+    return ENCODERS[ServerPackets.FRIENDS_LIST](friends)
 
 
 # packet id: 75
 @cache
 def protocol_version(ver: int) -> bytes:
-    return write(ServerPackets.PROTOCOL_VERSION, (ver, osuTypes.i32))
+    return ENCODERS[ServerPackets.PROTOCOL_VERSION](ver)
 
 
 # packet id: 76
 @cache
 def main_menu_icon(icon_url: str, onclick_url: str) -> bytes:
-    return write(
-        ServerPackets.MAIN_MENU_ICON,
-        (icon_url + "|" + onclick_url, osuTypes.string),
-    )
+    return ENCODERS[ServerPackets.MAIN_MENU_ICON](icon_url + "|" + onclick_url)
 
 
 # packet id: 80
@@ -1118,13 +1301,13 @@ def monitor() -> bytes:
 
     # this doesn't work on newer clients, and I had no plans
     # of trying to put it to use - just coded for completion.
-    return write(ServerPackets.MONITOR)
+    return ENCODERS[ServerPackets.MONITOR]()
 
 
 # packet id: 81
 @cache
 def match_player_skipped(user_id: int) -> bytes:
-    return write(ServerPackets.MATCH_PLAYER_SKIPPED, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.MATCH_PLAYER_SKIPPED](user_id)
 
 
 # since the bot is always online and is
@@ -1133,16 +1316,15 @@ def match_player_skipped(user_id: int) -> bytes:
 # *very* frequently; only build it once.
 @cache
 def bot_presence(player: Player) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (player.id, osuTypes.i32),
-        (player.name, osuTypes.string),
-        (-5 + 24, osuTypes.u8),
-        (245, osuTypes.u8),  # satellite provider
-        (31, osuTypes.u8),
-        (1234.0, osuTypes.f32),  # send coordinates waaay
-        (4321.0, osuTypes.f32),  # off the map for the bot
-        (0, osuTypes.i32),
+    return ENCODERS[ServerPackets.USER_PRESENCE](
+        player.id,
+        player.name,
+        -5 + 24,
+        245,  # satellite provider
+        31,
+        1234.0,  # send coordinates waaay
+        4321.0,  # off the map for the bot
+        0,
     )
 
 
@@ -1154,73 +1336,63 @@ def _user_presence(
     country_code: int,
     bancho_privileges: int,
     mode: int,
-    latitude: int,
-    longitude: int,
+    latitude: float,
+    longitude: float,
     global_rank: int,
 ) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (user_id, osuTypes.i32),
-        (name, osuTypes.string),
-        (utc_offset + 24, osuTypes.u8),
-        (country_code, osuTypes.u8),
-        (bancho_privileges | (mode << 5), osuTypes.u8),
-        (longitude, osuTypes.f32),
-        (latitude, osuTypes.f32),
-        (global_rank, osuTypes.i32),
+    return ENCODERS[ServerPackets.USER_PRESENCE](
+        user_id,
+        name,
+        utc_offset + 24,
+        country_code,
+        bancho_privileges | (mode << 5),
+        longitude,
+        latitude,
+        global_rank,
     )
 
 
 def user_presence(player: Player) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (player.id, osuTypes.i32),
-        (player.name, osuTypes.string),
-        (player.utc_offset + 24, osuTypes.u8),
-        (player.geoloc["country"]["numeric"], osuTypes.u8),
-        (player.bancho_priv | (player.status.mode.as_vanilla << 5), osuTypes.u8),
-        (player.geoloc["longitude"], osuTypes.f32),
-        (player.geoloc["latitude"], osuTypes.f32),
-        (player.gm_stats.rank, osuTypes.i32),
-    )
+    # NOTE: the encoded packet is cached on the player, and
+    # only rebuilt after their presence data has changed.
+    return player.presence_packet
 
 
 # packet id: 86
 @cache
 def restart_server(ms: int) -> bytes:
-    return write(ServerPackets.RESTART, (ms, osuTypes.i32))
+    return ENCODERS[ServerPackets.RESTART](ms)
 
 
 # packet id: 88
 def match_invite(player: Player, target_name: str) -> bytes:
     assert player.match is not None
     msg = f"Come join my game: {player.match.embed}."
-    return write(
-        ServerPackets.MATCH_INVITE,
-        ((player.name, msg, target_name, player.id), osuTypes.message),
+    return ENCODERS[ServerPackets.MATCH_INVITE](
+        player.name, msg, target_name, player.id
     )
 
 
 # packet id: 89
 @cache
 def channel_info_end() -> bytes:
-    return write(ServerPackets.CHANNEL_INFO_END)
+    return ENCODERS[ServerPackets.CHANNEL_INFO_END]()
 
 
 # packet id: 91
 def match_change_password(new: str) -> bytes:
-    return write(ServerPackets.MATCH_CHANGE_PASSWORD, (new, osuTypes.string))
+    return ENCODERS[ServerPackets.MATCH_CHANGE_PASSWORD](new)
 
 
 # packet id: 92
 def silence_end(delta: int) -> bytes:
-    return write(ServerPackets.SILENCE_END, (delta, osuTypes.i32))
+    return ENCODERS[ServerPackets.SILENCE_END](delta)
 
 
 # packet id: 94
 @cache
 def user_silenced(user_id: int) -> bytes:
-    return write(ServerPackets.USER_SILENCED, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.USER_SILENCED](user_id)
 
 
 """ not sure why 95 & 96 exist? unused in bancho.py """
@@ -1229,44 +1401,41 @@ def user_silenced(user_id: int) -> bytes:
 # packet id: 95
 @cache
 def user_presence_single(user_id: int) -> bytes:
-    return write(ServerPackets.USER_PRESENCE_SINGLE, (user_id, osuTypes.i32))
+    return ENCODERS[ServerPackets.USER_PRESENCE_SINGLE](user_id)
 
 
 # packet id: 96
 def user_presence_bundle(user_ids: Collection[int]) -> bytes:
-    return write(ServerPackets.USER_PRESENCE_BUNDLE, (user_ids, osuTypes.i32_list))
+    return ENCODERS[ServerPackets.USER_PRESENCE_BUNDLE](user_ids)
 
 
 # packet id: 100
 def user_dm_blocked(target: str) -> bytes:
-    return write(ServerPackets.USER_DM_BLOCKED, (("", "", target, 0), osuTypes.message))
+    return ENCODERS[ServerPackets.USER_DM_BLOCKED]("", "", target, 0)
 
 
 # packet id: 101
 def target_silenced(target: str) -> bytes:
-    return write(
-        ServerPackets.TARGET_IS_SILENCED,
-        (("", "", target, 0), osuTypes.message),
-    )
+    return ENCODERS[ServerPackets.TARGET_IS_SILENCED]("", "", target, 0)
 
 
 # packet id: 102
 @cache
 def version_update_forced() -> bytes:
-    return write(ServerPackets.VERSION_UPDATE_FORCED)
+    return ENCODERS[ServerPackets.VERSION_UPDATE_FORCED]()
 
 
 # packet id: 103
 def switch_server(t: int) -> bytes:
     # increment endpoint index if
     # idletime >= t && match == null
-    return write(ServerPackets.SWITCH_SERVER, (t, osuTypes.i32))
+    return ENCODERS[ServerPackets.SWITCH_SERVER](t)
 
 
 # packet id: 104
 @cache
 def account_restricted() -> bytes:
-    return write(ServerPackets.ACCOUNT_RESTRICTED)
+    return ENCODERS[ServerPackets.ACCOUNT_RESTRICTED]()
 
 
 # packet id: 105
@@ -1276,13 +1445,13 @@ def rtx(msg: str) -> bytes:
     # to show some visual effects on screen for 5 seconds:
     # - black screen, freezes game, beeps loudly.
     # within the next 3-8 seconds at random.
-    return write(ServerPackets.RTX, (msg, osuTypes.string))
+    return ENCODERS[ServerPackets.RTX](msg)
 
 
 # packet id: 106
 @cache
 def match_abort() -> bytes:
-    return write(ServerPackets.MATCH_ABORT)
+    return ENCODERS[ServerPackets.MATCH_ABORT]()
 
 
 # packet id: 107
@@ -1290,4 +1459,4 @@ def switch_tournament_server(ip: str) -> bytes:
     # the client only reads the string if it's
     # not on the client's normal endpoints,
     # but we can send it either way xd.
-    return write(ServerPackets.SWITCH_TOURNAMENT_SERVER, (ip, osuTypes.string))
+    return ENCODERS[ServerPackets.SWITCH_TOURNAMENT_SERVER](ip)
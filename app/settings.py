@@ -68,6 +68,25 @@ DEBUG = read_bool(os.environ["DEBUG"])
 REDIRECT_OSU_URLS = read_bool(os.environ["REDIRECT_OSU_URLS"])
 
 PP_CACHED_ACCURACIES = [int(acc) for acc in read_list(os.environ["PP_CACHED_ACCS"])]
+PP_CALC_WORKERS = int(os.environ.get("PP_CALC_WORKERS") or 2)
+PP_CALC_BEATMAP_CACHE_SIZE = int(os.environ.get("PP_CALC_BEATMAP_CACHE_SIZE") or 64)
+WRITE_BEHIND_FLUSH_INTERVAL = int(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL") or 5)
+BEATMAP_NEGATIVE_CACHE_TTL = int(os.environ.get("BEATMAP_NEGATIVE_CACHE_TTL") or 60)
+BEATMAP_CACHE_MAX_MEMORY = int(os.environ.get("BEATMAP_CACHE_MAX_MEMORY") or 128)
+BEATMAP_CACHE_TTL = int(os.environ.get("BEATMAP_CACHE_TTL") or 6 * 60 * 60)
+REPLAY_COMPRESSION = os.environ.get("REPLAY_COMPRESSION") or "none"
+SPECTATOR_MAX_LAG_FRAMES = int(os.environ.get("SPECTATOR_MAX_LAG_FRAMES") or 256)
+PACKET_QUEUE_MAX_SIZE = int(os.environ.get("PACKET_QUEUE_MAX_SIZE") or 1024)
+PACKET_QUEUE_OVERFLOW_POLICY = os.environ.get("PACKET_QUEUE_OVERFLOW_POLICY") or "coalesce"
+LOGIN_PRESENCE_BUNDLE_THRESHOLD = int(os.environ.get("LOGIN_PRESENCE_BUNDLE_THRESHOLD") or 0)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND") or "local"
+BANCHO_WORKERS = int(os.environ.get("BANCHO_WORKERS") or 1)
+WORKER_ID = int(os.environ.get("WORKER_ID") or 0)  # (set by main.py for each worker)
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS") or 4)
+BCRYPT_MAX_PENDING = int(os.environ.get("BCRYPT_MAX_PENDING") or 64)
+BCRYPT_CACHE_SECRET = os.environ.get("BCRYPT_CACHE_SECRET") or ""
+CHAT_LOG_FORMAT = os.environ.get("CHAT_LOG_FORMAT") or "text"
+CHAT_LOG_MAX_SIZE = int(os.environ.get("CHAT_LOG_MAX_SIZE") or 64)
 
 DISALLOWED_NAMES = read_list(os.environ["DISALLOWED_NAMES"])
 DISALLOWED_PASSWORDS = read_list(os.environ["DISALLOWED_PASSWORDS"])
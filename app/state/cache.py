@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from app.objects.beatmap import Beatmap
     from app.objects.beatmap import BeatmapSet
+    from app.usecases.best_scores import BestScores
+    from app.usecases.best_scores import BestScoresKey
+    from app.usecases.leaderboards import Leaderboard
+    from app.usecases.leaderboards import LeaderboardKey
 
 
 bcrypt: dict[bytes, bytes] = {}  # {bcrypt: md5, ...}
-beatmap: dict[str | int, Beatmap] = {}  # {md5: map, id: map, ...}
-beatmapset: dict[int, BeatmapSet] = {}  # {bsid: map_set}
-unsubmitted: set[str] = set()  # {md5, ...}
-needs_update: set[str] = set()  # {md5, ...}
+beatmap: dict[str | int, Beatmap] = {}  # {md5: map, id: map, ...}; index of sets' maps
+beatmapset: OrderedDict[int, BeatmapSet] = OrderedDict()  # lru; {bsid: map_set}
+unsubmitted: OrderedDict[str, float] = OrderedDict()  # {md5: expiry, ...}
+needs_update: OrderedDict[str, float] = OrderedDict()  # {md5: expiry, ...}
+leaderboards: OrderedDict[LeaderboardKey, Leaderboard] = OrderedDict()  # lru
+best_scores: OrderedDict[BestScoresKey, BestScores] = OrderedDict()  # lru
@@ -4,11 +4,15 @@ import asyncio
 from typing import TYPE_CHECKING
 from typing import Any
 
+import app.settings
 from app.logging import Ansi
 from app.logging import log
 from app.objects.collections import Channels
 from app.objects.collections import Matches
 from app.objects.collections import Players
+from app.objects.session_backend import RedisSessionBroker
+from app.objects.session_backend import SessionBackend
+from app.state import services
 
 if TYPE_CHECKING:
     from app.objects.player import Player
@@ -17,6 +21,17 @@ players = Players()
 channels = Channels()
 matches = Matches()
 
+backend = SessionBackend(
+    players,
+    channels,
+    worker_id=app.settings.WORKER_ID,
+    broker=(
+        RedisSessionBroker(services.redis)
+        if app.settings.SESSION_BACKEND == "redis"
+        else None
+    ),
+)
+
 api_keys: dict[str, int] = {}
 
 housekeeping_tasks: set[asyncio.Task[Any]] = set()
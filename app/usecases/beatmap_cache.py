@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING
+from typing import Any
+
+import orjson
+
+import app.metrics
+import app.objects.beatmap
+import app.settings
+import app.state
+import app.utils
+from app.constants.gamemodes import GameMode
+from app.logging import Ansi
+from app.logging import log
+from app.objects.session_backend import shared_invalidation
+
+if TYPE_CHECKING:
+    from app.objects.beatmap import Beatmap
+    from app.objects.beatmap import BeatmapSet
+
+# the cache is written here on shutdown, and read back on startup
+SNAPSHOT_PATH = app.utils.DATA_PATH / "beatmap_cache.json"
+SNAPSHOT_VERSION = 1
+
+# the max number of md5s remembered as unsubmitted (or needing an update)
+MAX_UNKNOWN_MD5S = 50_000
+
+# estimated memory usage of the cached sets; {bsid: bytes}
+_memory_usage: dict[int, int] = {}
+_total_memory_usage = 0
+
+# the keys each cached set's maps are indexed under; {bsid: [md5, id, ...]}
+_indexed_keys: dict[int, list[str | int]] = {}
+
+# when each cached set was last accessed, as time.monotonic(); {bsid: time}
+_last_access: dict[int, float] = {}
+
+
+def memory_usage() -> int:
+    """The estimated memory usage of the cached beatmap sets, in bytes."""
+    return _total_memory_usage
+
+
+def _beatmap_fields() -> list[str]:
+    # (all but the beatmap's set)
+    return [field for field in app.objects.beatmap.Beatmap.__slots__ if field != "set"]
+
+
+def _sizeof_beatmap_set(bmap_set: BeatmapSet) -> int:
+    fields = _beatmap_fields()
+
+    size = sys.getsizeof(bmap_set) + sys.getsizeof(bmap_set.maps)
+    for bmap in bmap_set.maps:
+        size += sys.getsizeof(bmap)
+        for field in fields:
+            size += sys.getsizeof(getattr(bmap, field))
+
+    # each map is indexed by both its md5 & id
+    size += len(bmap_set.maps) * 2 * sys.getsizeof(0)
+    return size
+
+
+def _update_gauges() -> None:
+    app.metrics.gauge("ex_beatmap_cache_sets", len(app.state.cache.beatmapset))
+    app.metrics.gauge("ex_beatmap_cache_memory", _total_memory_usage)
+
+
+def get_set(bsid: int) -> BeatmapSet | None:
+    """Fetch a beatmap set from the cache by set id."""
+    bmap_set = app.state.cache.beatmapset.get(bsid)
+
+    if bmap_set is None:
+        app.metrics.increment("ex_beatmap_cache_misses")
+        return None
+
+    app.metrics.increment("ex_beatmap_cache_hits")
+    app.state.cache.beatmapset.move_to_end(bsid)
+    _last_access[bsid] = time.monotonic()
+    return bmap_set
+
+
+def get_map(key: str | int) -> Beatmap | None:
+    """Fetch a beatmap from the cache by md5 or id."""
+    bmap = app.state.cache.beatmap.get(key)
+
+    if bmap is None:
+        app.metrics.increment("ex_beatmap_cache_misses")
+        return None
+
+    app.metrics.increment("ex_beatmap_cache_hits")
+    if bmap.set.id in app.state.cache.beatmapset:
+        app.state.cache.beatmapset.move_to_end(bmap.set.id)
+        _last_access[bmap.set.id] = time.monotonic()
+    return bmap
+
+
+def add_set(bmap_set: BeatmapSet) -> None:
+    """Add a beatmap set (and its maps) to the cache,
+    evicting the least recently used sets to make room."""
+    global _total_memory_usage
+
+    # the set's maps may have changed since it was cached
+    _remove_set(bmap_set.id)
+
+    app.state.cache.beatmapset[bmap_set.id] = bmap_set
+    _last_access[bmap_set.id] = time.monotonic()
+
+    indexed_keys: list[str | int] = []
+    for bmap in bmap_set.maps:
+        app.state.cache.beatmap[bmap.md5] = bmap
+        app.state.cache.beatmap[bmap.id] = bmap
+        indexed_keys += (bmap.md5, bmap.id)
+    _indexed_keys[bmap_set.id] = indexed_keys
+
+    size = _sizeof_beatmap_set(bmap_set)
+    _memory_usage[bmap_set.id] = size
+    _total_memory_usage += size
+
+    max_memory_usage = app.settings.BEATMAP_CACHE_MAX_MEMORY * 1024 * 1024
+    while _total_memory_usage > max_memory_usage and len(_memory_usage) > 1:
+        _evict(next(iter(app.state.cache.beatmapset)))
+
+    _update_gauges()
+
+
+def _remove_set(bsid: int) -> None:
+    global _total_memory_usage
+
+    bmap_set = app.state.cache.beatmapset.pop(bsid, None)
+    if bmap_set is None:
+        return
+
+    for key in _indexed_keys.pop(bsid):
+        bmap = app.state.cache.beatmap.get(key)
+        if bmap is not None and bmap.set is bmap_set:
+            del app.state.cache.beatmap[key]
+
+    _total_memory_usage -= _memory_usage.pop(bsid)
+    del _last_access[bsid]
+
+
+def _evict(bsid: int) -> None:
+    _remove_set(bsid)
+    app.metrics.increment("ex_beatmap_cache_evictions")
+
+
+def remove_set(bsid: int) -> None:
+    """Remove a beatmap set (and its maps) from the cache."""
+    _remove_set(bsid)
+    _update_gauges()
+
+
+@shared_invalidation
+def invalidate_set(bsid: int) -> None:
+    """Remove a beatmap set (and its maps) from every worker's cache;
+    e.g. when its maps' statuses change, so they're refetched from sql."""
+    remove_set(bsid)
+
+
+def evict_expired() -> None:
+    """Evict the sets which haven't been accessed within the cache's ttl,
+    and forget the md5s which were marked as unsubmitted or outdated."""
+    deadline = time.monotonic() - app.settings.BEATMAP_CACHE_TTL
+
+    # the sets are ordered by their last access
+    while app.state.cache.beatmapset:
+        bsid = next(iter(app.state.cache.beatmapset))
+        if _last_access[bsid] > deadline:
+            break
+
+        _evict(bsid)
+
+    _update_gauges()
+
+    now = time.monotonic()
+    for md5s in (app.state.cache.unsubmitted, app.state.cache.needs_update):
+        for md5 in [md5 for md5, expiry in md5s.items() if expiry <= now]:
+            del md5s[md5]
+
+
+def clear() -> None:
+    """Remove all beatmap sets (and their maps) from the cache."""
+    global _total_memory_usage
+
+    app.state.cache.beatmapset.clear()
+    app.state.cache.beatmap.clear()
+    _memory_usage.clear()
+    _indexed_keys.clear()
+    _last_access.clear()
+    _total_memory_usage = 0
+
+    _update_gauges()
+
+
+# md5s sent by clients which we couldn't find a map for are
+# remembered for a while (rather than forever), as maps may be
+# submitted (or updated) on osu! while the server is running.
+
+
+def _remember_md5(md5s: OrderedDict[str, float], md5: str) -> None:
+    md5s[md5] = time.monotonic() + app.settings.BEATMAP_CACHE_TTL
+    md5s.move_to_end(md5)
+
+    while len(md5s) > MAX_UNKNOWN_MD5S:
+        md5s.popitem(last=False)
+
+
+def _recall_md5(md5s: OrderedDict[str, float], md5: str) -> bool:
+    expiry = md5s.get(md5)
+    if expiry is None:
+        return False
+
+    if expiry <= time.monotonic():
+        del md5s[md5]
+        return False
+
+    return True
+
+
+def mark_unsubmitted(md5: str) -> None:
+    """Remember that a map's md5 isn't submitted on osu!."""
+    _remember_md5(app.state.cache.unsubmitted, md5)
+
+
+def is_unsubmitted(md5: str) -> bool:
+    """Whether a map's md5 was recently found to be unsubmitted on osu!."""
+    return _recall_md5(app.state.cache.unsubmitted, md5)
+
+
+def mark_needs_update(md5: str) -> None:
+    """Remember that a map's md5 is an outdated version of the map."""
+    _remember_md5(app.state.cache.needs_update, md5)
+
+
+def needs_update(md5: str) -> bool:
+    """Whether a map's md5 was recently found to be outdated."""
+    return _recall_md5(app.state.cache.needs_update, md5)
+
+
+# the cache is written to disk on shutdown and loaded on startup,
+# so restarts don't start cold against the database & osu!api.
+
+
+def _serialize_beatmap_set(bmap_set: BeatmapSet) -> dict[str, Any]:
+    fields = _beatmap_fields()
+    return {
+        "id": bmap_set.id,
+        "last_osuapi_check": bmap_set.last_osuapi_check,
+        "maps": [
+            {field: getattr(bmap, field) for field in fields} for bmap in bmap_set.maps
+        ],
+    }
+
+
+def _deserialize_beatmap_set(data: dict[str, Any]) -> BeatmapSet:
+    bmap_set = app.objects.beatmap.BeatmapSet(
+        id=data["id"],
+        last_osuapi_check=datetime.fromisoformat(data["last_osuapi_check"]),
+    )
+
+    for map_data in data["maps"]:
+        map_data["last_update"] = datetime.fromisoformat(map_data["last_update"])
+        map_data["status"] = app.objects.beatmap.RankedStatus(map_data["status"])
+        map_data["mode"] = GameMode(map_data["mode"])
+        bmap_set.maps.append(app.objects.beatmap.Beatmap(map_set=bmap_set, **map_data))
+
+    return bmap_set
+
+
+async def save_snapshot() -> None:
+    """Write the cached beatmap sets to disk."""
+    # least recently used first, so loading restores the order
+    sets = [
+        _serialize_beatmap_set(bmap_set)
+        for bmap_set in app.state.cache.beatmapset.values()
+    ]
+    snapshot = {"version": SNAPSHOT_VERSION, "created_at": time.time(), "sets": sets}
+
+    try:
+        await asyncio.to_thread(
+            app.utils.write_file_atomically,
+            SNAPSHOT_PATH,
+            orjson.dumps(snapshot),
+        )
+    except OSError as exc:
+        log(f"Failed to save beatmap cache snapshot: {exc!r}", Ansi.LRED)
+        return
+
+    log(f"Saved {len(sets)} beatmap sets to disk.", Ansi.LCYAN)
+
+
+def load_snapshot() -> None:
+    """Load the cached beatmap sets written to disk on the last shutdown."""
+    if not SNAPSHOT_PATH.exists():
+        return
+
+    try:
+        snapshot = orjson.loads(SNAPSHOT_PATH.read_bytes())
+    except (OSError, orjson.JSONDecodeError) as exc:
+        log(f"Failed to load beatmap cache snapshot: {exc!r}", Ansi.LRED)
+        return
+    finally:
+        # a snapshot is only ever loaded once; it
+        # would be outdated by the next startup
+        SNAPSHOT_PATH.unlink(missing_ok=True)
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return
+
+    # maps may have changed in the database since the snapshot was taken
+    if time.time() - snapshot["created_at"] > app.settings.BEATMAP_CACHE_TTL:
+        log("Beatmap cache snapshot is outdated, ignoring.", Ansi.LYELLOW)
+        return
+
+    for set_data in snapshot["sets"]:
+        add_set(_deserialize_beatmap_set(set_data))
+
+    log(f"Loaded {len(snapshot['sets'])} beatmap sets from disk.", Ansi.LCYAN)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import bisect
+import math
+import time
+from collections.abc import Iterable
+from collections.abc import Mapping
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+import app.state
+from app.constants.gamemodes import GameMode
+from app.logging import Ansi
+from app.logging import log
+from app.objects.session_backend import shared_invalidation
+
+# the max number of players' best scores kept in the cache
+MAX_CACHED_BEST_SCORES = 1000
+
+# how long players' best scores are cached before they're refetched from
+# sql, in case they've been changed without being invalidated (e.g. by hand)
+BEST_SCORES_TTL = 10 * 60  # seconds
+
+# each score is weighted by 0.95^i, where i is its index by pp
+WEIGHT_DECAY = 0.95
+
+# (-pp, -acc, map_md5); ascending order is descending by pp (and then acc)
+BestScoreEntry = tuple[float, float, str]
+
+
+@dataclass
+class BestScores:
+    """\
+    A player's best scores on ranked & approved maps in a mode,
+    ordered by pp, along with their running weighted pp & acc sums.
+
+    Replacing a score only reweights the scores between its old and new
+    positions, rather than recalculating the totals from scratch.
+    """
+
+    entries: list[BestScoreEntry] = field(default_factory=list)
+    by_map: dict[str, BestScoreEntry] = field(default_factory=dict)
+
+    weighted_pp: float = 0.0
+    weighted_acc: float = 0.0
+
+    # when the scores were fetched from sql, as time.monotonic()
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]]) -> BestScores:
+        best_scores = cls()
+        for row in rows:
+            entry = (-row["pp"], -row["acc"], row["map_md5"])
+            best_scores.by_map[row["map_md5"]] = entry
+            best_scores.entries.append(entry)
+
+        best_scores.entries.sort()
+        best_scores.weighted_pp, best_scores.weighted_acc = best_scores._weighted_sums(
+            0,
+            len(best_scores.entries),
+        )
+        return best_scores
+
+    @property
+    def pp(self) -> int:
+        """The player's total pp, including bonus pp."""
+        bonus_pp = 416.6667 * (1 - 0.9994 ** len(self.entries))
+        return round(self.weighted_pp + bonus_pp)
+
+    @property
+    def acc(self) -> float:
+        """The player's total weighted accuracy."""
+        if not self.entries:
+            return 0.0
+
+        bonus_acc = 100.0 / (20 * (1 - WEIGHT_DECAY ** len(self.entries)))
+        return (self.weighted_acc * bonus_acc) / 100
+
+    def _weighted_sums(self, start: int, stop: int) -> tuple[float, float]:
+        """Sum the weighted pp & acc of the entries in [start, stop)."""
+        weighted_pp = weighted_acc = 0.0
+        weight = WEIGHT_DECAY**start
+        for idx in range(start, stop):
+            neg_pp, neg_acc, _ = self.entries[idx]
+            weighted_pp -= neg_pp * weight
+            weighted_acc -= neg_acc * weight
+            weight *= WEIGHT_DECAY
+
+        return weighted_pp, weighted_acc
+
+    def _reweight(self, start: int, stop: int, factor: float) -> None:
+        """Multiply the weights of the entries in [start, stop) by `factor`."""
+        if start >= stop:
+            return
+
+        weighted_pp, weighted_acc = self._weighted_sums(start, stop)
+        self.weighted_pp += weighted_pp * (factor - 1)
+        self.weighted_acc += weighted_acc * (factor - 1)
+
+    def update(self, map_md5: str, pp: float, acc: float) -> None:
+        """Insert the player's new best score on a map, replacing any previous."""
+        new_entry = (-pp, -acc, map_md5)
+        old_entry = self.by_map.get(map_md5)
+
+        if old_entry == new_entry:
+            return
+
+        new_idx = bisect.bisect_left(self.entries, new_entry)
+
+        if old_entry is None:
+            # all lower scores move down a position
+            self._reweight(new_idx, len(self.entries), WEIGHT_DECAY)
+        else:
+            old_idx = bisect.bisect_left(self.entries, old_entry)
+
+            # only the scores between the old & new positions move
+            if new_idx <= old_idx:
+                self._reweight(new_idx, old_idx, WEIGHT_DECAY)
+            else:
+                self._reweight(old_idx + 1, new_idx, 1 / WEIGHT_DECAY)
+                new_idx -= 1
+
+            del self.entries[old_idx]
+            self.weighted_pp += old_entry[0] * WEIGHT_DECAY**old_idx
+            self.weighted_acc += old_entry[1] * WEIGHT_DECAY**old_idx
+
+        self.entries.insert(new_idx, new_entry)
+        self.by_map[map_md5] = new_entry
+
+        self.weighted_pp += pp * WEIGHT_DECAY**new_idx
+        self.weighted_acc += acc * WEIGHT_DECAY**new_idx
+
+
+BestScoresKey = tuple[int, GameMode]  # (user_id, mode)
+
+# incremented on each invalidation; best scores fetched from sql are
+# only cached if no invalidation occurred while they were being fetched.
+_generation = 0
+
+
+@shared_invalidation
+def invalidate_user(user_id: int) -> None:
+    """Remove a user's best scores (in all modes) from every worker's cache."""
+    global _generation
+    _generation += 1
+
+    for key in list(app.state.cache.best_scores):
+        if key[0] == user_id:
+            del app.state.cache.best_scores[key]
+
+
+@shared_invalidation
+def clear() -> None:
+    """Remove all best scores from every worker's cache;
+    e.g. when a map's status changes."""
+    global _generation
+    _generation += 1
+
+    app.state.cache.best_scores.clear()
+
+
+async def fetch_from_sql(user_id: int, mode: GameMode) -> BestScores:
+    """Fetch a player's best scores in a mode from sql."""
+    # NOTE: we select all plays (and not just top100)
+    # because bonus pp counts the total amount of ranked scores.
+    rows = await app.state.services.database.fetch_all(
+        "SELECT s.pp, s.acc, s.map_md5 FROM scores s "
+        "INNER JOIN maps m ON s.map_md5 = m.md5 "
+        "WHERE s.userid = :user_id AND s.mode = :mode "
+        "AND s.status = 2 AND m.status IN (2, 3)",  # ranked, approved
+        {"user_id": user_id, "mode": mode},
+    )
+
+    return BestScores.from_rows(rows)
+
+
+async def fetch(user_id: int, mode: GameMode) -> BestScores:
+    """Fetch a player's best scores in a mode from the cache, or from sql."""
+    key: BestScoresKey = (user_id, mode)
+
+    best_scores = app.state.cache.best_scores.get(key)
+    if best_scores is not None:
+        if time.monotonic() - best_scores.fetched_at < BEST_SCORES_TTL:
+            app.state.cache.best_scores.move_to_end(key)
+            return best_scores
+
+        del app.state.cache.best_scores[key]
+
+    generation = _generation
+
+    best_scores = await fetch_from_sql(user_id, mode)
+
+    if generation == _generation:
+        app.state.cache.best_scores[key] = best_scores
+        while len(app.state.cache.best_scores) > MAX_CACHED_BEST_SCORES:
+            app.state.cache.best_scores.popitem(last=False)
+
+    return best_scores
+
+
+async def check_consistency(
+    best_scores: BestScores,
+    user_id: int,
+    mode: GameMode,
+) -> BestScores:
+    """\
+    Check a player's incrementally updated totals against a recalculation
+    from sql, returning (and caching) the best scores from sql on a mismatch.
+    """
+    sql_best_scores = await fetch_from_sql(user_id, mode)
+
+    # scores' pp & acc are stored with limited precision in sql
+    if abs(sql_best_scores.pp - best_scores.pp) <= 1 and math.isclose(
+        sql_best_scores.acc,
+        best_scores.acc,
+        abs_tol=0.01,
+    ):
+        return best_scores
+
+    log(
+        f"Best scores for user {user_id} ({mode!r}) were inconsistent with sql "
+        f"({best_scores.pp}pp, {best_scores.acc:.2f}% vs. "
+        f"{sql_best_scores.pp}pp, {sql_best_scores.acc:.2f}%).",
+        Ansi.LYELLOW,
+    )
+
+    key: BestScoresKey = (user_id, mode)
+    if key in app.state.cache.best_scores:
+        app.state.cache.best_scores[key] = sql_best_scores
+
+    return sql_best_scores
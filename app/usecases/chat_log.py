@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import itertools
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import NamedTuple
+
+import orjson
+
+import app.settings
+from app import metrics
+from app.logging import Ansi
+from app.logging import log
+from app.objects.channel import Channel
+
+if TYPE_CHECKING:
+    from app.objects.player import Player
+
+CHAT_LOGS_PATH = Path.cwd() / ".data/logs"
+
+# messages are buffered in memory between flushes; past this
+# many (e.g. if the disk is stalling), the oldest are dropped.
+MAX_BUFFERED_MESSAGES = 10_000
+
+GMT = datetime.timezone.utc
+
+
+class ChatMessage(NamedTuple):
+    sent_at: float
+    sender_id: int
+    sender_name: str
+    recipient_id: int | None  # (none for channels)
+    recipient_name: str
+    msg: str
+
+
+_buffer: deque[ChatMessage] = deque(maxlen=MAX_BUFFERED_MESSAGES)
+
+
+def chat_log_path() -> Path:
+    """The path of the chat log currently being written to."""
+    name = "chat"
+    if app.settings.BANCHO_WORKERS > 1:
+        # (each worker writes, & rotates, its own log)
+        name += f".{app.settings.WORKER_ID}"
+
+    suffix = ".jsonl" if app.settings.CHAT_LOG_FORMAT == "jsonl" else ".log"
+    return CHAT_LOGS_PATH / f"{name}{suffix}"
+
+
+def write(sender: Player, recipient: Player | Channel, msg: str) -> None:
+    """Queue a chat message to be written to the chat log."""
+    if len(_buffer) == _buffer.maxlen:
+        metrics.increment("ex_chat_log_dropped_messages")
+
+    if isinstance(recipient, Channel):
+        recipient_id, recipient_name = None, recipient.real_name
+    else:
+        recipient_id, recipient_name = recipient.id, recipient.name
+
+    _buffer.append(
+        ChatMessage(
+            time.time(),
+            sender.id,
+            sender.name,
+            recipient_id,
+            recipient_name,
+            msg,
+        ),
+    )
+
+
+def _format_message(message: ChatMessage) -> str:
+    sent_at = datetime.datetime.fromtimestamp(message.sent_at, tz=GMT)
+
+    if app.settings.CHAT_LOG_FORMAT == "jsonl":
+        return orjson.dumps(
+            {
+                "time": sent_at.isoformat(),
+                "sender_id": message.sender_id,
+                "sender": message.sender_name,
+                "recipient_id": message.recipient_id,
+                "recipient": message.recipient_name,
+                "msg": message.msg,
+            },
+        ).decode()
+
+    # (in the same format as the players' & channels' reprs)
+    sender = f"<{message.sender_name} ({message.sender_id})>"
+    if message.recipient_id is not None:
+        recipient = f"<{message.recipient_name} ({message.recipient_id})>"
+    else:
+        recipient = f"<{message.recipient_name}>"
+
+    return f"[{sent_at:%d/%m/%Y %I:%M:%S%p}] {sender} @ {recipient}: {message.msg}"
+
+
+def _rotated_path(path: Path, date: datetime.date) -> Path:
+    for idx in range(1, 10_000):
+        rotated_path = path.with_name(f"{path.stem}.{date}.{idx}{path.suffix}")
+        if not rotated_path.exists():
+            return rotated_path
+
+    raise FileExistsError(f"Too many rotated chat logs for {date}")
+
+
+def _write_to_disk(path: Path, data: bytes, today: datetime.date) -> None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    else:
+        # logs are rotated daily, and by size
+        modified_date = datetime.datetime.fromtimestamp(stat.st_mtime, tz=GMT).date()
+        max_size = app.settings.CHAT_LOG_MAX_SIZE * 1024 * 1024
+
+        if modified_date != today or (
+            max_size and stat.st_size and stat.st_size + len(data) > max_size
+        ):
+            os.replace(path, _rotated_path(path, modified_date))
+
+    with path.open("ab") as f:
+        f.write(data)
+
+
+async def flush() -> None:
+    """Write all buffered messages to the chat log, in a single write."""
+    global _buffer
+
+    if not _buffer:
+        return
+
+    messages = list(_buffer)
+    _buffer.clear()
+
+    data = "".join(f"{_format_message(message)}\n" for message in messages)
+    today = datetime.datetime.now(tz=GMT).date()
+
+    try:
+        await asyncio.to_thread(
+            _write_to_disk,
+            chat_log_path(),
+            data.encode(),
+            today,
+        )
+    except Exception as exc:
+        log(f"Failed to write the chat log: {exc!r}", Ansi.LRED)
+
+        # requeue the messages (before any sent since) to be retried
+        # on the next flush; the oldest are dropped if there's no room.
+        _buffer = deque(
+            itertools.chain(messages, _buffer),
+            maxlen=MAX_BUFFERED_MESSAGES,
+        )
@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+import bisect
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+from enum import IntEnum
+from enum import unique
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Literal
+
+import app.state
+from app.constants.gamemodes import GameMode
+from app.constants.mods import Mods
+from app.objects.session_backend import shared_invalidation
+from app.utils import escape_enum
+from app.utils import pymysql_encode
+
+if TYPE_CHECKING:
+    from app.objects.player import Player
+
+# the number of scores shown on an in-game leaderboard
+LEADERBOARD_SIZE = 50
+
+# the number of scores cached per leaderboard; the mods, friends
+# & country views are filtered from these whenever possible.
+CACHED_SCORES_PER_LEADERBOARD = 500
+
+# the max number of leaderboards kept in the cache
+MAX_CACHED_LEADERBOARDS = 1000
+
+# how long leaderboards are cached before they're refetched from sql, in
+# case they've been changed without being invalidated (e.g. a user's name)
+LEADERBOARD_TTL = 5 * 60  # seconds
+
+SCORE_LISTING_FMTSTR = (
+    "{id}|{name}|{score}|{max_combo}|"
+    "{n50}|{n100}|{n300}|{nmiss}|{nkatu}|{ngeki}|"
+    "{perfect}|{mods}|{userid}|{rank}|{time}|{has_replay}"
+)
+
+# a score's rank depends on the view it's shown in, so
+# listings are rendered in two parts on either side of it.
+_LISTING_HEAD_FMTSTR, _LISTING_TAIL_FMTSTR = SCORE_LISTING_FMTSTR.split("{rank}")
+
+
+@unique
+@pymysql_encode(escape_enum)
+class LeaderboardType(IntEnum):
+    Local = 0
+    Top = 1
+    Mods = 2
+    Friends = 3
+    Country = 4
+
+
+@dataclass(slots=True)
+class LeaderboardScore:
+    id: int
+    user_id: int
+    score: float  # by the leaderboard's scoring metric
+    mods: int
+    country: str
+
+    listing_head: str
+    listing_tail: str
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any]) -> LeaderboardScore:
+        fmt_args = row | {"score": int(round(row["_score"])), "has_replay": "1"}
+        return cls(
+            id=row["id"],
+            user_id=row["userid"],
+            score=row["_score"],
+            mods=row["mods"],
+            country=row.get("country", ""),
+            listing_head=_LISTING_HEAD_FMTSTR.format(**fmt_args),
+            listing_tail=_LISTING_TAIL_FMTSTR.format(**fmt_args),
+        )
+
+    def render(self, rank: int) -> str:
+        """Render the score's listing for the osu! client."""
+        return f"{self.listing_head}{rank}{self.listing_tail}"
+
+
+@dataclass
+class Leaderboard:
+    # unrestricted players' best scores, sorted by score descending
+    scores: list[LeaderboardScore]
+
+    # whether all of the map's best scores are cached
+    complete: bool
+
+    # when the leaderboard was fetched from sql, as time.monotonic()
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    by_user: dict[int, LeaderboardScore] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.by_user = {score.user_id: score for score in self.scores}
+
+    def rank_of(self, score: float) -> int:
+        """The global rank a score with the given value would have."""
+        return 1 + bisect.bisect_left(self.scores, -score, key=lambda s: -s.score)
+
+
+LeaderboardKey = tuple[str, int, str]  # (map_md5, mode, scoring_metric)
+
+# incremented on each invalidation; leaderboards fetched from sql are
+# only cached if no invalidation occurred while they were being fetched.
+_generation = 0
+
+
+@shared_invalidation
+def invalidate_map(map_md5: str, mode: GameMode | None = None) -> None:
+    """Remove a map's leaderboards (optionally for one mode)
+    from every worker's cache."""
+    global _generation
+    _generation += 1
+
+    for key in list(app.state.cache.leaderboards):
+        if key[0] == map_md5 and (mode is None or key[1] == mode):
+            del app.state.cache.leaderboards[key]
+
+
+@shared_invalidation
+def invalidate_user(user_id: int) -> None:
+    """Remove all leaderboards containing a user's scores
+    from every worker's cache."""
+    global _generation
+    _generation += 1
+
+    for key, leaderboard in list(app.state.cache.leaderboards.items()):
+        if user_id in leaderboard.by_user:
+            del app.state.cache.leaderboards[key]
+
+
+@shared_invalidation
+def clear() -> None:
+    """Remove all leaderboards from every worker's cache."""
+    global _generation
+    _generation += 1
+
+    app.state.cache.leaderboards.clear()
+
+
+async def _fetch_leaderboard(
+    map_md5: str,
+    mode: GameMode,
+    scoring_metric: Literal["pp", "score"],
+) -> Leaderboard:
+    """Fetch a map's leaderboard from the cache, or from sql."""
+    key: LeaderboardKey = (map_md5, mode, scoring_metric)
+
+    leaderboard = app.state.cache.leaderboards.get(key)
+    if leaderboard is not None:
+        if time.monotonic() - leaderboard.fetched_at < LEADERBOARD_TTL:
+            app.state.cache.leaderboards.move_to_end(key)
+            return leaderboard
+
+        del app.state.cache.leaderboards[key]
+
+    generation = _generation
+
+    score_rows = await app.state.services.database.fetch_all(
+        f"SELECT s.id, s.{scoring_metric} AS _score, "
+        "s.max_combo, s.n50, s.n100, s.n300, "
+        "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
+        "UNIX_TIMESTAMP(s.play_time) time, u.id userid, u.country, "
+        "COALESCE(CONCAT('[', c.tag, '] ', u.name), u.name) AS name "
+        "FROM scores s "
+        "INNER JOIN users u ON u.id = s.userid "
+        "LEFT JOIN clans c ON c.id = u.clan_id "
+        "WHERE s.map_md5 = :map_md5 AND s.status = 2 "  # 2: =best score
+        "AND u.priv & 1 AND mode = :mode "
+        f"ORDER BY _score DESC LIMIT {CACHED_SCORES_PER_LEADERBOARD}",
+        {"map_md5": map_md5, "mode": mode},
+    )
+
+    leaderboard = Leaderboard(
+        scores=[LeaderboardScore.from_row(row) for row in score_rows],
+        complete=len(score_rows) < CACHED_SCORES_PER_LEADERBOARD,
+    )
+
+    if generation == _generation:
+        app.state.cache.leaderboards[key] = leaderboard
+        while len(app.state.cache.leaderboards) > MAX_CACHED_LEADERBOARDS:
+            app.state.cache.leaderboards.popitem(last=False)
+
+    return leaderboard
+
+
+async def _fetch_personal_best(
+    map_md5: str,
+    mode: GameMode,
+    player: Player,
+    scoring_metric: Literal["pp", "score"],
+) -> tuple[LeaderboardScore, int] | None:
+    """Fetch a player's personal best score & its rank from sql."""
+    personal_best_score_row = await app.state.services.database.fetch_one(
+        f"SELECT s.id, s.{scoring_metric} AS _score, "
+        "s.max_combo, s.n50, s.n100, s.n300, "
+        "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
+        "UNIX_TIMESTAMP(s.play_time) time, u.id userid, "
+        "COALESCE(CONCAT('[', c.tag, '] ', u.name), u.name) AS name "
+        "FROM scores s "
+        "INNER JOIN users u ON u.id = s.userid "
+        "LEFT JOIN clans c ON c.id = u.clan_id "
+        "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
+        "AND s.userid = :user_id AND s.status = 2 "
+        "ORDER BY _score DESC LIMIT 1",
+        {"map_md5": map_md5, "mode": mode, "user_id": player.id},
+    )
+
+    if personal_best_score_row is None:
+        return None
+
+    # calculate the rank of the score.
+    p_best_rank = 1 + await app.state.services.database.fetch_val(
+        "SELECT COUNT(*) FROM scores s "
+        "INNER JOIN users u ON u.id = s.userid "
+        "WHERE s.map_md5 = :map_md5 AND s.mode = :mode "
+        "AND s.status = 2 AND u.priv & 1 "
+        f"AND s.{scoring_metric} > :score",
+        {
+            "map_md5": map_md5,
+            "mode": mode,
+            "score": personal_best_score_row["_score"],
+        },
+        column=0,  # COUNT(*)
+    )
+
+    return LeaderboardScore.from_row(personal_best_score_row), p_best_rank
+
+
+async def _fetch_leaderboard_scores_from_sql(
+    leaderboard_type: LeaderboardType | int,
+    map_md5: str,
+    mode: GameMode,
+    mods: Mods,
+    player: Player,
+    scoring_metric: Literal["pp", "score"],
+) -> list[LeaderboardScore]:
+    """Fetch a view of a map's leaderboard directly from sql."""
+    query = [
+        f"SELECT s.id, s.{scoring_metric} AS _score, "
+        "s.max_combo, s.n50, s.n100, s.n300, "
+        "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
+        "UNIX_TIMESTAMP(s.play_time) time, u.id userid, "
+        "COALESCE(CONCAT('[', c.tag, '] ', u.name), u.name) AS name "
+        "FROM scores s "
+        "INNER JOIN users u ON u.id = s.userid "
+        "LEFT JOIN clans c ON c.id = u.clan_id "
+        "WHERE s.map_md5 = :map_md5 AND s.status = 2 "  # 2: =best score
+        "AND (u.priv & 1 OR u.id = :user_id) AND mode = :mode",
+    ]
+
+    params: dict[str, Any] = {
+        "map_md5": map_md5,
+        "user_id": player.id,
+        "mode": mode,
+    }
+
+    if leaderboard_type == LeaderboardType.Mods:
+        query.append("AND s.mods = :mods")
+        params["mods"] = mods
+    elif leaderboard_type == LeaderboardType.Friends:
+        query.append("AND s.userid IN :friends")
+        params["friends"] = player.friends | {player.id}
+    elif leaderboard_type == LeaderboardType.Country:
+        query.append("AND u.country = :country")
+        params["country"] = player.geoloc["country"]["acronym"]
+
+    # TODO: customizability of the number of scores
+    query.append(f"ORDER BY _score DESC LIMIT {LEADERBOARD_SIZE}")
+
+    score_rows = await app.state.services.database.fetch_all(
+        " ".join(query),
+        params,
+    )
+
+    return [LeaderboardScore.from_row(row) for row in score_rows]
+
+
+def _filter_cached_view(
+    leaderboard: Leaderboard,
+    leaderboard_type: LeaderboardType | int,
+    mods: Mods,
+    player: Player,
+) -> list[LeaderboardScore] | None:
+    """\
+    Filter a view of a cached leaderboard.
+
+    Returns `None` if the view can't be served from the cache,
+    i.e. it may contain scores below the cached range.
+    """
+    predicate: Callable[[LeaderboardScore], bool] | None = None
+
+    if leaderboard_type == LeaderboardType.Mods:
+        predicate = lambda s: s.mods == mods
+    elif leaderboard_type == LeaderboardType.Friends:
+        friends = player.friends | {player.id}
+        predicate = lambda s: s.user_id in friends
+    elif leaderboard_type == LeaderboardType.Country:
+        country = player.geoloc["country"]["acronym"]
+        predicate = lambda s: s.country == country
+
+    if predicate is None:
+        scores = leaderboard.scores[:LEADERBOARD_SIZE]
+    else:
+        scores = []
+        for score in leaderboard.scores:
+            if predicate(score):
+                scores.append(score)
+                if len(scores) == LEADERBOARD_SIZE:
+                    break
+
+    if len(scores) < LEADERBOARD_SIZE and not leaderboard.complete:
+        # there may be more matching scores which weren't cached
+        return None
+
+    return scores
+
+
+async def fetch_score_listings(
+    leaderboard_type: LeaderboardType | int,
+    map_md5: str,
+    mode: GameMode,
+    mods: Mods,
+    player: Player,
+    scoring_metric: Literal["pp", "score"],
+) -> tuple[list[str], str | None]:
+    """\
+    Fetch the rendered score listings for a view of a map's
+    leaderboard, along with the player's personal best listing.
+
+    Views are served from the leaderboard cache whenever possible.
+    """
+    scores: list[LeaderboardScore] | None = None
+    leaderboard: Leaderboard | None = None
+
+    # restricted players can see their own scores,
+    # which are never cached; always use sql for them.
+    if not player.restricted:
+        leaderboard = await _fetch_leaderboard(map_md5, mode, scoring_metric)
+        scores = _filter_cached_view(leaderboard, leaderboard_type, mods, player)
+
+    if scores is None:
+        scores = await _fetch_leaderboard_scores_from_sql(
+            leaderboard_type,
+            map_md5,
+            mode,
+            mods,
+            player,
+            scoring_metric,
+        )
+
+    if not scores:
+        return [], None
+
+    score_listings = [score.render(idx + 1) for idx, score in enumerate(scores)]
+
+    # fetch the player's personal best score & its rank
+    personal_best: tuple[LeaderboardScore, int] | None
+    if leaderboard is not None and (pb := leaderboard.by_user.get(player.id)):
+        personal_best = (pb, leaderboard.rank_of(pb.score))
+    elif leaderboard is not None and leaderboard.complete:
+        personal_best = None  # the player has no score on the map
+    else:
+        personal_best = await _fetch_personal_best(
+            map_md5,
+            mode,
+            player,
+            scoring_metric,
+        )
+
+    if personal_best is None:
+        return score_listings, None
+
+    pb, pb_rank = personal_best
+    return score_listings, pb.render(pb_rank)
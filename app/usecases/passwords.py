@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import TypeVar
+
+import bcrypt
+
+import app.settings
+import app.state
+from app import metrics
+from app.logging import Ansi
+from app.logging import log
+
+# verified passwords are kept in redis (as an hmac of the password's md5,
+# never the md5 itself), so that the bcrypt cache survives restarts.
+BCRYPT_CACHE_KEY = "bancho:bcrypt_cache:{}"
+BCRYPT_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+
+T = TypeVar("T")
+
+
+class PasswordChecksOverloaded(Exception):
+    """Raised when too many password checks are already waiting to run."""
+
+
+# the thread pool bcrypt is run in; bcrypt releases the gil
+# while hashing, so checks don't block the server's event loop.
+_executor: ThreadPoolExecutor | None = None
+
+# the number of password checks running or waiting in the pool
+_pending_checks = 0
+
+
+def start_workers() -> None:
+    """Start the pool of password hashing threads."""
+    global _executor
+
+    if _executor is not None:
+        return
+
+    _executor = ThreadPoolExecutor(
+        max_workers=app.settings.BCRYPT_WORKERS,
+        thread_name_prefix="bcrypt",
+    )
+
+
+def shutdown_workers() -> None:
+    """Stop the pool of password hashing threads."""
+    global _executor
+
+    if _executor is None:
+        return
+
+    _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
+
+
+async def _run_in_pool(func: Callable[..., T], *args: Any) -> T:
+    if _executor is None:
+        start_workers()
+
+    loop = asyncio.get_running_loop()
+    start_time = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, func, *args)
+    finally:
+        metrics.histrogram("ex_bcrypt_time", time.perf_counter() - start_time)
+
+
+def _cache_digest(pw_md5: bytes, pw_bcrypt: bytes) -> str:
+    key = app.settings.BCRYPT_CACHE_SECRET.encode() + pw_bcrypt
+    return hmac.new(key, pw_md5, hashlib.sha256).hexdigest()
+
+
+async def _check_persisted_cache(pw_md5: bytes, pw_bcrypt: bytes) -> bool:
+    if not app.settings.BCRYPT_CACHE_SECRET:
+        return False
+
+    try:
+        digest = await app.state.services.redis.get(
+            BCRYPT_CACHE_KEY.format(pw_bcrypt.decode()),
+        )
+    except Exception as exc:
+        log(f"Failed to read the persisted bcrypt cache: {exc!r}", Ansi.LYELLOW)
+        return False
+
+    if digest is None:
+        return False
+
+    if isinstance(digest, bytes):
+        digest = digest.decode()
+
+    return hmac.compare_digest(digest, _cache_digest(pw_md5, pw_bcrypt))
+
+
+async def _persist_cache_entry(pw_md5: bytes, pw_bcrypt: bytes) -> None:
+    if not app.settings.BCRYPT_CACHE_SECRET:
+        return
+
+    try:
+        await app.state.services.redis.set(
+            BCRYPT_CACHE_KEY.format(pw_bcrypt.decode()),
+            _cache_digest(pw_md5, pw_bcrypt),
+            ex=BCRYPT_CACHE_TTL,
+        )
+    except Exception as exc:
+        log(f"Failed to persist a bcrypt cache entry: {exc!r}", Ansi.LYELLOW)
+
+
+async def verify_password(pw_md5: bytes, pw_bcrypt: bytes) -> bool:
+    """\
+    Check a password's md5 against a user's bcrypt hash.
+
+    Recently verified passwords are checked against the in-memory
+    (then the persisted) cache; otherwise bcrypt is run in the pool.
+    If BCRYPT_MAX_PENDING checks are already running or waiting,
+    `PasswordChecksOverloaded` is raised instead of waiting in line.
+    """
+    global _pending_checks
+
+    # in-memory bcrypt lookup cache for performance
+    if pw_bcrypt in app.state.cache.bcrypt:  # ~0.01 ms
+        return hmac.compare_digest(pw_md5, app.state.cache.bcrypt[pw_bcrypt])
+
+    if await _check_persisted_cache(pw_md5, pw_bcrypt):  # ~1 ms
+        app.state.cache.bcrypt[pw_bcrypt] = pw_md5
+        return True
+
+    if _pending_checks >= app.settings.BCRYPT_MAX_PENDING:
+        metrics.increment("ex_bcrypt_checks_rejected")
+        raise PasswordChecksOverloaded
+
+    _pending_checks += 1
+    metrics.increment("ex_bcrypt_pending_checks")
+    try:
+        if not await _run_in_pool(bcrypt.checkpw, pw_md5, pw_bcrypt):  # ~200ms
+            return False
+    finally:
+        _pending_checks -= 1
+        metrics.decrement("ex_bcrypt_pending_checks")
+
+    app.state.cache.bcrypt[pw_bcrypt] = pw_md5
+    await _persist_cache_entry(pw_md5, pw_bcrypt)
+    return True
+
+
+async def hash_password(pw_md5: bytes) -> bytes:
+    """Hash a password's md5 with bcrypt, in the pool, & cache the result."""
+    pw_bcrypt = await _run_in_pool(bcrypt.hashpw, pw_md5, bcrypt.gensalt())
+
+    app.state.cache.bcrypt[pw_bcrypt] = pw_md5  # cache result for login
+    await _persist_cache_entry(pw_md5, pw_bcrypt)
+    return pw_bcrypt
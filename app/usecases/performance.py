@@ -1,14 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import math
+import time
+from collections import OrderedDict
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
+from pathlib import Path
 from typing import TypedDict
 
 from akatsuki_pp_py import Beatmap
 from akatsuki_pp_py import Calculator
 
+import app.settings
+from app import metrics
 from app.constants.mods import Mods
+from app.logging import Ansi
+from app.logging import log
+
+BEATMAPS_PATH = Path.cwd() / ".data/osu"
 
 
 @dataclass
@@ -66,12 +78,21 @@ def calculate_performances(
 
     Typically most useful for mass-recalculation situations.
 
+    NOTE: this blocks until complete; the server should instead
+    use `calculate_performances_async` to run in a worker process.
+
     TODO: Some level of error handling & returning to caller should be
     implemented here to handle cases where e.g. the beatmap file is invalid
     or there an issue during calculation.
     """
     calc_bmap = Beatmap(path=osu_file_path)
+    return _calculate_performances(calc_bmap, scores)
+
 
+def _calculate_performances(
+    calc_bmap: Beatmap,
+    scores: Iterable[ScoreParams],
+) -> list[PerformanceResult]:
     results: list[PerformanceResult] = []
 
     for score in scores:
@@ -136,3 +157,115 @@ def calculate_performances(
         )
 
     return results
+
+
+# the worker pool performance calculations are run in, so that
+# large (e.g. marathon) maps don't block the server's event loop.
+_executor: ProcessPoolExecutor | None = None
+
+# parsed beatmaps, kept in each worker process & keyed by (id, md5)
+# so that an updated .osu file will never be served from the cache.
+_beatmap_cache: OrderedDict[tuple[int, str], Beatmap] = OrderedDict()
+_beatmap_cache_size = 0
+
+
+def _initialize_worker(beatmap_cache_size: int) -> None:
+    global _beatmap_cache_size
+    _beatmap_cache_size = beatmap_cache_size
+
+
+def _get_beatmap(beatmap_id: int, beatmap_md5: str) -> Beatmap:
+    """Fetch a parsed beatmap from the worker's cache, or parse it from disk."""
+    key = (beatmap_id, beatmap_md5)
+
+    calc_bmap = _beatmap_cache.get(key)
+    if calc_bmap is not None:
+        _beatmap_cache.move_to_end(key)
+        return calc_bmap
+
+    calc_bmap = Beatmap(path=str(BEATMAPS_PATH / f"{beatmap_id}.osu"))
+
+    if _beatmap_cache_size > 0:
+        _beatmap_cache[key] = calc_bmap
+        while len(_beatmap_cache) > _beatmap_cache_size:
+            _beatmap_cache.popitem(last=False)
+
+    return calc_bmap
+
+
+def _calculate_in_worker(
+    beatmap_id: int,
+    beatmap_md5: str,
+    scores: list[ScoreParams],
+) -> list[PerformanceResult]:
+    calc_bmap = _get_beatmap(beatmap_id, beatmap_md5)
+    return _calculate_performances(calc_bmap, scores)
+
+
+def start_workers() -> None:
+    """Start the pool of performance calculation workers."""
+    global _executor
+
+    if _executor is not None:
+        return
+
+    _executor = ProcessPoolExecutor(
+        max_workers=app.settings.PP_CALC_WORKERS,
+        initializer=_initialize_worker,
+        initargs=(app.settings.PP_CALC_BEATMAP_CACHE_SIZE,),
+    )
+
+
+def shutdown_workers() -> None:
+    """Stop the pool of performance calculation workers."""
+    global _executor
+
+    if _executor is None:
+        return
+
+    _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
+
+
+async def calculate_performances_async(
+    beatmap_id: int,
+    beatmap_md5: str,
+    scores: Iterable[ScoreParams],
+) -> list[PerformanceResult]:
+    """\
+    Calculate performance for multiple scores on a single beatmap,
+    in a worker process (the .osu file must already be on disk).
+
+    Each worker keeps an LRU cache of parsed beatmaps, so
+    repeated calculations on a map will not re-parse it.
+    """
+    global _executor
+
+    if _executor is None:
+        start_workers()
+        assert _executor is not None
+
+    executor = _executor
+    loop = asyncio.get_running_loop()
+
+    metrics.increment("ex_pp_calc_queue_depth")
+    start_time = time.perf_counter()
+    try:
+        return await loop.run_in_executor(
+            executor,
+            _calculate_in_worker,
+            beatmap_id,
+            beatmap_md5,
+            list(scores),
+        )
+    except BrokenProcessPool:
+        # a worker died unexpectedly (e.g. a crash in the calculator);
+        # the pool is unusable, so a new one will be started next call.
+        log(f"PP calculation worker pool broke on map {beatmap_id}.", Ansi.LRED)
+        if _executor is executor:
+            executor.shutdown(wait=False)
+            _executor = None
+        raise
+    finally:
+        metrics.decrement("ex_pp_calc_queue_depth")
+        metrics.histrogram("ex_pp_calc_time", time.perf_counter() - start_time)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import lzma
+import os
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+import app.settings
+import app.utils
+
+REPLAYS_PATH = Path.cwd() / ".data/osr"
+
+# replays are streamed from disk in chunks of this many bytes
+READ_CHUNK_SIZE = 64 * 1024
+
+# the suffix of replays packed with lzma at rest
+PACKED_SUFFIX = ".osr.xz"
+
+
+def replay_path(score_id: int, packed: bool = False) -> Path:
+    """The path of a replay in the store.
+
+    Replays are sharded into 256 * 256 directories by a hash of their
+    score id, so no single directory holds more than a few files."""
+    shard = hashlib.md5(str(score_id).encode()).hexdigest()
+    suffix = PACKED_SUFFIX if packed else ".osr"
+    return REPLAYS_PATH / shard[0:2] / shard[2:4] / f"{score_id}{suffix}"
+
+
+def legacy_replay_path(score_id: int) -> Path:
+    """The path of a replay written before the store was sharded."""
+    return REPLAYS_PATH / f"{score_id}.osr"
+
+
+@dataclass
+class StoredReplay:
+    size: int  # (of the unpacked replay)
+    path: Path
+
+    # the contents of packed replays, which are unpacked when found
+    data: bytes | None = None
+
+    # unpacked replays are opened when found, so they can't be moved
+    # (e.g. by tools/migrate_replays.py) before they're streamed
+    file: BinaryIO | None = None
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Stream the replay's contents, without reading it all into memory."""
+        if self.data is not None:
+            yield self.data
+            return
+
+        assert self.file is not None
+        try:
+            while chunk := await asyncio.to_thread(self.file.read, READ_CHUNK_SIZE):
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Close the replay's file, if it won't be streamed."""
+        if self.file is not None:
+            self.file.close()
+
+
+def _find(score_id: int) -> StoredReplay | None:
+    for path in (replay_path(score_id), legacy_replay_path(score_id)):
+        try:
+            f = path.open("rb")
+        except FileNotFoundError:
+            continue
+
+        return StoredReplay(size=os.fstat(f.fileno()).st_size, path=path, file=f)
+
+    path = replay_path(score_id, packed=True)
+    try:
+        data = lzma.decompress(path.read_bytes())
+    except FileNotFoundError:
+        return None
+
+    return StoredReplay(size=len(data), path=path, data=data)
+
+
+async def find(score_id: int) -> StoredReplay | None:
+    """Find a score's replay in the store."""
+    return await asyncio.to_thread(_find, score_id)
+
+
+def _save(score_id: int, data: bytes, pack: bool) -> None:
+    if pack:
+        # NOTE: replay frames are already lzma compressed by
+        # the client, so packing them again saves little space.
+        data = lzma.compress(data)
+
+    app.utils.write_file_atomically(replay_path(score_id, packed=pack), data)
+
+
+async def save(score_id: int, data: bytes) -> None:
+    """Write a score's replay to the store."""
+    pack = app.settings.REPLAY_COMPRESSION == "lzma"
+    await asyncio.to_thread(_save, score_id, data, pack)
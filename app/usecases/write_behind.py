@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from typing import Any
+
+import app.state
+from app.constants.gamemodes import GameMode
+from app.logging import Ansi
+from app.logging import log
+
+# the max number of rows updated by a single statement
+MAX_ROWS_PER_STATEMENT = 1000
+
+# pending writes, coalesced by key until the next flush
+_latest_activity: dict[int, int] = {}  # {user_id: timestamp}; last write wins
+_replay_views: Counter[tuple[int, int]] = Counter()  # {(user_id, mode): views}
+_map_plays: Counter[str] = Counter()  # {map_md5: plays}
+_map_passes: Counter[str] = Counter()  # {map_md5: passes}
+
+# the most recent flush, which is run in its own task (see `flush`)
+_flush_task: asyncio.Task[None] | None = None
+
+
+def update_latest_activity(user_id: int, timestamp: int) -> None:
+    """Queue an update to a user's latest activity."""
+    if timestamp > _latest_activity.get(user_id, 0):
+        _latest_activity[user_id] = timestamp
+
+
+def increment_replay_views(user_id: int, mode: GameMode) -> None:
+    """Queue an increment of a user's replay views in a mode."""
+    _replay_views[(user_id, mode)] += 1
+
+
+def increment_map_plays(map_md5: str, passed: bool) -> None:
+    """Queue an increment of a map's plays (and passes)."""
+    _map_plays[map_md5] += 1
+    if passed:
+        _map_passes[map_md5] += 1
+
+
+def _chunks(items: list[Any]) -> list[list[Any]]:
+    return [
+        items[idx : idx + MAX_ROWS_PER_STATEMENT]
+        for idx in range(0, len(items), MAX_ROWS_PER_STATEMENT)
+    ]
+
+
+async def _write_latest_activity(rows: list[tuple[int, int]]) -> None:
+    cases = []
+    params: dict[str, Any] = {"user_ids": [user_id for user_id, _ in rows]}
+    for idx, (user_id, timestamp) in enumerate(rows):
+        cases.append(f"WHEN :id_{idx} THEN :latest_activity_{idx}")
+        params[f"id_{idx}"] = user_id
+        params[f"latest_activity_{idx}"] = timestamp
+
+    await app.state.services.database.execute(
+        "UPDATE users SET latest_activity = "
+        f"CASE id {' '.join(cases)} ELSE latest_activity END "
+        "WHERE id IN :user_ids",
+        params,
+    )
+
+
+async def _write_replay_views(rows: list[tuple[tuple[int, int], int]]) -> None:
+    values = []
+    params: dict[str, Any] = {}
+    for idx, ((user_id, mode), views) in enumerate(rows):
+        values.append(f"(:id_{idx}, :mode_{idx}, :views_{idx})")
+        params[f"id_{idx}"] = user_id
+        params[f"mode_{idx}"] = mode
+        params[f"views_{idx}"] = views
+
+    # (id, mode) is the primary key; these rows already exist
+    await app.state.services.database.execute(
+        "INSERT INTO stats (id, mode, replay_views) "
+        f"VALUES {', '.join(values)} "
+        "ON DUPLICATE KEY UPDATE "
+        "replay_views = replay_views + VALUES(replay_views)",
+        params,
+    )
+
+
+async def _write_map_plays(rows: list[tuple[str, int, int]]) -> None:
+    plays_cases = []
+    passes_cases = []
+    params: dict[str, Any] = {"map_md5s": [map_md5 for map_md5, _, _ in rows]}
+    for idx, (map_md5, plays, passes) in enumerate(rows):
+        plays_cases.append(f"WHEN :md5_{idx} THEN :plays_{idx}")
+        passes_cases.append(f"WHEN :md5_{idx} THEN :passes_{idx}")
+        params[f"md5_{idx}"] = map_md5
+        params[f"plays_{idx}"] = plays
+        params[f"passes_{idx}"] = passes
+
+    await app.state.services.database.execute(
+        "UPDATE maps SET "
+        f"plays = plays + CASE md5 {' '.join(plays_cases)} ELSE 0 END, "
+        f"passes = passes + CASE md5 {' '.join(passes_cases)} ELSE 0 END "
+        "WHERE md5 IN :map_md5s",
+        params,
+    )
+
+
+async def flush() -> None:
+    """\
+    Write all pending writes to sql, as multi-row statements.
+
+    The flush is shielded from cancellation (e.g. of the housekeeping
+    task on shutdown), as the writes it's swapped out would be lost;
+    a cancelled flush is finished before the next one is started.
+    """
+    global _flush_task
+
+    if _flush_task is not None:
+        await asyncio.shield(_flush_task)
+
+    _flush_task = asyncio.create_task(_flush())
+    await asyncio.shield(_flush_task)
+
+
+async def _flush() -> None:
+    global _latest_activity, _replay_views, _map_plays, _map_passes
+
+    # swap out the pending writes, so writes
+    # queued during the flush aren't lost.
+    latest_activity, _latest_activity = _latest_activity, {}
+    replay_views, _replay_views = _replay_views, Counter()
+    map_plays, _map_plays = _map_plays, Counter()
+    map_passes, _map_passes = _map_passes, Counter()
+
+    # on failure, writes are requeued to be retried on the next flush
+    for activity_rows in _chunks(list(latest_activity.items())):
+        try:
+            await _write_latest_activity(activity_rows)
+        except Exception as exc:
+            log(f"Failed to write latest activity: {exc!r}", Ansi.LRED)
+            for user_id, timestamp in activity_rows:
+                update_latest_activity(user_id, timestamp)
+
+    for views_rows in _chunks(list(replay_views.items())):
+        try:
+            await _write_replay_views(views_rows)
+        except Exception as exc:
+            log(f"Failed to write replay views: {exc!r}", Ansi.LRED)
+            _replay_views.update(dict(views_rows))
+
+    map_md5s = map_plays.keys() | map_passes.keys()
+    plays_rows = [(md5, map_plays[md5], map_passes[md5]) for md5 in map_md5s]
+    for plays_rows_chunk in _chunks(plays_rows):
+        try:
+            await _write_map_plays(plays_rows_chunk)
+        except Exception as exc:
+            log(f"Failed to write map plays: {exc!r}", Ansi.LRED)
+            for map_md5, plays, passes in plays_rows_chunk:
+                _map_plays[map_md5] += plays
+                _map_passes[map_md5] += passes
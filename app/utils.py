@@ -5,6 +5,7 @@ import inspect
 import os
 import socket
 import sys
+import tempfile
 from collections.abc import Callable
 from pathlib import Path
 from typing import TYPE_CHECKING
@@ -202,6 +203,21 @@ def escape_enum(
     return str(int(val))
 
 
+def write_file_atomically(path: Path, data: bytes) -> None:
+    """Write a file through a temporary file, so readers never see it
+    partially written (and a crash can't leave it truncated)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
 def ensure_persistent_volumes_are_available() -> None:
     # create /.data directory
     DATA_PATH.mkdir(exist_ok=True)
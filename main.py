@@ -2,28 +2,57 @@
 from __future__ import annotations
 
 import logging
+import multiprocessing
+import os
 
 import uvicorn
 
 import app.logging
 import app.settings
 import app.utils
+from app.logging import Ansi
+from app.logging import log
 
 app.logging.configure_logging()
 
 
-def main() -> int:
-    app.utils.display_startup_dialog()
+def run_worker() -> None:
     uvicorn.run(
         "app.api.init_api:asgi_app",
-        reload=app.settings.DEBUG,
+        reload=app.settings.DEBUG and app.settings.BANCHO_WORKERS == 1,
         log_level=logging.WARNING,
         server_header=False,
         date_header=False,
         headers=[("bancho-version", app.settings.VERSION)],
         host=app.settings.APP_HOST,
-        port=app.settings.APP_PORT,
+        port=app.settings.APP_PORT + app.settings.WORKER_ID,
     )
+
+
+def main() -> int:
+    app.utils.display_startup_dialog()
+
+    if app.settings.BANCHO_WORKERS == 1:
+        run_worker()
+        return 0
+
+    if app.settings.SESSION_BACKEND != "redis":
+        log("Multiple workers require SESSION_BACKEND=redis.", Ansi.LRED)
+        return 1
+
+    # each worker is a fresh process, which reads its id from the environment
+    context = multiprocessing.get_context("spawn")
+    workers = []
+
+    for worker_id in range(app.settings.BANCHO_WORKERS):
+        os.environ["WORKER_ID"] = str(worker_id)
+        worker = context.Process(target=run_worker, name=f"bancho-{worker_id}")
+        worker.start()
+        workers.append(worker)
+
+    for worker in workers:
+        worker.join()
+
     return 0
 
 
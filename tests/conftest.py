@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 from collections.abc import AsyncIterator
+from collections.abc import Callable
+from datetime import datetime
 
 import httpx
 import pytest
@@ -10,6 +12,12 @@ from asgi_lifespan._types import ASGIApp
 from fastapi import status
 
 from app.api.init_api import asgi_app
+from app.constants.gamemodes import GameMode
+from app.constants.privileges import Privileges
+from app.objects.beatmap import Beatmap
+from app.objects.beatmap import BeatmapSet
+from app.objects.beatmap import RankedStatus
+from app.objects.player import Player
 
 # TODO: fixtures for postgres database connection(s) for itests
 
@@ -54,4 +62,68 @@ async def http_client(app: ASGIApp) -> AsyncIterator[httpx.AsyncClient]:
         yield client
 
 
+@pytest.fixture
+def make_player() -> Callable[..., Player]:
+    def make_player(
+        id: int,
+        name: str | None = None,
+        priv: Privileges = Privileges.UNRESTRICTED,
+        country: str = "ca",
+    ) -> Player:
+        return Player(
+            id=id,
+            name=name if name is not None else f"user{id}",
+            priv=priv,
+            pw_bcrypt=None,
+            token=Player.generate_token(),
+            geoloc={
+                "latitude": 0.0,
+                "longitude": 0.0,
+                "country": {"acronym": country, "numeric": 0},
+            },
+            irc_key=f"irc-{id}",
+        )
+
+    return make_player
+
+
+@pytest.fixture
+def make_beatmap_set() -> Callable[..., BeatmapSet]:
+    def make_beatmap_set(
+        bsid: int,
+        map_md5s: list[str] | None = None,
+        last_osuapi_check: datetime | None = None,
+    ) -> BeatmapSet:
+        if map_md5s is None:
+            map_md5s = [f"{bsid:016x}{idx:016x}" for idx in range(3)]
+
+        bmap_set = BeatmapSet(
+            id=bsid,
+            last_osuapi_check=last_osuapi_check or datetime.now(),
+        )
+        for idx, map_md5 in enumerate(map_md5s):
+            bmap_set.maps.append(
+                Beatmap(
+                    map_set=bmap_set,
+                    md5=map_md5,
+                    id=bsid * 10 + idx,
+                    set_id=bsid,
+                    artist="Camellia",
+                    title="Exit This Earth's Atomosphere",
+                    version=f"Diff {idx}",
+                    creator="Kanui",
+                    last_update=datetime(2023, 6, 1, 12, 30),
+                    status=RankedStatus.Ranked,
+                    mode=GameMode.VANILLA_OSU,
+                    bpm=200.0,
+                    diff=7.27,
+                    filename=f"diff {idx}.osu",
+                ),
+            )
+
+        return bmap_set
+
+    return make_beatmap_set
+
+
 pytest_plugins = []
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import orjson
+import pytest
+
+import app.settings
+import app.state
+import app.usecases.beatmap_cache
+from app.objects.beatmap import Beatmap
+from app.objects.beatmap import RankedStatus
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(app.state.cache, "unsubmitted", OrderedDict())
+    monkeypatch.setattr(app.state.cache, "needs_update", OrderedDict())
+    monkeypatch.setattr(
+        app.usecases.beatmap_cache,
+        "SNAPSHOT_PATH",
+        tmp_path / "beatmap_cache.json",
+    )
+
+    app.usecases.beatmap_cache.clear()
+    yield
+    app.usecases.beatmap_cache.clear()
+
+
+def test_maps_are_indexed_by_md5_and_id(make_beatmap_set):
+    bmap_set = make_beatmap_set(1)
+    app.usecases.beatmap_cache.add_set(bmap_set)
+
+    for bmap in bmap_set.maps:
+        assert app.usecases.beatmap_cache.get_map(bmap.md5) is bmap
+        assert app.usecases.beatmap_cache.get_map(bmap.id) is bmap
+    assert app.usecases.beatmap_cache.get_set(1) is bmap_set
+    assert app.usecases.beatmap_cache.memory_usage() > 0
+
+    # re-adding the set drops maps which are no longer in it
+    removed_map = bmap_set.maps.pop()
+    app.usecases.beatmap_cache.add_set(bmap_set)
+    assert app.usecases.beatmap_cache.get_map(removed_map.md5) is None
+    assert app.usecases.beatmap_cache.get_map(removed_map.id) is None
+
+    app.usecases.beatmap_cache.remove_set(1)
+    assert not app.state.cache.beatmap
+    assert app.usecases.beatmap_cache.memory_usage() == 0
+
+
+def test_least_recently_used_sets_are_evicted(monkeypatch, make_beatmap_set):
+    app.usecases.beatmap_cache.add_set(make_beatmap_set(1))
+    set_size = app.usecases.beatmap_cache.memory_usage()
+
+    # room for three sets
+    max_memory_usage = set_size * 3.5 / (1024 * 1024)
+    monkeypatch.setattr(app.settings, "BEATMAP_CACHE_MAX_MEMORY", max_memory_usage)
+
+    app.usecases.beatmap_cache.add_set(make_beatmap_set(2))
+    app.usecases.beatmap_cache.add_set(make_beatmap_set(3))
+
+    # using the first set makes the second the least recently used
+    assert app.usecases.beatmap_cache.get_map(10) is not None
+
+    app.usecases.beatmap_cache.add_set(make_beatmap_set(4))
+
+    assert list(app.state.cache.beatmapset) == [3, 1, 4]
+    assert app.usecases.beatmap_cache.get_map(20) is None
+    assert app.usecases.beatmap_cache.memory_usage() <= set_size * 3.5
+
+
+def test_unused_sets_expire(monkeypatch, make_beatmap_set):
+    for bsid in (1, 2, 3):
+        app.usecases.beatmap_cache.add_set(make_beatmap_set(bsid))
+
+    # the first two sets were last used over the ttl ago
+    expired = time.monotonic() - app.settings.BEATMAP_CACHE_TTL - 1
+    app.usecases.beatmap_cache._last_access[1] = expired
+    app.usecases.beatmap_cache._last_access[2] = expired
+    assert app.usecases.beatmap_cache.get_set(2) is not None
+
+    app.usecases.beatmap_cache.evict_expired()
+
+    assert list(app.state.cache.beatmapset) == [3, 2]
+
+
+def test_unknown_md5s_expire(monkeypatch):
+    monkeypatch.setattr(app.usecases.beatmap_cache, "MAX_UNKNOWN_MD5S", 2)
+
+    for md5 in ("a" * 32, "b" * 32, "c" * 32):
+        app.usecases.beatmap_cache.mark_unsubmitted(md5)
+
+    # the oldest md5 is forgotten first
+    assert not app.usecases.beatmap_cache.is_unsubmitted("a" * 32)
+    assert app.usecases.beatmap_cache.is_unsubmitted("b" * 32)
+
+    app.state.cache.unsubmitted["c" * 32] = time.monotonic() - 1
+    assert not app.usecases.beatmap_cache.is_unsubmitted("c" * 32)
+    assert list(app.state.cache.unsubmitted) == ["b" * 32]
+
+
+async def test_snapshot_round_trip(make_beatmap_set):
+    for bsid in (1, 2):
+        app.usecases.beatmap_cache.add_set(
+            make_beatmap_set(bsid, last_osuapi_check=datetime(2024, 1, 1)),
+        )
+    app.usecases.beatmap_cache.get_set(1)
+
+    original_maps = {
+        bmap.md5: {field: getattr(bmap, field) for field in Beatmap.__slots__[1:]}
+        for bmap_set in app.state.cache.beatmapset.values()
+        for bmap in bmap_set.maps
+    }
+
+    await app.usecases.beatmap_cache.save_snapshot()
+    app.usecases.beatmap_cache.clear()
+    app.usecases.beatmap_cache.load_snapshot()
+
+    # the snapshot is only loaded once
+    assert not app.usecases.beatmap_cache.SNAPSHOT_PATH.exists()
+
+    assert list(app.state.cache.beatmapset) == [2, 1]
+    loaded_maps = {
+        bmap.md5: {field: getattr(bmap, field) for field in Beatmap.__slots__[1:]}
+        for bmap_set in app.state.cache.beatmapset.values()
+        for bmap in bmap_set.maps
+    }
+    assert loaded_maps == original_maps
+
+    bmap = app.usecases.beatmap_cache.get_map(10)
+    assert bmap is not None
+    assert isinstance(bmap.status, RankedStatus)
+    assert bmap.set.last_osuapi_check == datetime(2024, 1, 1)
+
+
+async def test_outdated_snapshots_are_ignored(make_beatmap_set):
+    app.usecases.beatmap_cache.add_set(make_beatmap_set(1))
+    await app.usecases.beatmap_cache.save_snapshot()
+    app.usecases.beatmap_cache.clear()
+
+    snapshot_path = app.usecases.beatmap_cache.SNAPSHOT_PATH
+    snapshot = orjson.loads(snapshot_path.read_bytes())
+    snapshot["created_at"] -= app.settings.BEATMAP_CACHE_TTL + 1
+    snapshot_path.write_bytes(orjson.dumps(snapshot))
+
+    app.usecases.beatmap_cache.load_snapshot()
+    assert not app.state.cache.beatmapset
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+import app.objects.beatmap
+import app.state
+import app.usecases.beatmap_cache
+from app.objects.beatmap import Beatmap
+from app.objects.beatmap import BeatmapSet
+from app.objects.beatmap import ensure_osu_file_is_available
+
+
+class FakeSources:
+    """Stands in for the database & osu!api, counting lookups."""
+
+    def __init__(self, beatmap_sets: list[BeatmapSet]) -> None:
+        self.beatmap_sets = {bmap_set.id: bmap_set for bmap_set in beatmap_sets}
+        self.lookups: list[tuple[str, Any]] = []
+
+    async def fetch_one(self, **kwargs: Any) -> dict[str, Any] | None:
+        self.lookups.append(("maps", kwargs))
+        await asyncio.sleep(0.01)
+        for bmap_set in self.beatmap_sets.values():
+            for bmap in bmap_set.maps:
+                if bmap.md5 == kwargs.get("md5") or bmap.id == kwargs.get("id"):
+                    return {"set_id": bmap_set.id}
+        return None
+
+    async def api_get_beatmaps(self, **params: Any) -> dict[str, Any]:
+        self.lookups.append(("api", params))
+        await asyncio.sleep(0.01)
+        return {"data": None, "status_code": 404}
+
+    async def from_bsid_sql(self, bsid: int) -> BeatmapSet | None:
+        self.lookups.append(("mapsets", bsid))
+        await asyncio.sleep(0.01)
+        return self.beatmap_sets.get(bsid)
+
+    async def from_bsid_osuapi(self, bsid: int) -> BeatmapSet | None:
+        self.lookups.append(("api", {"s": bsid}))
+        await asyncio.sleep(0.01)
+        return None
+
+
+@pytest.fixture
+def sources(monkeypatch, make_beatmap_set):
+    sources = FakeSources([make_beatmap_set(1, ["a" * 32, "b" * 32])])
+
+    monkeypatch.setattr(app.objects.beatmap, "_in_flight", {})
+    monkeypatch.setattr(app.objects.beatmap, "_not_found", {})
+    monkeypatch.setattr(app.objects.beatmap.maps_repo, "fetch_one", sources.fetch_one)
+    monkeypatch.setattr(
+        app.objects.beatmap,
+        "api_get_beatmaps",
+        sources.api_get_beatmaps,
+    )
+    monkeypatch.setattr(BeatmapSet, "_from_bsid_sql", sources.from_bsid_sql)
+    monkeypatch.setattr(BeatmapSet, "_from_bsid_osuapi", sources.from_bsid_osuapi)
+
+    app.usecases.beatmap_cache.clear()
+    yield sources
+    app.usecases.beatmap_cache.clear()
+
+
+async def test_concurrent_lookups_are_coalesced(sources):
+    results = await asyncio.gather(
+        *[Beatmap.from_md5("a" * 32) for _ in range(25)],
+        *[Beatmap.from_md5("b" * 32) for _ in range(25)],
+        *[Beatmap.from_bid(10) for _ in range(25)],
+    )
+
+    assert {bmap.md5 for bmap in results[:25]} == {"a" * 32}
+    assert {bmap.md5 for bmap in results[25:50]} == {"b" * 32}
+    assert {bmap.md5 for bmap in results[50:]} == {"a" * 32}
+
+    # one lookup per key, and the set is only loaded once
+    assert sorted(lookups for lookups, _ in sources.lookups) == [
+        "maps",
+        "maps",
+        "maps",
+        "mapsets",
+    ]
+    assert not app.objects.beatmap._in_flight
+
+    # the set is now cached
+    assert await Beatmap.from_md5("a" * 32) is results[0]
+    assert len(sources.lookups) == 4
+
+
+async def test_missing_maps_are_negatively_cached(sources, monkeypatch):
+    assert await Beatmap.from_md5("c" * 32) is None
+    assert len(sources.lookups) == 2  # sql, then osu!api
+
+    for _ in range(5):
+        assert await Beatmap.from_md5("c" * 32) is None
+    assert len(sources.lookups) == 2
+
+    # once expired, the map is looked up again
+    key = ("md5", "c" * 32)
+    app.objects.beatmap._not_found[key] = 0.0
+    assert await Beatmap.from_md5("c" * 32) is None
+    assert len(sources.lookups) == 4
+
+
+async def test_failed_lookups_are_shared_and_retried(sources, monkeypatch):
+    async def fetch_one(**kwargs: Any) -> dict[str, Any] | None:
+        sources.lookups.append(("maps", kwargs))
+        await asyncio.sleep(0.01)
+        raise ConnectionError("lost connection to sql")
+
+    monkeypatch.setattr(app.objects.beatmap.maps_repo, "fetch_one", fetch_one)
+
+    results = await asyncio.gather(
+        *[Beatmap.from_md5("a" * 32) for _ in range(10)],
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert len(sources.lookups) == 1
+
+    # errors aren't mistaken for the map not existing
+    assert not app.objects.beatmap._not_found
+    with pytest.raises(ConnectionError):
+        await Beatmap.from_md5("a" * 32)
+    assert len(sources.lookups) == 2
+
+
+async def test_cancelled_caller_does_not_cancel_others(sources):
+    first = asyncio.create_task(BeatmapSet.from_bsid(1))
+    second = asyncio.create_task(BeatmapSet.from_bsid(1))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    bmap_set = await second
+
+    assert bmap_set is not None and bmap_set.id == 1
+    assert first.cancelled()
+    assert len(sources.lookups) == 1
+
+
+async def test_concurrent_updates_are_coalesced(sources, monkeypatch, make_beatmap_set):
+    bmap_set = make_beatmap_set(2, ["d" * 32])
+    checks = 0
+
+    async def check_for_update(self: BeatmapSet) -> None:
+        nonlocal checks
+        checks += 1
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(BeatmapSet, "_check_for_update", check_for_update)
+
+    await asyncio.gather(*[bmap_set._update_if_available() for _ in range(10)])
+    assert checks == 1
+
+    await bmap_set._update_if_available()
+    assert checks == 2
+
+
+@pytest.fixture
+def osu_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(app.objects.beatmap, "BEATMAPS_PATH", tmp_path)
+    monkeypatch.setattr(app.objects.beatmap, "_in_flight", {})
+    monkeypatch.setattr(app.objects.beatmap, "_osu_file_versions", OrderedDict())
+
+    downloads: list[int] = []
+
+    async def api_get_osu_file(beatmap_id: int) -> bytes:
+        downloads.append(beatmap_id)
+        await asyncio.sleep(0.01)
+        return f"osu file format v14\n// {beatmap_id}\n".encode()
+
+    monkeypatch.setattr(app.objects.beatmap, "api_get_osu_file", api_get_osu_file)
+    return downloads
+
+
+async def test_concurrent_osu_file_downloads_are_coalesced(osu_files, tmp_path):
+    results = await asyncio.gather(
+        *[ensure_osu_file_is_available(315) for _ in range(10)],
+    )
+
+    assert all(results)
+    assert osu_files == [315]
+    assert (tmp_path / "315.osu").read_bytes() == b"osu file format v14\n// 315\n"
+
+    # no temporary files are left behind
+    assert [path.name for path in tmp_path.iterdir()] == ["315.osu"]
+
+
+async def test_osu_file_md5s_are_only_hashed_when_changed(
+    osu_files,
+    tmp_path,
+    monkeypatch,
+):
+    hashed: list[Path] = []
+
+    def hash_osu_file(osu_file_path: Path) -> tuple[int, int, str]:
+        hashed.append(osu_file_path)
+        return original_hash_osu_file(osu_file_path)
+
+    original_hash_osu_file = app.objects.beatmap.hash_osu_file
+    monkeypatch.setattr(app.objects.beatmap, "hash_osu_file", hash_osu_file)
+
+    data = b"osu file format v14\n// 315\n"
+    md5 = hashlib.md5(data).hexdigest()
+
+    # the md5 of a downloaded file is known without reading it back
+    assert await ensure_osu_file_is_available(315, expected_md5=md5)
+    for _ in range(5):
+        assert await ensure_osu_file_is_available(315, expected_md5=md5)
+    assert osu_files == [315]
+    assert not hashed
+
+    # files changed on disk are re-hashed, and re-downloaded if outdated
+    osu_file_path = tmp_path / "315.osu"
+    osu_file_path.write_bytes(b"osu file format v14\n// outdated\n")
+    os.utime(osu_file_path, ns=(0, 0))
+
+    assert await ensure_osu_file_is_available(315, expected_md5=md5)
+    assert hashed == [osu_file_path]
+    assert osu_files == [315, 315]
+    assert osu_file_path.read_bytes() == data
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import math
+import random
+import time
+from collections import OrderedDict
+
+import app.state
+import app.usecases.best_scores
+from app.constants.gamemodes import GameMode
+from app.usecases.best_scores import BestScores
+
+
+def calculate_totals(scores: dict[str, tuple[float, float]]) -> tuple[int, float]:
+    """Calculate a player's total pp & acc the way score submission used to."""
+    best_scores = sorted(scores.values(), reverse=True)
+
+    weighted_acc = sum(acc * 0.95**i for i, (_, acc) in enumerate(best_scores))
+    bonus_acc = 100.0 / (20 * (1 - 0.95 ** len(best_scores)))
+
+    weighted_pp = sum(pp * 0.95**i for i, (pp, _) in enumerate(best_scores))
+    bonus_pp = 416.6667 * (1 - 0.9994 ** len(best_scores))
+
+    return round(weighted_pp + bonus_pp), (weighted_acc * bonus_acc) / 100
+
+
+def test_from_rows():
+    rows = [
+        {"map_md5": "a", "pp": 100.0, "acc": 99.0},
+        {"map_md5": "b", "pp": 300.0, "acc": 95.0},
+        {"map_md5": "c", "pp": 200.0, "acc": 97.0},
+    ]
+    best_scores = BestScores.from_rows(rows)
+
+    assert [entry[2] for entry in best_scores.entries] == ["b", "c", "a"]
+    assert (best_scores.pp, best_scores.acc) == calculate_totals(
+        {row["map_md5"]: (row["pp"], row["acc"]) for row in rows},
+    )
+
+    assert BestScores.from_rows([]).pp == 0
+    assert BestScores.from_rows([]).acc == 0.0
+
+
+def test_incremental_updates_match_full_recalculation():
+    rng = random.Random(727)
+    best_scores = BestScores()
+    scores: dict[str, tuple[float, float]] = {}
+
+    for _ in range(2000):
+        # mostly new maps, with some improvements (or pp
+        # decreases, e.g. on score-based leaderboards)
+        if scores and rng.random() < 0.3:
+            map_md5 = rng.choice(list(scores))
+        else:
+            map_md5 = f"{rng.getrandbits(128):032x}"
+
+        pp = round(rng.uniform(0, 800), 3)
+        acc = round(rng.uniform(60, 100), 3)
+
+        best_scores.update(map_md5, pp, acc)
+        scores[map_md5] = (pp, acc)
+
+        expected_pp, expected_acc = calculate_totals(scores)
+        assert abs(best_scores.pp - expected_pp) <= 1
+        assert math.isclose(best_scores.acc, expected_acc, abs_tol=1e-6)
+
+    assert len(best_scores.entries) == len(best_scores.by_map) == len(scores)
+    assert best_scores.entries == sorted(best_scores.entries)
+
+    recalculated = BestScores.from_rows(
+        {"map_md5": map_md5, "pp": pp, "acc": acc}
+        for map_md5, (pp, acc) in scores.items()
+    )
+    assert math.isclose(best_scores.weighted_pp, recalculated.weighted_pp)
+    assert math.isclose(best_scores.weighted_acc, recalculated.weighted_acc)
+
+
+async def test_cached_best_scores_expire(monkeypatch):
+    monkeypatch.setattr(app.state.cache, "best_scores", OrderedDict())
+
+    fetches: list[tuple[int, GameMode]] = []
+
+    async def fetch_from_sql(user_id: int, mode: GameMode) -> BestScores:
+        fetches.append((user_id, mode))
+        return BestScores.from_rows([{"map_md5": "a", "pp": 100.0, "acc": 99.0}])
+
+    monkeypatch.setattr(app.usecases.best_scores, "fetch_from_sql", fetch_from_sql)
+
+    best_scores = await app.usecases.best_scores.fetch(3, GameMode.VANILLA_OSU)
+    assert await app.usecases.best_scores.fetch(3, GameMode.VANILLA_OSU) is best_scores
+    assert len(fetches) == 1
+
+    # past the ttl, they're refetched from sql
+    now = time.monotonic() + app.usecases.best_scores.BEST_SCORES_TTL
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+
+    assert await app.usecases.best_scores.fetch(3, GameMode.VANILLA_OSU) is not (
+        best_scores
+    )
+    assert len(fetches) == 2
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import datetime
+import os
+from collections import deque
+
+import orjson
+import pytest
+
+import app.settings
+import app.usecases.chat_log
+from app.objects.channel import Channel
+from app.objects.player import Player
+
+
+@pytest.fixture(autouse=True)
+def chat_logs_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(app.usecases.chat_log, "CHAT_LOGS_PATH", tmp_path)
+    monkeypatch.setattr(
+        app.usecases.chat_log,
+        "_buffer",
+        deque(maxlen=app.usecases.chat_log.MAX_BUFFERED_MESSAGES),
+    )
+    monkeypatch.setattr(app.settings, "CHAT_LOG_FORMAT", "text")
+    monkeypatch.setattr(app.settings, "CHAT_LOG_MAX_SIZE", 64)
+    monkeypatch.setattr(app.settings, "BANCHO_WORKERS", 1)
+    return tmp_path
+
+
+@pytest.fixture
+def cmyui(make_player) -> Player:
+    return make_player(3, "cmyui")
+
+
+@pytest.fixture
+def jacobian(make_player) -> Player:
+    return make_player(4, "jacobian")
+
+
+OSU = Channel(name="#osu", topic="General discussion.")
+
+
+async def test_messages_are_written_in_batches(chat_logs_path, cmyui, jacobian):
+    app.usecases.chat_log.write(cmyui, OSU, "hello #osu")
+    app.usecases.chat_log.write(cmyui, jacobian, "hello jacobian")
+
+    # nothing's written until the next flush
+    assert not (chat_logs_path / "chat.log").exists()
+
+    await app.usecases.chat_log.flush()
+
+    lines = (chat_logs_path / "chat.log").read_text().splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith("] <cmyui (3)> @ <#osu>: hello #osu")
+    assert lines[1].endswith("] <cmyui (3)> @ <jacobian (4)>: hello jacobian")
+
+    # (flushing with no messages buffered is a no-op)
+    await app.usecases.chat_log.flush()
+    assert len((chat_logs_path / "chat.log").read_text().splitlines()) == 2
+
+
+async def test_jsonl_format(chat_logs_path, monkeypatch, cmyui, jacobian):
+    monkeypatch.setattr(app.settings, "CHAT_LOG_FORMAT", "jsonl")
+
+    app.usecases.chat_log.write(cmyui, OSU, "hello #osu")
+    app.usecases.chat_log.write(jacobian, cmyui, 'a "quoted"\nmessage')
+    await app.usecases.chat_log.flush()
+
+    lines = (chat_logs_path / "chat.jsonl").read_bytes().splitlines()
+    entries = [orjson.loads(line) for line in lines]
+
+    assert [entry.pop("time") for entry in entries]
+    assert entries == [
+        {
+            "sender_id": 3,
+            "sender": "cmyui",
+            "recipient_id": None,
+            "recipient": "#osu",
+            "msg": "hello #osu",
+        },
+        {
+            "sender_id": 4,
+            "sender": "jacobian",
+            "recipient_id": 3,
+            "recipient": "cmyui",
+            "msg": 'a "quoted"\nmessage',
+        },
+    ]
+
+
+async def test_logs_are_rotated_by_size(chat_logs_path, monkeypatch, cmyui):
+    monkeypatch.setattr(app.settings, "CHAT_LOG_MAX_SIZE", 1)  # MiB
+
+    for _ in range(3):
+        app.usecases.chat_log.write(cmyui, OSU, "a" * 400_000)
+        await app.usecases.chat_log.flush()
+
+    today = datetime.datetime.now(tz=datetime.timezone.utc).date()
+    rotated_path = chat_logs_path / f"chat.{today}.1.log"
+
+    assert len(rotated_path.read_text().splitlines()) == 2
+    assert len((chat_logs_path / "chat.log").read_text().splitlines()) == 1
+
+
+async def test_logs_are_rotated_daily(chat_logs_path, cmyui):
+    app.usecases.chat_log.write(cmyui, OSU, "yesterday's message")
+    await app.usecases.chat_log.flush()
+
+    yesterday = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(
+        days=1,
+    )
+    os.utime(chat_logs_path / "chat.log", (yesterday.timestamp(),) * 2)
+
+    app.usecases.chat_log.write(cmyui, OSU, "today's message")
+    await app.usecases.chat_log.flush()
+
+    rotated_path = chat_logs_path / f"chat.{yesterday.date()}.1.log"
+    assert "yesterday's message" in rotated_path.read_text()
+    assert "today's message" in (chat_logs_path / "chat.log").read_text()
+
+
+async def test_failed_writes_are_retried(chat_logs_path, monkeypatch, cmyui):
+    write_to_disk = app.usecases.chat_log._write_to_disk
+
+    def failing_write_to_disk(*args: object) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(
+        app.usecases.chat_log,
+        "_write_to_disk",
+        failing_write_to_disk,
+    )
+    app.usecases.chat_log.write(cmyui, OSU, "first")
+    await app.usecases.chat_log.flush()
+
+    monkeypatch.setattr(app.usecases.chat_log, "_write_to_disk", write_to_disk)
+    app.usecases.chat_log.write(cmyui, OSU, "second")
+    await app.usecases.chat_log.flush()
+
+    lines = (chat_logs_path / "chat.log").read_text().splitlines()
+    assert [line.rsplit(": ", 1)[1] for line in lines] == ["first", "second"]
@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import pytest
+
+import app.packets
+import app.state
+from app.constants.gamemodes import GameMode
+from app.constants.mods import Mods
+from app.constants.privileges import Privileges
+from app.objects.channel import Channel
+from app.objects.collections import Channels
+from app.objects.collections import Matches
+from app.objects.collections import Players
+from app.objects.match import MAX_MATCH_ID
+from app.objects.match import Match
+from app.objects.match import MatchTeamTypes
+from app.objects.match import MatchWinConditions
+from app.objects.player import ModeData
+from app.objects.player import Player
+
+
+def test_players_get_by_index(make_player):
+    players = Players()
+    cmyui = make_player(3, "cmyui")
+    jacobian = make_player(4, "Jacobian Gaming")
+    players.append(cmyui)
+    players.append(jacobian)
+
+    assert players.get(token=cmyui.token) is cmyui
+    assert players.get(id=4) is jacobian
+    assert players.get(name="jacobian_gaming") is jacobian
+    assert players.get(name="JACOBIAN GAMING") is jacobian
+    assert players.get(irc_key="irc-3") is cmyui
+    assert players.get(id=5) is None
+    assert players.get() is None
+
+    assert "cmyui" in players
+    assert "CMYUI" not in players
+    assert jacobian in players
+    assert players.ids == {3, 4}
+
+
+def test_players_remove_after_logout(make_player):
+    players = Players()
+    player = make_player(3, "cmyui")
+    players.append(player)
+
+    token = player.token
+    player.token = ""  # logout invalidates the token before removal
+    players.remove(player)
+
+    assert player not in players
+    assert players.get(token=token) is None
+    assert players.get(id=3) is None
+    assert players.get(name="cmyui") is None
+    assert list(players) == []
+
+
+def test_players_duplicate_sessions_return_earliest(make_player):
+    players = Players()
+    first = make_player(3, "cmyui")
+    second = make_player(3, "cmyui")  # e.g. a tourney client
+    players.append(first)
+    players.append(second)
+
+    assert players.get(id=3) is first
+
+    players.remove(first)
+    assert players.get(id=3) is second
+    assert players.get(name="cmyui") is second
+
+
+def test_players_rename(make_player):
+    players = Players()
+    player = make_player(3, "cmyui")
+    players.append(player)
+
+    players.rename(player, "cmyui2")
+
+    assert player.name == "cmyui2"
+    assert players.get(name="cmyui") is None
+    assert players.get(name="cmyui2") is player
+
+
+def test_players_cached_views(make_player):
+    players = Players()
+    staff = make_player(3, "cmyui", Privileges.UNRESTRICTED | Privileges.ADMINISTRATOR)
+    normal = make_player(4, "jacobian")
+    restricted = make_player(5, "cheater", Privileges.VERIFIED)
+
+    for player in (staff, normal, restricted):
+        players.append(player)
+
+    assert players.staff == {staff}
+    assert players.unrestricted == {staff, normal}
+    assert players.restricted == {restricted}
+    assert players.unrestricted is players.unrestricted
+
+    players.remove(normal)
+    assert players.unrestricted == {staff}
+
+    restricted.priv |= Privileges.UNRESTRICTED
+    players.clear_cached_views()
+    assert players.restricted == set()
+
+
+def test_player_packets_cached_until_invalidated(make_player):
+    player = make_player(3, "cmyui")
+    player.stats[GameMode.VANILLA_OSU] = ModeData(
+        tscore=0,
+        rscore=0,
+        pp=0,
+        acc=0.0,
+        plays=0,
+        playtime=0,
+        max_combo=0,
+        total_hits=0,
+        rank=0,
+        grades={},
+    )
+
+    stats = app.packets.user_stats(player)
+    assert app.packets.user_stats(player) is stats
+    assert app.packets.user_presence(player) is player.presence_packet
+
+    player.status.map_id = 315
+    player.invalidate_packets()
+    assert app.packets.user_stats(player) is not stats
+
+
+def test_players_broadcasts(make_player):
+    players = Players()
+    staff = make_player(3, "cmyui", Privileges.UNRESTRICTED | Privileges.ADMINISTRATOR)
+    normal = make_player(4, "jacobian")
+    restricted = make_player(5, "cheater", Privileges.VERIFIED)
+
+    for player in (staff, normal, restricted):
+        players.append(player)
+
+    players.enqueue(b"everyone")
+    players.enqueue(b"not cmyui", immune=[staff])
+    players.enqueue_to_readers(Privileges.ADMINISTRATOR, b"staff channel")
+    players.enqueue_to_readers(Privileges.UNRESTRICTED, b"public channel")
+
+    # broadcasts share a single payload between the recipients' queues
+    assert staff._packet_queue.chunks[0] is normal._packet_queue.chunks[0]
+
+    assert staff.dequeue() == b"everyone" b"staff channel" b"public channel"
+    assert normal.dequeue() == b"everyone" b"not cmyui" b"public channel"
+    assert restricted.dequeue() == b"everyone" b"not cmyui"
+    assert staff.dequeue() is None
+
+    assert players.readers(Privileges(0)) == {staff, normal, restricted}
+
+
+def give_stats(player: Player) -> Player:
+    player.stats[GameMode.VANILLA_OSU] = ModeData(
+        tscore=0,
+        rscore=0,
+        pp=0,
+        acc=0.0,
+        plays=0,
+        playtime=0,
+        max_combo=0,
+        total_hits=0,
+        rank=0,
+        grades={},
+    )
+    return player
+
+
+def login_packets(player: Player) -> bytes:
+    return app.packets.user_presence(player) + app.packets.user_stats(player)
+
+
+def test_players_login_packets(make_player):
+    players = Players()
+    cmyui = give_stats(make_player(3, "cmyui"))
+    jacobian = give_stats(make_player(4, "jacobian"))
+    cheater = give_stats(make_player(5, "cheater", Privileges.VERIFIED))
+
+    for player in (cmyui, jacobian, cheater):
+        players.append(player)
+
+    buffer = bytes(players.login_packets())
+    assert len(buffer) == len(login_packets(cmyui) + login_packets(jacobian))
+    assert login_packets(cmyui) in buffer
+    assert login_packets(jacobian) in buffer
+    assert app.packets.user_presence(cheater) not in buffer
+
+    # a player's updated packets are appended to the buffer
+    old_packets = login_packets(cmyui)
+    cmyui.status.map_id = 315
+    cmyui.invalidate_packets()
+    players.update_login_packets(cmyui)
+
+    buffer = bytes(players.login_packets())
+    assert buffer.endswith(login_packets(cmyui))
+
+    # the buffer is rebuilt without players who have left
+    players.remove(jacobian)
+    buffer = bytes(players.login_packets())
+    assert buffer == login_packets(cmyui)
+    assert old_packets not in buffer
+
+    # & updated as players are (un)restricted
+    cheater.priv |= Privileges.UNRESTRICTED
+    players.update_login_packets(cheater)
+    cmyui.priv &= ~Privileges.UNRESTRICTED
+    players.update_login_packets(cmyui)
+
+    assert bytes(players.login_packets()) == login_packets(cheater)
+
+
+async def test_channels_broadcast_changed_player_counts(monkeypatch, make_player):
+    players = Players()
+    normal = make_player(3, "cmyui")
+    restricted = make_player(4, "cheater", Privileges.VERIFIED)
+    players.append(normal)
+    players.append(restricted)
+    monkeypatch.setattr(app.state.sessions, "players", players)
+
+    osu = Channel(
+        name="#osu",
+        topic="General discussion.",
+        read_priv=Privileges.UNRESTRICTED,
+        write_priv=Privileges.UNRESTRICTED,
+        auto_join=True,
+    )
+    announce = Channel(
+        name="#announce",
+        topic="Announcements.",
+        read_priv=Privileges(0),
+        write_priv=Privileges.ADMINISTRATOR,
+        auto_join=True,
+    )
+    channels = Channels([osu, announce])
+
+    for _ in range(3):
+        channels.mark_player_count_changed(osu)
+    channels.mark_player_count_changed(announce)
+
+    await channels.broadcast_player_counts()
+
+    # each playercount is sent once, to the players who can see it
+    osu_info = app.packets.channel_info("#osu", "General discussion.", 0)
+    announce_info = app.packets.channel_info("#announce", "Announcements.", 0)
+    assert sorted(normal._packet_queue.chunks) == sorted([osu_info, announce_info])
+    assert restricted._packet_queue.chunks == [announce_info]
+
+    # nothing changed since the last broadcast
+    normal.dequeue()
+    await channels.broadcast_player_counts()
+    assert normal.dequeue() is None
+
+
+def test_players_presence_bundle(make_player):
+    players = Players()
+    cmyui = make_player(3, "cmyui")
+    tourney_client = make_player(3, "cmyui")
+    cheater = make_player(5, "cheater", Privileges.VERIFIED)
+
+    for player in (cmyui, tourney_client, cheater):
+        players.append(player)
+
+    bundle = players.presence_bundle()
+    assert bundle == app.packets.user_presence_bundle([3])
+    assert players.presence_bundle() is bundle
+
+    jacobian = make_player(4, "jacobian")
+    players.append(jacobian)
+    assert players.presence_bundle() == app.packets.user_presence_bundle([3, 4])
+
+    players.remove(jacobian)
+    assert players.presence_bundle() == bundle
+
+
+def make_match(matches: Matches, host_id: int) -> Match:
+    match_id = matches.get_free()
+    assert match_id is not None
+
+    match = Match(
+        id=match_id,
+        name=f"match {match_id}",
+        password="",
+        has_public_history=False,
+        map_name="",
+        map_id=0,
+        map_md5="",
+        host_id=host_id,
+        mode=GameMode.VANILLA_OSU,
+        mods=Mods.NOMOD,
+        win_condition=MatchWinConditions.score,
+        team_type=MatchTeamTypes.head_to_head,
+        freemods=False,
+        seed=0,
+        chat_channel=Channel(name=f"#multi_{match_id}", topic="", instance=True),
+    )
+    matches.append(match)
+    return match
+
+
+def test_matches_get_by_index():
+    matches = Matches()
+    first = make_match(matches, host_id=3)
+    second = make_match(matches, host_id=4)
+
+    assert (first.id, second.id) == (0, 1)
+    assert list(matches) == [first, second]
+    assert len(matches) == 2
+
+    assert matches.get(1) is second
+    assert matches.get(2) is None
+    assert matches.get(-1) is None
+    assert matches.get_by_host(3) is first
+    assert matches.get_by_channel(second.chat) is second
+
+    matches.set_host(first, 5)
+    assert first.host_id == 5
+    assert matches.get_by_host(3) is None
+    assert matches.get_by_host(5) is first
+
+    matches.remove(first)
+    assert first not in matches
+    assert list(matches) == [second]
+    assert matches.get(0) is None
+    assert matches.get_by_host(5) is None
+    assert matches.get_by_channel(first.chat) is None
+
+    # removing a match twice is harmless
+    matches.remove(first)
+    assert list(matches) == [second]
+
+
+def test_matches_recycle_ids():
+    matches = Matches()
+    created = [make_match(matches, host_id=3) for _ in range(100)]
+    assert [match.id for match in created] == list(range(100))
+
+    # freed ids are reused before new ids are allocated
+    for match in created[10:20]:
+        matches.remove(match)
+
+    recreated = [make_match(matches, host_id=3) for _ in range(11)]
+    assert sorted(match.id for match in recreated) == list(range(10, 20)) + [100]
+    assert len(matches) == 101
+
+    with pytest.raises(ValueError):
+        matches.append(created[0])
+
+
+def test_matches_limited_to_i16_ids():
+    matches = Matches()
+    make_match(matches, host_id=3)
+
+    # (e.g. a long-running server)
+    matches._next_id = MAX_MATCH_ID
+    last = make_match(matches, host_id=3)
+    assert last.id == MAX_MATCH_ID
+    assert matches.get_free() is None
+
+    matches.remove(last)
+    assert matches.get_free() == MAX_MATCH_ID
+
+
+def test_channels_get_by_name():
+    osu = Channel(name="#osu", topic="General discussion.")
+    multi = Channel(name="#multi_1", topic="", instance=True)
+    channels = Channels([osu])
+    channels.append(multi)
+
+    assert list(channels) == [osu, multi]
+    assert channels.get_by_name("#osu") is osu
+    assert channels.get_by_name("#multi_1") is multi
+    assert channels.get_by_name("#multiplayer") is None
+    assert "#multi_1" in channels
+    assert multi in channels
+
+    channels.remove(multi)
+    assert channels.get_by_name("#multi_1") is None
+    assert multi not in channels
+    assert list(channels) == [osu]
+
+
+def test_channel_members_are_ordered(make_player):
+    channel = Channel(name="#osu", topic="General discussion.")
+    members = [make_player(id, f"player {id}") for id in range(3, 10)]
+
+    for player in members:
+        channel.append(player)
+    channel.remove(members[2])
+
+    assert members[2] not in channel
+    assert members[3] in channel
+    assert list(channel.players) == members[:2] + members[3:]
+
+
+def test_channel_send_skips_blockers(monkeypatch, make_player):
+    players = Players()
+    monkeypatch.setattr(app.state.sessions, "players", players)
+
+    cmyui = make_player(3, "cmyui")
+    jacobian = make_player(4, "jacobian")
+    tourney_client = make_player(4, "jacobian")
+    blocker = make_player(5, "blocker")
+    blocker.blocks.add(3)
+
+    channel = Channel(name="#osu", topic="General discussion.")
+    for player in (cmyui, jacobian, tourney_client, blocker):
+        players.append(player)
+        channel.append(player)
+
+    assert players.get_blocked_by(3) == {blocker}
+
+    channel.send("hello", sender=cmyui)
+    message = app.packets.send_message(
+        sender="cmyui",
+        msg="hello",
+        recipient="#osu",
+        sender_id=3,
+    )
+    assert cmyui.dequeue() is None
+    assert jacobian.dequeue() == message
+    assert tourney_client.dequeue() == message
+    assert blocker.dequeue() is None
+
+    # the index follows changes to blocks, & logouts
+    blocker.blocks.remove(3)
+    jacobian.blocks.add(3)
+    players.update_blocks(blocker)
+    players.update_blocks(jacobian)
+    assert players.get_blocked_by(3) == {jacobian}
+
+    players.remove(jacobian)
+    assert not players.get_blocked_by(3)
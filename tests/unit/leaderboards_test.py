@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any
+
+import pytest
+
+import app.state
+import app.usecases.leaderboards
+from app.constants.gamemodes import GameMode
+from app.constants.mods import Mods
+from app.usecases.leaderboards import LEADERBOARD_SIZE
+from app.usecases.leaderboards import Leaderboard
+from app.usecases.leaderboards import LeaderboardScore
+from app.usecases.leaderboards import LeaderboardType
+
+
+def make_score(
+    id: int,
+    user_id: int,
+    score: float,
+    mods: int = 0,
+    country: str = "ca",
+) -> LeaderboardScore:
+    return LeaderboardScore.from_row(
+        {
+            "id": id,
+            "_score": score,
+            "max_combo": 100,
+            "n50": 0,
+            "n100": 1,
+            "n300": 99,
+            "nmiss": 0,
+            "nkatu": 0,
+            "ngeki": 0,
+            "perfect": 1,
+            "mods": mods,
+            "time": 1700000000,
+            "userid": user_id,
+            "country": country,
+            "name": f"user{user_id}",
+        },
+    )
+
+
+@pytest.fixture
+def leaderboards(monkeypatch):
+    cache: OrderedDict = OrderedDict()
+    monkeypatch.setattr(app.state.cache, "leaderboards", cache)
+    return cache
+
+
+def test_score_render():
+    score = make_score(id=1, user_id=3, score=1234.6, mods=Mods.HIDDEN)
+    assert score.render(7) == (
+        f"1|user3|1235|100|0|1|99|0|0|0|1|{int(Mods.HIDDEN)}|3|7|1700000000|1"
+    )
+
+
+def test_rank_of():
+    leaderboard = Leaderboard(
+        scores=[
+            make_score(i, i, score) for i, score in enumerate((300, 200, 200, 100))
+        ],
+        complete=True,
+    )
+
+    assert leaderboard.rank_of(400) == 1
+    assert leaderboard.rank_of(300) == 1
+    assert leaderboard.rank_of(200) == 2
+    assert leaderboard.rank_of(150) == 4
+    assert leaderboard.rank_of(0) == 5
+
+
+def test_filter_cached_view(make_player):
+    scores = [
+        make_score(1, 1, 500, mods=Mods.HIDDEN, country="us"),
+        make_score(2, 2, 400, country="ca"),
+        make_score(3, 3, 300, mods=Mods.HIDDEN, country="ca"),
+    ]
+    player = make_player(3, country="ca")
+    player.friends = {1}
+
+    leaderboard = Leaderboard(scores=scores, complete=True)
+    view = app.usecases.leaderboards._filter_cached_view
+
+    assert view(leaderboard, LeaderboardType.Top, Mods.NOMOD, player) == scores
+    assert view(leaderboard, LeaderboardType.Mods, Mods.HIDDEN, player) == [
+        scores[0],
+        scores[2],
+    ]
+    assert view(leaderboard, LeaderboardType.Friends, Mods.NOMOD, player) == [
+        scores[0],
+        scores[2],
+    ]
+    assert view(leaderboard, LeaderboardType.Country, Mods.NOMOD, player) == [
+        scores[1],
+        scores[2],
+    ]
+
+    # views with fewer scores than shown may be missing uncached scores
+    leaderboard.complete = False
+    assert view(leaderboard, LeaderboardType.Mods, Mods.HIDDEN, player) is None
+
+    leaderboard.scores = [make_score(i, i, 1000 - i) for i in range(LEADERBOARD_SIZE)]
+    assert view(leaderboard, LeaderboardType.Top, Mods.NOMOD, player) == (
+        leaderboard.scores
+    )
+
+
+def test_invalidation(leaderboards):
+    leaderboards[("a" * 32, GameMode.VANILLA_OSU, "score")] = Leaderboard(
+        scores=[make_score(1, 3, 100)],
+        complete=True,
+    )
+    leaderboards[("a" * 32, GameMode.RELAX_OSU, "pp")] = Leaderboard(
+        scores=[make_score(2, 4, 100)],
+        complete=True,
+    )
+    leaderboards[("b" * 32, GameMode.VANILLA_OSU, "score")] = Leaderboard(
+        scores=[make_score(3, 4, 100)],
+        complete=True,
+    )
+
+    app.usecases.leaderboards.invalidate_map("a" * 32, GameMode.RELAX_OSU)
+    assert list(leaderboards) == [
+        ("a" * 32, GameMode.VANILLA_OSU, "score"),
+        ("b" * 32, GameMode.VANILLA_OSU, "score"),
+    ]
+
+    app.usecases.leaderboards.invalidate_user(3)
+    assert list(leaderboards) == [("b" * 32, GameMode.VANILLA_OSU, "score")]
+
+    app.usecases.leaderboards.clear()
+    assert not leaderboards
+
+
+async def test_cached_leaderboards_expire(leaderboards, monkeypatch):
+    queries: list[str] = []
+
+    async def fetch_all(query: str, params: dict[str, Any]) -> list[dict[str, Any]]:
+        queries.append(query)
+        return []
+
+    monkeypatch.setattr(app.state.services.database, "fetch_all", fetch_all)
+
+    fetch_leaderboard = app.usecases.leaderboards._fetch_leaderboard
+    leaderboard = await fetch_leaderboard("a" * 32, GameMode.VANILLA_OSU, "score")
+    assert await fetch_leaderboard("a" * 32, GameMode.VANILLA_OSU, "score") is (
+        leaderboard
+    )
+    assert len(queries) == 1
+
+    # past the ttl, it's refetched from sql
+    now = time.monotonic() + app.usecases.leaderboards.LEADERBOARD_TTL
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+
+    assert await fetch_leaderboard("a" * 32, GameMode.VANILLA_OSU, "score") is not (
+        leaderboard
+    )
+    assert len(queries) == 2
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from datetime import datetime
+
+import pytest
+
+import app.objects.match
+from app.constants.gamemodes import GameMode
+from app.constants.mods import Mods
+from app.constants.privileges import Privileges
+from app.objects.beatmap import Beatmap
+from app.objects.beatmap import BeatmapSet
+from app.objects.channel import Channel
+from app.objects.match import Match
+from app.objects.match import MatchTeamTypes
+from app.objects.match import MatchWinConditions
+from app.objects.match import Slot
+from app.objects.match import SlotStatus
+from app.objects.player import Player
+from app.objects.score import Score
+
+
+@pytest.fixture(autouse=True)
+def beatmaps(monkeypatch):
+    beatmaps: dict[str, Beatmap] = {}
+
+    async def from_md5(md5: str, set_id: int = -1) -> Beatmap | None:
+        return beatmaps.get(md5)
+
+    monkeypatch.setattr(Beatmap, "from_md5", from_md5)
+    monkeypatch.setattr(app.objects.match, "SCORE_SUBMISSION_TIMEOUT", 0.5)
+    return beatmaps
+
+
+def make_beatmap(beatmaps: dict[str, Beatmap], map_id: int) -> Beatmap:
+    bmap_set = BeatmapSet(id=map_id, last_osuapi_check=datetime.now())
+    bmap = Beatmap(map_set=bmap_set, md5=f"{map_id:032x}", id=map_id, total_length=90)
+    bmap_set.maps.append(bmap)
+
+    beatmaps[bmap.md5] = bmap
+    return bmap
+
+
+def make_match(
+    match_id: int,
+    bmap: Beatmap,
+    num_players: int,
+) -> tuple[Match, list[Slot]]:
+    match = Match(
+        id=match_id,
+        name=f"match {match_id}",
+        password="",
+        has_public_history=False,
+        map_name="",
+        map_id=bmap.id,
+        map_md5=bmap.md5,
+        host_id=match_id * 100,
+        mode=GameMode.VANILLA_OSU,
+        mods=Mods.NOMOD,
+        win_condition=MatchWinConditions.score,
+        team_type=MatchTeamTypes.head_to_head,
+        freemods=False,
+        seed=0,
+        chat_channel=Channel(name=f"#multi_{match_id}", topic="", instance=True),
+    )
+
+    for slot_id in range(num_players):
+        player_id = match_id * 100 + slot_id
+        player = Player(
+            id=player_id,
+            name=f"player {player_id}",
+            priv=Privileges.UNRESTRICTED,
+            pw_bcrypt=None,
+            token=f"token {player_id}",
+        )
+        player.match = match
+
+        slot = match.slots[slot_id]
+        slot.player = player
+        slot.status = SlotStatus.complete
+
+    return match, match.slots[:num_players]
+
+
+def submit_score(player: Player, bmap: Beatmap, points: int) -> None:
+    # what score submission does, once the score's been saved
+    score = Score()
+    score.bmap = bmap
+    score.player = player
+    score.mode = GameMode.VANILLA_OSU
+    score.score = points
+    score.server_time = datetime.now()
+
+    player.recent_scores[score.mode] = score
+    if player.match is not None:
+        player.match.submit_score(score)
+
+
+async def test_await_submissions(beatmaps):
+    bmap = make_beatmap(beatmaps, 1)
+    match, slots = make_match(1, bmap, num_players=3)
+    cmyui, jacobian, late = (slot.player for slot in slots)
+    assert cmyui and jacobian and late
+
+    # scores submitted before the map was completed are found
+    submit_score(cmyui, bmap, 1_000_000)
+
+    submissions = asyncio.create_task(match.await_submissions(slots))
+    await asyncio.sleep(0)
+
+    submit_score(jacobian, bmap, 500_000)
+
+    scores, didnt_submit = await submissions
+    assert scores == {cmyui: 1_000_000, jacobian: 500_000}
+    assert didnt_submit == [late]
+
+    # nothing's left waiting for the late submission
+    assert not match._score_waiters
+    submit_score(late, bmap, 750_000)
+
+
+async def test_await_submissions_ignores_other_maps(beatmaps):
+    bmap = make_beatmap(beatmaps, 1)
+    other_bmap = make_beatmap(beatmaps, 2)
+    match, slots = make_match(1, bmap, num_players=1)
+    assert slots[0].player
+
+    submissions = asyncio.create_task(match.await_submissions(slots))
+    await asyncio.sleep(0)
+
+    submit_score(slots[0].player, other_bmap, 1_000_000)
+
+    scores, didnt_submit = await submissions
+    assert not scores
+    assert didnt_submit == [slots[0].player]
+
+
+async def test_concurrent_matches(beatmaps):
+    rng = random.Random(727)
+    num_matches = 64
+
+    matches: list[tuple[Match, list[Slot], Beatmap]] = []
+    for match_id in range(1, num_matches + 1):
+        bmap = make_beatmap(beatmaps, match_id)
+        match, slots = make_match(match_id, bmap, num_players=16)
+        matches.append((match, slots, bmap))
+
+    start_time = time.perf_counter()
+    submissions = asyncio.gather(
+        *(match.await_submissions(slots) for match, slots, _ in matches),
+    )
+    await asyncio.sleep(0)
+
+    # all but the last player of each match submit, in a random order
+    expected_scores = []
+    pending_scores = []
+
+    for match, slots, bmap in matches:
+        scores = {}
+        for slot in slots[:-1]:
+            assert slot.player is not None
+            points = rng.randrange(1, 1_000_000)
+            scores[slot.player] = points
+            pending_scores.append((slot.player, bmap, points))
+
+        expected_scores.append((scores, [slots[-1].player]))
+
+    rng.shuffle(pending_scores)
+    for player, bmap, points in pending_scores:
+        submit_score(player, bmap, points)
+        if rng.random() < 0.1:
+            await asyncio.sleep(0)
+
+    results = await submissions
+    elapsed = time.perf_counter() - start_time
+
+    assert [(dict(scores), didnt_submit) for scores, didnt_submit in results] == (
+        expected_scores
+    )
+
+    # every slot of every match waited on the same deadline,
+    # rather than each slow submitter being waited on in turn
+    assert elapsed < app.objects.match.SCORE_SUBMISSION_TIMEOUT * 2
+    assert not any(match._score_waiters for match, _, _ in matches)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+import respx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+import app.settings
+import app.state
+from app.api.domains.osu import route_to_session_worker
+from app.api.middlewares import FORWARDED_HEADER
+from app.api.middlewares import SessionOnOtherWorker
+from app.api.middlewares import WorkerRoutingMiddleware
+from app.objects.session_backend import MemorySessionBroker
+
+
+async def submit_score(request: Request) -> Response:
+    form = await request.form()
+    if form["u"] == "cmyui" and FORWARDED_HEADER not in request.headers:
+        raise SessionOnOtherWorker(1)
+
+    return Response(b"submitted locally")
+
+
+@pytest.fixture
+def client(monkeypatch) -> httpx.AsyncClient:
+    monkeypatch.setattr(app.state.sessions.backend, "broker", MemorySessionBroker())
+    monkeypatch.setattr(app.settings, "APP_HOST", "0.0.0.0")
+    monkeypatch.setattr(app.settings, "APP_PORT", 10000)
+
+    asgi_app = Starlette(routes=[Route("/web/submit", submit_score, methods=["POST"])])
+    asgi_app.add_middleware(WorkerRoutingMiddleware)
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=asgi_app),  # type: ignore[arg-type]
+        base_url="http://osu.ppy.sh",
+    )
+
+
+async def test_requests_are_forwarded_to_the_users_worker(
+    client: httpx.AsyncClient,
+    respx_mock: respx.MockRouter,
+) -> None:
+    route = respx_mock.post("http://127.0.0.1:10001/web/submit?v=2").mock(
+        return_value=httpx.Response(200, content=b"submitted on worker 1"),
+    )
+
+    response = await client.post("/web/submit?v=2", data={"u": "cmyui"})
+    assert response.content == b"submitted on worker 1"
+
+    # the whole body (which was already parsed) is forwarded, once
+    forwarded_request = route.calls.last.request
+    assert forwarded_request.content == b"u=cmyui"
+    assert forwarded_request.headers["host"] == "osu.ppy.sh"
+    assert forwarded_request.headers[FORWARDED_HEADER] == str(app.settings.WORKER_ID)
+
+    # users on this worker are handled locally
+    response = await client.post("/web/submit", data={"u": "jacobian"})
+    assert response.content == b"submitted locally"
+
+
+async def test_session_workers_are_looked_up_for_each_request(monkeypatch) -> None:
+    broker = MemorySessionBroker()
+    monkeypatch.setattr(app.state.sessions.backend, "broker", broker)
+    await broker.set_users({"cmyui": 3}, worker_id=1)
+
+    request = Request({"type": "http", "headers": []})
+    for _ in range(2):
+        with pytest.raises(SessionOnOtherWorker):
+            await route_to_session_worker(request, "cmyui")
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import pytest
+
+import app.packets
+from app.objects.packet_queue import PacketQueue
+
+
+def user_stats(user_id: int, action: int) -> bytes:
+    # (a stats packet for a user, identified by its action)
+    return app.packets.ENCODERS[app.packets.ServerPackets.USER_STATS](
+        user_id, action, "", "", 0, 0, 0, 0, 0.0, 0, 0, 0, 0
+    )
+
+
+def test_queue_is_drained_in_order():
+    queue = PacketQueue(max_size=1024)
+    queue.push(b"first")
+    queue.push(b"second")
+
+    assert queue.size == len(b"firstsecond")
+    assert queue.drain() == [b"first", b"second"]
+    assert queue.size == 0
+    assert not queue
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        PacketQueue(max_size=1024, overflow_policy="ignore")
+
+
+def test_drop_oldest_policy():
+    queue = PacketQueue(max_size=10, overflow_policy="drop_oldest")
+    for chunk in (b"aaaa", b"bbbb", b"cccc"):
+        queue.push(chunk)
+
+    assert queue.drain() == [b"bbbb", b"cccc"]
+
+    # the newest chunk is kept, even if it's too large alone
+    queue.push(b"d" * 20)
+    assert queue.drain() == [b"d" * 20]
+
+
+def test_coalesce_policy_keeps_the_latest_stats():
+    notification = app.packets.notification("hello")
+    chunks = [
+        user_stats(1, action=0) + user_stats(2, action=0),
+        notification,
+        user_stats(2, action=1) + user_stats(3, action=1),
+    ]
+
+    queue = PacketQueue(max_size=sum(map(len, chunks)) - 1)
+    for chunk in chunks:
+        queue.push(chunk)
+
+    assert queue.drain() == [
+        user_stats(1, action=0),
+        notification,
+        user_stats(2, action=1) + user_stats(3, action=1),
+    ]
+
+
+def test_coalesce_policy_falls_back_to_dropping_oldest():
+    queue = PacketQueue(max_size=40)
+    for _ in range(4):
+        queue.push(app.packets.notification("no stats here"))
+
+    assert queue.size <= 40
+    assert len(queue.drain()) == 1
+
+
+def test_disconnect_policy():
+    queue = PacketQueue(max_size=10, overflow_policy="disconnect")
+    queue.push(b"aaaa")
+    assert not queue.overflowed
+
+    queue.push(b"b" * 10)
+    assert queue.overflowed
+    assert queue.size == 0
+
+    # packets are no longer accepted
+    queue.push(b"cccc")
+    assert not queue.drain()
+
+
+def test_latest_stats_replace_queued_stats():
+    queue = PacketQueue(max_size=1024)
+    notification = app.packets.notification("hello")
+
+    queue.push(user_stats(1, action=0))
+    queue.push(user_stats(2, action=0))
+    queue.push(notification)
+    queue.push(user_stats(1, action=1))
+
+    # the replaced packet is sent in the newer packet's position
+    assert queue.size == len(notification) + 2 * len(user_stats(1, action=0))
+    assert b"".join(queue.drain()) == (
+        user_stats(2, action=0) + notification + user_stats(1, action=1)
+    )
+
+    # the slots are emptied with the queue
+    queue.push(user_stats(1, action=2))
+    assert queue.drain() == [user_stats(1, action=2)]
+
+
+def test_presence_and_stats_have_separate_slots():
+    queue = PacketQueue(max_size=1024)
+    presence = app.packets.ENCODERS[app.packets.ServerPackets.USER_PRESENCE](
+        1, "cmyui", 0, 0, 0, 0.0, 0.0, 0
+    )
+
+    queue.push(presence)
+    queue.push(user_stats(1, action=0))
+    queue.push(user_stats(1, action=1))
+    queue.push(presence)
+
+    assert b"".join(queue.drain()) == user_stats(1, action=1) + presence
+
+
+def test_replaced_packets_are_compacted():
+    queue = PacketQueue(max_size=1024 * 1024)
+    for action in range(1000):
+        queue.push(user_stats(1, action=action % 256))
+        queue.push(user_stats(2, action=action % 256))
+
+    assert len(queue) < 200
+    assert b"".join(queue.drain()) == (
+        user_stats(1, action=999 % 256) + user_stats(2, action=999 % 256)
+    )
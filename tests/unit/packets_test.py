@@ -667,3 +667,134 @@ def test_write_match_abort():
 )
 def test_write_switch_tournament_server(test_input, expected):
     assert app.packets.switch_tournament_server(test_input) == expected
+
+
+class _ReadMessage(app.packets.BasePacket):
+    def __init__(self, reader: app.packets.BanchoPacketReader) -> None:
+        self.msg = reader.read_message()
+
+    async def handle(self, player) -> None: ...
+
+
+class _ReadFrames(app.packets.BasePacket):
+    def __init__(self, reader: app.packets.BanchoPacketReader) -> None:
+        self.bundle = reader.read_replayframe_bundle()
+
+    async def handle(self, player) -> None: ...
+
+
+class _ReadMatch(app.packets.BasePacket):
+    def __init__(self, reader: app.packets.BanchoPacketReader) -> None:
+        self.match = reader.read_match()
+
+    async def handle(self, player) -> None: ...
+
+
+def _read_packets(body: bytes, packet_map) -> list:
+    with memoryview(body) as body_view:
+        return list(app.packets.BanchoPacketReader(body_view, packet_map))
+
+
+def test_read_skips_unhandled_packets():
+    message = app.packets.write_message("cmyui", "hello", "#osu", 3)
+    body = (
+        b"\x04\x00\x00\x00\x00\x00\x00"  # ping (unhandled)
+        + b"\xff\x7f\x00\x02\x00\x00\x00\xab\xcd"  # unknown id
+        + b"\x01\x00\x00"
+        + len(message).to_bytes(4, "little")
+        + message
+    )
+
+    packets = _read_packets(
+        body,
+        {app.packets.ClientPackets.SEND_PUBLIC_MESSAGE: _ReadMessage},
+    )
+
+    assert len(packets) == 1
+    assert packets[0].msg == app.packets.Message("cmyui", "hello", "#osu", 3)
+
+
+def test_read_replayframe_bundle():
+    frames = [(1, 0, 256.0, 192.0, 1000), (0, 0, 128.5, 96.25, 1016)]
+    scoreframe = app.packets.ScoreFrame(
+        1016,
+        0,
+        300,
+        10,
+        2,
+        50,
+        5,
+        1,
+        1_234_567,
+        400,
+        120,
+        False,
+        200,
+        0,
+        True,
+    )
+    data = (
+        (0).to_bytes(4, "little")
+        + len(frames).to_bytes(2, "little")
+        + b"".join(app.packets.REPLAYFRAME_FMT.pack(*f) for f in frames)
+        + b"\x00"  # standard action
+        + app.packets.write_scoreframe(scoreframe)
+        + app.packets.SCOREFRAME_V2_FMT.pack(0.5, 0.25)
+        + (7).to_bytes(2, "little")
+    )
+    body = b"\x12\x00\x00" + len(data).to_bytes(4, "little") + data
+
+    (packet,) = _read_packets(
+        body,
+        {app.packets.ClientPackets.SPECTATE_FRAMES: _ReadFrames},
+    )
+
+    bundle = packet.bundle
+    assert bundle.replay_frames == [app.packets.ReplayFrame(*f) for f in frames]
+    assert bundle.action == app.packets.ReplayAction.Standard
+    assert bundle.sequence == 7
+    assert bundle.score_frame.total_score == 1_234_567
+    assert bundle.score_frame.combo_portion == 0.5
+    assert bundle.score_frame.bonus_portion == 0.25
+    assert bundle.raw_data.tobytes() == data
+
+
+def test_read_match():
+    slot_statuses = [4] * 2 + [1] * 14  # two players, rest open
+    data = (
+        app.packets.MATCH_HEAD_FMT.pack(5, 0, 0, 64)
+        + app.packets.write_string("cmyui's game")
+        + app.packets.write_string("")
+        + app.packets.write_string("ano - yoru")
+        + (315).to_bytes(4, "little")
+        + app.packets.write_string("1cf5b2c2edfafd055536d2cefcb89c0e")
+        + bytes(slot_statuses)
+        + bytes([0, 1] + [0] * 14)
+        + (3).to_bytes(4, "little")
+        + (1001).to_bytes(4, "little")
+        + app.packets.MATCH_TAIL_FMT.pack(3, 0, 1, 2, 1)
+        + app.packets.MATCH_SLOT_MODS_FMT.pack(*([8] * 16))
+        + (-1).to_bytes(4, "little", signed=True)
+    )
+    body = b"\x1f\x00\x00" + len(data).to_bytes(4, "little") + data
+
+    (packet,) = _read_packets(
+        body,
+        {app.packets.ClientPackets.CREATE_MATCH: _ReadMatch},
+    )
+
+    match = packet.match
+    assert match.id == 5
+    assert match.mods == 64
+    assert match.name == "cmyui's game"
+    assert match.passwd == ""
+    assert match.map_id == 315
+    assert match.slot_statuses == slot_statuses
+    assert match.slot_teams[:2] == [0, 1]
+    assert match.slot_ids == [3, 1001]
+    assert match.host_id == 3
+    assert match.win_condition == 1
+    assert match.team_type == 2
+    assert match.freemods is True
+    assert match.slot_mods == [8] * 16
+    assert match.seed == -1
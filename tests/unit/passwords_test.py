@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+
+import bcrypt
+import pytest
+
+import app.settings
+import app.state
+import app.usecases.passwords
+
+PW_MD5 = hashlib.md5(b"lol123").hexdigest().encode()
+WRONG_PW_MD5 = hashlib.md5(b"lol1234").hexdigest().encode()
+
+# (fewer rounds than usual, to keep the tests fast)
+PW_BCRYPT = bcrypt.hashpw(PW_MD5, bcrypt.gensalt(rounds=4))
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.values: dict[str, str] = {}
+
+    async def get(self, key: str) -> str | None:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: str, ex: int | None = None) -> None:
+        self.values[key] = value
+
+
+@pytest.fixture(autouse=True)
+def bcrypt_cache(monkeypatch):
+    bcrypt_cache: dict[bytes, bytes] = {}
+    monkeypatch.setattr(app.state.cache, "bcrypt", bcrypt_cache)
+    monkeypatch.setattr(app.settings, "BCRYPT_CACHE_SECRET", "")
+
+    yield bcrypt_cache
+
+    app.usecases.passwords.shutdown_workers()
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(app.state.services, "redis", redis)
+    monkeypatch.setattr(app.settings, "BCRYPT_CACHE_SECRET", "secret")
+    return redis
+
+
+async def test_verify_password(bcrypt_cache):
+    assert not await app.usecases.passwords.verify_password(WRONG_PW_MD5, PW_BCRYPT)
+    assert not bcrypt_cache
+
+    assert await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
+    assert bcrypt_cache == {PW_BCRYPT: PW_MD5}
+
+    # checked against the cache from now on
+    assert await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
+    assert not await app.usecases.passwords.verify_password(WRONG_PW_MD5, PW_BCRYPT)
+
+
+async def test_hash_password(bcrypt_cache):
+    pw_bcrypt = await app.usecases.passwords.hash_password(PW_MD5)
+
+    assert bcrypt.checkpw(PW_MD5, pw_bcrypt)
+    assert bcrypt_cache == {pw_bcrypt: PW_MD5}
+
+
+async def test_persisted_cache_survives_restarts(bcrypt_cache, redis, monkeypatch):
+    assert await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
+
+    # only an hmac of the password is persisted
+    (digest,) = redis.values.values()
+    assert PW_MD5.decode() not in digest
+
+    # restart; passwords in the persisted cache aren't checked with bcrypt
+    bcrypt_cache.clear()
+
+    def checkpw(password: bytes, hashed_password: bytes) -> bool:
+        raise AssertionError("bcrypt shouldn't be run")
+
+    monkeypatch.setattr(bcrypt, "checkpw", checkpw)
+    assert await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
+    assert bcrypt_cache == {PW_BCRYPT: PW_MD5}
+
+    # entries from another secret are ignored
+    bcrypt_cache.clear()
+    monkeypatch.setattr(app.settings, "BCRYPT_CACHE_SECRET", "another secret")
+    with pytest.raises(AssertionError):
+        await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
+
+
+async def test_overloaded_password_checks(bcrypt_cache, monkeypatch):
+    monkeypatch.setattr(app.settings, "BCRYPT_MAX_PENDING", 2)
+    monkeypatch.setattr(app.usecases.passwords, "_pending_checks", 2)
+
+    with pytest.raises(app.usecases.passwords.PasswordChecksOverloaded):
+        await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
+
+    # cached passwords are still checked
+    bcrypt_cache[PW_BCRYPT] = PW_MD5
+    assert await app.usecases.passwords.verify_password(PW_MD5, PW_BCRYPT)
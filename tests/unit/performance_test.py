@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import shutil
+from collections import OrderedDict
+
+import pytest
+
+import app.usecases.performance
+from app.usecases.performance import ScoreParams
+
+VIVID_OSU_FILE = "testing/sample_data/vivid_osu_file.osu"
+
+
+@pytest.fixture
+def beatmaps_path(tmp_path, monkeypatch):
+    shutil.copy(VIVID_OSU_FILE, tmp_path / "315.osu")
+    shutil.copy(VIVID_OSU_FILE, tmp_path / "316.osu")
+    monkeypatch.setattr(app.usecases.performance, "BEATMAPS_PATH", tmp_path)
+    return tmp_path
+
+
+def test_worker_beatmap_cache(beatmaps_path, monkeypatch):
+    monkeypatch.setattr(app.usecases.performance, "_beatmap_cache", OrderedDict())
+    monkeypatch.setattr(app.usecases.performance, "_beatmap_cache_size", 1)
+
+    first = app.usecases.performance._get_beatmap(315, "a" * 32)
+    assert app.usecases.performance._get_beatmap(315, "a" * 32) is first
+
+    # a different md5 (i.e. an updated map) must be parsed again
+    assert app.usecases.performance._get_beatmap(315, "b" * 32) is not first
+
+    app.usecases.performance._get_beatmap(316, "c" * 32)
+    assert list(app.usecases.performance._beatmap_cache) == [(316, "c" * 32)]
+
+
+async def test_calculate_performances_async(beatmaps_path):
+    scores = [ScoreParams(mode=0, acc=acc) for acc in (95.0, 100.0)]
+
+    app.usecases.performance.start_workers()
+    try:
+        results = await app.usecases.performance.calculate_performances_async(
+            beatmap_id=315,
+            beatmap_md5="a" * 32,
+            scores=scores,
+        )
+    finally:
+        app.usecases.performance.shutdown_workers()
+
+    expected = app.usecases.performance.calculate_performances(
+        str(beatmaps_path / "315.osu"),
+        scores,
+    )
+    assert results == expected
+    assert results[0]["performance"]["pp"] < results[1]["performance"]["pp"]
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+import app.settings
+import app.usecases.replays
+
+
+@pytest.fixture(autouse=True)
+def replays_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(app.usecases.replays, "REPLAYS_PATH", tmp_path)
+    return tmp_path
+
+
+async def read_replay(score_id: int) -> bytes | None:
+    replay = await app.usecases.replays.find(score_id)
+    if replay is None:
+        return None
+
+    data = b"".join([chunk async for chunk in replay.iter_chunks()])
+    assert len(data) == replay.size
+    return data
+
+
+@pytest.mark.parametrize("compression", ["none", "lzma"])
+async def test_replays_are_sharded(monkeypatch, replays_path, compression):
+    monkeypatch.setattr(app.settings, "REPLAY_COMPRESSION", compression)
+    monkeypatch.setattr(app.usecases.replays, "READ_CHUNK_SIZE", 64)
+
+    replays = {score_id: os.urandom(1000 + score_id) for score_id in range(1, 50)}
+    for score_id, data in replays.items():
+        await app.usecases.replays.save(score_id, data)
+
+    for score_id, data in replays.items():
+        assert await read_replay(score_id) == data
+    assert await read_replay(50) is None
+
+    # nothing is written to the top level directory
+    shards = list(replays_path.iterdir())
+    assert len(shards) > 1
+    assert all(shard.is_dir() for shard in shards)
+
+    replay_files = [path for path in replays_path.rglob("*") if path.is_file()]
+    assert len(replay_files) == len(replays)
+    if compression == "lzma":
+        assert all(path.name.endswith(".osr.xz") for path in replay_files)
+
+
+async def test_legacy_replays_are_found(replays_path):
+    (replays_path / "727.osr").write_bytes(b"legacy replay")
+
+    assert await read_replay(727) == b"legacy replay"
+
+
+async def test_found_replays_can_be_moved_before_streaming(replays_path):
+    (replays_path / "727.osr").write_bytes(b"legacy replay")
+
+    replay = await app.usecases.replays.find(727)
+    assert replay is not None
+
+    # e.g. by tools/migrate_replays.py, between finding & streaming the replay
+    sharded_path = app.usecases.replays.replay_path(727)
+    sharded_path.parent.mkdir(parents=True)
+    (replays_path / "727.osr").rename(sharded_path)
+
+    data = b"".join([chunk async for chunk in replay.iter_chunks()])
+    assert data == b"legacy replay"
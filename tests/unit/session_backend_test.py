@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+import pytest
+
+import app.objects.session_backend
+import app.packets
+import app.state
+from app.constants.gamemodes import GameMode
+from app.constants.privileges import Privileges
+from app.objects.channel import Channel
+from app.objects.collections import Channels
+from app.objects.collections import Players
+from app.objects.player import ModeData
+from app.objects.player import Player
+from app.objects.session_backend import MemorySessionBroker
+from app.objects.session_backend import SessionBackend
+from app.objects.session_backend import shared_invalidation
+
+
+@dataclass
+class Worker:
+    players: Players
+    channels: Channels
+    backend: SessionBackend
+
+    def login(self, id: int, name: str) -> Player:
+        player = Player(
+            id=id,
+            name=name,
+            priv=Privileges.UNRESTRICTED,
+            pw_bcrypt=None,
+            token=self.backend.generate_token(),
+        )
+        player.stats[GameMode.VANILLA_OSU] = ModeData(
+            tscore=0,
+            rscore=0,
+            pp=0,
+            acc=0.0,
+            plays=0,
+            playtime=0,
+            max_combo=0,
+            total_hits=0,
+            rank=0,
+            grades={},
+        )
+
+        self.players.append(player)
+        self.backend.add_session(player)
+        return player
+
+    def join_channel(self, player: Player, channel_name: str) -> None:
+        channel = self.channels.get_by_name(channel_name)
+        assert channel is not None
+
+        channel.append(player)
+        self.backend.add_channel_member(channel, player)
+
+
+def make_worker(worker_id: int, broker: MemorySessionBroker) -> Worker:
+    players = Players()
+    channels = Channels([Channel(name="#osu", topic="General discussion.")])
+    backend = SessionBackend(players, channels, worker_id=worker_id, broker=broker)
+    return Worker(players, channels, backend)
+
+
+@pytest.fixture
+async def workers() -> AsyncIterator[tuple[Worker, Worker]]:
+    broker = MemorySessionBroker()
+    workers = (make_worker(0, broker), make_worker(1, broker))
+
+    for worker in workers:
+        await worker.backend.start()
+
+    yield workers
+
+    for worker in workers:
+        await worker.backend.stop()
+
+
+async def deliver(*workers: Worker) -> None:
+    # send the workers' queued packets, and let them be received
+    for worker in workers:
+        await worker.backend.flush()
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_single_worker_backend():
+    players = Players()
+    backend = SessionBackend(players, Channels())
+    assert not backend.distributed
+
+    player = Player(
+        id=3,
+        name="cmyui",
+        priv=Privileges.UNRESTRICTED,
+        pw_bcrypt=None,
+        token=backend.generate_token(),
+    )
+    players.append(player)
+
+    # nothing is shared or published
+    backend.add_session(player)
+    backend.broadcast(b"hello")
+    assert not player.dequeue()
+
+
+async def test_sessions_are_shared_between_workers(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    jacobian = worker_b.login(4, "jacobian")
+
+    # tokens identify the worker which owns the session
+    assert cmyui.token.startswith("0-")
+    assert jacobian.token.startswith("1-")
+
+    assert await worker_b.backend.get_session_worker(cmyui.token) == 0
+    assert await worker_a.backend.get_session_worker(jacobian.token) == 1
+    assert await worker_a.backend.get_online_user_ids() == {3, 4}
+    assert await worker_a.backend.is_online(jacobian)
+
+    # presences are available to the other workers
+    assert await worker_b.backend.get_presences([3, 5]) == {
+        3: app.packets.user_presence(cmyui) + app.packets.user_stats(cmyui),
+    }
+
+    cmyui.status.map_id = 315
+    cmyui.invalidate_packets()
+    worker_a.backend.update_presence(cmyui)
+    await worker_a.backend.flush()
+    presences = await worker_b.backend.get_presences([3])
+    assert presences[3].endswith(app.packets.user_stats(cmyui))
+
+    worker_a.backend.remove_session(cmyui)
+    worker_a.players.remove(cmyui)
+    await worker_a.backend.flush()
+    assert await worker_b.backend.get_session_worker(cmyui.token) is None
+    assert await worker_b.backend.get_online_user_ids() == {4}
+
+
+async def test_restricted_players_are_hidden_from_other_workers(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    cheater = worker_b.login(5, "cheater")
+    cheater.priv = Privileges.VERIFIED
+    await worker_b.backend.flush()
+
+    assert await worker_a.backend.get_online_user_ids() == {3}
+    assert await worker_a.backend.get_presences([5]) == {}
+
+    # (though they can still be messaged)
+    assert await worker_a.backend.is_online(cheater)
+
+    # players restricted while online are hidden, too
+    cmyui.priv = Privileges.VERIFIED
+    cmyui.invalidate_packets()
+    worker_a.backend.update_presence(cmyui)
+    await worker_a.backend.flush()
+    assert await worker_b.backend.get_online_user_ids() == set()
+    assert await worker_b.backend.get_presences([3]) == {}
+
+
+async def test_presences_are_removed_on_logout(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    await worker_a.backend.flush()
+    assert await worker_b.backend.get_presences([3])
+
+    worker_a.backend.remove_session(cmyui)
+    worker_a.players.remove(cmyui)
+    await worker_a.backend.flush()
+
+    assert await worker_b.backend.get_presences([3]) == {}
+    assert not await worker_b.backend.is_online(cmyui)
+
+
+async def test_users_are_routed_to_their_worker(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    tourney_client = worker_a.login(3, "cmyui")
+    await worker_a.backend.flush()
+
+    assert await worker_b.backend.get_user_worker("Cmyui") == 0
+
+    # users stay on the worker while they have any session there
+    worker_a.backend.remove_session(tourney_client)
+    worker_a.players.remove(tourney_client)
+    await worker_a.backend.flush()
+    assert await worker_b.backend.get_user_worker("cmyui") == 0
+
+    # logins to another worker take over, even if the old session's left later
+    relogin = worker_b.login(3, "cmyui")
+    await worker_b.backend.flush()
+    worker_a.backend.remove_session(cmyui)
+    worker_a.players.remove(cmyui)
+    await worker_a.backend.flush()
+    assert await worker_a.backend.get_user_worker("cmyui") == 1
+
+    worker_b.backend.remove_session(relogin)
+    worker_b.players.remove(relogin)
+    await worker_b.backend.flush()
+    assert await worker_b.backend.get_user_worker("cmyui") is None
+
+
+async def test_packets_are_delivered_between_workers(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    jacobian = worker_b.login(4, "jacobian")
+    restricted = worker_b.login(5, "cheater")
+    restricted.priv = Privileges.VERIFIED
+    worker_b.players.clear_cached_views()
+
+    worker_a.backend.broadcast(b"to everyone")
+    worker_a.backend.broadcast(b"to readers", Privileges.UNRESTRICTED)
+    worker_a.backend.send_to_user(4, b"to jacobian")
+    await deliver(worker_a)
+
+    # packets aren't delivered back to the worker which sent them
+    assert cmyui.dequeue() is None
+    assert jacobian.dequeue() == b"to everyone" b"to readers" b"to jacobian"
+    assert restricted.dequeue() == b"to everyone"
+
+
+async def test_channels_are_shared_between_workers(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    jacobian = worker_b.login(4, "jacobian")
+    tourney_client = worker_b.login(4, "jacobian")
+    cheater = worker_b.login(5, "cheater")
+
+    worker_a.join_channel(cmyui, "#osu")
+    for player in (jacobian, tourney_client, cheater):
+        worker_b.join_channel(player, "#osu")
+
+    # members on all workers are counted, once per user
+    channel = worker_a.channels.get_by_name("#osu")
+    assert await worker_a.backend.get_channel_player_counts([channel]) == {"#osu": 3}
+
+    cheater.blocks.add(3)
+    worker_b.players.update_blocks(cheater)
+    worker_a.backend.send_to_channel(channel, b"hello #osu", sender_id=3)
+    await deliver(worker_a)
+
+    assert jacobian.dequeue() == b"hello #osu"
+    assert tourney_client.dequeue() == b"hello #osu"
+    assert cheater.dequeue() is None
+
+    # instanced channels are local to their worker
+    instance = Channel(name="#spec_3", topic="", instance=True)
+    worker_a.backend.send_to_channel(instance, b"spectators only", sender_id=3)
+    await deliver(worker_a)
+    assert jacobian.dequeue() is None
+
+
+async def test_cache_invalidations_are_shared_between_workers(workers, monkeypatch):
+    worker_a, worker_b = workers
+    monkeypatch.setattr(app.state.sessions, "backend", worker_a.backend)
+
+    invalidations = []
+
+    @shared_invalidation
+    def invalidate_map(map_md5: str, mode: GameMode | None = None) -> None:
+        invalidations.append((map_md5, mode))
+
+    invalidate_map("1cf5b2c2edfafd055536d2cefcb89c0e", mode=GameMode.VANILLA_TAIKO)
+    await deliver(worker_a)
+
+    # run on this worker, then once on the other
+    assert invalidations == [
+        ("1cf5b2c2edfafd055536d2cefcb89c0e", GameMode.VANILLA_TAIKO),
+        ("1cf5b2c2edfafd055536d2cefcb89c0e", GameMode.VANILLA_TAIKO),
+    ]
+
+
+async def test_stopped_workers_remove_their_sessions(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    worker_b.login(4, "jacobian")
+
+    await worker_a.backend.stop()
+
+    assert await worker_b.backend.get_session_worker(cmyui.token) is None
+    assert await worker_b.backend.get_online_user_ids() == {4}
+
+
+async def test_restarted_workers_remove_their_channel_members(workers):
+    worker_a, worker_b = workers
+    cmyui = worker_a.login(3, "cmyui")
+    jacobian = worker_b.login(4, "jacobian")
+    worker_a.join_channel(cmyui, "#osu")
+    worker_b.join_channel(jacobian, "#osu")
+
+    channel = worker_b.channels.get_by_name("#osu")
+    assert await worker_b.backend.get_channel_player_counts([channel]) == {"#osu": 2}
+
+    # worker a crashes (without its players leaving), and restarts
+    assert isinstance(worker_a.backend.broker, MemorySessionBroker)
+    restarted_worker = make_worker(0, worker_a.backend.broker)
+    await restarted_worker.backend.start()
+
+    assert await worker_b.backend.get_channel_player_counts([channel]) == {"#osu": 1}
+    await restarted_worker.backend.stop()
+
+
+async def test_failed_flushes_are_retried(workers, monkeypatch):
+    worker_a, worker_b = workers
+    monkeypatch.setattr(app.objects.session_backend, "FLUSH_RETRY_DELAY", 0)
+
+    broker = worker_a.backend.broker
+    assert isinstance(broker, MemorySessionBroker)
+    publish = broker.publish
+
+    async def publish_once_failed(messages: list[bytes]) -> None:
+        monkeypatch.setattr(broker, "publish", publish)
+        raise ConnectionError("lost connection to redis")
+
+    monkeypatch.setattr(broker, "publish", publish_once_failed)
+
+    cmyui = worker_a.login(3, "cmyui")
+    jacobian = worker_b.login(4, "jacobian")
+    worker_a.join_channel(cmyui, "#osu")
+    worker_a.backend.send_to_user(4, b"to jacobian")
+    await deliver(worker_a, worker_b)
+
+    # the flush is retried, & only the packets which failed are resent
+    assert await worker_b.backend.get_session_worker(cmyui.token) == 0
+    assert await worker_b.backend.get_user_worker("cmyui") == 0
+    assert await worker_b.backend.get_online_user_ids() == {3, 4}
+
+    channel = worker_b.channels.get_by_name("#osu")
+    assert await worker_b.backend.get_channel_player_counts([channel]) == {"#osu": 1}
+    assert broker.channel_members["#osu"] == {(0, 3): 1}
+
+    assert jacobian.dequeue() == b"to jacobian"
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import struct
+
+import app.packets
+import app.state
+from app.objects.collections import Channels
+from app.objects.collections import Players
+from app.objects.spectator_relay import SpectatorRelay
+
+
+def spectate_frames(raw_data: bytes) -> bytes:
+    return struct.pack("<HxI", 15, len(raw_data)) + raw_data
+
+
+def test_spectators_read_each_bundle_once(make_player):
+    a, b = make_player(4, "a"), make_player(5, "b")
+
+    relay = SpectatorRelay(max_lag=16)
+    relay.publish(b"before anyone was watching")
+
+    relay.add_spectator(a)
+    relay.add_spectator(b)
+    assert relay.read(a) is None
+
+    relay.publish(b"frame 1")
+    relay.publish(b"frame 2")
+    assert relay.read(a) == spectate_frames(b"frame 1") + spectate_frames(b"frame 2")
+    assert relay.read(a) is None
+
+    relay.publish(b"frame 3")
+    assert relay.read(b) == b"".join(
+        spectate_frames(frame) for frame in (b"frame 1", b"frame 2", b"frame 3")
+    )
+    assert relay.read(a) == spectate_frames(b"frame 3")
+
+    # bundles read by every spectator are released
+    assert not relay.frames
+
+
+def test_lagging_spectators_skip_dropped_bundles(make_player):
+    stalled, polling = make_player(4, "stalled"), make_player(5, "polling")
+
+    relay = SpectatorRelay(max_lag=4)
+    relay.add_spectator(stalled)
+    relay.add_spectator(polling)
+
+    for idx in range(10):
+        relay.publish(f"frame {idx}".encode())
+        assert relay.read(polling) == spectate_frames(f"frame {idx}".encode())
+
+    # the stalled spectator only receives the most recent bundles
+    assert len(relay.frames) == 4
+    assert relay.read(stalled) == b"".join(
+        spectate_frames(f"frame {idx}".encode()) for idx in range(6, 10)
+    )
+    assert not relay.frames
+
+    relay.remove_spectator(stalled)
+    relay.publish(b"frame 10")
+    assert relay.cursors == {polling: 10}
+
+
+def test_spectators_receive_frames_when_polling(make_player):
+    host = make_player(3, "cmyui")
+    spectator = make_player(4, "Jacobian Gaming")
+    tourney_spectator = make_player(4, "Jacobian Gaming")
+
+    host.spectator_relay = SpectatorRelay(max_lag=16)
+    for player in (spectator, tourney_spectator):
+        host.spectator_relay.add_spectator(player)
+        player.spectating = host
+
+    spectator.enqueue(app.packets.notification("hello"))
+    host.spectator_relay.publish(b"frame 1")
+
+    # frames are sent after any other queued packets
+    assert spectator.dequeue() == (
+        app.packets.notification("hello") + spectate_frames(b"frame 1")
+    )
+    assert spectator.dequeue() is None
+
+    # tourney clients share their user id, but read frames independently
+    assert tourney_spectator.dequeue() == spectate_frames(b"frame 1")
+
+
+def test_spectators_can_log_out(monkeypatch, make_player):
+    players = Players()
+    monkeypatch.setattr(app.state.sessions, "players", players)
+    monkeypatch.setattr(app.state.sessions, "channels", Channels())
+
+    host = make_player(3, "cmyui")
+    spectators = [make_player(4, "Jacobian Gaming"), make_player(5, "rumoi")]
+    for player in (host, *spectators):
+        players.append(player)
+
+    for spectator in spectators:
+        host.add_spectator(spectator)
+
+    spectators[0].logout()
+
+    assert spectators[0] not in players
+    assert not spectators[0].channels
+    assert host.spectators == [spectators[1]]
+
+    assert host.spectator_relay is not None
+    host.spectator_relay.publish(b"frame 1")
+    assert spectators[1].dequeue() is not None
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from typing import Any
+
+import pytest
+
+import app.state
+import app.usecases.write_behind
+from app.constants.gamemodes import GameMode
+
+
+class RecordingDatabase:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.queries: list[tuple[str, dict[str, Any]]] = []
+
+    async def execute(self, query: str, values: dict[str, Any]) -> None:
+        if self.fail:
+            raise ConnectionError("lost connection to sql")
+
+        self.queries.append((query, values))
+
+
+@pytest.fixture(autouse=True)
+def pending_writes(monkeypatch):
+    monkeypatch.setattr(app.usecases.write_behind, "_latest_activity", {})
+    monkeypatch.setattr(app.usecases.write_behind, "_replay_views", Counter())
+    monkeypatch.setattr(app.usecases.write_behind, "_map_plays", Counter())
+    monkeypatch.setattr(app.usecases.write_behind, "_map_passes", Counter())
+    monkeypatch.setattr(app.usecases.write_behind, "_flush_task", None)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = RecordingDatabase()
+    monkeypatch.setattr(app.state.services, "database", database)
+    return database
+
+
+async def test_flush_coalesces_writes(database):
+    for timestamp in (100, 300, 200):
+        app.usecases.write_behind.update_latest_activity(3, timestamp)
+    app.usecases.write_behind.update_latest_activity(4, 150)
+
+    for _ in range(5):
+        app.usecases.write_behind.increment_replay_views(3, GameMode.VANILLA_OSU)
+    app.usecases.write_behind.increment_replay_views(3, GameMode.RELAX_OSU)
+
+    app.usecases.write_behind.increment_map_plays("a" * 32, passed=True)
+    app.usecases.write_behind.increment_map_plays("a" * 32, passed=False)
+    app.usecases.write_behind.increment_map_plays("b" * 32, passed=False)
+
+    await app.usecases.write_behind.flush()
+
+    # one statement per table
+    assert len(database.queries) == 3
+    (activity_query, activity), (_, views), (_, plays) = database.queries
+
+    assert activity_query.startswith("UPDATE users SET latest_activity")
+    assert activity["user_ids"] == [3, 4]
+    assert activity["latest_activity_0"] == 300
+    assert activity["latest_activity_1"] == 150
+
+    assert sorted(
+        (views[f"mode_{idx}"], views[f"views_{idx}"]) for idx in range(2)
+    ) == [(GameMode.VANILLA_OSU, 5), (GameMode.RELAX_OSU, 1)]
+
+    map_plays = {
+        plays[f"md5_{idx}"]: (plays[f"plays_{idx}"], plays[f"passes_{idx}"])
+        for idx in range(2)
+    }
+    assert map_plays == {"a" * 32: (2, 1), "b" * 32: (1, 0)}
+
+    # nothing is left to be written
+    await app.usecases.write_behind.flush()
+    assert len(database.queries) == 3
+
+
+async def test_flush_requeues_failed_writes(database):
+    database.fail = True
+
+    app.usecases.write_behind.update_latest_activity(3, 100)
+    app.usecases.write_behind.increment_replay_views(3, GameMode.VANILLA_OSU)
+    app.usecases.write_behind.increment_map_plays("a" * 32, passed=True)
+
+    await app.usecases.write_behind.flush()
+    assert not database.queries
+
+    # writes queued after the failure are merged with the failed writes
+    app.usecases.write_behind.increment_replay_views(3, GameMode.VANILLA_OSU)
+    app.usecases.write_behind.increment_map_plays("a" * 32, passed=False)
+
+    database.fail = False
+    await app.usecases.write_behind.flush()
+
+    (_, activity), (_, views), (_, plays) = database.queries
+    assert activity["latest_activity_0"] == 100
+    assert views["views_0"] == 2
+    assert (plays["plays_0"], plays["passes_0"]) == (2, 1)
+
+
+async def test_flush_splits_large_batches(database, monkeypatch):
+    monkeypatch.setattr(app.usecases.write_behind, "MAX_ROWS_PER_STATEMENT", 2)
+
+    for user_id in range(5):
+        app.usecases.write_behind.update_latest_activity(user_id, 100)
+
+    await app.usecases.write_behind.flush()
+
+    assert [len(values["user_ids"]) for _, values in database.queries] == [2, 2, 1]
+
+
+async def test_cancelled_flushes_are_finished(database, monkeypatch):
+    execute = database.execute
+
+    async def slow_execute(query: str, values: dict[str, Any]) -> None:
+        await asyncio.sleep(0.01)
+        await execute(query, values)
+
+    monkeypatch.setattr(database, "execute", slow_execute)
+
+    app.usecases.write_behind.update_latest_activity(3, 100)
+    app.usecases.write_behind.increment_map_plays("a" * 32, passed=True)
+
+    # e.g. the housekeeping task being cancelled on shutdown, midway through writing
+    flush = asyncio.create_task(app.usecases.write_behind.flush())
+    await asyncio.sleep(0.005)
+    flush.cancel()
+
+    # the next flush waits for the cancelled one's writes
+    app.usecases.write_behind.increment_map_plays("a" * 32, passed=False)
+    await app.usecases.write_behind.flush()
+
+    (_, activity), (_, plays), (_, more_plays) = database.queries
+    assert activity["latest_activity_0"] == 100
+    assert (plays["plays_0"], plays["passes_0"]) == (1, 1)
+    assert (more_plays["plays_0"], more_plays["passes_0"]) == (1, 0)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3.11
+"""Benchmark for recalculating players' total pp & acc on score submission.
+
+Compares recalculating the totals from all of a player's best scores
+(as score submission previously did, after selecting them all from sql)
+against incrementally updating their cached best scores, on synthetic
+players with many ranked scores.
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+from collections.abc import Callable
+from typing import Any
+
+sys.path.insert(0, os.path.abspath(os.pardir))
+os.chdir(os.path.abspath(os.pardir))
+
+try:
+    from app.usecases.best_scores import BestScores
+except ModuleNotFoundError:
+    print("\x1b[;91mMust run from tools/ directory\x1b[m")
+    raise
+
+
+def legacy_totals(best_scores: list[dict[str, Any]]) -> tuple[int, float]:
+    """The previous calculation, over rows sorted by pp descending."""
+    weighted_acc = sum(row["acc"] * 0.95**i for i, row in enumerate(best_scores))
+    bonus_acc = 100.0 / (20 * (1 - 0.95 ** len(best_scores)))
+    acc = (weighted_acc * bonus_acc) / 100
+
+    weighted_pp = sum(row["pp"] * 0.95**i for i, row in enumerate(best_scores))
+    bonus_pp = 416.6667 * (1 - 0.9994 ** len(best_scores))
+    pp = round(weighted_pp + bonus_pp)
+
+    return pp, acc
+
+
+def synthetic_scores(rng: random.Random, count: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "map_md5": f"{rng.getrandbits(128):032x}",
+            "pp": round(rng.paretovariate(2.0) * 50, 3),
+            "acc": round(rng.uniform(80, 100), 3),
+        }
+        for _ in range(count)
+    ]
+
+
+def run(name: str, func: Callable[[], Any], number: int) -> float:
+    elapsed = min(timeit.repeat(func, number=number, repeat=5))
+    per_call = elapsed / number * 1e6
+    print(f"  {name:<24} {per_call:9.2f}us")
+    return per_call
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--scores", type=int, default=10_000)
+    parser.add_argument("-n", "--number", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(727)
+    rows = synthetic_scores(rng, args.scores)
+    sorted_rows = sorted(rows, key=lambda row: (row["pp"], row["acc"]), reverse=True)
+    pps = sorted(row["pp"] for row in rows)
+
+    # new best scores at the top, middle & bottom of the player's scores
+    cases = {
+        "new top play": pps[-1] + 1,
+        "new median play": pps[len(pps) // 2],
+        "new bottom play": pps[0] / 2,
+    }
+
+    print(f"recalculating totals for {args.scores} best scores (lower is better)")
+    for case_name, pp in cases.items():
+        print(case_name)
+
+        best_scores = BestScores.from_rows(rows)
+        improved_row = rng.choice(rows)
+
+        # alternate between two values, so each call moves the score
+        values = [(pp, 99.0), (improved_row["pp"], improved_row["acc"])]
+        state = {"idx": 0}
+
+        def incremental() -> None:
+            state["idx"] ^= 1
+            best_scores.update(improved_row["map_md5"], *values[state["idx"]])
+
+        legacy = run("legacy", lambda: legacy_totals(sorted_rows), args.number)
+        current = run("incremental", incremental, args.number)
+        print(f"  {'speedup':<24} {legacy / current:9.2f}x")
+
+        # the incremental totals must match a full recalculation
+        expected = BestScores.from_rows(
+            {"map_md5": map_md5, "pp": -neg_pp, "acc": -neg_acc}
+            for neg_pp, neg_acc, map_md5 in best_scores.entries
+        )
+        assert abs(best_scores.pp - expected.pp) <= 1, case_name
+        assert math.isclose(best_scores.acc, expected.acc, abs_tol=1e-6), case_name
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
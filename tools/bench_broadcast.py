@@ -0,0 +1,175 @@
+#!/usr/bin/env python3.11
+"""Benchmark for broadcasting packets to many online players.
+
+Compares the current broadcasts in `app.objects.collections.Players`
+(which share one payload between each recipient's queue, and build
+exclusion sets once) against the previous implementations (which
+copied the payload into each recipient's bytearray, and checked
+exclusions by linear membership), with thousands of simulated players.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from collections.abc import Callable
+from collections.abc import Sequence
+from typing import Any
+
+sys.path.insert(0, os.path.abspath(os.pardir))
+os.chdir(os.path.abspath(os.pardir))
+
+try:
+    import app.packets
+    from app.constants.privileges import Privileges
+    from app.objects.channel import Channel
+    from app.objects.collections import Players
+    from app.objects.player import Player
+except ModuleNotFoundError:
+    print("\x1b[;91mMust run from tools/ directory\x1b[m")
+    raise
+
+
+class LegacyPlayer:
+    """A player with the previous bytearray-based packet queue."""
+
+    def __init__(self, id: int, priv: Privileges) -> None:
+        self.id = id
+        self.priv = priv
+        self._packet_queue = bytearray()
+
+    def enqueue(self, data: bytes) -> None:
+        self._packet_queue += data
+
+    def dequeue(self) -> bytes | None:
+        if self._packet_queue:
+            data = bytes(self._packet_queue)
+            self._packet_queue.clear()
+            return data
+
+        return None
+
+
+def legacy_enqueue(
+    players: list[LegacyPlayer],
+    data: bytes,
+    immune: Sequence[LegacyPlayer] = [],
+) -> None:
+    for player in players:
+        if player not in immune:
+            player.enqueue(data)
+
+
+def legacy_enqueue_to_readers(
+    players: list[LegacyPlayer],
+    channel: Channel,
+    data: bytes,
+) -> None:
+    for player in players:
+        if channel.can_read(player.priv):
+            player.enqueue(data)
+
+
+def random_priv(rng: random.Random) -> Privileges:
+    if rng.random() < 0.01:
+        return Privileges.UNRESTRICTED | Privileges.ADMINISTRATOR
+    elif rng.random() < 0.02:
+        return Privileges.VERIFIED  # restricted
+    else:
+        return Privileges.UNRESTRICTED
+
+
+def run(name: str, func: Callable[[], Any], number: int) -> float:
+    elapsed = min(timeit.repeat(func, number=number, repeat=5))
+    per_call = elapsed / number * 1e6
+    print(f"  {name:<24} {per_call:9.2f}us")
+    return per_call
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-p", "--players", type=int, default=5_000)
+    parser.add_argument("-n", "--number", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(727)
+    privs = [random_priv(rng) for _ in range(args.players)]
+
+    players = Players()
+    legacy_players: list[LegacyPlayer] = []
+    for idx, priv in enumerate(privs):
+        players.append(
+            Player(
+                id=idx + 3,
+                name=f"player {idx}",
+                priv=priv,
+                pw_bcrypt=None,
+                token=Player.generate_token(),
+            ),
+        )
+        legacy_players.append(LegacyPlayer(idx + 3, priv))
+
+    logout = app.packets.logout(3)
+    chan_info = app.packets.channel_info("#osu", "General discussion.", 1_000)
+    public_channel = Channel("#osu", "General discussion.")
+    staff_channel = Channel("#staff", "Staff only.", read_priv=Privileges.STAFF)
+    match_immune = rng.sample(range(args.players), 16)
+
+    def drain() -> None:
+        for player in players:
+            player.dequeue()
+        for legacy_player in legacy_players:
+            legacy_player.dequeue()
+
+    cases: dict[str, tuple[Callable[[], None], Callable[[], None]]] = {
+        "logout (to everyone)": (
+            lambda: legacy_enqueue(legacy_players, logout),
+            lambda: players.enqueue(logout),
+        ),
+        "logout (16 immune)": (
+            lambda: legacy_enqueue(
+                legacy_players,
+                logout,
+                immune=[legacy_players[idx] for idx in match_immune],
+            ),
+            lambda: players.enqueue(
+                logout,
+                immune=[players[idx] for idx in match_immune],
+            ),
+        ),
+        "chan info (public)": (
+            lambda: legacy_enqueue_to_readers(
+                legacy_players, public_channel, chan_info
+            ),
+            lambda: players.enqueue_to_readers(Privileges.UNRESTRICTED, chan_info),
+        ),
+        "chan info (staff)": (
+            lambda: legacy_enqueue_to_readers(legacy_players, staff_channel, chan_info),
+            lambda: players.enqueue_to_readers(Privileges.STAFF, chan_info),
+        ),
+    }
+
+    print(f"broadcasting to {args.players} players (lower is better)")
+    for case_name, (legacy_func, current_func) in cases.items():
+        print(case_name)
+        legacy = run("legacy", legacy_func, args.number)
+        drain()
+        current = run("current", current_func, args.number)
+        drain()
+        print(f"  {'speedup':<24} {legacy / current:9.2f}x")
+
+    # both must deliver the same bytes to each player
+    for legacy_func, current_func in cases.values():
+        legacy_func()
+        current_func()
+    for player, legacy_player in zip(players, legacy_players):
+        assert player.dequeue() == legacy_player.dequeue(), player
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
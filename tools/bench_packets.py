@@ -0,0 +1,438 @@
+#!/usr/bin/env python3.11
+"""Micro-benchmarks for bancho packet (de)serialization.
+
+Compares the current implementations in `app.packets` against the
+previous slice-based implementations, on representative cho traffic.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import struct
+import sys
+import timeit
+from collections.abc import Callable
+from collections.abc import Iterator
+from typing import Any
+
+sys.path.insert(0, os.path.abspath(os.pardir))
+os.chdir(os.path.abspath(os.pardir))
+
+try:
+    import app.packets
+    from app.packets import BasePacket
+    from app.packets import ClientPackets
+    from app.packets import MultiplayerMatch
+    from app.packets import PacketMap
+    from app.packets import ReplayAction
+    from app.packets import ReplayFrame
+    from app.packets import ReplayFrameBundle
+    from app.packets import ScoreFrame
+    from app.packets import ServerPackets
+    from app.packets import osuTypes
+except ModuleNotFoundError:
+    print("\x1b[;91mMust run from tools/ directory\x1b[m")
+    raise
+
+
+class LegacyPacketReader:
+    """The previous reader, which re-sliced its view after every read."""
+
+    def __init__(self, body_view: memoryview, packet_map: PacketMap) -> None:
+        self.body_view = body_view
+        self.packet_map = packet_map
+        self.current_len = 0
+
+    def __iter__(self) -> Iterator[BasePacket]:
+        return self
+
+    def __next__(self) -> BasePacket:
+        p_type = ClientPackets.UNKNOWN_PACKET
+        p_len = 0
+        while self.body_view:
+            data = struct.unpack("<HxI", self.body_view[:7])
+            self.body_view = self.body_view[7:]
+            p_type, p_len = ClientPackets(data[0]), data[1]
+
+            if p_type not in self.packet_map:
+                if p_len != 0:
+                    self.body_view = self.body_view[p_len:]
+            else:
+                break
+        else:
+            raise StopIteration
+
+        self.current_len = p_len
+        return self.packet_map[p_type](self)  # type: ignore[arg-type]
+
+    def _read_int(self, size: int, signed: bool) -> int:
+        val = int.from_bytes(self.body_view[:size], "little", signed=signed)
+        self.body_view = self.body_view[size:]
+        return val
+
+    def read_i8(self) -> int:
+        val = self.body_view[0]
+        self.body_view = self.body_view[1:]
+        return val - 256 if val > 127 else val
+
+    def read_u8(self) -> int:
+        val = self.body_view[0]
+        self.body_view = self.body_view[1:]
+        return val
+
+    def read_i16(self) -> int:
+        return self._read_int(2, signed=True)
+
+    def read_u16(self) -> int:
+        return self._read_int(2, signed=False)
+
+    def read_i32(self) -> int:
+        return self._read_int(4, signed=True)
+
+    def read_f32(self) -> float:
+        (val,) = struct.unpack_from("<f", self.body_view[:4])
+        self.body_view = self.body_view[4:]
+        return val  # type: ignore[no-any-return]
+
+    def read_f64(self) -> float:
+        (val,) = struct.unpack_from("<d", self.body_view[:8])
+        self.body_view = self.body_view[8:]
+        return val  # type: ignore[no-any-return]
+
+    def read_string(self) -> str:
+        exists = self.body_view[0] == 0x0B
+        self.body_view = self.body_view[1:]
+
+        if not exists:
+            return ""
+
+        length = shift = 0
+
+        while True:
+            byte = self.body_view[0]
+            self.body_view = self.body_view[1:]
+
+            length |= (byte & 0x7F) << shift
+            if (byte & 0x80) == 0:
+                break
+
+            shift += 7
+
+        val = self.body_view[:length].tobytes().decode()
+        self.body_view = self.body_view[length:]
+        return val
+
+    def read_message(self) -> app.packets.Message:
+        return app.packets.Message(
+            sender=self.read_string(),
+            text=self.read_string(),
+            recipient=self.read_string(),
+            sender_id=self.read_i32(),
+        )
+
+    def read_match(self) -> MultiplayerMatch:
+        match = MultiplayerMatch(
+            id=self.read_i16(),
+            in_progress=self.read_i8() == 1,
+            powerplay=self.read_i8(),
+            mods=self.read_i32(),
+            name=self.read_string(),
+            passwd=self.read_string(),
+            map_name=self.read_string(),
+            map_id=self.read_i32(),
+            map_md5=self.read_string(),
+            slot_statuses=[self.read_i8() for _ in range(16)],
+            slot_teams=[self.read_i8() for _ in range(16)],
+        )
+
+        for status in match.slot_statuses:
+            if status & 124 != 0:
+                match.slot_ids.append(self.read_i32())
+
+        match.host_id = self.read_i32()
+        match.mode = self.read_i8()
+        match.win_condition = self.read_i8()
+        match.team_type = self.read_i8()
+        match.freemods = self.read_i8() == 1
+
+        if match.freemods:
+            match.slot_mods = [self.read_i32() for _ in range(16)]
+
+        match.seed = self.read_i32()
+        return match
+
+    def read_scoreframe(self) -> ScoreFrame:
+        sf = ScoreFrame(*app.packets.SCOREFRAME_FMT.unpack_from(self.body_view[:29]))
+        self.body_view = self.body_view[29:]
+
+        if sf.score_v2:
+            sf.combo_portion = self.read_f64()
+            sf.bonus_portion = self.read_f64()
+
+        return sf
+
+    def read_replayframe(self) -> ReplayFrame:
+        return ReplayFrame(
+            button_state=self.read_u8(),
+            taiko_byte=self.read_u8(),
+            x=self.read_f32(),
+            y=self.read_f32(),
+            time=self.read_i32(),
+        )
+
+    def read_replayframe_bundle(self) -> ReplayFrameBundle:
+        raw_data = self.body_view[: self.current_len]
+
+        extra = self.read_i32()
+        framecount = self.read_u16()
+        frames = [self.read_replayframe() for _ in range(framecount)]
+        action = ReplayAction(self.read_u8())
+        scoreframe = self.read_scoreframe()
+        sequence = self.read_u16()
+
+        return ReplayFrameBundle(frames, scoreframe, action, extra, sequence, raw_data)
+
+
+LEGACY_NOEXPAND_TYPES: dict[osuTypes, Callable[..., bytes | bytearray]] = {
+    osuTypes.u8: struct.Struct("<B").pack,
+    osuTypes.u16: struct.Struct("<H").pack,
+    osuTypes.i32: struct.Struct("<i").pack,
+    osuTypes.f32: struct.Struct("<f").pack,
+    osuTypes.i64: struct.Struct("<q").pack,
+    osuTypes.string: app.packets.write_string,
+    osuTypes.i32_list: app.packets.write_i32_list,
+}
+
+LEGACY_EXPAND_TYPES: dict[osuTypes, Callable[..., bytearray]] = {
+    osuTypes.message: app.packets.write_message,
+    osuTypes.channel: app.packets.write_channel,
+}
+
+
+def legacy_write(packid: int, *args: tuple[Any, osuTypes]) -> bytes:
+    """The previous writer, which dispatched on each field's type."""
+    ret = bytearray(struct.pack("<Hx", packid))
+
+    for p_args, p_type in args:
+        if p_type == osuTypes.raw:
+            ret += p_args
+        elif p_type in LEGACY_NOEXPAND_TYPES:
+            ret += LEGACY_NOEXPAND_TYPES[p_type](p_args)
+        elif p_type in LEGACY_EXPAND_TYPES:
+            ret += LEGACY_EXPAND_TYPES[p_type](*p_args)
+
+    ret[3:3] = struct.pack("<I", len(ret) - 3)
+    return bytes(ret)
+
+
+# (packet id, (value, type) fields) of commonly sent server packets
+WRITER_CASES: dict[str, tuple[ServerPackets, list[tuple[Any, osuTypes]]]] = {
+    "user stats": (
+        ServerPackets.USER_STATS,
+        [
+            (1001, osuTypes.i32),
+            (2, osuTypes.u8),
+            ("xi - FREEDOM DiVE [FOUR DIMENSIONS]", osuTypes.string),
+            ("da8aae79c8f3306b5d65ec951874a7fb", osuTypes.string),
+            (88, osuTypes.i32),
+            (0, osuTypes.u8),
+            (129891, osuTypes.i32),
+            (1_234_567_890, osuTypes.i64),
+            (0.9876, osuTypes.f32),
+            (12_345, osuTypes.i32),
+            (9_876_543_210, osuTypes.i64),
+            (1, osuTypes.i32),
+            (12_345, osuTypes.u16),
+        ],
+    ),
+    "user presence": (
+        ServerPackets.USER_PRESENCE,
+        [
+            (1001, osuTypes.i32),
+            ("cmyui", osuTypes.string),
+            (24 - 5, osuTypes.u8),
+            (38, osuTypes.u8),
+            (1 | (0 << 5), osuTypes.u8),
+            (-79.38, osuTypes.f32),
+            (43.65, osuTypes.f32),
+            (1, osuTypes.i32),
+        ],
+    ),
+    "send message": (
+        ServerPackets.SEND_MESSAGE,
+        [(("cmyui", "gl hf everyone!", "#multiplayer", 1001), osuTypes.message)],
+    ),
+    "channel info": (
+        ServerPackets.CHANNEL_INFO,
+        [(("#osu", "General discussion.", 1234), osuTypes.channel)],
+    ),
+    "friends list (x100)": (
+        ServerPackets.FRIENDS_LIST,
+        [(list(range(1000, 1100)), osuTypes.i32_list)],
+    ),
+    "logout": (
+        ServerPackets.USER_LOGOUT,
+        [(1001, osuTypes.i32), (0, osuTypes.u8)],
+    ),
+    "spectate frames": (
+        ServerPackets.SPECTATE_FRAMES,
+        [(bytes(269), osuTypes.raw)],
+    ),
+}
+
+
+def flatten_fields(fields: list[tuple[Any, osuTypes]]) -> list[Any]:
+    values: list[Any] = []
+    for value, field_type in fields:
+        if field_type in (osuTypes.message, osuTypes.channel):
+            values.extend(value)
+        else:
+            values.append(value)
+    return values
+
+
+class SpectateFrames(BasePacket):
+    def __init__(self, reader: Any) -> None:
+        self.frame_bundle = reader.read_replayframe_bundle()
+
+    async def handle(self, player: Any) -> None: ...
+
+
+class MatchChangeSettings(BasePacket):
+    def __init__(self, reader: Any) -> None:
+        self.match = reader.read_match()
+
+    async def handle(self, player: Any) -> None: ...
+
+
+class SendMessage(BasePacket):
+    def __init__(self, reader: Any) -> None:
+        self.msg = reader.read_message()
+
+    async def handle(self, player: Any) -> None: ...
+
+
+PACKET_MAP: PacketMap = {
+    ClientPackets.SPECTATE_FRAMES: SpectateFrames,
+    ClientPackets.MATCH_CHANGE_SETTINGS: MatchChangeSettings,
+    ClientPackets.SEND_PUBLIC_MESSAGE: SendMessage,
+}
+
+
+def make_packet(packet_id: int, data: bytes | bytearray) -> bytes:
+    return app.packets.PACKET_HEADER_FMT.pack(packet_id, len(data)) + data
+
+
+def spectate_frames_body(framecount: int) -> bytes:
+    """A typical spectator upload; osu! batches ~`framecount` frames."""
+    frames = b"".join(
+        app.packets.REPLAYFRAME_FMT.pack(i & 1, 0, 256.0 + i, 192.0 - i, i * 16)
+        for i in range(framecount)
+    )
+    scoreframe = ScoreFrame(
+        *(framecount * 16, 0, 300, 10, 2, 50, 5, 1),
+        *(1_234_567, 400, 120, False, 200, 0, False),
+    )
+    data = (
+        (0).to_bytes(4, "little")
+        + framecount.to_bytes(2, "little")
+        + frames
+        + bytes((ReplayAction.Standard,))
+        + app.packets.write_scoreframe(scoreframe)
+        + (1).to_bytes(2, "little")
+    )
+    return make_packet(ClientPackets.SPECTATE_FRAMES, data)
+
+
+def match_settings_body() -> bytes:
+    data = (
+        app.packets.MATCH_HEAD_FMT.pack(5, 0, 0, 64)
+        + app.packets.write_string("cmyui's multiplayer game")
+        + app.packets.write_string("")
+        + app.packets.write_string("xi - FREEDOM DiVE [FOUR DIMENSIONS]")
+        + (129891).to_bytes(4, "little")
+        + app.packets.write_string("da8aae79c8f3306b5d65ec951874a7fb")
+        + bytes([4] * 8 + [1] * 8)
+        + bytes([0, 1] * 8)
+        + b"".join(i.to_bytes(4, "little") for i in range(1000, 1008))
+        + app.packets.MATCH_TAIL_FMT.pack(1000, 0, 1, 2, 1)
+        + app.packets.MATCH_SLOT_MODS_FMT.pack(*([8] * 16))
+        + (0).to_bytes(4, "little")
+    )
+    return make_packet(ClientPackets.MATCH_CHANGE_SETTINGS, data)
+
+
+def chat_body() -> bytes:
+    return (
+        make_packet(ClientPackets.PING, b"")
+        + make_packet(
+            ClientPackets.SEND_PUBLIC_MESSAGE,
+            app.packets.write_message("", "gl hf everyone!", "#multiplayer", 0),
+        )
+        + make_packet(ClientPackets.PING, b"")
+    )
+
+
+def bench_reader(reader_cls: Callable[..., Iterator[BasePacket]], body: bytes) -> None:
+    with memoryview(body) as body_view:
+        for _ in reader_cls(body_view, PACKET_MAP):
+            pass
+
+
+def run(name: str, func: Callable[[], Any], number: int) -> float:
+    elapsed = min(timeit.repeat(func, number=number, repeat=5))
+    per_call = elapsed / number * 1e6
+    print(f"  {name:<24} {per_call:9.2f}us")
+    return per_call
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=2_000)
+    args = parser.parse_args(argv)
+
+    bodies = {
+        "spectate frames (x16)": spectate_frames_body(16),
+        "spectate frames (x128)": spectate_frames_body(128),
+        "match settings": match_settings_body(),
+        "chat + pings": chat_body(),
+    }
+
+    print("reading packets (lower is better)")
+    for body_name, body in bodies.items():
+        print(f"{body_name} ({len(body)} bytes)")
+        legacy = run(
+            "legacy",
+            lambda: bench_reader(LegacyPacketReader, body),
+            args.number,
+        )
+        current = run(
+            "current",
+            lambda: bench_reader(app.packets.BanchoPacketReader, body),
+            args.number,
+        )
+        print(f"  {'speedup':<24} {legacy / current:9.2f}x")
+
+    print("writing packets (lower is better)")
+    for case_name, (packet_id, fields) in WRITER_CASES.items():
+        encoder = app.packets.ENCODERS[packet_id]
+        values = flatten_fields(fields)
+
+        # the compiled encoders must be byte-for-byte identical
+        assert encoder(*values) == legacy_write(packet_id, *fields), case_name
+
+        print(case_name)
+        legacy = run(
+            "legacy",
+            lambda: legacy_write(packet_id, *fields),
+            args.number,
+        )
+        current = run("current", lambda: encoder(*values), args.number)
+        print(f"  {'speedup':<24} {legacy / current:9.2f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
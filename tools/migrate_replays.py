@@ -0,0 +1,88 @@
+#!/usr/bin/env python3.11
+"""Move replays from the flat .data/osr directory into the sharded replay store.
+
+Replays are moved (or packed, with --pack) into the directories given by
+`app.usecases.replays.replay_path`. The server finds replays in either
+layout, so this can safely be run while it's online, and resumed if stopped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import lzma
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.pardir))
+os.chdir(os.path.abspath(os.pardir))
+
+try:
+    import app.settings
+    import app.utils
+    from app.usecases.replays import REPLAYS_PATH
+    from app.usecases.replays import replay_path
+except ModuleNotFoundError:
+    print("\x1b[;91mMust run from tools/ directory\x1b[m")
+    raise
+
+
+def migrate_replay(score_id: int, pack: bool) -> None:
+    flat_path = REPLAYS_PATH / f"{score_id}.osr"
+    sharded_path = replay_path(score_id, packed=pack)
+
+    if pack:
+        data = lzma.compress(flat_path.read_bytes())
+        app.utils.write_file_atomically(sharded_path, data)
+        flat_path.unlink()
+    else:
+        sharded_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(flat_path, sharded_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--pack",
+        help="pack replays with lzma (defaults to REPLAY_COMPRESSION)",
+        action=argparse.BooleanOptionalAction,
+        default=app.settings.REPLAY_COMPRESSION == "lzma",
+    )
+    parser.add_argument(
+        "--dry-run",
+        help="only count the replays to be migrated",
+        action="store_true",
+    )
+    args = parser.parse_args(argv)
+
+    score_ids: list[int] = []
+    with os.scandir(REPLAYS_PATH) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext == ".osr" and stem.isdecimal() and entry.is_file():
+                score_ids.append(int(stem))
+
+    print(f"Found {len(score_ids)} replays to migrate.")
+    if args.dry_run:
+        return 0
+
+    start_time = time.time()
+    failed = 0
+
+    for idx, score_id in enumerate(score_ids, start=1):
+        try:
+            migrate_replay(score_id, args.pack)
+        except OSError as exc:
+            print(f"Failed to migrate replay {score_id}: {exc!r}")
+            failed += 1
+
+        if idx % 10_000 == 0:
+            print(f"Migrated {idx}/{len(score_ids)} replays.")
+
+    elapsed = time.time() - start_time
+    print(f"Migrated {len(score_ids) - failed} replays in {elapsed:.2f}s.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,12 +3,14 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import math
+import json
 import os
 import sys
-from collections.abc import Awaitable
+from collections import defaultdict
 from collections.abc import Iterator
+from collections.abc import Mapping
 from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from dataclasses import field
 from pathlib import Path
@@ -16,8 +18,6 @@ from typing import Any
 from typing import TypeVar
 
 import databases
-from akatsuki_pp_py import Beatmap
-from akatsuki_pp_py import Calculator
 from redis import asyncio as aioredis
 
 sys.path.insert(0, os.path.abspath(os.pardir))
@@ -27,194 +27,331 @@ try:
     import app.settings
     import app.state.services
     from app.constants.gamemodes import GameMode
-    from app.constants.mods import Mods
     from app.constants.privileges import Privileges
     from app.objects.beatmap import ensure_osu_file_is_available
+    from app.objects.score import SubmissionStatus
+    from app.usecases.best_scores import BestScores
+    from app.usecases.performance import ScoreParams
+    from app.usecases.performance import calculate_performances
 except ModuleNotFoundError:
     print("\x1b[;91mMust run from tools/ directory\x1b[m")
     raise
 
 T = TypeVar("T")
 
-debug_mode_enabled = True
-
-DEBUG = True
+debug_mode_enabled = False
 
 BEATMAPS_PATH = Path.cwd() / ".data/osu"
+CHECKPOINT_PATH = Path.cwd() / ".data/recalc_checkpoint.json"
+
+# the number of maps (or users) whose scores are fetched at a time
+MAPS_PER_BATCH = 100
+USERS_PER_BATCH = 500
+
+# the max number of rows written by a single statement
+ROWS_PER_STATEMENT = 1000
+
+
+@dataclass
+class Checkpoint:
+    """\
+    Progress through each stage of the recalculation (e.g. "scores:0"),
+    saved after each batch so an interrupted run can be resumed.
+
+    Maps are processed in order of md5 & users in order of id; the last
+    key of the latest completed batch is stored for each stage.
+    """
+
+    path: Path
+    progress: dict[str, Any] = field(default_factory=dict)
+    completed: set[str] = field(default_factory=set)
+
+    @classmethod
+    def load(cls, path: Path) -> Checkpoint:
+        if not path.exists():
+            return cls(path)
+
+        data = json.loads(path.read_text())
+        return cls(path, data["progress"], set(data["completed"]))
+
+    def save(self) -> None:
+        # write to a temporary file first, so the
+        # checkpoint can't be corrupted by a crash.
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_text(
+            json.dumps(
+                {"progress": self.progress, "completed": sorted(self.completed)},
+            ),
+        )
+        os.replace(temp_path, self.path)
+
+    def advance(self, stage: str, last_key: Any) -> None:
+        self.progress[stage] = last_key
+        self.save()
+
+    def complete(self, stage: str) -> None:
+        self.progress.pop(stage, None)
+        self.completed.add(stage)
+        self.save()
 
 
 @dataclass
 class Context:
     database: databases.Database
     redis: aioredis.Redis
-    beatmaps: dict[int, Beatmap] = field(default_factory=dict)
+    executor: ProcessPoolExecutor
+    checkpoint: Checkpoint
 
 
 def divide_chunks(values: list[T], n: int) -> Iterator[list[T]]:
     for i in range(0, len(values), n):
         yield values[i : i + n]
 
-async def recalculate_score(
-    score: dict[str, Any],
-    beatmap_path: Path,
+
+def find_best_scores(scores: Sequence[Mapping[str, Any]]) -> set[int]:
+    """Find the ids of the best (highest pp) score of each user on a map."""
+    best_scores: dict[int, Mapping[str, Any]] = {}
+    for score in scores:
+        best = best_scores.get(score["userid"])
+        # on ties, prefer the earliest score
+        if best is None or (score["pp"], -score["id"]) > (best["pp"], -best["id"]):
+            best_scores[score["userid"]] = score
+
+    return {score["id"] for score in best_scores.values()}
+
+
+async def recalculate_beatmap(
+    beatmap_id: int,
+    beatmap_md5: str,
+    scores: list[dict[str, Any]],
     ctx: Context,
-) -> None:
+) -> list[dict[str, Any]]:
+    """Recalculate the pp of a map's scores, & which of them are users' bests.
+
+    Returns the scores whose pp or status changed.
+    """
+    osu_file_available = await ensure_osu_file_is_available(
+        beatmap_id,
+        expected_md5=beatmap_md5,
+    )
+    if not osu_file_available:
+        print(f"Skipping beatmap ID {beatmap_id} (.osu file unavailable)")
+        return []
+
+    loop = asyncio.get_running_loop()
     try:
-        beatmap = ctx.beatmaps.get(score["map_id"])
-        if beatmap is None:
-            beatmap = Beatmap(path=str(beatmap_path))
-            ctx.beatmaps[score["map_id"]] = beatmap
-
-        calculator = Calculator(
-            mode=GameMode(score["mode"]).as_vanilla,
-            mods=score["mods"],
-            combo=score["max_combo"],
-            n_geki=score["ngeki"],  # Mania 320s
-            n300=score["n300"],
-            n_katu=score["nkatu"],  # Mania 200s, Catch tiny droplets
-            n100=score["n100"],
-            n50=score["n50"],
-            n_misses=score["nmiss"],
+        # the beatmap is parsed once for all of its scores
+        results = await loop.run_in_executor(
+            ctx.executor,
+            calculate_performances,
+            str(BEATMAPS_PATH / f"{beatmap_id}.osu"),
+            [
+                ScoreParams(
+                    mode=GameMode(score["mode"]).as_vanilla,
+                    mods=score["mods"],
+                    combo=score["max_combo"],
+                    ngeki=score["ngeki"],  # Mania 320s
+                    n300=score["n300"],
+                    nkatu=score["nkatu"],  # Mania 200s, Catch tiny droplets
+                    n100=score["n100"],
+                    n50=score["n50"],
+                    nmiss=score["nmiss"],
+                )
+                for score in scores
+            ],
         )
-        attrs = calculator.performance(beatmap)
+    except Exception as e:
+        # Log the error and continue processing other beatmaps
+        print(f"Failed to recalculate beatmap ID {beatmap_id}: {e}")
+        return []
 
-        new_pp: float = attrs.pp
-        if math.isnan(new_pp) or math.isinf(new_pp):
-            new_pp = 0.0
+    for score, result in zip(scores, results):
+        score["new_pp"] = result["performance"]["pp"]
 
-        await ctx.database.execute(
-            "UPDATE scores SET pp = :new_pp WHERE id = :id",
-            {"new_pp": new_pp, "id": score["id"]},
-        )
+    # the user's best score on the map may have changed
+    best_score_ids = find_best_scores(
+        [{**score, "pp": score["new_pp"]} for score in scores],
+    )
+
+    changed_scores = []
+    for score in scores:
+        if score["id"] in best_score_ids:
+            score["new_status"] = SubmissionStatus.BEST
+        else:
+            score["new_status"] = SubmissionStatus.SUBMITTED
+
+        # (pp is stored to 3 decimal places, like the new pp)
+        if (
+            score["new_pp"] != round(score["pp"], 3)
+            or score["new_status"] != score["status"]
+        ):
+            changed_scores.append(score)
 
         if debug_mode_enabled:
             print(
-                f"Recalculated score ID {score['id']} ({score['pp']:.3f}pp -> {new_pp:.3f}pp)",
+                f"Recalculated score ID {score['id']} "
+                f"({score['pp']:.3f}pp -> {score['new_pp']:.3f}pp)",
             )
-            
-    except Exception as e:
-        # Log the error and continue processing other scores
-        print(f"Failed to recalculate score ID {score['id']}: {e}")
 
+    return changed_scores
 
-async def process_score_chunk(
-    chunk: list[dict[str, Any]],
-    ctx: Context,
-) -> None:
-    tasks: list[Awaitable[None]] = []
-    for score in chunk:
-        osu_file_available = await ensure_osu_file_is_available(
-            score["map_id"],
-            expected_md5=score["map_md5"],
-        )
-        if osu_file_available:
-            tasks.append(
-                recalculate_score(
-                    score,
-                    BEATMAPS_PATH / f"{score['map_id']}.osu",
-                    ctx,
-                ),
-            )
 
-    await asyncio.gather(*tasks)
+async def write_scores(scores: list[dict[str, Any]], ctx: Context) -> None:
+    for chunk in divide_chunks(scores, ROWS_PER_STATEMENT):
+        pp_cases = []
+        status_cases = []
+        params: dict[str, Any] = {"ids": [score["id"] for score in chunk]}
+        for i, score in enumerate(chunk):
+            pp_cases.append(f"WHEN :id_{i} THEN :pp_{i}")
+            status_cases.append(f"WHEN :id_{i} THEN :status_{i}")
+            params[f"id_{i}"] = score["id"]
+            params[f"pp_{i}"] = score["new_pp"]
+            params[f"status_{i}"] = score["new_status"]
 
+        # NOTE: an INSERT .. ON DUPLICATE KEY UPDATE can't be used
+        # here, as scores have columns without default values.
+        await ctx.database.execute(
+            "UPDATE scores SET "
+            f"pp = CASE id {' '.join(pp_cases)} END, "
+            f"status = CASE id {' '.join(status_cases)} END "
+            "WHERE id IN :ids",
+            params,
+        )
 
-async def recalculate_user(
-    id: int,
-    game_mode: GameMode,
-    ctx: Context,
-) -> None:
-    best_scores = await ctx.database.fetch_all(
-        "SELECT s.pp, s.acc FROM scores s "
-        "INNER JOIN maps m ON s.map_md5 = m.md5 "
-        "WHERE s.userid = :user_id AND s.mode = :mode "
-        "AND s.status = 2 AND m.status IN (2, 3) "  # ranked, approved
-        "ORDER BY s.pp DESC",
-        {"user_id": id, "mode": game_mode},
-    )
 
-    total_scores = len(best_scores)
-    if not total_scores:
+async def recalculate_mode_scores(mode: GameMode, ctx: Context) -> None:
+    stage = f"scores:{mode.value}"
+    if stage in ctx.checkpoint.completed:
         return
 
-    # calculate new total weighted accuracy
-    weighted_acc = sum(row["acc"] * 0.95**i for i, row in enumerate(best_scores))
-    bonus_acc = 100.0 / (20 * (1 - 0.95**total_scores))
-    acc = (weighted_acc * bonus_acc) / 100
-
-    # calculate new total weighted pp
-    weighted_pp = sum(row["pp"] * 0.95**i for i, row in enumerate(best_scores))
-    bonus_pp = 416.6667 * (1 - 0.9994**total_scores)
-    pp = round(weighted_pp + bonus_pp)
-
-    await ctx.database.execute(
-        "UPDATE stats SET pp = :pp, acc = :acc WHERE id = :id AND mode = :mode",
-        {"pp": pp, "acc": acc, "id": id, "mode": game_mode},
-    )
-
-    user_info = await ctx.database.fetch_one(
-        "SELECT country, priv FROM users WHERE id = :id",
-        {"id": id},
-    )
-    if user_info is None:
-        raise Exception(f"Unknown user ID {id}?")
+    last_map_md5 = ctx.checkpoint.progress.get(stage, "")
+    if last_map_md5:
+        print(f"Resuming {mode!r} scores after map {last_map_md5}")
+
+    while True:
+        # stream through the maps by md5, fetching
+        # the scores of a batch of maps at a time.
+        beatmaps = await ctx.database.fetch_all(
+            "SELECT id, md5 FROM maps WHERE md5 > :last_map_md5 "
+            f"ORDER BY md5 LIMIT {MAPS_PER_BATCH}",
+            {"last_map_md5": last_map_md5},
+        )
+        if not beatmaps:
+            break
 
-    if user_info["priv"] & Privileges.UNRESTRICTED:
-        await ctx.redis.zadd(
-            f"bancho:leaderboard:{game_mode.value}",
-            {str(id): pp},
+        scores_by_map: defaultdict[str, list[dict[str, Any]]] = defaultdict(list)
+        for row in await ctx.database.fetch_all(
+            """\
+            SELECT id, mode, mods, map_md5, userid, pp, status, max_combo,
+              ngeki, n300, nkatu, n100, n50, nmiss
+            FROM scores
+            WHERE map_md5 IN :map_md5s
+              AND mode = :mode
+              AND status IN (1, 2)
+            """,
+            {"map_md5s": [beatmap["md5"] for beatmap in beatmaps], "mode": mode},
+        ):
+            scores_by_map[row["map_md5"]].append(dict(row))
+
+        results = await asyncio.gather(
+            *(
+                recalculate_beatmap(
+                    beatmap["id"],
+                    beatmap["md5"],
+                    scores_by_map[beatmap["md5"]],
+                    ctx,
+                )
+                for beatmap in beatmaps
+                if beatmap["md5"] in scores_by_map
+            ),
         )
 
-        await ctx.redis.zadd(
-            f"bancho:leaderboard:{game_mode.value}:{user_info['country']}",
-            {str(id): pp},
+        await write_scores(
+            [score for changed_scores in results for score in changed_scores],
+            ctx,
         )
-        
-    if debug_mode_enabled:
-        print(f"Recalculated user ID {id} ({pp:.3f}pp, {acc:.3f}%)")
 
-async def process_user_chunk(
-    chunk: list[int],
-    game_mode: GameMode,
-    ctx: Context,
-) -> None:
-    tasks: list[Awaitable[None]] = []
-    for id in chunk:
-        tasks.append(recalculate_user(id, game_mode, ctx))
+        last_map_md5 = beatmaps[-1]["md5"]
+        ctx.checkpoint.advance(stage, last_map_md5)
 
-    await asyncio.gather(*tasks)
+    ctx.checkpoint.complete(stage)
 
 
 async def recalculate_mode_users(mode: GameMode, ctx: Context) -> None:
-    user_ids = [
-        row["id"] for row in await ctx.database.fetch_all("SELECT id FROM users")
-    ]
+    stage = f"stats:{mode.value}"
+    if stage in ctx.checkpoint.completed:
+        return
 
-    for id_chunk in divide_chunks(user_ids, 100):
-        await process_user_chunk(id_chunk, mode, ctx)
+    last_user_id = ctx.checkpoint.progress.get(stage, 0)
+    if last_user_id:
+        print(f"Resuming {mode!r} stats after user ID {last_user_id}")
 
+    while True:
+        users = await ctx.database.fetch_all(
+            "SELECT id, country, priv FROM users WHERE id > :last_user_id "
+            f"ORDER BY id LIMIT {USERS_PER_BATCH}",
+            {"last_user_id": last_user_id},
+        )
+        if not users:
+            break
 
-async def recalculate_mode_scores(mode: GameMode, ctx: Context) -> None:
-    scores = [
-        dict(row)
+        best_scores: defaultdict[int, list[Mapping[str, Any]]] = defaultdict(list)
         for row in await ctx.database.fetch_all(
-            """\
-            SELECT scores.id, scores.mode, scores.mods, scores.map_md5,
-              scores.pp, scores.acc, scores.max_combo,
-              scores.ngeki, scores.n300, scores.nkatu, scores.n100, scores.n50, scores.nmiss,
-              maps.id as `map_id`
-            FROM scores
-            INNER JOIN maps ON scores.map_md5 = maps.md5
-            WHERE scores.status = 2
-              AND scores.mode = :mode
-            ORDER BY scores.pp DESC
-            """,
-            {"mode": mode},
-        )
-    ]
+            "SELECT s.userid, s.pp, s.acc, s.map_md5 FROM scores s "
+            "INNER JOIN maps m ON s.map_md5 = m.md5 "
+            "WHERE s.userid IN :user_ids AND s.mode = :mode "
+            "AND s.status = 2 AND m.status IN (2, 3)",  # ranked, approved
+            {"user_ids": [user["id"] for user in users], "mode": mode},
+        ):
+            best_scores[row["userid"]].append(dict(row))
+
+        stats = []
+        for user in users:
+            if user["id"] not in best_scores:
+                continue
+
+            totals = BestScores.from_rows(best_scores[user["id"]])
+            stats.append((user, totals.pp, totals.acc))
+
+            if debug_mode_enabled:
+                print(
+                    f"Recalculated user ID {user['id']} "
+                    f"({totals.pp:.3f}pp, {totals.acc:.3f}%)",
+                )
+
+        for chunk in divide_chunks(stats, ROWS_PER_STATEMENT):
+            values = []
+            params: dict[str, Any] = {"mode": mode}
+            for i, (user, pp, acc) in enumerate(chunk):
+                values.append(f"(:id_{i}, :mode, :pp_{i}, :acc_{i})")
+                params[f"id_{i}"] = user["id"]
+                params[f"pp_{i}"] = pp
+                params[f"acc_{i}"] = acc
+
+            await ctx.database.execute(
+                "INSERT INTO stats (id, mode, pp, acc) "
+                f"VALUES {', '.join(values)} "
+                "ON DUPLICATE KEY UPDATE pp = VALUES(pp), acc = VALUES(acc)",
+                params,
+            )
+
+        async with ctx.redis.pipeline() as pipe:
+            for user, pp, _ in stats:
+                if user["priv"] & Privileges.UNRESTRICTED:
+                    pipe.zadd(
+                        f"bancho:leaderboard:{mode.value}",
+                        {str(user["id"]): pp},
+                    )
+                    pipe.zadd(
+                        f"bancho:leaderboard:{mode.value}:{user['country']}",
+                        {str(user["id"]): pp},
+                    )
+            await pipe.execute()
+
+        last_user_id = users[-1]["id"]
+        ctx.checkpoint.advance(stage, last_user_id)
 
-    for score_chunk in divide_chunks(scores, 100):
-        await process_score_chunk(score_chunk, ctx)
+    ctx.checkpoint.complete(stage)
 
 
 async def main(argv: Sequence[str] | None = None) -> int:
@@ -240,6 +377,24 @@ async def main(argv: Sequence[str] | None = None) -> int:
         help="Disable recalculating user stats",
         action="store_true",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes to calculate performance with",
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Path to save progress to, for resuming interrupted runs",
+        type=Path,
+        default=CHECKPOINT_PATH,
+    )
+    parser.add_argument(
+        "--restart",
+        help="Discard any saved progress & start from the beginning",
+        action="store_true",
+    )
 
     parser.add_argument(
         "-m",
@@ -255,26 +410,40 @@ async def main(argv: Sequence[str] | None = None) -> int:
     global debug_mode_enabled
     debug_mode_enabled = args.debug
 
+    if args.restart:
+        args.checkpoint.unlink(missing_ok=True)
+
+    checkpoint = Checkpoint.load(args.checkpoint)
+
     db = databases.Database(app.settings.DB_DSN)
     await db.connect()
 
     redis = await aioredis.from_url(app.settings.REDIS_DSN)  # type: ignore[no-untyped-call]
 
-    ctx = Context(db, redis)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        ctx = Context(db, redis, executor, checkpoint)
+
+        for mode in args.mode:
+            mode = GameMode(int(mode))
 
-    for mode in args.mode:
-        mode = GameMode(int(mode))
+            if not args.no_scores:
+                await recalculate_mode_scores(mode, ctx)
 
-        if not args.no_scores:
-            await recalculate_mode_scores(mode, ctx)
+            if not args.no_stats:
+                await recalculate_mode_users(mode, ctx)
 
-        if not args.no_stats:
-            await recalculate_mode_users(mode, ctx)
+    # everything requested is done; the next run starts over
+    args.checkpoint.unlink(missing_ok=True)
 
     await app.state.services.http_client.aclose()
     await db.disconnect()
     await redis.aclose()
 
+    print(
+        "Recalculation complete; restart the server to "
+        "clear its cached leaderboards & best scores.",
+    )
+
     return 0
 
 